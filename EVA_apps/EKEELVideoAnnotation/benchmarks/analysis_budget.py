@@ -0,0 +1,72 @@
+"""
+Benchmark of the slide analysis with a budget.
+
+Runs `analyze_slides` on a synthetic EduOpen lecture without a budget and then with budgets of OCR calls
+that are fractions of the calls it needed: the steps get wider while the analysis is behind schedule and it stops
+when the budget is over. Reports the slides found, the OCR calls and whether the analysis is partial;
+partial analyses are then resumed from their checkpoint (saved and loaded as a dict) until they are complete.
+
+Run from the EKEELVideoAnnotation folder with `python -m benchmarks.analysis_budget`
+
+Functions
+---------
+run_benchmark
+    Analyze the lecture with decreasing budgets and resume the partial analyses
+"""
+
+import tempfile
+from time import perf_counter
+
+from media.segmentation import analyze_slides, AnalysisBudget, SlideAnalysisCheckpoint
+from benchmarks.synthetic import generate_slide_video
+
+
+def run_benchmark(budget_fractions:'tuple[float,...]'=(1.5, 0.75, 0.5, 0.25), num_slides:int=20, seconds_per_slide:float=15) -> 'list[dict]':
+    """
+    Analyze a synthetic lecture with budgets of OCR calls and resume the partial analyses.
+
+    Parameters
+    ----------
+    budget_fractions : tuple, optional
+        Budgets as fractions of the OCR calls of the analysis without a budget
+    num_slides : int, optional
+        Number of slides of the synthetic lecture
+    seconds_per_slide : float, optional
+        Seconds every slide stays on screen
+
+    Returns
+    -------
+    list
+        For the analysis without a budget and for every budget, slides, OCR calls and seconds of the first run,
+        whether it's partial, and slides and total OCR calls once resumed to the end
+    """
+    folder = tempfile.mkdtemp()
+    generate_slide_video(folder, "synthetic_lecture", num_slides=num_slides, seconds_per_slide=seconds_per_slide,
+                         fps=25, opening_seconds=4)
+    start = perf_counter()
+    slides, num_ocr_calls = analyze_slides("synthetic_lecture", _testing_path=folder)
+    results = [{"budget": None, "slides": len(slides), "ocr_calls": num_ocr_calls, "seconds": perf_counter() - start, "partial": False}]
+
+    for budget_fraction in budget_fractions:
+        max_ocr_calls = max(int(num_ocr_calls * budget_fraction), 1)
+        checkpoint = SlideAnalysisCheckpoint()
+        start = perf_counter()
+        budget_slides, budget_ocr_calls = analyze_slides("synthetic_lecture", budget=AnalysisBudget(max_ocr_calls=max_ocr_calls),
+                                                         checkpoint=checkpoint, _testing_path=folder)
+        result = {"budget": max_ocr_calls, "slides": len(budget_slides), "ocr_calls": budget_ocr_calls,
+                  "seconds": perf_counter() - start, "partial": not checkpoint.is_complete()}
+        num_runs, total_ocr_calls = 1, budget_ocr_calls
+        while not checkpoint.is_complete():
+            checkpoint = SlideAnalysisCheckpoint.from_dict(checkpoint.to_dict())
+            budget_slides, budget_ocr_calls = analyze_slides("synthetic_lecture", budget=AnalysisBudget(max_ocr_calls=max_ocr_calls),
+                                                             checkpoint=checkpoint, _testing_path=folder)
+            num_runs, total_ocr_calls = num_runs + 1, total_ocr_calls + budget_ocr_calls
+        result.update(resumed_runs=num_runs, resumed_slides=len(budget_slides), resumed_ocr_calls=total_ocr_calls,
+                      same_texts=[slide.get_full_text() for slide in budget_slides] == [slide.get_full_text() for slide in slides])
+        results.append(result)
+    return results
+
+
+if __name__ == '__main__':
+    for result in run_benchmark():
+        print(" | ".join(f"{key}: {round(value,3) if isinstance(value,float) else value}" for key,value in result.items()))
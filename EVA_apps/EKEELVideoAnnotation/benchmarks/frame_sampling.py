@@ -0,0 +1,156 @@
+"""
+Benchmark of the frame access layer.
+
+Compares the frames per second obtained by `FrameSampler` against the previous behaviour
+of seeking with `CAP_PROP_POS_FRAMES` before every read, on a synthetic slide lecture
+and on request patterns similar to the ones of `VideoAnalyzer.analyze_video` and `VideoSpeedManager`.
+
+Run from the EKEELVideoAnnotation folder with `python -m benchmarks.frame_sampling`
+
+Functions
+---------
+build_requests
+    Build the sequence of frame numbers requested by an analysis
+seek_every_time
+    Read the requested frames seeking before every read
+sampled
+    Read the requested frames through a `FrameSampler`
+run_benchmark
+    Run both strategies on a synthetic video and report the results
+"""
+
+from pathlib import Path
+from random import Random
+from time import perf_counter
+import tempfile
+
+import cv2
+
+from media.video import FrameSampler
+from benchmarks.synthetic import generate_slide_video
+
+
+def build_requests(num_frames:int, fps:int, pattern:str="adaptive", seed:int=0) -> 'list[int]':
+    """
+    Build the sequence of frame numbers requested by an analysis.
+
+    Parameters
+    ----------
+    num_frames : int
+        Number of frames of the video
+    fps : int
+        Frames per second of the video
+    pattern : str, optional
+        - 'adaptive': step grows while the content is the same and sometimes rolls back
+          (like the speed manager after a collision)\n
+        - 'fixed': step of one second\n
+    seed : int, optional
+        Seed of the random pattern
+
+    Returns
+    -------
+    list of int
+        Requested frame numbers
+    """
+    rand = Random(seed)
+    requests = []
+    curr_frame = 0
+    step = fps
+    while curr_frame < num_frames:
+        requests.append(curr_frame)
+        if pattern == "adaptive":
+            if rand.random() < 0.08:
+                # collision: roll back and restart from min step
+                curr_frame = max(0, curr_frame - step + fps//10)
+                step = fps//10 or 1
+                continue
+            step = min(step + fps//2, fps*10)
+        curr_frame += step
+    return requests
+
+
+def seek_every_time(video_path:str, requests:'list[int]') -> int:
+    """
+    Read the requested frames seeking before every read.
+
+    Returns
+    -------
+    int
+        Number of decoded frames
+    """
+    vidcap = cv2.VideoCapture(video_path)
+    decoded = 0
+    for num_frame in requests:
+        vidcap.set(cv2.CAP_PROP_POS_FRAMES, num_frame)
+        decoded += vidcap.read()[0]
+    vidcap.release()
+    return decoded
+
+
+def sampled(video_path:str, requests:'list[int]') -> 'tuple[int,dict]':
+    """
+    Read the requested frames through a `FrameSampler`.
+
+    Returns
+    -------
+    tuple
+        Number of decoded frames and the sampler stats
+    """
+    vidcap = cv2.VideoCapture(video_path)
+    sampler = FrameSampler(vidcap)
+    decoded = 0
+    for num_frame in requests:
+        decoded += sampler.read(num_frame) is not None
+    vidcap.release()
+    return decoded, sampler.get_stats()
+
+
+def run_benchmark(video_path:'str | None'=None, patterns:'tuple[str,...]'=("fixed","adaptive")) -> 'list[dict]':
+    """
+    Run both strategies on a video and report frames per second.
+
+    Parameters
+    ----------
+    video_path : str, optional
+        Path of the video, a synthetic lecture is generated if None
+    patterns : tuple of str, optional
+        Request patterns to measure, see `build_requests()`
+
+    Returns
+    -------
+    list of dict
+        One result for every pattern
+    """
+    if video_path is None:
+        video_path = generate_slide_video(tempfile.mkdtemp(), "synthetic_slides", num_slides=30, seconds_per_slide=10).__str__()
+    vidcap = cv2.VideoCapture(video_path)
+    num_frames = int(vidcap.get(cv2.CAP_PROP_FRAME_COUNT))
+    fps = int(vidcap.get(cv2.CAP_PROP_FPS))
+    vidcap.release()
+
+    results = []
+    for pattern in patterns:
+        requests = build_requests(num_frames, fps, pattern)
+
+        start = perf_counter()
+        decoded_seek = seek_every_time(video_path, requests)
+        seek_time = perf_counter() - start
+
+        start = perf_counter()
+        decoded_sampled, stats = sampled(video_path, requests)
+        sampled_time = perf_counter() - start
+
+        assert decoded_seek == decoded_sampled
+        results.append({"pattern": pattern,
+                        "requests": len(requests),
+                        "seek_every_time_fps": len(requests)/seek_time,
+                        "sampler_fps": len(requests)/sampled_time,
+                        "speedup": seek_time/sampled_time,
+                        **stats})
+    return results
+
+
+if __name__ == '__main__':
+    import sys
+    for result in run_benchmark(sys.argv[1] if len(sys.argv) > 1 else None):
+        print(" | ".join(f"{key}: {round(value,6) if isinstance(value,float) else value}" for key,value in result.items()))
@@ -0,0 +1,132 @@
+"""
+Benchmark of the OCR of a frame.
+
+Reads the text of synthetic slides with one tesseract call per text region and with one call
+on the mosaic of all the regions, and reports the tesseract subprocesses spawned, the time per slide
+and whether the texts read are the same.
+Then reads them with the tesseract executable, with the in-process engine and with a pool of workers.
+
+Requires the tesseract executable (and tesserocr for the in-process engine). Run from the EKEELVideoAnnotation folder with `python -m benchmarks.ocr_calls`
+
+Functions
+---------
+count_spawns
+    Count the subprocesses started while running a function
+run_benchmark
+    Read the slides with both OCR modes and report the results
+run_engines_benchmark
+    Read the slides with both OCR backends and with the worker pool and report the results
+"""
+
+import subprocess
+from time import perf_counter
+
+from media.image import ImageClassifier, OCRWorkerPool, OCR_MODE_PER_CONTOUR, OCR_MODE_MOSAIC
+from media.ocr import set_ocr_backend, OCR_BACKEND_PYTESSERACT, OCR_BACKEND_TESSEROCR
+from benchmarks.synthetic import render_slide
+
+
+def count_spawns(function, *args, **kwargs) -> tuple:
+    """
+    Count the subprocesses started while running a function.
+
+    Parameters
+    ----------
+    function : callable
+        Function to run
+    *args, **kwargs
+        Arguments of the function
+
+    Returns
+    -------
+    tuple
+        Result of the function and number of subprocesses started
+    """
+    popen = subprocess.Popen
+    num_spawns = 0
+
+    class CountingPopen(popen):
+        def __init__(self, *popen_args, **popen_kwargs):
+            nonlocal num_spawns
+            num_spawns += 1
+            super().__init__(*popen_args, **popen_kwargs)
+
+    subprocess.Popen = CountingPopen
+    try:
+        result = function(*args, **kwargs)
+    finally:
+        subprocess.Popen = popen
+    return result, num_spawns
+
+
+def run_benchmark(num_slides:int=10, frame_size:'tuple[int,int]'=(1280,720)) -> dict:
+    """
+    Read the text of synthetic slides with both OCR modes.
+
+    Parameters
+    ----------
+    num_slides : int, optional
+        Number of slides read
+    frame_size : tuple, optional
+        Size (width, height) of the slides
+
+    Returns
+    -------
+    dict
+        Spawns and seconds per slide of both modes and the number of slides read the same way
+    """
+    slides = [render_slide(slide_num, frame_size) for slide_num in range(num_slides)]
+    result = {"num_slides": num_slides}
+    texts = {}
+    for name, ocr_mode in (("per_contour", OCR_MODE_PER_CONTOUR), ("mosaic", OCR_MODE_MOSAIC)):
+        num_spawns = 0
+        texts[name] = []
+        start = perf_counter()
+        for slide in slides:
+            text, slide_spawns = count_spawns(ImageClassifier(slide).extract_text, return_text=True, ocr_mode=ocr_mode)
+            texts[name].append(text)
+            num_spawns += slide_spawns
+        result[name+"_seconds_per_slide"] = (perf_counter() - start) / num_slides
+        result[name+"_spawns_per_slide"] = num_spawns / num_slides
+    result["same_text_slides"] = sum(text == other_text for text, other_text in zip(texts["per_contour"], texts["mosaic"]))
+    return result
+
+
+def run_engines_benchmark(num_slides:int=10, frame_size:'tuple[int,int]'=(1280,720), num_workers:'int | None'=None) -> dict:
+    """
+    Read the text of synthetic slides with the tesseract executable, with the in-process engine and with a pool of workers.
+
+    Parameters
+    ----------
+    num_slides : int, optional
+        Number of slides read
+    frame_size : tuple, optional
+        Size (width, height) of the slides
+    num_workers : int or None, optional
+        Number of threads of the pool, all the cores if None
+
+    Returns
+    -------
+    dict
+        Seconds per slide of every backend and the number of slides read the same way
+    """
+    slides = [render_slide(slide_num, frame_size) for slide_num in range(num_slides)]
+    result = {"num_slides": num_slides}
+    texts = {}
+    for name, backend in (("pytesseract", OCR_BACKEND_PYTESSERACT), ("tesserocr", OCR_BACKEND_TESSEROCR)):
+        set_ocr_backend(backend)
+        start = perf_counter()
+        texts[name] = [ImageClassifier(slide).extract_text(return_text=True) for slide in slides]
+        result[name+"_seconds_per_slide"] = (perf_counter() - start) / num_slides
+    start = perf_counter()
+    with OCRWorkerPool(num_workers) as ocr_pool:
+        texts["pool"] = ocr_pool.map(slides)
+    result["pool_seconds_per_slide"] = (perf_counter() - start) / num_slides
+    result["same_text_slides"] = sum(text == other_text == pool_text
+                                     for text, other_text, pool_text in zip(texts["pytesseract"], texts["tesserocr"], texts["pool"]))
+    return result
+
+
+if __name__ == '__main__':
+    for result in (run_benchmark(), run_engines_benchmark()):
+        print(" | ".join(f"{key}: {round(value,3) if isinstance(value,float) else value}" for key,value in result.items()))
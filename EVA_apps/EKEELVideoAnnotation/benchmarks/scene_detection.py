@@ -0,0 +1,99 @@
+"""
+Benchmark of the scene change detection.
+
+Runs `SceneChangeDetector` on a synthetic slide lecture, decoding the video and reading the thumbnails
+of its `FrameFeatureStore`, and reports the time spent as a fraction of the video duration
+and the boundaries found against the known slide changes.
+
+Run from the EKEELVideoAnnotation folder with `python -m benchmarks.scene_detection`
+
+Functions
+---------
+match_boundaries
+    Count the expected boundaries found by the detector
+run_benchmark
+    Run the detector on a synthetic video and report the results
+"""
+
+import tempfile
+from time import perf_counter
+
+from media.scene import SceneChangeDetector
+from media.features import FrameFeatureStore
+from benchmarks.synthetic import generate_slide_video
+
+
+def match_boundaries(boundaries:'list[tuple[float,float]]', expected_times:'list[float]', max_seconds_dist:float) -> 'tuple[int,int]':
+    """
+    Count the expected boundaries found by the detector.
+
+    Parameters
+    ----------
+    boundaries : list of tuple
+        Time and confidence of the detected boundaries
+    expected_times : list of float
+        Times of the true boundaries
+    max_seconds_dist : float
+        Max distance of a detected boundary from the true one
+
+    Returns
+    -------
+    tuple
+        Number of true boundaries found and number of detected boundaries that match none
+    """
+    detected_times = [b_time for b_time, _ in boundaries]
+    num_found = sum(any(abs(b_time - e_time) <= max_seconds_dist for b_time in detected_times) for e_time in expected_times)
+    num_false = sum(all(abs(b_time - e_time) > max_seconds_dist for e_time in expected_times) for b_time in detected_times)
+    return num_found, num_false
+
+
+def run_benchmark(num_slides:int=40, seconds_per_slide:float=15, opening_seconds:float=4) -> dict:
+    """
+    Run the detector on a synthetic lecture decoding the video and reading the feature store.
+
+    Parameters
+    ----------
+    num_slides : int, optional
+        Number of slides of the synthetic lecture
+    seconds_per_slide : float, optional
+        Seconds every slide stays on screen
+    opening_seconds : float, optional
+        Seconds of opening before the slides
+
+    Returns
+    -------
+    dict
+        Times as fraction of the video duration, boundaries found and false boundaries
+    """
+    folder = tempfile.mkdtemp()
+    generate_slide_video(folder, "synthetic_lecture", num_slides=num_slides, seconds_per_slide=seconds_per_slide,
+                         opening_seconds=opening_seconds)
+    duration = opening_seconds + num_slides*seconds_per_slide
+    expected_times = [opening_seconds/2] if opening_seconds > 0 else []
+    expected_times += [opening_seconds + num_slide*seconds_per_slide for num_slide in range(1 if opening_seconds == 0 else 0, num_slides)]
+    detector = SceneChangeDetector()
+
+    start = perf_counter()
+    boundaries = detector.detect("synthetic_lecture", _testing_path=folder)
+    decode_time = perf_counter() - start
+    num_found, num_false = match_boundaries(boundaries, expected_times, max_seconds_dist=1)
+
+    store = FrameFeatureStore.build("synthetic_lecture", detect_faces=False, _testing_path=folder)
+    start = perf_counter()
+    store_boundaries = detector.detect("synthetic_lecture", store=store, _testing_path=folder)
+    store_time = perf_counter() - start
+    store_found, store_false = match_boundaries(store_boundaries, expected_times, max_seconds_dist=1)
+
+    return {"video_seconds": duration,
+            "expected_boundaries": len(expected_times),
+            "decode_fraction_of_duration": decode_time/duration,
+            "found": num_found,
+            "false": num_false,
+            "store_fraction_of_duration": store_time/duration,
+            "store_found": store_found,
+            "store_false": store_false}
+
+
+if __name__ == '__main__':
+    result = run_benchmark()
+    print(" | ".join(f"{key}: {round(value,4) if isinstance(value,float) else value}" for key,value in result.items()))
@@ -0,0 +1,99 @@
+"""
+Benchmark of the time-sharded slide analysis.
+
+Runs `analyze_slides` on a synthetic EduOpen lecture in the current process and split in time ranges
+over a process pool, reports the wall-clock times and checks that the slides found are the same.
+
+Run from the EKEELVideoAnnotation folder with `python -m benchmarks.sharded_analysis [num_workers]`
+
+Functions
+---------
+compare_slides
+    Check that two slide lists have the same texts and close appearance times
+run_benchmark
+    Run the single-process and the sharded analysis and report the results
+"""
+
+import os
+import tempfile
+from time import perf_counter
+
+from media.segmentation import analyze_slides
+from benchmarks.synthetic import generate_slide_video
+
+
+def compare_slides(slides, other_slides, max_frames_dist:int) -> bool:
+    """
+    Check that two slide lists have the same texts and close appearance times.
+
+    Parameters
+    ----------
+    slides, other_slides : list of VideoSlide
+        Slides to compare
+    max_frames_dist : int
+        Max distance between the start and end frames of the same slide
+
+    Returns
+    -------
+    bool
+        True if the lists match
+    """
+    if len(slides) != len(other_slides):
+        return False
+    for slide, other_slide in zip(slides, other_slides):
+        if slide.get_full_text() != other_slide.get_full_text():
+            return False
+        start, end = slide.start_end_frames[0][0], slide.start_end_frames[-1][1]
+        other_start, other_end = other_slide.start_end_frames[0][0], other_slide.start_end_frames[-1][1]
+        if abs(start - other_start) > max_frames_dist or abs(end - other_end) > max_frames_dist:
+            return False
+    return True
+
+
+def run_benchmark(num_workers:'int | None'=None, num_slides:int=40, seconds_per_slide:float=15) -> dict:
+    """
+    Run the single-process and the sharded analysis on a synthetic lecture.
+
+    Parameters
+    ----------
+    num_workers : int or None, optional
+        Number of processes of the sharded run, all the cores if None
+    num_slides : int, optional
+        Number of slides of the synthetic lecture
+    seconds_per_slide : float, optional
+        Seconds every slide stays on screen
+
+    Returns
+    -------
+    dict
+        Times, speedup and whether the sharded slides match the single-process ones
+    """
+    num_workers = num_workers or os.cpu_count()
+    fps = 25
+    folder = tempfile.mkdtemp()
+    generate_slide_video(folder, "synthetic_lecture", num_slides=num_slides, seconds_per_slide=seconds_per_slide,
+                         fps=fps, opening_seconds=4)
+    min_shard_seconds = num_slides*seconds_per_slide / (2*num_workers)
+
+    start = perf_counter()
+    slides, _ = analyze_slides("synthetic_lecture", num_workers=1, _testing_path=folder)
+    single_time = perf_counter() - start
+
+    start = perf_counter()
+    sharded_slides, _ = analyze_slides("synthetic_lecture", num_workers=num_workers,
+                                       min_shard_seconds=min_shard_seconds, _testing_path=folder)
+    sharded_time = perf_counter() - start
+
+    return {"num_workers": num_workers,
+            "num_slides": len(slides),
+            "single_process_seconds": single_time,
+            "sharded_seconds": sharded_time,
+            "speedup": single_time/sharded_time,
+            # ranges start with a different sampling phase, times can move up to the max step of the analysis
+            "same_slides": compare_slides(slides, sharded_slides, max_frames_dist=fps*10)}
+
+
+if __name__ == '__main__':
+    import sys
+    result = run_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else None)
+    print(" | ".join(f"{key}: {round(value,3) if isinstance(value,float) else value}" for key,value in result.items()))
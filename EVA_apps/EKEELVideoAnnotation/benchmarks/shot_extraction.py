@@ -0,0 +1,63 @@
+"""
+Benchmark of the shot-first slide extraction.
+
+Runs `analyze_slides` on a synthetic EduOpen lecture with the state machine and with one OCR call
+per stable shot, and reports the OCR calls, the wall-clock times and whether the slides found match.
+
+Run from the EKEELVideoAnnotation folder with `python -m benchmarks.shot_extraction`
+
+Functions
+---------
+run_benchmark
+    Run both extraction modes and report the results
+"""
+
+import tempfile
+from time import perf_counter
+
+from media.segmentation import analyze_slides
+from benchmarks.synthetic import generate_slide_video
+from benchmarks.sharded_analysis import compare_slides
+
+
+def run_benchmark(num_slides:int=40, seconds_per_slide:float=15) -> dict:
+    """
+    Run the state machine and the shot-first extraction on a synthetic lecture.
+
+    Parameters
+    ----------
+    num_slides : int, optional
+        Number of slides of the synthetic lecture
+    seconds_per_slide : float, optional
+        Seconds every slide stays on screen
+
+    Returns
+    -------
+    dict
+        OCR calls and times of both modes and whether the slides match
+    """
+    fps = 25
+    folder = tempfile.mkdtemp()
+    generate_slide_video(folder, "synthetic_lecture", num_slides=num_slides, seconds_per_slide=seconds_per_slide,
+                         fps=fps, opening_seconds=4)
+
+    start = perf_counter()
+    slides, ocr_calls = analyze_slides("synthetic_lecture", mode='states', _testing_path=folder)
+    states_time = perf_counter() - start
+
+    start = perf_counter()
+    shot_slides, shots_ocr_calls = analyze_slides("synthetic_lecture", mode='shots', _testing_path=folder)
+    shots_time = perf_counter() - start
+
+    return {"num_slides": len(slides),
+            "states_ocr_calls": ocr_calls,
+            "shots_ocr_calls": shots_ocr_calls,
+            "states_seconds": states_time,
+            "shots_seconds": shots_time,
+            # the state machine moves up to 10 seconds at a time, its boundaries are that late at most
+            "same_slides": compare_slides(slides, shot_slides, max_frames_dist=fps*10)}
+
+
+if __name__ == '__main__':
+    result = run_benchmark()
+    print(" | ".join(f"{key}: {round(value,3) if isinstance(value,float) else value}" for key,value in result.items()))
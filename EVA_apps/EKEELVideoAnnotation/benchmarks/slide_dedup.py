@@ -0,0 +1,171 @@
+"""
+Benchmark of the merge of the duplicated slides.
+
+Builds the slides extracted from synthetic lectures (slides revealed one bullet at a time, slides shown again later,
+OCR errors in the text) and merges them with `SlideDuplicatesIndex` and with the loops it replaced, which call
+`TextSimilarityClassifier.is_partially_in()` on adjacent and then on all the pairs until nothing changes.
+Reports times, comparisons and whether the slides left are the same for lectures of increasing length,
+with the growth exponent of the time (1 is linear, 2 quadratic).
+
+Run from the EKEELVideoAnnotation folder with `python -m benchmarks.slide_dedup [max slides of the loops]`
+
+Functions
+---------
+build_lecture_slides
+    Build the slides extracted from a synthetic lecture
+merge_duplicates_pairwise
+    Merge the slides with the loops on all the pairs
+run_benchmark
+    Merge the slides of lectures of increasing length with both methods and report the results
+"""
+
+import sys
+from math import log
+from random import Random
+from time import perf_counter
+
+from text_processor.words import VideoSlide, TextSimilarityClassifier, SlideDuplicatesIndex, ComparisonMethods
+from utils.itertools import pairwise, double_iterator
+from benchmarks.synthetic import WORDS
+
+
+def build_lecture_slides(num_slides:int=500, frames_per_slide:int=250, revisit_rate:float=0.1,
+                         ocr_error_rate:float=0.01, vocabulary_size:int=2000, seed:int=0) -> 'list[VideoSlide]':
+    """
+    Build the slides extracted from a synthetic lecture, in order of appearance.
+
+    Every slide of the lecture is shown with one to four bullets more at every step,
+    some of them are shown again later and the text read has random character errors.
+
+    Parameters
+    ----------
+    num_slides : int, optional
+        Number of slides extracted
+    frames_per_slide : int, optional
+        Frames every slide extracted stays on screen
+    revisit_rate : float, optional
+        Probability that a slide extracted is a slide already shown
+    ocr_error_rate : float, optional
+        Probability that a character is read wrong
+    vocabulary_size : int, optional
+        Number of words of the lecture
+    seed : int, optional
+        Seed of text and errors
+
+    Returns
+    -------
+    list
+        Slides with the frame range they appear in
+    """
+    rand = Random(seed)
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    # lecture words follow a Zipf distribution over a vocabulary larger than the synthetic slides one
+    vocabulary = WORDS + ["".join(rand.choice("bcdfglmnprstv") + rand.choice("aeiou") for _ in range(rand.randint(2, 4)))
+                          for _ in range(vocabulary_size - len(WORDS))]
+    weights = [1 / rank for rank in range(1, len(vocabulary) + 1)]
+    word = lambda: rand.choices(vocabulary, weights)[0]
+    read = lambda line: "".join(rand.choice(letters) if char.isalpha() and rand.random() < ocr_error_rate else char for char in line)
+    shown = []
+    slides = []
+    num_lecture_slide = 0
+    while len(slides) < num_slides:
+        if shown and rand.random() < revisit_rate:
+            steps = [rand.choice(shown)]
+        else:
+            lines = [f"Slide {num_lecture_slide}: {word().title()} {word().title()}"]
+            lines += ["- " + " ".join(word() for _ in range(rand.randint(3, 7))) for _ in range(rand.randint(2, 8))]
+            num_lecture_slide += 1
+            num_steps = rand.randint(1, 4)
+            steps = [lines[:2 + (len(lines)-2)*(step+1)//num_steps] for step in range(num_steps)]
+            shown.append(lines)
+        for lines in steps[:num_slides - len(slides)]:
+            start = len(slides) * frames_per_slide
+            slides.append(VideoSlide([(read(line) + "\n", (0.05, 0.1 + 0.1*num_line, 0.8, 0.05)) for num_line, line in enumerate(lines)],
+                                     (start, start + frames_per_slide - 1)))
+    return slides
+
+
+def merge_duplicates_pairwise(slides:'list[VideoSlide]', txt_classif:TextSimilarityClassifier) -> 'tuple[list[VideoSlide], int]':
+    """
+    Merge the slides partially contained in other slides with the loops `SlideDuplicatesIndex` replaced
+    (slides are removed by identity, `VideoSlide.__eq__` compares texts).
+
+    Parameters
+    ----------
+    slides : list
+        Slides to deduplicate, merged in place
+    txt_classif : TextSimilarityClassifier
+        Classifier comparing the pairs
+
+    Returns
+    -------
+    tuple
+        Slides left and number of comparisons
+    """
+    slides = list(slides)
+    remove = lambda slide: slides.pop(next(index for index, other in enumerate(slides) if other is slide))
+    num_comparisons = 0
+    changed = True
+    while changed:
+        changed = False
+        for to_reverse in [False, True]:
+            for slide1, slide2 in pairwise(slides, None_tail=False, reversed=to_reverse):
+                if txt_classif.is_partially_in(slide1, slide2):
+                    slide2.merge_frames(slide1)
+                    remove(slide1)
+                    changed = True
+                num_comparisons += 1
+        for slide1, slide2 in double_iterator(slides):
+            if txt_classif.is_partially_in(slide2, slide1):
+                slide1.merge_frames(slide2)
+                remove(slide2)
+                changed = True
+            num_comparisons += 1
+    return slides, num_comparisons
+
+
+def run_benchmark(sizes:'tuple[int,...]'=(50, 100, 200, 500), max_pairwise_slides:int=200) -> 'list[dict]':
+    """
+    Merge the slides of lectures of increasing length with both methods.
+
+    Parameters
+    ----------
+    sizes : tuple, optional
+        Number of slides extracted from every lecture
+    max_pairwise_slides : int, optional
+        Longest lecture merged with the loops on all the pairs as well
+
+    Returns
+    -------
+    list
+        For every lecture, slides left, comparisons and seconds of both methods, whether the texts of the slides left
+        are the same and the growth exponent of the times from the previous lecture
+    """
+    comp_methods = {ComparisonMethods.FUZZY_PARTIAL_RATIO, ComparisonMethods.CHARS_COMMON_DISTRIB}
+    results = []
+    for num_slides in sizes:
+        result = {"num_slides": num_slides}
+        duplicates_index = SlideDuplicatesIndex(TextSimilarityClassifier(comp_methods=comp_methods))
+        slides = build_lecture_slides(num_slides)
+        start = perf_counter()
+        merged = duplicates_index.merge_duplicates(slides)
+        result.update(index_slides=len(merged), index_comparisons=duplicates_index.num_comparisons, index_seconds=perf_counter() - start)
+        if num_slides <= max_pairwise_slides:
+            start = perf_counter()
+            merged_pairwise, num_comparisons = merge_duplicates_pairwise(build_lecture_slides(num_slides),
+                                                                         TextSimilarityClassifier(comp_methods=comp_methods))
+            result.update(pairwise_slides=len(merged_pairwise), pairwise_comparisons=num_comparisons, pairwise_seconds=perf_counter() - start,
+                          # a slide contained in more slides can be merged into a different one
+                          same_slides=sorted(slide.get_full_text() for slide in merged) == sorted(slide.get_full_text() for slide in merged_pairwise))
+        if results:
+            previous = results[-1]
+            for method in ("index", "pairwise"):
+                if method+"_seconds" in result and method+"_seconds" in previous:
+                    result[method+"_growth"] = log(result[method+"_seconds"]/previous[method+"_seconds"]) / log(num_slides/previous["num_slides"])
+        results.append(result)
+    return results
+
+
+if __name__ == '__main__':
+    for result in run_benchmark(max_pairwise_slides=int(sys.argv[1]) if len(sys.argv) > 1 else 200):
+        print(" | ".join(f"{key}: {round(value,3) if isinstance(value,float) else value}" for key,value in result.items()))
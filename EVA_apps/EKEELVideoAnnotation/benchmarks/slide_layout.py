@@ -0,0 +1,128 @@
+"""
+Benchmark of the slide layout.
+
+Renders picture-in-picture lecture frames (presenter camera next to a slide with a static logo and banner)
+and full screen slides with the camera over a corner, finds their `SlideLayout` from pairs of thumbnails as
+`SlideLayout.detect_from_store()` does, then compares the frame analysis with and without the layout:
+pixels processed, slide changes detected by `ImageClassifier.is_same_image()` (true ones and spurious ones
+caused by the moving presenter), text read and time of the text extraction.
+
+Requires the tesseract executable. Run from the EKEELVideoAnnotation folder with `python -m benchmarks.slide_layout`
+
+Functions
+---------
+render_lecture
+    Render the frames of a lecture with a presenter camera
+run_benchmark
+    Find the layout and compare the analysis of the frames with and without it
+"""
+
+import re
+from time import perf_counter
+
+import cv2
+import numpy as np
+
+from media.image import ImageClassifier
+from media.layout import SlideLayout
+from benchmarks.synthetic import render_picture_in_picture, render_talking_head
+
+
+def render_lecture(num_slides:int=12, seconds_per_slide:float=10, sample_fps:float=2, frame_size:'tuple[int,int]'=(1280,720),
+                   camera_over_slide:bool=False) -> 'tuple[list[int],list[np.ndarray]]':
+    """
+    Render the frames of a lecture with a presenter camera.
+
+    Parameters
+    ----------
+    num_slides : int, optional
+        Number of slides
+    seconds_per_slide : float, optional
+        Seconds every slide stays on screen
+    sample_fps : float, optional
+        Frames rendered per second
+    frame_size : tuple, optional
+        Size (width, height) of the frames
+    camera_over_slide : bool, optional
+        Whether the camera is over the bottom right corner of a full screen slide instead of next to the slide
+
+    Returns
+    -------
+    tuple
+        Slide number and BGR image of every frame
+    """
+    width, height = frame_size
+    cam_w, cam_h = width//4, height//3
+    presenter = render_talking_head((cam_w, cam_h), seed=1)
+    slide_nums, frames = [], []
+    for num_frame in range(int(num_slides*seconds_per_slide*sample_fps)):
+        seconds = num_frame / sample_fps
+        slide_num = int(seconds // seconds_per_slide)
+        frame = render_picture_in_picture(slide_num, seconds, frame_size, camera=not camera_over_slide)
+        if camera_over_slide:
+            shift = np.float32([[1, 0, cam_w*0.05*np.sin(seconds*2.1)], [0, 1, cam_h*0.03*np.sin(seconds*3.7)]])
+            frame[height-cam_h-height//40:height-height//40, width-cam_w-width//80:width-width//80] = \
+                cv2.warpAffine(presenter, shift, (cam_w, cam_h), borderMode=cv2.BORDER_REPLICATE)
+        slide_nums.append(slide_num)
+        frames.append(frame)
+    return slide_nums, frames
+
+
+def run_benchmark(camera_over_slide:bool=False, num_samples:int=32, thumbnail_size:'tuple[int,int]'=(160,90)) -> dict:
+    """
+    Find the layout of a synthetic lecture and compare the analysis of its frames with and without it.
+
+    Parameters
+    ----------
+    camera_over_slide : bool, optional
+        Whether the camera is over a corner of a full screen slide instead of next to the slide
+    num_samples : int, optional
+        Number of pairs of thumbnails the layout is found from
+    thumbnail_size : tuple, optional
+        Size (width, height) of the thumbnails
+
+    Returns
+    -------
+    dict
+        Layout, fraction of the pixels analyzed, true and spurious slide changes, words of the overlays read
+        and milliseconds per frame of the text extraction, without and with the layout
+    """
+    slide_nums, frames = render_lecture(camera_over_slide=camera_over_slide)
+    thumbnails = np.stack([cv2.cvtColor(cv2.resize(frame, thumbnail_size, interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+                           for frame in frames])
+    rows = np.unique(np.linspace(0, len(thumbnails)-2, num_samples).astype(int))
+    start = perf_counter()
+    layout = SlideLayout.detect(thumbnails[rows], thumbnails[rows+1])
+    result = {"slide_box": [round(coord, 3) for coord in layout.slide_box],
+              "masked_boxes": [[round(coord, 3) for coord in box] for box in layout.masked_boxes],
+              "detection_ms": (perf_counter() - start) * 1000}
+    x0, y0, x1, y1 = layout.get_slide_rect(frames[0].shape[1], frames[0].shape[0])
+    result["analyzed_pixels"] = (x1-x0)*(y1-y0) / (frames[0].shape[0]*frames[0].shape[1])
+
+    ocr_cache = ImageClassifier.get_ocr_cache()
+    ImageClassifier.set_ocr_cache(None)
+    for name, frame_layout in (("full", None), ("layout", layout)):
+        true_changes = spurious_changes = 0
+        for num_frame in range(1, len(frames)):
+            changed = not ImageClassifier(frames[num_frame]).set_layout(frame_layout).is_same_image(
+                          ImageClassifier(frames[num_frame-1]).set_layout(frame_layout))
+            true_changes += changed and slide_nums[num_frame] != slide_nums[num_frame-1]
+            spurious_changes += changed and slide_nums[num_frame] == slide_nums[num_frame-1]
+        result[name+"_true_changes"] = true_changes
+        result[name+"_spurious_changes"] = spurious_changes
+        # one frame per slide is read
+        start = perf_counter()
+        texts = [ImageClassifier(frames[num_frame]).set_layout(frame_layout).extract_text(return_text=True)
+                 for num_frame in range(0, len(frames), len(frames)//max(slide_nums[-1]+1, 1))]
+        result[name+"_ocr_ms"] = (perf_counter() - start) / len(texts) * 1000
+        result[name+"_overlay_words"] = sum(len(re.findall(r'UNIV|Course', text)) for text in texts)
+        result[name+"_slide_titles"] = sum(len(re.findall(r'Slide\s*\d+', text)) for text in texts)
+    ImageClassifier.set_ocr_cache(ocr_cache)
+    result["num_slide_changes"] = len(set(slide_nums)) - 1
+    return result
+
+
+if __name__ == '__main__':
+    for camera_over_slide in (False, True):
+        result = run_benchmark(camera_over_slide)
+        print(" | ".join(f"{key}: {round(value,3) if isinstance(value,float) else value}" for key,value in result.items()))
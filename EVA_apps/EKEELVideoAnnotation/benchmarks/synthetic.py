@@ -0,0 +1,260 @@
+"""
+Synthetic lecture videos for benchmarks.
+
+Generates MP4 files that mimic slide lectures (static slides with text that change
+every few seconds) in the folder layout expected by `LocalVideo` and `SimpleVideo`
+(`<folder>/<video_id>.mp4`), so that the media pipeline can be measured without downloads.
+
+Functions
+---------
+generate_slide_video
+    Write a synthetic slide lecture to an MP4 file
+render_slide
+    Render a single slide with text lines
+render_opening
+    Render the EduOpen opening screen
+render_talking_head
+    Render a frame of a speaker without slides
+render_picture_in_picture
+    Render a frame of a slide with a logo and a banner, optionally next to the presenter camera
+"""
+
+import subprocess
+from shutil import which
+from pathlib import Path
+from random import Random
+
+import cv2
+import numpy as np
+
+WORDS = ("gradient descent convergence matrix vector eigenvalue entropy network "
+         "layer function derivative integral probability variance estimator kernel "
+         "graph node edge tree search sorting complexity memory cache thread").split()
+
+
+def render_slide(slide_num:int, frame_size:'tuple[int,int]'=(1280,720), num_lines:int=5, seed:int=0):
+    """
+    Render a single slide with a title and bullet lines of text.
+
+    Parameters
+    ----------
+    slide_num : int
+        Number of the slide, printed in the title
+    frame_size : tuple, optional
+        Size (width, height) of the slide
+    num_lines : int, optional
+        Number of bullet lines under the title
+    seed : int, optional
+        Seed for the random words of the lines
+
+    Returns
+    -------
+    ndarray
+        BGR image of the slide
+    """
+    width, height = frame_size
+    rand = Random(seed*1000+slide_num)
+    image = np.full((height, width, 3), 245, dtype=np.uint8)
+    scale = height / 720
+    cv2.putText(image, f"Slide {slide_num}: {rand.choice(WORDS).title()}", (int(60*scale), int(90*scale)),
+                cv2.FONT_HERSHEY_SIMPLEX, 1.6*scale, (40, 40, 40), max(1, int(3*scale)))
+    for line in range(num_lines):
+        text = "- " + " ".join(rand.choice(WORDS) for _ in range(rand.randint(3, 6)))
+        cv2.putText(image, text, (int(80*scale), int((190+line*90)*scale)),
+                    cv2.FONT_HERSHEY_SIMPLEX, 1.1*scale, (20, 20, 20), max(1, int(2*scale)))
+    return image
+
+
+def render_opening(frame_size:'tuple[int,int]'=(1280,720)):
+    """
+    Render the opening screen of EduOpen lectures, searched by `VideoAnalyzer.analyze_video()`.
+
+    Parameters
+    ----------
+    frame_size : tuple, optional
+        Size (width, height) of the screen
+
+    Returns
+    -------
+    ndarray
+        BGR image of the opening
+    """
+    width, height = frame_size
+    image = np.full((height, width, 3), (120, 60, 20), dtype=np.uint8)
+    scale = height / 720
+    cv2.putText(image, "eduopen", (int(width/2-260*scale), int(height/2+30*scale)),
+                cv2.FONT_HERSHEY_SIMPLEX, 3*scale, (255, 255, 255), max(1, int(6*scale)))
+    return image
+
+
+def render_talking_head(frame_size:'tuple[int,int]'=(1280,720), caption:'str | None'=None, seed:int=0):
+    """
+    Render a frame of a speaker in front of a shaded background, optionally with a caption at the bottom.
+
+    Parameters
+    ----------
+    frame_size : tuple, optional
+        Size (width, height) of the frame
+    caption : str or None, optional
+        Text of the caption, no caption if None
+    seed : int, optional
+        Seed for position, colors and noise of the speaker
+
+    Returns
+    -------
+    ndarray
+        BGR image of the frame
+    """
+    width, height = frame_size
+    rand = np.random.default_rng(seed)
+    scale = height / 720
+    background = rand.integers(40, 200, 3)
+    shading = np.linspace(0.6, 1.2, width)[None,:,None]
+    image = np.clip(np.broadcast_to(background, (height, width, 3)) * shading, 0, 255).astype(np.uint8)
+    center_x = int(width * rand.uniform(0.3, 0.7))
+    # shoulders, face and hair
+    cv2.ellipse(image, (center_x, height), (int(300*scale), int(260*scale)), 0, 180, 360,
+                tuple(int(c) for c in rand.integers(20, 120, 3)), -1)
+    cv2.ellipse(image, (center_x, int(330*scale)), (int(110*scale), int(145*scale)), 0, 0, 360, (120, 150, 200), -1)
+    cv2.ellipse(image, (center_x, int(250*scale)), (int(115*scale), int(80*scale)), 0, 180, 360,
+                tuple(int(c) for c in rand.integers(10, 60, 3)), -1)
+    for eye_offset in (-40, 40):
+        cv2.circle(image, (center_x + int(eye_offset*scale), int(310*scale)), max(1, int(8*scale)), (40, 40, 40), -1)
+    image = cv2.add(cv2.GaussianBlur(image, (0, 0), 3*scale), rand.integers(0, 6, image.shape, dtype=np.uint8))
+    if caption is not None:
+        cv2.rectangle(image, (0, int(height-110*scale)), (width, int(height-40*scale)), (30, 30, 30), -1)
+        cv2.putText(image, caption, (int(60*scale), int(height-62*scale)), cv2.FONT_HERSHEY_SIMPLEX, 1.2*scale,
+                    (240, 240, 240), max(1, int(2*scale)))
+    return image
+
+
+def render_picture_in_picture(slide_num:int, seconds:float, frame_size:'tuple[int,int]'=(1280,720), camera:bool=True, seed:int=0):
+    """
+    Render a frame of a slide with a static logo and banner, next to a presenter camera if `camera`.
+
+    The camera panel takes the left third of the frame and the presenter moves in it with time,
+    otherwise the slide fills the frame.
+
+    Parameters
+    ----------
+    slide_num : int
+        Number of the slide, see `render_slide()`
+    seconds : float
+        Time of the frame, moves the presenter
+    frame_size : tuple, optional
+        Size (width, height) of the frame
+    camera : bool, optional
+        Whether the frame has the presenter camera
+    seed : int, optional
+        Seed for text, presenter and noise
+
+    Returns
+    -------
+    ndarray
+        BGR image of the frame
+    """
+    width, height = frame_size
+    image = np.full((height, width, 3), 50, dtype=np.uint8)
+    if camera:
+        cam_w, cam_h = int(width*0.3), int(height*0.4)
+        presenter = render_talking_head((cam_w, cam_h), seed=seed)
+        shift = np.float32([[1, 0, cam_w*0.06*np.sin(seconds*2.1)], [0, 1, cam_h*0.03*np.sin(seconds*3.7)]])
+        image[int(height*0.1):int(height*0.1)+cam_h, int(width*0.01):int(width*0.01)+cam_w] = \
+            cv2.warpAffine(presenter, shift, (cam_w, cam_h), borderMode=cv2.BORDER_REPLICATE)
+        slide_x, slide_y, slide_w, slide_h = int(width*0.33), int(height*0.12), int(width*0.66), int(height*0.66)
+    else:
+        slide_x, slide_y, slide_w, slide_h = 0, 0, width, height
+    slide = render_slide(slide_num, (slide_w, slide_h), seed=seed)
+    scale = slide_h / 720
+    # logo in the top right corner and banner at the bottom, the same in every frame
+    cv2.rectangle(slide, (int(slide_w-230*scale), int(20*scale)), (int(slide_w-20*scale), int(110*scale)), (160, 90, 30), -1)
+    cv2.putText(slide, "UNIV", (int(slide_w-210*scale), int(90*scale)), cv2.FONT_HERSHEY_SIMPLEX, 2*scale, (255, 255, 255), max(1, int(4*scale)))
+    cv2.rectangle(slide, (0, int(slide_h-70*scale)), (slide_w, slide_h), (90, 40, 20), -1)
+    cv2.putText(slide, "Course of Machine Learning - Lecture 3", (int(40*scale), int(slide_h-22*scale)),
+                cv2.FONT_HERSHEY_SIMPLEX, 1.1*scale, (255, 255, 255), max(1, int(2*scale)))
+    image[slide_y:slide_y+slide_h, slide_x:slide_x+slide_w] = slide
+    noise = np.random.default_rng(seed*1000003 + int(seconds*1000)).integers(0, 3, image.shape, dtype=np.uint8)
+    return cv2.add(image, noise)
+
+
+def generate_slide_video(folder:'str | Path', video_id:str, num_slides:int=20, seconds_per_slide:float=6,
+                         fps:int=25, frame_size:'tuple[int,int]'=(1280,720), gop_size:int=250, noise:int=2,
+                         opening_seconds:float=0, seed:int=0) -> Path:
+    """
+    Write a synthetic slide lecture to `<folder>/<video_id>.mp4`.
+
+    Frames are encoded with H.264 and a long GOP through ffmpeg when it is installed,
+    to reproduce the keyframe spacing of real lectures, otherwise with OpenCV's MPEG-4 writer.
+    A small amount of noise is added to every frame to mimic compression artifacts.
+
+    Parameters
+    ----------
+    folder : str or Path
+        Destination folder, created if missing
+    video_id : str
+        Name of the video file without extension
+    num_slides : int, optional
+        Number of slides
+    seconds_per_slide : float, optional
+        Seconds every slide stays on screen
+    fps : int, optional
+        Frames per second
+    frame_size : tuple, optional
+        Size (width, height) of the frames
+    gop_size : int, optional
+        Max distance between two keyframes (ffmpeg only)
+    noise : int, optional
+        Max absolute noise added to the pixels
+    opening_seconds : float, optional
+        Seconds of EduOpen opening (blank screen then logo) before the slides
+    seed : int, optional
+        Seed for text and noise
+
+    Returns
+    -------
+    Path
+        Path of the generated file
+    """
+    folder = Path(folder)
+    folder.mkdir(parents=True, exist_ok=True)
+    output_path = folder.joinpath(video_id+".mp4")
+    width, height = frame_size
+    frames_per_slide = int(seconds_per_slide*fps)
+    noise_gen = np.random.default_rng(seed)
+
+    if which("ffmpeg") is not None:
+        writer = subprocess.Popen(['ffmpeg', '-y', '-loglevel', 'error',
+                                   '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-s', f'{width}x{height}', '-r', str(fps), '-i', '-',
+                                   '-c:v', 'libx264', '-preset', 'veryfast', '-g', str(gop_size), '-pix_fmt', 'yuv420p',
+                                   output_path.__str__()],
+                                  stdin=subprocess.PIPE)
+        write = lambda frame: writer.stdin.write(frame.tobytes())
+    else:
+        writer = cv2.VideoWriter(output_path.__str__(), cv2.VideoWriter_fourcc(*'mp4v'), fps, frame_size)
+        write = writer.write
+
+    screens = []
+    if opening_seconds > 0:
+        # the logo appears in the second half, after a blank screen, like the animated opening
+        screens += [(np.full((height, width, 3), 255, dtype=np.uint8), int(opening_seconds*fps/2)),
+                    (render_opening(frame_size), int(opening_seconds*fps) - int(opening_seconds*fps/2))]
+    screens += [(render_slide(slide_num, frame_size, seed=seed), frames_per_slide) for slide_num in range(num_slides)]
+    for slide, num_frames in screens:
+        for _ in range(num_frames):
+            if noise > 0:
+                frame = cv2.add(slide, noise_gen.integers(0, noise+1, slide.shape, dtype=np.uint8))
+            else:
+                frame = slide
+            write(frame)
+
+    if isinstance(writer, subprocess.Popen):
+        writer.stdin.close()
+        if writer.wait() != 0:
+            raise Exception("ERROR SUBPROCESS FFMPEG")
+    else:
+        writer.release()
+    return output_path
+
+
+if __name__ == '__main__':
+    print(generate_slide_video(Path(__file__).parent.joinpath("videos","synthetic_slides"), "synthetic_slides"))
@@ -0,0 +1,174 @@
+"""
+Benchmark and calibration of the text likelihood pre-filter of `ImageClassifier`.
+
+Labels a set of frames with the OCR output (a frame has text if OCR reads a word of at least 3 letters or digits),
+then reports precision and recall of the pre-filter at the threshold used by `extract_text(use_prefilter=True)`, the OCR calls
+it skips and the threshold that keeps the recall requested.\n
+The frame set is made of synthetic frames of the kinds found in lectures (slides, titles, EduOpen opening,
+speakers with and without captions, black transitions, fades, blurred transitions, blank screens) and,
+optionally, of the images (.png, .jpg) of a local folder.
+
+Requires the tesseract executable. Run from the EKEELVideoAnnotation folder with `python -m benchmarks.text_prefilter [frames folder]`
+
+Functions
+---------
+build_frame_set
+    Render the synthetic frames
+load_frame_set
+    Load the images of a folder
+calibrate_threshold
+    Highest threshold that keeps a min recall
+run_benchmark
+    Label the frames with OCR and report precision and recall of the pre-filter
+"""
+
+import re
+import sys
+from pathlib import Path
+from time import perf_counter
+
+import cv2
+import numpy as np
+
+from media.image import ImageClassifier, TEXT_LIKELIHOOD_THRESHOLD
+from benchmarks.synthetic import render_slide, render_opening, render_talking_head, WORDS
+
+
+def build_frame_set(num_frames_per_kind:int=8, frame_size:'tuple[int,int]'=(1280,720), seed:int=0) -> 'list[tuple[str,np.ndarray]]':
+    """
+    Render synthetic frames of the kinds found in lectures.
+
+    Parameters
+    ----------
+    num_frames_per_kind : int, optional
+        Number of frames of every kind
+    frame_size : tuple, optional
+        Size (width, height) of the frames
+    seed : int, optional
+        Seed of text, colors and noise
+
+    Returns
+    -------
+    list
+        Kind and BGR image of every frame
+    """
+    width, height = frame_size
+    rand = np.random.default_rng(seed)
+    noise = lambda image: cv2.add(image, rand.integers(0, 4, image.shape, dtype=np.uint8))
+    frames = []
+    for num in range(num_frames_per_kind):
+        frame_seed = seed*1000 + num
+        frames += [("slide", noise(render_slide(num, frame_size, num_lines=int(rand.integers(1, 6)), seed=seed))),
+                   ("title", noise(render_slide(num, frame_size, num_lines=0, seed=seed))),
+                   ("opening", noise(render_opening(frame_size))),
+                   ("caption", render_talking_head(frame_size, caption=" ".join(rand.choice(WORDS, 3)).title(), seed=frame_seed)),
+                   ("talking_head", render_talking_head(frame_size, seed=frame_seed)),
+                   ("black", noise(np.zeros((height, width, 3), dtype=np.uint8))),
+                   ("blank", noise(np.full((height, width, 3), 245, dtype=np.uint8))),
+                   ("fade", (render_slide(num, frame_size, seed=seed) * rand.uniform(0.02, 0.3)).astype(np.uint8)),
+                   ("blur", cv2.GaussianBlur(render_slide(num, frame_size, seed=seed), (0, 0), rand.uniform(2, 10)))]
+    return frames
+
+
+def load_frame_set(folder:'str | Path') -> 'list[tuple[str,np.ndarray]]':
+    """
+    Load the images of a folder and of its subfolders.
+
+    Parameters
+    ----------
+    folder : str or Path
+        Folder of the images
+
+    Returns
+    -------
+    list
+        Name of the parent folder and BGR image of every frame
+    """
+    return [(path.parent.name, cv2.imread(path.__str__()))
+            for path in sorted(Path(folder).rglob("*")) if path.suffix.lower() in (".png", ".jpg", ".jpeg")]
+
+
+def calibrate_threshold(likelihoods:np.ndarray, labels:np.ndarray, min_recall:float=1.) -> float:
+    """
+    Highest threshold of the likelihood that passes at least `min_recall` of the frames with text.
+
+    Parameters
+    ----------
+    likelihoods : ndarray
+        Text likelihood of every frame
+    labels : ndarray
+        Whether OCR reads text in every frame
+    min_recall : float, optional
+        Min fraction of the frames with text that must be read
+
+    Returns
+    -------
+    float
+        Threshold, 0 if the frames with text are not separable
+    """
+    positives = np.sort(likelihoods[labels])
+    if len(positives) == 0:
+        return 0.
+    return float(positives[int(np.floor(len(positives)*(1-min_recall)))])
+
+
+def run_benchmark(frames_folder:'str | Path | None'=None, num_frames_per_kind:int=8,
+                  frame_size:'tuple[int,int]'=(1280,720), min_recall:float=0.95) -> dict:
+    """
+    Label the frames with OCR and measure the pre-filter against the labels.
+
+    Parameters
+    ----------
+    frames_folder : str or Path or None, optional
+        Folder of local frames added to the synthetic ones
+    num_frames_per_kind : int, optional
+        Number of synthetic frames of every kind
+    frame_size : tuple, optional
+        Size (width, height) of the synthetic frames
+    min_recall : float, optional
+        Recall kept by the calibrated threshold
+
+    Returns
+    -------
+    dict
+        Precision, recall and skipped OCR calls at the threshold of `extract_text()`, calibrated threshold,
+        times of pre-filter and OCR and, for every kind of frame, number of frames, frames with text and frames passed
+    """
+    frames = build_frame_set(num_frames_per_kind, frame_size)
+    if frames_folder is not None:
+        frames += load_frame_set(frames_folder)
+
+    # labels are the plain OCR output
+    ocr_cache = ImageClassifier.get_ocr_cache()
+    ImageClassifier.set_ocr_cache(None)
+    likelihoods, labels = [], []
+    prefilter_time = ocr_time = 0
+    for _, image in frames:
+        start = perf_counter()
+        likelihoods.append(ImageClassifier(image).get_text_likelihood())
+        prefilter_time += perf_counter() - start
+        start = perf_counter()
+        labels.append(re.search(r'[A-Za-z0-9]{3}', ImageClassifier(image).extract_text(return_text=True)) is not None)
+        ocr_time += perf_counter() - start
+    ImageClassifier.set_ocr_cache(ocr_cache)
+
+    likelihoods, labels = np.array(likelihoods), np.array(labels)
+    passed = likelihoods >= TEXT_LIKELIHOOD_THRESHOLD
+    result = {"num_frames": len(frames),
+              "threshold": TEXT_LIKELIHOOD_THRESHOLD,
+              "precision": np.count_nonzero(passed & labels) / max(np.count_nonzero(passed), 1),
+              "recall": np.count_nonzero(passed & labels) / max(np.count_nonzero(labels), 1),
+              "skipped_ocr": np.count_nonzero(~passed) / len(frames),
+              "calibrated_threshold": calibrate_threshold(likelihoods, labels, min_recall),
+              "prefilter_ms": prefilter_time / len(frames) * 1000,
+              "ocr_ms": ocr_time / len(frames) * 1000}
+    kinds = np.array([kind for kind, _ in frames])
+    for kind in dict.fromkeys(kinds):
+        in_kind = kinds == kind
+        result[kind] = f"{np.count_nonzero(in_kind)} frames, {np.count_nonzero(labels & in_kind)} with text, {np.count_nonzero(passed & in_kind)} passed"
+    return result
+
+
+if __name__ == '__main__':
+    result = run_benchmark(sys.argv[1] if len(sys.argv) > 1 else None)
+    print("\n".join(f"{key}: {round(value,3) if isinstance(value,float) else value}" for key,value in result.items()))
@@ -0,0 +1,199 @@
+"""
+Benchmark and regression check of the slide comparisons of `TextSimilarityClassifier`.
+
+Builds a regression set of pairs of slides (slides of synthetic lectures read with increasing OCR errors, their
+truncated and edited copies, compared with the slides close in time and with random ones) and compares the decisions
+and the time of `is_partially_in()` and `are_cosine_similar()`, which use the representations cached by the slides
+and reject most pairs with cheap bounds, with the computation from scratch they replaced.
+
+Run from the EKEELVideoAnnotation folder with `python -m benchmarks.text_similarity [num random pairs]`
+
+Functions
+---------
+build_regression_pairs
+    Build the slides and the pairs of the regression set
+is_partially_in_reference
+    Containment check computed from scratch
+are_cosine_similar_reference
+    Words cosine similarity computed from scratch
+run_benchmark
+    Compare the decisions and the times of both computations on the regression set
+"""
+
+import sys
+from collections import Counter
+from difflib import ndiff
+from random import Random
+from time import perf_counter
+
+import numpy as np
+from fuzzywuzzy.fuzz import partial_ratio
+from sklearn.metrics.pairwise import cosine_similarity
+
+from text_processor.words import VideoSlide, TextSimilarityClassifier, TextCleaner, ComparisonMethods
+from benchmarks.slide_dedup import build_lecture_slides
+
+
+def build_regression_pairs(num_random_pairs:int=5000, seed:int=0) -> 'tuple[list[VideoSlide], list[tuple[int,int]]]':
+    """
+    Build the slides and the pairs of the regression set.
+
+    Parameters
+    ----------
+    num_random_pairs : int, optional
+        Number of random pairs added to the pairs of slides close in the list
+    seed : int, optional
+        Seed of the slides and of the pairs
+
+    Returns
+    -------
+    tuple
+        Slides and pairs of indices of the slides compared
+    """
+    rand = Random(seed)
+    slides = []
+    for num_error_rate, ocr_error_rate in enumerate((0, 0.01, 0.03, 0.06)):
+        slides += build_lecture_slides(60, ocr_error_rate=ocr_error_rate, seed=seed*10 + num_error_rate)
+    # parts of the slides read with more errors, the pairs close to the thresholds
+    for slide in rand.sample(slides, 60):
+        text = slide.get_full_text()
+        for edit_rate in (0, 0.05, 0.1):
+            part = text[:rand.randint(1, len(text))]
+            part = "".join(rand.choice("abcdexyz ") if rand.random() < edit_rate else char for char in part)
+            slides.append(VideoSlide([(part, (0, 0, 1, 1))], (0, 1)))
+    slides += [VideoSlide([(text, (0, 0, 1, 1))], (0, 1)) for text in ("", "a", "!!")]
+
+    pairs = {(index, other) for index in range(len(slides)) for other in range(max(0, index-6), min(len(slides), index+7)) if other != index}
+    pairs.update((rand.randrange(len(slides)), rand.randrange(len(slides))) for _ in range(num_random_pairs))
+    return slides, sorted(pairs)
+
+
+def is_partially_in_reference(txt_classif:TextSimilarityClassifier, slide1:VideoSlide, slide2:VideoSlide) -> bool:
+    """
+    Check if the text of a slide is partially in another computing every enabled method from scratch,
+    as `TextSimilarityClassifier.is_partially_in()` did before the cached representations (methods but the lemmas one).
+
+    Parameters
+    ----------
+    txt_classif : TextSimilarityClassifier
+        Classifier with the methods and the thresholds
+    slide1 : VideoSlide
+        Slide whose text is looked for
+    slide2 : VideoSlide
+        Slide whose text is looked in
+
+    Returns
+    -------
+    bool
+        True if the text of the first slide is part of the text of the second
+    """
+    comp_methods = txt_classif._comp_methods
+    text1, text2 = slide1.get_full_text(), slide2.get_full_text()
+    cleaner = TextCleaner()
+    text1_cleaned, text2_cleaned = cleaner.clean_text(text1), cleaner.clean_text(text2)
+    if not (text1 and text2 and len(text1_cleaned) < len(text2_cleaned)):
+        return False
+    if ComparisonMethods.FUZZY_PARTIAL_RATIO in comp_methods:
+        fuzz_ratio = partial_ratio(text1_cleaned, text2_cleaned)/100
+        if not fuzz_ratio > txt_classif.fuzz_ratio_thresh:
+            return False
+    if ComparisonMethods.TXT_SIM_RATIO in comp_methods or ComparisonMethods.TXT_MISS_RATIO in comp_methods:
+        counter = Counter([change[0] for change in ndiff(text1_cleaned, text2_cleaned)])
+        removed_chars_count, common_chars_count, added_chars_count = counter['-'], counter[' '], counter['+']
+        diffs_len = removed_chars_count + common_chars_count + added_chars_count
+    if ComparisonMethods.TXT_SIM_RATIO in comp_methods and \
+        not (diffs_len > 0 and removed_chars_count/diffs_len < txt_classif.removed_chars_diff_ratio_thresh and
+             common_chars_count/len(text1_cleaned) > txt_classif.common_chars_txt_ratio_thresh and
+             added_chars_count/diffs_len < txt_classif.added_chars_diff_ratio_thresh):
+        return False
+    if ComparisonMethods.TXT_MISS_RATIO in comp_methods and \
+        not removed_chars_count/len(text1_cleaned) < txt_classif.removed_chars_txt_ratio_thresh:
+        return False
+    if ComparisonMethods.CHARS_COMMON_DISTRIB in comp_methods:
+        counts1, counts2 = Counter(text1_cleaned), Counter(text2_cleaned)
+        counts1.pop(" ", 0); counts2.pop(" ", 0)
+        keys = sorted(set(counts1.keys()).union(counts2.keys()))
+        cosine_sim = cosine_similarity([np.array([counts1[key] for key in keys])], [np.array([counts2[key] for key in keys])])[0][0]
+        if not (cosine_sim > txt_classif.cosine_sim_thresh or
+                (ComparisonMethods.FUZZY_PARTIAL_RATIO in comp_methods and fuzz_ratio > 0.95)):
+            return False
+    return True
+
+
+def are_cosine_similar_reference(text1:str, text2:str, confidence:float) -> bool:
+    """
+    Words cosine similarity of `TextSimilarityClassifier.are_cosine_similar()` computed with numpy from scratch.
+
+    Parameters
+    ----------
+    text1 : str
+        First text
+    text2 : str
+        Second text
+    confidence : float
+        Min similarity
+
+    Returns
+    -------
+    bool
+        True if the texts are similar
+    """
+    cleaner = TextCleaner()
+    split1, split2 = cleaner.clean_text(text1).split(), cleaner.clean_text(text2).split()
+    max_len = max(len(split1), len(split2))
+    if min(len(split1), len(split2)) == 0:
+        return False
+    words_dict = {word: value for value, word in enumerate(sorted(set(split1 + split2)), start=1)}
+    texts_vectorized = np.zeros((2, max_len), dtype=int)
+    texts_vectorized[0, :len(split1)] = [words_dict[word] for word in split1]
+    texts_vectorized[1, :len(split2)] = [words_dict[word] for word in split2]
+    return np.sum(np.prod(texts_vectorized, axis=0))/np.prod(np.linalg.norm(texts_vectorized, axis=1)) > confidence
+
+
+def run_benchmark(num_random_pairs:int=5000) -> 'list[dict]':
+    """
+    Compare the decisions and the times of the cached comparisons and of the ones from scratch on the regression set.
+
+    Parameters
+    ----------
+    num_random_pairs : int, optional
+        Number of random pairs of the regression set
+
+    Returns
+    -------
+    list
+        For every comparison (methods of `is_partially_in()` used by the analysis and the default ones,
+        cosine similarity of `VideoSlide.__eq__()`) pairs, positive pairs, different decisions and times
+    """
+    slides, pairs = build_regression_pairs(num_random_pairs)
+    comparisons = {"fuzzy+chars_distrib": {ComparisonMethods.FUZZY_PARTIAL_RATIO, ComparisonMethods.CHARS_COMMON_DISTRIB},
+                   "default": None,
+                   "all_but_words_and_lemmas": {ComparisonMethods.FUZZY_PARTIAL_RATIO, ComparisonMethods.CHARS_COMMON_DISTRIB,
+                                                ComparisonMethods.TXT_SIM_RATIO, ComparisonMethods.TXT_MISS_RATIO}}
+    results = []
+    for name, comp_methods in comparisons.items():
+        txt_classif = TextSimilarityClassifier(comp_methods=comp_methods)
+        start = perf_counter()
+        reference = [is_partially_in_reference(txt_classif, slides[index], slides[other]) for index, other in pairs]
+        reference_time = perf_counter() - start
+        start = perf_counter()
+        decisions = [txt_classif.is_partially_in(slides[index], slides[other]) for index, other in pairs]
+        results.append({"comparison": name, "pairs": len(pairs), "positives": int(np.count_nonzero(reference)),
+                        "different": int(np.count_nonzero(np.array(reference) != np.array(decisions))),
+                        "reference_seconds": reference_time, "cached_seconds": perf_counter() - start})
+
+    txt_classif = TextSimilarityClassifier()
+    start = perf_counter()
+    reference = [are_cosine_similar_reference(slides[index].get_full_text(), slides[other].get_full_text(), 0.8) for index, other in pairs]
+    reference_time = perf_counter() - start
+    start = perf_counter()
+    decisions = [txt_classif.are_cosine_similar(slides[index], slides[other], confidence=0.8) for index, other in pairs]
+    results.append({"comparison": "cosine_words", "pairs": len(pairs), "positives": int(np.count_nonzero(reference)),
+                    "different": int(np.count_nonzero(np.array(reference) != np.array(decisions))),
+                    "reference_seconds": reference_time, "cached_seconds": perf_counter() - start})
+    return results
+
+
+if __name__ == '__main__':
+    for result in run_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 5000):
+        print(" | ".join(f"{key}: {round(value,3) if isinstance(value,float) else value}" for key,value in result.items()))
@@ -0,0 +1,171 @@
+"""
+Benchmark of the transcription backends.
+
+Transcribes a local reference set of recordings with every configuration of backend, model size and compute type
+(see `transcribe.get_transcription_options()`) and reports the seconds to load the model, the real-time factor
+(seconds of transcription per second of audio, below 1 is faster than real time) and the word error rate
+against the reference transcripts.\n
+The reference set is a folder of audio (or video) files, each one with its reference transcript in a .txt file
+with the same name. Texts are compared lowercase, without punctuation.
+
+Requires the backends benchmarked and ffmpeg. Run from the EKEELVideoAnnotation folder with
+`python -m benchmarks.transcription_backends [reference folder]`
+
+Functions
+---------
+normalize_words
+    Split a text in lowercase words without punctuation
+word_error_rate
+    Word edit distance between a reference and a hypothesis
+load_reference_set
+    Load the recordings and reference transcripts of a folder
+run_benchmark
+    Transcribe the reference set with every configuration and report speed and quality
+"""
+
+import re
+import sys
+from pathlib import Path
+from time import perf_counter
+
+import numpy as np
+
+from media.audio import PCMAudioStream
+from transcribe import get_transcription_options, load_transcription_backend, transcribe_in_windows, \
+                       TRANSCRIPTION_BACKEND_STABLE_WHISPER, TRANSCRIPTION_BACKEND_FASTER_WHISPER
+
+AUDIO_EXTENSIONS = (".wav", ".mp3", ".flac", ".ogg", ".m4a", ".mp4")
+
+CONFIGURATIONS = ({"backend": TRANSCRIPTION_BACKEND_STABLE_WHISPER, "model_size": "large-v3", "compute_type": None},
+                  {"backend": TRANSCRIPTION_BACKEND_FASTER_WHISPER, "model_size": "large-v3", "compute_type": "int8"},
+                  {"backend": TRANSCRIPTION_BACKEND_FASTER_WHISPER, "model_size": "medium", "compute_type": "int8"},
+                  {"backend": TRANSCRIPTION_BACKEND_FASTER_WHISPER, "model_size": "small", "compute_type": "int8"})
+
+
+def normalize_words(text:str) -> 'list[str]':
+    """
+    Split a text in lowercase words, without punctuation (apostrophes split words).
+
+    Parameters
+    ----------
+    text : str
+        Text to split
+
+    Returns
+    -------
+    list
+        Words of the text
+    """
+    return re.findall(r"\w+", text.lower())
+
+
+def word_error_rate(reference:'list[str]', hypothesis:'list[str]') -> 'tuple[int,int]':
+    """
+    Word edit distance (substitutions, deletions and insertions) between a reference and a hypothesis.
+
+    The distance is computed one row of the edit matrix at a time, insertions of a row with a cumulative minimum,
+    so long transcripts take O(len(reference)) numpy operations.
+
+    Parameters
+    ----------
+    reference : list
+        Words of the reference
+    hypothesis : list
+        Words of the hypothesis
+
+    Returns
+    -------
+    tuple
+        Number of edits and number of words of the reference (the WER is their ratio)
+    """
+    vocabulary = {word: i for i, word in enumerate(dict.fromkeys(reference + hypothesis))}
+    hypothesis_ids = np.array([vocabulary[word] for word in hypothesis], dtype=np.int64)
+    positions = np.arange(len(hypothesis)+1)
+    row = positions.copy()
+    for word in reference:
+        candidates = np.empty_like(row)
+        candidates[0] = row[0] + 1
+        # substitution (or match) from the diagonal, deletion from above
+        candidates[1:] = np.minimum(row[:-1] + (hypothesis_ids != vocabulary[word]), row[1:] + 1)
+        # insertion from the left: row[j] = min over k <= j of candidates[k] + (j - k)
+        row = np.minimum.accumulate(candidates - positions) + positions
+    return int(row[-1]), len(reference)
+
+
+def load_reference_set(folder:'str | Path') -> 'list[tuple[Path,str,float]]':
+    """
+    Load the recordings of a folder that have a reference transcript.
+
+    Parameters
+    ----------
+    folder : str or Path
+        Folder of the reference set
+
+    Returns
+    -------
+    list
+        Path, reference transcript and seconds of every recording
+    """
+    reference_set = []
+    for audio_path in sorted(Path(folder).iterdir()):
+        text_path = audio_path.with_suffix(".txt")
+        if audio_path.suffix.lower() not in AUDIO_EXTENSIONS or not text_path.exists():
+            continue
+        with PCMAudioStream(audio_path) as audio_stream:
+            for _ in audio_stream.iter_chunks(600):
+                pass
+            seconds = audio_stream.get_time()
+        reference_set.append((audio_path, text_path.read_text(), seconds))
+    return reference_set
+
+
+def run_benchmark(reference_folder:'str | Path', configurations:'tuple[dict,...]'=CONFIGURATIONS) -> 'list[dict]':
+    """
+    Transcribe the reference set with every configuration and report speed and quality.
+
+    Parameters
+    ----------
+    reference_folder : str or Path
+        Folder of the reference set, see `load_reference_set()`
+    configurations : tuple, optional
+        Transcription options of the configurations, see `transcribe.get_transcription_options()`
+
+    Returns
+    -------
+    list
+        For every configuration: its options, seconds to load the model, real-time factor and word error rate
+        (an error instead if the backend can't be loaded)
+    """
+    reference_set = load_reference_set(reference_folder)
+    if not reference_set:
+        raise Exception(f"No recordings with reference transcripts in {reference_folder}")
+    audio_seconds = sum([seconds for _, _, seconds in reference_set])
+    results = []
+    for configuration in configurations:
+        options = get_transcription_options(configuration)
+        result = {"configuration": "/".join(str(value) for value in options.values()), "recordings": len(reference_set),
+                  "audio_seconds": audio_seconds}
+        start = perf_counter()
+        try:
+            backend = load_transcription_backend(options)
+        except Exception as e:
+            results.append(result | {"error": str(e)})
+            continue
+        result["load_seconds"] = perf_counter() - start
+        num_edits, num_words, transcription_seconds = 0, 0, 0.
+        for audio_path, reference, _ in reference_set:
+            start = perf_counter()
+            segments = transcribe_in_windows(backend, audio_path)
+            transcription_seconds += perf_counter() - start
+            edits, words = word_error_rate(normalize_words(reference), normalize_words(" ".join([segment["text"] for segment in segments])))
+            num_edits, num_words = num_edits + edits, num_words + words
+        del backend
+        result.update(rtf=transcription_seconds / audio_seconds, wer=num_edits / max(num_words, 1))
+        results.append(result)
+    return results
+
+
+if __name__ == '__main__':
+    folder = sys.argv[1] if len(sys.argv) > 1 else Path(__file__).parent.joinpath("transcription_reference")
+    for result in run_benchmark(folder):
+        print(" | ".join(f"{key}: {round(value,3) if isinstance(value,float) else value}" for key,value in result.items()))
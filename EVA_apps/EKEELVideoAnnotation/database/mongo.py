@@ -5,6 +5,9 @@ This module provides functions for interacting with the MongoDB database,
 handling user data, annotations, videos, and concept maps.
 """
 
+import time
+from datetime import datetime, timezone
+
 import pymongo
 from bson import ObjectId
 from env import MONGO_CLUSTER_USERNAME,MONGO_CLUSTER_PASSWORD
@@ -255,6 +258,18 @@ def get_conll(video_id:str):
     return None if document is None else document["conll"]
 
 
+def remove_conll(video_id:str):
+    """
+    Remove the conll of a video, e.g. when its transcript changes.
+
+    Parameters
+    ----------
+    video_id : str
+        ID of the video
+    """
+    db.conlls.delete_many({"video_id": video_id})
+
+
 # from string id to object id
 def get_user(user_string_id):
     print("***** EKEEL - Video Annotation: db_mongo.py::get_user() ******")
@@ -310,14 +325,284 @@ def get_untranscribed_videos():
     Returns
     -------
     list
-        List of tuples containing (video_id, language)
+        List of tuples containing (video_id, language, transcription options of the job or None)
     """
-    docs = list(db.videos.find({"transcript_data.is_whisper_transcribed":False},{"video_id":1, "language":1}))
+    docs = list(db.videos.find({"transcript_data.is_whisper_transcribed":False},{"video_id":1, "language":1, "transcript_data.transcription_options":1}))
     if len(docs):
-        docs = [(doc["video_id"], doc["language"]) for doc in docs]
+        docs = [(doc["video_id"], doc["language"], doc.get("transcript_data", {}).get("transcription_options")) for doc in docs]
     return docs
 
 
+TRANSCRIPTION_JOB_QUEUED = "queued"
+TRANSCRIPTION_JOB_RUNNING = "running"
+TRANSCRIPTION_JOB_DONE = "done"
+TRANSCRIPTION_JOB_FAILED = "failed"
+TRANSCRIPTION_JOB_MAX_ATTEMPTS = 3
+
+_are_transcription_jobs_indexed = False
+
+def ensure_transcription_jobs_indexes():
+    """
+    Create the indexes of the transcription jobs collection, if missing (once per process).
+
+    Jobs are unique per video and claimed in order of status, priority and age.
+    """
+    global _are_transcription_jobs_indexed
+    if _are_transcription_jobs_indexed:
+        return
+    db.transcription_jobs.create_index("video_id", unique=True)
+    db.transcription_jobs.create_index([("status", pymongo.ASCENDING), ("priority", pymongo.DESCENDING), ("created_at", pymongo.ASCENDING)])
+    _are_transcription_jobs_indexed = True
+
+
+def enqueue_transcription_job(video_id:str, language:str, priority:int=0, options:dict=None, requeue_finished:bool=True):
+    """
+    Queue the transcription of a video.
+
+    A video has one job: a finished or failed job is queued again (if `requeue_finished`), a queued or running one
+    is left as it is (its priority is raised to the one given, if higher).
+
+    Parameters
+    ----------
+    video_id : str
+        ID of the video
+    language : str
+        Language of the video
+    priority : int, optional
+        Higher priorities are claimed first
+    options : dict, optional
+        Transcription options of the job (backend, model size, compute type), None for the defaults of the worker
+    requeue_finished : bool, optional
+        Queue again the job of the video if done or failed
+    """
+    # without the unique index concurrent upserts could create two jobs for the video
+    ensure_transcription_jobs_indexes()
+    now = datetime.now(timezone.utc)
+    requeue = {"status": TRANSCRIPTION_JOB_QUEUED, "language": language, "options": options, "priority": priority,
+               "created_at": now, "available_at": now, "attempts": 0, "worker_id": None, "lease_expires_at": None, "error": None}
+    if requeue_finished:
+        db.transcription_jobs.update_one({"video_id": video_id, "status": {"$in": [TRANSCRIPTION_JOB_DONE, TRANSCRIPTION_JOB_FAILED]}},
+                                         {"$set": requeue})
+    try:
+        db.transcription_jobs.update_one({"video_id": video_id},
+                                         {"$setOnInsert": {key: value for key, value in requeue.items() if key != "priority"},
+                                          "$max": {"priority": priority}},
+                                         upsert=True)
+    except pymongo.errors.DuplicateKeyError:
+        # queued at the same time by another process
+        pass
+
+
+def enqueue_untranscribed_videos():
+    """
+    Queue the transcription of the videos waiting for it without a job (see `get_untranscribed_videos()`),
+    e.g. marked before the queue existed.
+    """
+    for video_id, language, options in get_untranscribed_videos():
+        enqueue_transcription_job(video_id, language, options=options, requeue_finished=False)
+
+
+def claim_transcription_job(worker_id:str, lease_seconds:float, max_attempts:int=TRANSCRIPTION_JOB_MAX_ATTEMPTS):
+    """
+    Atomically claim the queued job with the highest priority (the oldest among equals), or a running job
+    whose lease has expired (its worker is considered dead).
+
+    Expired jobs that already had `max_attempts` are marked as failed instead of being claimed again,
+    so a video that kills its workers (e.g. out of memory) isn't retried forever.\n
+    Leases are compared with the clock of the database, workers clocks don't matter.
+
+    Parameters
+    ----------
+    worker_id : str
+        ID of the worker claiming the job
+    lease_seconds : float
+        Seconds the job is leased to the worker, see `renew_transcription_job_lease()`
+    max_attempts : int, optional
+        Attempts after which a job whose lease expired fails
+
+    Returns
+    -------
+    dict or None
+        Job claimed (video_id, language, options, attempts...), None if there are no jobs to run
+    """
+    db.transcription_jobs.update_many(
+        {"status": TRANSCRIPTION_JOB_RUNNING, "attempts": {"$gte": max_attempts}, "$expr": {"$lt": ["$lease_expires_at", "$$NOW"]}},
+        {"$set": {"status": TRANSCRIPTION_JOB_FAILED, "lease_expires_at": None,
+                  "error": f"Lease expired after {max_attempts} attempts, the worker died"}})
+    return db.transcription_jobs.find_one_and_update(
+        {"$or": [{"status": TRANSCRIPTION_JOB_QUEUED, "$expr": {"$lte": ["$available_at", "$$NOW"]}},
+                 {"status": TRANSCRIPTION_JOB_RUNNING, "attempts": {"$lt": max_attempts},
+                  "$expr": {"$lt": ["$lease_expires_at", "$$NOW"]}}]},
+        [{"$set": {"status": TRANSCRIPTION_JOB_RUNNING, "worker_id": worker_id, "attempts": {"$add": ["$attempts", 1]},
+                   "lease_expires_at": {"$add": ["$$NOW", int(lease_seconds*1000)]}}}],
+        sort=[("priority", pymongo.DESCENDING), ("created_at", pymongo.ASCENDING)],
+        return_document=pymongo.ReturnDocument.AFTER)
+
+
+def renew_transcription_job_lease(video_id:str, worker_id:str, lease_seconds:float) -> bool:
+    """
+    Extend the lease of a running job (heartbeat of its worker).
+
+    Parameters
+    ----------
+    video_id : str
+        ID of the video of the job
+    worker_id : str
+        ID of the worker of the job
+    lease_seconds : float
+        Seconds the job is leased from now
+
+    Returns
+    -------
+    bool
+        False if the job isn't leased to the worker anymore (lease expired and job claimed by another worker)
+    """
+    result = db.transcription_jobs.update_one({"video_id": video_id, "worker_id": worker_id, "status": TRANSCRIPTION_JOB_RUNNING},
+                                              [{"$set": {"lease_expires_at": {"$add": ["$$NOW", int(lease_seconds*1000)]}}}])
+    return result.matched_count > 0
+
+
+def complete_transcription_job(video_id:str, worker_id:str) -> bool:
+    """
+    Mark a running job as done.
+
+    Parameters
+    ----------
+    video_id : str
+        ID of the video of the job
+    worker_id : str
+        ID of the worker of the job
+
+    Returns
+    -------
+    bool
+        False if the job isn't leased to the worker anymore
+    """
+    result = db.transcription_jobs.update_one({"video_id": video_id, "worker_id": worker_id, "status": TRANSCRIPTION_JOB_RUNNING},
+                                              {"$set": {"status": TRANSCRIPTION_JOB_DONE, "lease_expires_at": None, "error": None}})
+    return result.matched_count > 0
+
+
+def release_transcription_job(video_id:str, worker_id:str, error:str, retry_seconds:float=300, max_attempts:int=TRANSCRIPTION_JOB_MAX_ATTEMPTS):
+    """
+    Release a running job that failed: it's queued again after `retry_seconds`, or marked as failed after `max_attempts`.
+
+    Parameters
+    ----------
+    video_id : str
+        ID of the video of the job
+    worker_id : str
+        ID of the worker of the job
+    error : str
+        Description of the error
+    retry_seconds : float, optional
+        Seconds before the job can be claimed again
+    max_attempts : int, optional
+        Attempts after which the job fails
+    """
+    db.transcription_jobs.update_one({"video_id": video_id, "worker_id": worker_id, "status": TRANSCRIPTION_JOB_RUNNING},
+                                     [{"$set": {"status": {"$cond": [{"$gte": ["$attempts", max_attempts]}, TRANSCRIPTION_JOB_FAILED, TRANSCRIPTION_JOB_QUEUED]},
+                                                "available_at": {"$add": ["$$NOW", int(retry_seconds*1000)]},
+                                                "lease_expires_at": None, "error": error}}])
+
+
+def wait_for_transcription_jobs(timeout_seconds:float):
+    """
+    Wait until a job is queued or released, or until the timeout.
+
+    Uses a change stream of the jobs collection, so that idle workers start new jobs as soon as they are queued;
+    where change streams aren't available (standalone server) it just waits the timeout.
+
+    Parameters
+    ----------
+    timeout_seconds : float
+        Max seconds to wait
+    """
+    deadline = time.time() + timeout_seconds
+    try:
+        with db.transcription_jobs.watch([{"$match": {"$or": [{"operationType": "insert"},
+                                                               {"updateDescription.updatedFields.status": TRANSCRIPTION_JOB_QUEUED}]}}],
+                                         max_await_time_ms=1000) as stream:
+            while time.time() < deadline:
+                if stream.try_next() is not None:
+                    return
+    except pymongo.errors.OperationFailure:
+        time.sleep(max(deadline - time.time(), 0))
+
+
+
+def append_transcript_segments(video_id:str, segments:list, first_index:int, watermark_seconds:float) -> bool:
+    """
+    Publish segments of a transcription still running in `transcript_data.whisper_partial` of the video,
+    with the watermark (seconds of audio up to which the transcription is final), see `text_processor.words.get_current_transcript()`.
+
+    Segments are appended after the ones published: `first_index` must be the number of segments published,
+    0 replaces them (e.g. a transcription restarted from a checkpoint).
+
+    Parameters
+    ----------
+    video_id : str
+        ID of the video
+    segments : list
+        New segments, in the format of the "segments" of the stable-ts JSON result
+    first_index : int
+        Index of the first new segment in the transcription
+    watermark_seconds : float
+        Seconds of audio transcribed
+
+    Returns
+    -------
+    bool
+        False if the segments published aren't `first_index` (nothing is written)
+    """
+    if first_index == 0:
+        result = db.videos.update_one({"video_id": video_id},
+                                      {"$set": {"transcript_data.whisper_partial": {"segments": segments, "num_segments": len(segments),
+                                                                                    "watermark_seconds": watermark_seconds}}})
+    else:
+        result = db.videos.update_one({"video_id": video_id, "transcript_data.whisper_partial.num_segments": first_index},
+                                      {"$push": {"transcript_data.whisper_partial.segments": {"$each": segments}},
+                                       "$set": {"transcript_data.whisper_partial.num_segments": first_index + len(segments),
+                                                "transcript_data.whisper_partial.watermark_seconds": watermark_seconds}})
+    return result.matched_count > 0
+
+
+def finalize_transcript(video_id:str, num_segments:int, transcription_options:dict) -> bool:
+    """
+    Make the segments published with `append_transcript_segments()` the transcript of the video.
+
+    The segments are moved by the database: nothing but the options is sent.\n
+    As writing a new transcript, `transcript_data` is rebuilt from scratch and the data derived from the previous
+    transcript (tagged text, `ItaliaNLP_doc_id`, terms, `video_data.segments` and the conll) is removed,
+    so that the analysis of the video runs again on the new one.
+
+    Parameters
+    ----------
+    video_id : str
+        ID of the video
+    num_segments : int
+        Number of segments of the transcription
+    transcription_options : dict
+        Options of the transcription (backend, model size, compute type)
+
+    Returns
+    -------
+    bool
+        False if the segments published aren't `num_segments` (nothing is written)
+    """
+    result = db.videos.update_one({"video_id": video_id, "transcript_data.whisper_partial.num_segments": num_segments},
+                                  [{"$set": {"_whisper_segments": "$transcript_data.whisper_partial.segments"}},
+                                   {"$unset": ["transcript_data", "video_data.segments"]},
+                                   {"$set": {"transcript_data": {"is_whisper_transcribed": True,
+                                                                 "is_autogenerated": True,
+                                                                 "transcription_options": {"$literal": transcription_options},
+                                                                 "text": "$_whisper_segments"}}},
+                                   {"$unset": "_whisper_segments"}])
+    if result.matched_count == 0:
+        return False
+    remove_conll(video_id)
+    return True
+
 
 def get_graphs_info(selected_video=None):
     """
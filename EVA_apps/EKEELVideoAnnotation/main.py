@@ -52,7 +52,7 @@ from media.segmentation import VideoAnalyzer, SemanticText
 from ontology.rdf_graph import annotations_to_jsonLD
 from burst.prototype import create_local_vocabulary, create_burst_graph
 from forms.form import addVideoForm, RegisterForm, LoginForm, GoldStandardForm, ForgotForm, PasswordResetForm, ConfirmCodeForm, BurstForm
-from text_processor.words import get_real_keywords
+from text_processor.words import get_real_keywords, get_current_transcript
 from text_processor.conll import conll_gen, html_interactable_transcript_legacy, html_interactable_transcript_word_level
 from metrics.analysis import compute_data_summary, compute_agreement, linguistic_analysis, fleiss
 from metrics.agreement import create_gold
@@ -399,14 +399,15 @@ def video_selection():
         data = vid_analyzer.data
         
         language = vid_analyzer.identify_language()
-        text = SemanticText(" ".join(timed_sentence["text"] for timed_sentence in data["transcript_data"]["text"] if not "[" in timed_sentence['text']), language)
+        transcript = get_current_transcript(data["transcript_data"])
+        text = SemanticText(" ".join(timed_sentence["text"] for timed_sentence in transcript if not "[" in timed_sentence['text']), language)
         conll_sentences = conll_gen(video_id,text,language)
         if vid_analyzer.data["transcript_data"]["is_whisper_transcribed"]:
             #lemmatized_subtitles, all_lemmas = html_interactable_transcript_word_level(data["transcript_data"]["text"], language)
             #all_lemmas = vid_analyzer.data["transcript_data"]["lemmas"]
             lemmatized_subtitles = html_interactable_transcript_word_level(data["transcript_data"]["text"])
         else:
-            lemmatized_subtitles, all_lemmas = html_interactable_transcript_legacy(data["transcript_data"]["text"], conll_sentences, language)
+            lemmatized_subtitles, all_lemmas = html_interactable_transcript_legacy(transcript, conll_sentences, language)
         
         if form.annotator.data == "self":
         
@@ -465,7 +466,7 @@ def video_selection():
         NLPSingleton().destroy()  
                 
         return render_template('mooc_annotator.html', 
-                               result=data["transcript_data"]["text"], video_id=video_id, start_times=list(map(lambda x: x[0],data["video_data"]["segments"])),
+                               result=transcript, video_id=video_id, start_times=list(map(lambda x: x[0],data["video_data"]["segments"])),
                                images_path=vid_analyzer.images_path, concepts=lemmatized_concepts,is_temp_transcript=not data["transcript_data"]["is_whisper_transcribed"],
                                video_duration=data['duration'], lemmatized_subtitles=lemmatized_subtitles, annotator=annotator, language=language, is_completed=marked_completed,
                                conceptVocabulary=conceptVocabulary, title=data['title'], relations=relations, definitions=definitions)
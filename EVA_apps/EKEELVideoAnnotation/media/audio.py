@@ -2,18 +2,32 @@
 Audio processing module for video files.
 
 This module provides functionality for converting video files to audio format,
-specifically focusing on MP4 to WAV conversion for further processing.
+specifically focusing on MP4 to WAV conversion and on streaming the audio of a video
+to the transcription, without intermediate files.
 
 Functions
 ---------
 convert_mp4_to_wav
     Converts MP4 video files to WAV audio format
+iter_speech_chunks
+    Splits the audio of a stream in chunks of bounded length at the pauses of the speech
+
+Classes
+-------
+PCMAudioStream
+    Streams the audio of a file as 16 kHz mono samples from an ffmpeg pipe, in chunks of fixed size
 """
 
 import subprocess
 import os
+from shutil import which
 from pathlib import Path
 import json
+from collections import deque
+from threading import Thread
+import numpy as np
+
+WHISPER_SAMPLE_RATE = 16000
 
 
 def convert_mp4_to_wav(video_path: str, video_id: str) -> Path:
@@ -54,6 +68,274 @@ def convert_mp4_to_wav(video_path: str, video_id: str) -> Path:
     return output_file_path
 
 
+class PCMAudioStream:
+    """
+    Audio of a file decoded and resampled by an ffmpeg subprocess to mono PCM (the input of Whisper models),
+    read from its pipe in chunks of fixed size.
+
+    Only the chunk being read is kept in memory (plus the pipe buffer, the subprocess blocks when it's full),
+    so memory doesn't grow with the length of the file and no WAV file is written on disk.\n
+    The stream only moves forward from `start_seconds`; use it as a context manager or call `close()` to terminate ffmpeg.
+
+    Attributes
+    ----------
+    _audio_path : str
+        Path of the audio (or video) file
+    _process : subprocess.Popen or None
+        Running ffmpeg subprocess, None before the first read and after closing
+    _stderr_tail : deque
+        Last lines written by ffmpeg on stderr, drained by a thread so that ffmpeg never blocks on a full pipe
+    _stderr_thread : Thread or None
+        Thread draining stderr of the subprocess
+    start_seconds : float
+        Time of the file where the stream starts
+    sample_rate : int
+        Samples per second
+    num_samples_read : int
+        Samples read since the start of the stream
+    is_ended : bool
+        Whether the end of the file has been reached
+
+    Methods
+    -------
+    read(num_samples)
+        Read the next samples
+    iter_chunks(chunk_seconds)
+        Iterate over chunks of the given length until the end of the file
+    get_time()
+        Get the time of the file of the next sample
+    close()
+        Terminate the ffmpeg subprocess
+    """
+
+    def __init__(self, audio_path:'str | Path', start_seconds:float=0., sample_rate:int=WHISPER_SAMPLE_RATE):
+        """
+        Initialize the stream, the subprocess is started at the first read.
+
+        Parameters
+        ----------
+        audio_path : str or Path
+            Path of the audio (or video) file
+        start_seconds : float, optional
+            Time of the file where the stream starts
+        sample_rate : int, optional
+            Samples per second
+        """
+        if which("ffmpeg") is None:
+            raise Exception("ffmpeg executable not found")
+        self._audio_path = str(audio_path)
+        self._process = None
+        self._stderr_tail = deque(maxlen=20)
+        self._stderr_thread = None
+        self.start_seconds = start_seconds
+        self.sample_rate = sample_rate
+        self.num_samples_read = 0
+        self.is_ended = False
+
+    def _start(self):
+        self._process = subprocess.Popen(['ffmpeg', '-loglevel', 'error', '-nostdin', '-ss', f"{self.start_seconds:.3f}",
+                                          '-i', self._audio_path, '-vn', '-sn',
+                                          '-f', 's16le', '-ac', '1', '-ar', str(self.sample_rate), 'pipe:1'],
+                                         stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        self._stderr_tail.clear()
+        self._stderr_thread = Thread(target=self._drain_stderr, args=(self._process.stderr,), daemon=True)
+        self._stderr_thread.start()
+
+    def _drain_stderr(self, stderr):
+        for line in stderr:
+            self._stderr_tail.append(line.decode(errors="replace").rstrip())
+
+    def read(self, num_samples:int) -> np.ndarray:
+        """
+        Read the next samples of the stream.
+
+        Parameters
+        ----------
+        num_samples : int
+            Number of samples to read
+
+        Returns
+        -------
+        np.ndarray
+            float32 samples in [-1, 1], fewer than requested at the end of the file (empty after it)
+
+        Raises
+        ------
+        Exception
+            If FFMPEG subprocess fails
+        """
+        if self.is_ended:
+            return np.empty(0, dtype=np.float32)
+        if self._process is None:
+            self._start()
+        pcm = np.empty(num_samples, dtype=np.int16)
+        view = memoryview(pcm).cast('B')
+        stdout = self._process.stdout
+        filled = 0
+        while filled < len(view):
+            num_read = stdout.readinto(view[filled:])
+            if not num_read:
+                break
+            filled += num_read
+        if filled < len(view):
+            self.is_ended = True
+            return_code = self._process.wait()
+            if return_code != 0:
+                self.close()
+                print("\n".join(self._stderr_tail))
+                raise Exception("ERROR SUBPROCESS FFMPEG")
+            self.close()
+        num_samples_read = filled // pcm.itemsize
+        self.num_samples_read += num_samples_read
+        return pcm[:num_samples_read].astype(np.float32) / 32768.0
+
+    def iter_chunks(self, chunk_seconds:float):
+        """
+        Iterate over chunks of the stream until the end of the file.
+
+        Parameters
+        ----------
+        chunk_seconds : float
+            Length of the chunks, the last one is shorter
+
+        Yields
+        ------
+        tuple
+            Time of the file where the chunk starts and its float32 samples
+        """
+        num_samples = int(chunk_seconds * self.sample_rate)
+        while not self.is_ended:
+            start_seconds = self.get_time()
+            chunk = self.read(num_samples)
+            if len(chunk):
+                yield start_seconds, chunk
+
+    def get_time(self) -> float:
+        """
+        Time of the file of the next sample of the stream.
+
+        Returns
+        -------
+        float
+            Seconds from the start of the file
+        """
+        return self.start_seconds + self.num_samples_read / self.sample_rate
+
+    def close(self):
+        """
+        Terminate the ffmpeg subprocess, if running.
+        """
+        if self._process is not None:
+            if self._process.poll() is None:
+                self._process.kill()
+            self._process.wait()
+            self._process.stdout.close()
+            # stderr is at its end once ffmpeg has exited
+            self._stderr_thread.join()
+            self._process.stderr.close()
+            self._process = None
+            self._stderr_thread = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def __del__(self):
+        self.close()
+
+
+def _find_chunk_cut(samples:np.ndarray, search_start:int, search_end:int, frame_samples:int, min_silence_frames:int,
+                    silence_margin_db:float) -> 'tuple[int,bool]':
+    """
+    Find the quietest stretch of `min_silence_frames` frames between two samples and whether it's a silence,
+    that is quieter than the median level of the samples by `silence_margin_db`.
+
+    Returns
+    -------
+    tuple
+        Sample in the middle of the quietest stretch and True if it's a silence
+    """
+    num_frames = len(samples) // frame_samples
+    frames = samples[:num_frames*frame_samples].reshape(num_frames, frame_samples)
+    levels_db = 10 * np.log10(np.mean(frames*frames, axis=1) + 1e-10)
+    first_frame, last_frame = search_start // frame_samples, search_end // frame_samples
+    search_levels = levels_db[first_frame:last_frame]
+    window = min(min_silence_frames, len(search_levels))
+    windows_levels = np.convolve(search_levels, np.ones(window)/window, mode='valid')
+    quietest = int(np.argmin(windows_levels))
+    cut = (first_frame + quietest + window // 2) * frame_samples
+    return cut, bool(windows_levels[quietest] < np.median(levels_db) - silence_margin_db)
+
+
+def iter_speech_chunks(audio_stream:PCMAudioStream, max_chunk_seconds:float=120., search_seconds:float=30.,
+                       min_silence_seconds:float=0.3, silence_margin_db:float=25., overlap_seconds:float=2.,
+                       keep_start_seconds:'float | None'=None):
+    """
+    Split the audio of a stream in chunks of bounded length, cut at pauses of the speech so that no word is split.
+
+    Every cut is at the quietest stretch of `min_silence_seconds` in the last `search_seconds` of a chunk.
+    When that stretch isn't a silence (continuous speech or music) the chunks are cut there anyway but overlap by
+    `overlap_seconds`, and each one keeps only the words before (after) the cut: a word split by the end of a chunk
+    is transcribed whole by the other one.\n
+    A chunk depends only on the audio from its start, so a stream started at the `next_start_seconds` of a chunk
+    (with its `keep_end_seconds` as `keep_start_seconds`) continues with the same chunks.
+
+    Parameters
+    ----------
+    audio_stream : PCMAudioStream
+        Stream of the audio, read up to the end
+    max_chunk_seconds : float, optional
+        Max length of the chunks
+    search_seconds : float, optional
+        Length of the end of a chunk where the cut is looked for
+    min_silence_seconds : float, optional
+        Length of the stretches of audio compared to find the cut
+    silence_margin_db : float, optional
+        dB below the median level of a chunk of the stretches considered silences
+    overlap_seconds : float, optional
+        Overlap of chunks cut where there isn't a silence
+    keep_start_seconds : float or None, optional
+        Keep start of the first chunk, when the stream starts at an overlapped cut
+
+    Yields
+    ------
+    tuple
+        Time of the file where the chunk starts, its float32 samples, the times the words of the chunk must start
+        (by their middle) at or after and before (None if unbounded), and the time where the next chunk starts
+    """
+    sample_rate = audio_stream.sample_rate
+    frame_samples = int(0.02 * sample_rate)
+    max_samples = int(max_chunk_seconds * sample_rate)
+    search_samples = min(int(search_seconds * sample_rate), max_samples // 2)
+    half_overlap = int(overlap_seconds / 2 * sample_rate)
+    min_silence_frames = max(int(min_silence_seconds * sample_rate) // frame_samples, 1)
+    buffer = np.empty(0, dtype=np.float32)
+    buffer_start = audio_stream.get_time()
+    while True:
+        if len(buffer) < max_samples and not audio_stream.is_ended:
+            buffer = np.concatenate([buffer, audio_stream.read(max_samples - len(buffer))])
+            continue
+        if audio_stream.is_ended and len(buffer) <= max_samples:
+            if len(buffer):
+                yield buffer_start, buffer, keep_start_seconds, None, buffer_start + len(buffer) / sample_rate
+            return
+        cut, is_silence = _find_chunk_cut(buffer, max_samples - search_samples, max_samples - half_overlap,
+                                          frame_samples, min_silence_frames, silence_margin_db)
+        cut_seconds = buffer_start + cut / sample_rate
+        if is_silence:
+            next_start = cut
+            yield buffer_start, buffer[:cut], keep_start_seconds, None, cut_seconds
+            keep_start_seconds = None
+        else:
+            next_start = cut - half_overlap
+            yield buffer_start, buffer[:cut+half_overlap], keep_start_seconds, cut_seconds, buffer_start + next_start / sample_rate
+            keep_start_seconds = cut_seconds
+        buffer = buffer[next_start:].copy()
+        buffer_start += next_start / sample_rate
+
+
 if __name__ == '__main__':
     pass
     
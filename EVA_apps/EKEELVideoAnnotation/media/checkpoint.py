@@ -0,0 +1,153 @@
+"""
+Per-video checkpoints of the long-running analysis stages.
+
+A stage (the slide analysis of a range of frames, the coarse-grained analysis of the frames, the transcription of the audio)
+saves its state as a JSON file in the `checkpoints` folder of the video while it runs, so that a run restarted after the
+process died continues from the last state saved instead of from the start, with the same result of an uninterrupted run.\n
+Files are replaced atomically: a process that dies while saving leaves the previous state.
+
+Classes
+-------
+StageCheckpoint
+    State of a stage saved periodically in the folder of the video
+"""
+
+import os
+import json
+import time
+from pathlib import Path
+
+CHECKPOINTS_FOLDER = "checkpoints"
+
+
+class StageCheckpoint:
+    """
+    State of a long-running stage of the analysis of a video, saved in a JSON file in the folder of the video.
+
+    The stage saves its state at the points it can be resumed from when `is_due()`, at most every `interval_seconds`,
+    (or with `save()` directly, e.g. when the stage ends) and a restarted stage `load()`s it and continues from there.\n
+    The key identifies the work of the stage (range of frames, parameters...): a state saved with a different key is ignored.
+
+    Attributes
+    ----------
+    _path : Path
+        Path of the file
+    _key : dict
+        Key of the work of the stage
+    _interval_seconds : float
+        Min seconds between two saves of `is_due()`
+    _last_save_time : float
+        Time of the last save (or of the creation)
+    num_saves : int
+        Number of states saved
+
+    Methods
+    -------
+    get_path()
+        Get the path of the file
+    load()
+        Load the state saved with the same key
+    is_due()
+        Whether it's time to save the state
+    save(state)
+        Save the state
+    remove()
+        Remove the state saved
+    clear(folder, prefix)
+        Remove the states of a folder whose name starts with a prefix
+    """
+
+    def __init__(self, folder:'str | Path', name:str, key:'dict | None'=None, interval_seconds:float=60.):
+        """
+        Parameters
+        ----------
+        folder : str or Path
+            Folder of the video
+        name : str
+            Name of the stage, the file is the name with .json extension
+        key : dict or None, optional
+            Key of the work of the stage (JSON serializable)
+        interval_seconds : float, optional
+            Min seconds between two saves of `is_due()`
+        """
+        self._path = Path(folder).joinpath(CHECKPOINTS_FOLDER, name + ".json")
+        # compared with the one of the file after a round trip
+        self._key = json.loads(json.dumps(key))
+        self._interval_seconds = interval_seconds
+        self._last_save_time = time.time()
+        self.num_saves = 0
+
+    def get_path(self) -> Path:
+        return self._path
+
+    def load(self) -> 'dict | None':
+        """
+        Load the state saved with the same key.
+
+        Returns
+        -------
+        dict or None
+            The state, None if missing, unreadable or saved with another key
+        """
+        if not self._path.exists():
+            return None
+        try:
+            with open(self._path) as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Warning: ignored checkpoint {self._path}: {e}")
+            return None
+        if data.get("key") != self._key:
+            return None
+        return data["state"]
+
+    def is_due(self) -> bool:
+        """
+        Whether `interval_seconds` have passed since the last save.
+
+        Returns
+        -------
+        bool
+            True if the state should be saved
+        """
+        return time.time() - self._last_save_time >= self._interval_seconds
+
+    def save(self, state:dict):
+        """
+        Save the state, replacing the previous one atomically.
+
+        Parameters
+        ----------
+        state : dict
+            State of the stage (JSON serializable)
+        """
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = self._path.with_name(f"{self._path.name}.{os.getpid()}.tmp")
+        with open(temp_path, "w") as f:
+            json.dump({"key": self._key, "state": state}, f)
+        os.replace(temp_path, self._path)
+        self._last_save_time = time.time()
+        self.num_saves += 1
+
+    def remove(self):
+        """
+        Remove the state saved, if any.
+        """
+        self._path.unlink(missing_ok=True)
+
+    @staticmethod
+    def clear(folder:'str | Path', prefix:str=""):
+        """
+        Remove the states saved in the folder of a video whose name starts with the prefix.
+
+        Parameters
+        ----------
+        folder : str or Path
+            Folder of the video
+        prefix : str, optional
+            Prefix of the names of the stages, all the states if empty
+        """
+        checkpoints_folder = Path(folder).joinpath(CHECKPOINTS_FOLDER)
+        if checkpoints_folder.exists():
+            for path in checkpoints_folder.glob(prefix + "*.json"):
+                path.unlink(missing_ok=True)
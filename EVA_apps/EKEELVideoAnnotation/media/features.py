@@ -0,0 +1,390 @@
+"""
+Per-video store of frame features.
+
+The features used by the analysis stages (grayscale thumbnails, 16 bins histograms,
+face features of the XGBoost model and frame timestamps) are computed in a single decode pass and saved
+as numpy arrays in the `features` folder of the video, then memory-mapped by the stages
+instead of decoding the same frames again.\n
+The store keeps only what the stages read: there are no 32 bins histograms (the keyframes use the thumbnails),
+and the face features are not a face detection result, they are computed only on the frames whose classification
+they can change and are zero elsewhere.\n
+The store is invalidated when the size or the modification time of the video file changes.
+
+Classes
+-------
+FrameFeatureStore
+    Memory-mapped features of the frames sampled at fixed rate
+"""
+
+import os
+import json
+import cv2
+import numpy as np
+from pathlib import Path
+from shutil import which, rmtree
+
+from media.video import VIDEOS_PATH, FFmpegFrameStream, FrameSampler, get_analysis_frame_size, COLOR_RGB
+from models.xgboost_adapter import XGBoostModelAdapter
+
+FEATURES_FOLDER = "features"
+FEATURES_VERSION = 2
+FEATURES_CHUNK_SIZE = 16
+
+
+class FrameFeatureStore:
+    """
+    Memory-mapped features of the frames of a video sampled at fixed rate.
+
+    Rows are sorted by frame number, a frame is represented by the closest sampled row before it.\n
+    Histograms are computed on the frames at the size used by `VideoSpeedManager`, converted to gray
+    as `ImageClassifier` does on RGB frames, so they match the features computed during the analysis.
+
+    Attributes
+    ----------
+    _folder : Path
+        Folder of the store
+    _meta : dict
+        Source file signature, fps, number of frames and sampling parameters
+    thumbnails : ndarray
+        Grayscale thumbnails, shape (num_rows, height, width)
+    hist16 : ndarray
+        16 bins histograms divided by the number of pixels (the XGBoost model features), shape (num_rows, 16)
+    faces : ndarray
+        Face features [x_center, face_size, n_faces] of the XGBoost model, shape (num_rows, 3),
+        zeros where the faces can't change the classification, so not a face detection result
+        (see `XGBoostModelAdapter.extract_decisive_features_batch()`)
+    frame_nums : ndarray
+        Number of the frame of every row
+    timestamps : ndarray
+        Time in seconds of every row
+
+    Methods
+    -------
+    open(video_id, _testing_path)
+        Open the store of a video if it exists and it's up to date
+    build(video_id, sample_fps, thumbnail_size, max_dim_frame, detect_faces, _testing_path)
+        Compute the features of a video in one decode pass and save them
+    open_or_build(video_id, _testing_path)
+        Open the store, building it if missing or stale
+    get_fps()
+        Get frames per second of the video
+    get_count_frames()
+        Get total number of frames of the video
+    get_time_from_num_frame(num_frame, decimals)
+        Convert frame number to time in seconds
+    get_num_frame_from_time(seconds)
+        Convert time to frame number
+    get_row(num_frame)
+        Get the row representing a frame
+    get_thumbnail(num_frame)
+        Get the thumbnail of a frame
+    get_model_features(num_frame)
+        Get the XGBoost model features of a frame
+    """
+    _ARRAYS = ("thumbnails", "hist16", "faces", "frame_nums", "timestamps")
+
+    def __init__(self, folder:Path, meta:dict):
+        """
+        Memory-map the arrays of the store, use `open()` or `build()` to get an instance.
+        """
+        self._folder = folder
+        self._meta = meta
+        num_rows = meta["num_rows"]
+        for name in self._ARRAYS:
+            setattr(self, name, np.load(folder.joinpath(name+".npy"), mmap_mode='r')[:num_rows])
+
+    @staticmethod
+    def _get_paths(video_id:str, _testing_path=None) -> 'tuple[Path,Path]':
+        video_folder = VIDEOS_PATH.joinpath(video_id) if _testing_path is None else Path(_testing_path)
+        return video_folder.joinpath(video_id+".mp4"), video_folder.joinpath(FEATURES_FOLDER)
+
+    @staticmethod
+    def _get_source_signature(video_path:Path) -> dict:
+        stat = os.stat(video_path)
+        return {"source_size": stat.st_size, "source_mtime_ns": stat.st_mtime_ns}
+
+    @classmethod
+    def open(cls, video_id:str, _testing_path=None) -> 'FrameFeatureStore | None':
+        """
+        Open the store of a video if it exists and it's up to date.
+
+        Parameters
+        ----------
+        video_id : str
+            Identifier of the video
+        _testing_path : str, optional
+            Override path of the video folder for testing
+
+        Returns
+        -------
+        FrameFeatureStore or None
+            The store, None if missing, of an older version or computed on a different video file
+        """
+        video_path, folder = cls._get_paths(video_id, _testing_path)
+        meta_path = folder.joinpath("meta.json")
+        if not meta_path.exists() or not video_path.exists():
+            return None
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if meta.get("version") != FEATURES_VERSION or \
+           any(meta.get(key) != value for key, value in cls._get_source_signature(video_path).items()):
+            return None
+        return cls(folder, meta)
+
+    @classmethod
+    def build(cls, video_id:str, sample_fps:float=1, thumbnail_size:'tuple[int,int]'=(160,90),
+              max_dim_frame:'tuple[int,int]'=(640,360), detect_faces:bool=True, _testing_path=None) -> 'FrameFeatureStore':
+        """
+        Compute the features of a video in one decode pass and save them.
+
+        Frames are decoded and scaled by ffmpeg when installed, otherwise by OpenCV.
+        Model features are extracted in chunks of frames, detecting faces only where they can change the classification.
+        Arrays are written directly on disk, the metadata file is written last so an interrupted build is never opened.
+
+        Parameters
+        ----------
+        video_id : str
+            Identifier of the video
+        sample_fps : float, optional
+            Rows per second of video
+        thumbnail_size : tuple, optional
+            Size (width, height) of the thumbnails
+        max_dim_frame : tuple, optional
+            Max size of the frames used for histograms and face detection, see `get_analysis_frame_size()`
+        detect_faces : bool, optional
+            Compute the decisive face features, left to zero otherwise
+        _testing_path : str, optional
+            Override path of the video folder for testing
+
+        Returns
+        -------
+        FrameFeatureStore
+            The new store
+        """
+        video_path, folder = cls._get_paths(video_id, _testing_path)
+        vidcap = cv2.VideoCapture(video_path.__str__())
+        if not vidcap.isOpened():
+            raise Exception(f"Can't find video: {video_id}")
+        src_fps = vidcap.get(cv2.CAP_PROP_FPS)
+        num_frames = int(vidcap.get(cv2.CAP_PROP_FRAME_COUNT))
+        frame_size = get_analysis_frame_size((int(vidcap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(vidcap.get(cv2.CAP_PROP_FRAME_HEIGHT))), max_dim_frame)
+        signature = cls._get_source_signature(video_path)
+
+        if folder.exists():
+            rmtree(folder)
+        folder.mkdir(parents=True)
+        # frame count is an estimate for some containers, a margin of rows is allocated
+        max_rows = int(num_frames / src_fps * sample_fps) + int(sample_fps) + 2
+        thumb_w, thumb_h = thumbnail_size
+        arrays = {  "thumbnails": ((max_rows, thumb_h, thumb_w), np.uint8),
+                    "hist16": ((max_rows, 16), np.float32),
+                    "faces": ((max_rows, 3), np.float32),
+                    "frame_nums": ((max_rows,), np.int64),
+                    "timestamps": ((max_rows,), np.float64) }
+        out = { name: np.lib.format.open_memmap(folder.joinpath(name+".npy"), mode='w+', dtype=dtype, shape=shape)
+                for name, (shape, dtype) in arrays.items() }
+        model = XGBoostModelAdapter.get_cached() if detect_faces else None
+
+        def store_chunk_features(chunk:'list[np.ndarray]', first_row:int):
+            # XGBoost features are computed on RGB frames converted as if they were BGR
+            if model is not None:
+                features = model.extract_decisive_features_batch(chunk)
+            else:
+                features = XGBoostModelAdapter.extract_features_batch(chunk, detect_faces=False)
+            out["hist16"][first_row:first_row+len(chunk)] = features[:, :16]
+            out["faces"][first_row:first_row+len(chunk)] = features[:, 16:]
+
+        num_rows = 0
+        chunk = []
+        for num_frame, frame in cls._iter_sampled_frames(video_path, vidcap, src_fps, num_frames, frame_size, sample_fps):
+            if num_rows == max_rows:
+                break
+            out["thumbnails"][num_rows] = cv2.resize(cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY), thumbnail_size, interpolation=cv2.INTER_AREA)
+            out["frame_nums"][num_rows] = num_frame
+            out["timestamps"][num_rows] = num_frame / src_fps
+            # the decoder can reuse the buffer of the frame
+            chunk.append(frame.copy())
+            num_rows += 1
+            if len(chunk) == FEATURES_CHUNK_SIZE:
+                store_chunk_features(chunk, num_rows - len(chunk))
+                chunk = []
+        if chunk:
+            store_chunk_features(chunk, num_rows - len(chunk))
+        vidcap.release()
+        for array in out.values():
+            array.flush()
+        del out
+
+        meta = {"version": FEATURES_VERSION,
+                **signature,
+                "fps": int(src_fps),
+                "src_fps": src_fps,
+                "num_frames": num_frames,
+                "num_rows": num_rows,
+                "sample_fps": sample_fps,
+                "frame_size": list(frame_size),
+                "thumbnail_size": list(thumbnail_size),
+                "detect_faces": detect_faces}
+        with open(folder.joinpath("meta.json"), "w") as f:
+            json.dump(meta, f)
+        return cls(folder, meta)
+
+    @staticmethod
+    def _iter_sampled_frames(video_path:Path, vidcap:cv2.VideoCapture, src_fps:float, num_frames:int,
+                             frame_size:'tuple[int,int]', sample_fps:float):
+        """
+        Yields the number and the RGB frame (at `frame_size`) of every sampled frame.
+        """
+        if which("ffmpeg") is not None:
+            stream = FFmpegFrameStream(video_path.__str__(), frame_size, src_fps, COLOR_RGB, sample_fps=sample_fps)
+            yield from stream.iter_frames()
+            stream.close()
+            return
+        sampler = FrameSampler(vidcap, default_max_grab_gap=int(src_fps/sample_fps)+1)
+        num_row = 0
+        while True:
+            num_frame = int(num_row / sample_fps * src_fps + 0.5)
+            frame = sampler.read(num_frame) if num_frame < num_frames else None
+            if frame is None:
+                return
+            yield num_frame, cv2.cvtColor(cv2.resize(frame, frame_size, interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2RGB)
+            num_row += 1
+
+    @classmethod
+    def open_or_build(cls, video_id:str, _testing_path=None, **build_params) -> 'FrameFeatureStore':
+        """
+        Open the store of a video, building it if missing or stale.
+
+        Parameters
+        ----------
+        video_id : str
+            Identifier of the video
+        _testing_path : str, optional
+            Override path of the video folder for testing
+        **build_params
+            Parameters of `build()`
+
+        Returns
+        -------
+        FrameFeatureStore
+            The store
+        """
+        store = cls.open(video_id, _testing_path)
+        if store is None:
+            store = cls.build(video_id, _testing_path=_testing_path, **build_params)
+        return store
+
+    def get_fps(self) -> int:
+        """
+        Get frames per second of the video, as `LocalVideo.get_fps()`.
+
+        Returns
+        -------
+        int
+            Frames per second
+        """
+        return self._meta["fps"]
+
+    def get_count_frames(self) -> int:
+        """
+        Get total number of frames of the video.
+
+        Returns
+        -------
+        int
+            Total frame count
+        """
+        return self._meta["num_frames"]
+
+    def get_time_from_num_frame(self, num_frame:int, decimals:int=1):
+        """
+        Convert frame number to time in seconds, as `LocalVideo.get_time_from_num_frame()`.
+
+        Parameters
+        ----------
+        num_frame : int
+            Frame number
+        decimals : int, optional
+            Number of decimal places
+
+        Returns
+        -------
+        float
+            Time in seconds
+        """
+        return np.round(num_frame/self.get_fps(), decimals=decimals)
+
+    def get_num_frame_from_time(self, seconds:float) -> int:
+        """
+        Convert time to frame number, as `LocalVideo.get_num_frame_from_time()`.
+
+        Parameters
+        ----------
+        seconds : float
+            Time in seconds
+
+        Returns
+        -------
+        int
+            Frame number
+        """
+        return int(seconds*self.get_fps())
+
+    def get_row(self, num_frame:int) -> 'int | None':
+        """
+        Get the row representing a frame: the closest sampled frame before it.
+
+        Parameters
+        ----------
+        num_frame : int
+            Frame number
+
+        Returns
+        -------
+        int or None
+            Index of the row, None if the frame is out of the video
+        """
+        if num_frame < 0 or num_frame >= self.get_count_frames() or not len(self.frame_nums):
+            return None
+        return max(int(np.searchsorted(self.frame_nums, num_frame, side='right')) - 1, 0)
+
+    def get_thumbnail(self, num_frame:int):
+        """
+        Get the grayscale thumbnail of a frame.
+
+        Parameters
+        ----------
+        num_frame : int
+            Frame number
+
+        Returns
+        -------
+        ndarray or None
+            Thumbnail of shape (height, width, 1), None if the frame is out of the video
+        """
+        row = self.get_row(num_frame)
+        if row is None:
+            return None
+        return self.thumbnails[row][:,:,None]
+
+    def get_model_features(self, num_frame:int):
+        """
+        Get the features of a frame for `XGBoostModelAdapter`.
+
+        Parameters
+        ----------
+        num_frame : int
+            Frame number
+
+        Returns
+        -------
+        ndarray or None
+            Features of shape (1, 19), None if the frame is out of the video
+        """
+        row = self.get_row(num_frame)
+        if row is None:
+            return None
+        out_arr = np.empty((1, 19), dtype=float)
+        out_arr[0, :16] = self.hist16[row]
+        out_arr[0, 16:] = self.faces[row]
+        return out_arr
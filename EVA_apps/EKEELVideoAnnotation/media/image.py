@@ -8,11 +8,17 @@ Classes
 -------
 FaceDetectorSingleton
     Singleton class for face detection using MediaPipe
+OCRCache
+    Results of the OCR of frames addressed by a perceptual hash
 ImageClassifier
     Main class for image analysis and text extraction
+OCRWorkerPool
+    Threads that extract the text of frames in background
 
 Functions
 ---------
+download_face_model
+    Download the MediaPipe face detection model
 draw_bounding_boxes_on_image
     Draws bounding boxes on an image
 draw_bounding_boxes_on_image_classifier
@@ -22,9 +28,9 @@ show_image
 """
 
 import cv2
-import pytesseract
-pytesseract.pytesseract.tesseract_cmd = "/usr/bin/tesseract"
 import os
+import json
+import base64
 from pathlib import Path
 import mediapipe as mp
 from mediapipe import Image, ImageFormat
@@ -32,53 +38,389 @@ from numpy import round, dot, diag, reshape, zeros, uint8, array, inf, mean, var
 from numpy.linalg import norm
 from typing import List, Tuple
 from bisect import insort_left
+from collections import OrderedDict
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor, Future
 import numpy as np
 
+from media.ocr import get_ocr_engine
+
 
 MODEL_PATH = Path(__file__).parent.parent.joinpath("models","blaze_face_detector_short_range.tflite")
+MODEL_URL = "https://storage.googleapis.com/mediapipe-models/face_detector/blaze_face_short_range/float16/latest/blaze_face_short_range.tflite"
+
+# Width of the copy of the frames faces are detected on, the short range model looks at 128x128 pixels anyway
+FACE_DETECTION_WIDTH:int=320
+
+def download_face_model(model_path:'str | Path'=MODEL_PATH):
+    """
+    Download the MediaPipe face detection model.
 
-if not os.path.exists(MODEL_PATH):
+    Parameters
+    ----------
+    model_path : str or Path, optional
+        Path where the model is saved
+    """
     import requests
-    response = requests.get("https://storage.googleapis.com/mediapipe-models/face_detector/blaze_face_short_range/float16/latest/blaze_face_short_range.tflite")
-    with open(MODEL_PATH, 'wb') as file:
+    response = requests.get(MODEL_URL)
+    response.raise_for_status()
+    with open(model_path, 'wb') as file:
         file.write(response.content)
 
 class FaceDetectorSingleton(object):
     """
     Singleton class for MediaPipe face detection.
 
+    The model is loaded from `MODEL_PATH` at the first detection, not when the module is imported.
+    Faces are detected on a copy of the image downscaled to `FACE_DETECTION_WIDTH` pixels of width
+    and their boxes are mapped back to the resolution of the image.
+
     Attributes
     ----------
     _instance : FaceDetectorSingleton
         Single instance of the detector
     _detector : MediaPipe.FaceDetector
-        MediaPipe face detector instance
+        MediaPipe face detector instance, None until the first detection
+    _lock : Lock
+        Lock of the loading of the model
 
     Methods
     -------
-    detect(image)
+    detect(image, max_width)
         Detect faces in the given image
     """
     _instance = None
+    _detector = None
+    _lock = Lock()
 
     def __new__(cls, *args, **kwargs):
         if cls._instance is None:
             cls._instance = super(FaceDetectorSingleton, cls).__new__(cls)
-            options = mp.tasks.vision.FaceDetectorOptions(base_options=mp.tasks.BaseOptions(model_asset_path=MODEL_PATH))
-            cls._detector = mp.tasks.vision.FaceDetector.create_from_options(options)
         return cls._instance
 
-    def detect(self, image):
-        return self._detector.detect(Image(image_format=ImageFormat.SRGB, data=image))
+    @classmethod
+    def _get_detector(cls):
+        """
+        Load the model at the first call, downloading it if it's not in `MODEL_PATH`.
+
+        Returns
+        -------
+        MediaPipe.FaceDetector
+            MediaPipe face detector instance
+        """
+        with cls._lock:
+            if cls._detector is None:
+                if not os.path.exists(MODEL_PATH):
+                    print(f"Face detection model not found in {MODEL_PATH}, downloading it")
+                    download_face_model(MODEL_PATH)
+                options = mp.tasks.vision.FaceDetectorOptions(base_options=mp.tasks.BaseOptions(model_asset_path=str(MODEL_PATH)))
+                cls._detector = mp.tasks.vision.FaceDetector.create_from_options(options)
+        return cls._detector
+
+    def detect(self, image, max_width:'int | None'=FACE_DETECTION_WIDTH):
+        """
+        Detect faces in the given image.
+
+        Parameters
+        ----------
+        image : ndarray
+            RGB image
+        max_width : int or None, optional
+            Width of the copy of the image the faces are detected on, if the image is wider. None detects on the image itself
+
+        Returns
+        -------
+        FaceDetectorResult
+            MediaPipe detections, with the boxes in pixels of the image
+        """
+        height, width = image.shape[:2]
+        scale_x = scale_y = 1.
+        if max_width is not None and width > max_width:
+            small_height = max(int(height * max_width / width + 0.5), 1)
+            scale_x, scale_y = width / max_width, height / small_height
+            image = cv2.resize(image, (max_width, small_height), interpolation=cv2.INTER_AREA)
+        result = self._get_detector().detect(Image(image_format=ImageFormat.SRGB, data=np.ascontiguousarray(image)))
+        if scale_x != 1.:
+            for detection in result.detections:
+                bounding_box = detection.bounding_box
+                bounding_box.origin_x = int(bounding_box.origin_x * scale_x + 0.5)
+                bounding_box.origin_y = int(bounding_box.origin_y * scale_y + 0.5)
+                bounding_box.width = int(bounding_box.width * scale_x + 0.5)
+                bounding_box.height = int(bounding_box.height * scale_y + 0.5)
+        return result
 
 COLOR_BGR:int=0
 COLOR_GRAY = cv2.COLOR_BGR2GRAY
 COLOR_RGB = cv2.COLOR_BGR2RGB
 
+# OCR of the text regions - one tesseract call per region or one call on a mosaic of all the regions
+OCR_MODE_PER_CONTOUR:int=0
+OCR_MODE_MOSAIC:int=1
+
+# Text likelihood under which extract_text(use_prefilter=True) doesn't run OCR, calibrated with benchmarks/text_prefilter.py
+TEXT_LIKELIHOOD_THRESHOLD:float=0.1
+
 # Distance measurements - Cosine Similairity or Mean Absolute Distance
 #DIST_MEAS_METHOD_COSINE_SIM:int=0
 #DIST_MEAS_METHOD_MEAN_ABSOLUTE_DIST:int=1
 
+# Version of the OCR results saved on disk, change it when the reading of the text changes
+OCR_CACHE_VERSION:int=2
+OCR_CACHE_FILENAME = "ocr_cache.jsonl"
+
+
+class OCRCache:
+    """
+    Results of the OCR of frames addressed by a perceptual hash of their grayscale image.
+
+    The hash is a difference hash (dHash) of the frame resized to `hash_size` with a dead zone:
+    every horizontal and vertical difference of adjacent pixels contributes two bits (brighter, darker)
+    set only when the difference is above `gradient_threshold`, so the flat background of slides
+    gives zeros instead of bits flipped by compression noise.\n
+    A result is reused when the hash of a frame with the same OCR language, mode and size
+    is within `max_distance` bits of a saved one and the thumbnails (`check_size`) of the two frames
+    differ by at most `max_pixel_difference` gray levels in every pixel: a few changed words
+    flip too few bits of the hash, but they change some pixels of the thumbnails by far more
+    than compression noise does.
+    Results are kept in an in-memory LRU of `max_size` entries and, if `folder` is set, appended
+    to a file in that folder (usually the folder of the video) that is loaded back on the next run.
+
+    Attributes
+    ----------
+    hits : int
+        Results found in memory
+    disk_hits : int
+        Results found in the file of the folder
+    misses : int
+        Results not found, the frame must be read
+    _entries : OrderedDict
+        In-memory LRU, (namespace, hash) to result and thumbnail of the image read
+    _disk_entries : dict
+        Results saved in the file, (namespace, hash) to result and thumbnail of the image read
+    _path : Path or None
+        File of the results
+
+    Methods
+    -------
+    get_hash(img_gray)
+        Perceptual hash of a grayscale image
+    get_thumbnail(img_gray)
+        Thumbnail that confirms the images with close hashes
+    get(img_gray, namespace)
+        Get the result of an image
+    put(img_gray, namespace, result)
+        Save the result of an image
+    get_folder()
+        Get the folder of the on-disk results
+    get_stats()
+        Get the counters of hits and misses
+    clear()
+        Remove the in-memory results
+    """
+
+    def __init__(self, max_size:int=512, folder:'str | Path | None'=None, hash_size:'tuple[int,int]'=(64,36),
+                 gradient_threshold:int=4, max_distance:int=6, check_size:'tuple[int,int]'=(128,72),
+                 max_pixel_difference:int=24):
+        """
+        Parameters
+        ----------
+        max_size : int, optional
+            Max number of results in memory
+        folder : str or Path or None, optional
+            Folder of the on-disk results, only in memory if None
+        hash_size : tuple, optional
+            Size (width, height) of the image the hash is computed on
+        gradient_threshold : int, optional
+            Min difference of gray level of adjacent pixels that sets a bit
+        max_distance : int, optional
+            Max number of different bits of the hashes of the same image
+        check_size : tuple, optional
+            Size (width, height) of the thumbnails compared to confirm a hit
+        max_pixel_difference : int, optional
+            Max difference of gray level of the pixels of the thumbnails of the same image
+        """
+        self._max_size = max_size
+        self._hash_size = hash_size
+        self._gradient_threshold = gradient_threshold
+        self._max_distance = max_distance
+        self._check_size = check_size
+        self._max_pixel_difference = max_pixel_difference
+        self._entries = OrderedDict()
+        self._disk_entries = {}
+        self._lock = Lock()
+        self.hits = self.disk_hits = self.misses = 0
+        self._path = None
+        if folder is not None:
+            self._path = Path(folder).joinpath(OCR_CACHE_FILENAME)
+            if self._path.exists():
+                self._load()
+
+    def _load(self):
+        with open(self._path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # line cut by an interrupted run
+                    continue
+                if entry.get("version") != OCR_CACHE_VERSION:
+                    continue
+                result = [(text, tuple(bb)) for text, bb in entry["result"]]
+                thumbnail = np.frombuffer(base64.b64decode(entry["thumbnail"]), dtype=uint8).reshape(entry["thumbnail_shape"])
+                self._disk_entries[(entry["namespace"], bytes.fromhex(entry["hash"]))] = (result, thumbnail)
+
+    def get_hash(self, img_gray) -> bytes:
+        """
+        Perceptual hash of a grayscale image.
+
+        Parameters
+        ----------
+        img_gray : ndarray
+            Grayscale image
+
+        Returns
+        -------
+        bytes
+            Bits of the hash packed in bytes
+        """
+        width, height = self._hash_size
+        small = cv2.resize(img_gray, (width+1, height+1), interpolation=cv2.INTER_AREA).astype(np.int16)
+        diff_x = small[:-1,1:] - small[:-1,:-1]
+        diff_y = small[1:,:-1] - small[:-1,:-1]
+        threshold = self._gradient_threshold
+        return np.packbits(np.concatenate((diff_x > threshold, diff_x < -threshold,
+                                           diff_y > threshold, diff_y < -threshold), axis=None)).tobytes()
+
+    def get_thumbnail(self, img_gray) -> np.ndarray:
+        """
+        Thumbnail of a grayscale image, compared with the one of a saved result to confirm a hit.
+
+        Parameters
+        ----------
+        img_gray : ndarray
+            Grayscale image
+
+        Returns
+        -------
+        ndarray
+            uint8 thumbnail of size `check_size`
+        """
+        return cv2.resize(img_gray, self._check_size, interpolation=cv2.INTER_AREA)
+
+    def _is_same_thumbnail(self, thumbnail:np.ndarray, other_thumbnail:np.ndarray) -> bool:
+        return thumbnail.shape == other_thumbnail.shape and \
+               int(np.abs(thumbnail.astype(np.int16) - other_thumbnail).max()) <= self._max_pixel_difference
+
+    def _find(self, entries:dict, namespace:str, img_hash:bytes, thumbnail:np.ndarray):
+        key = (namespace, img_hash)
+        if key in entries:
+            return key if self._is_same_thumbnail(thumbnail, entries[key][1]) else None
+        keys = [other_key for other_key in entries if other_key[0] == namespace]
+        if not keys or self._max_distance <= 0:
+            return None
+        hashes = np.frombuffer(b''.join(other_hash for _, other_hash in keys), dtype=uint8).reshape(len(keys), -1)
+        distances = np.unpackbits(hashes ^ np.frombuffer(img_hash, dtype=uint8), axis=1).sum(axis=1)
+        # the closest hash whose thumbnail confirms the image
+        for index in np.argsort(distances, kind='stable'):
+            if distances[index] > self._max_distance:
+                return None
+            if self._is_same_thumbnail(thumbnail, entries[keys[index]][1]):
+                return keys[index]
+        return None
+
+    def get(self, img_gray, namespace:str) -> 'list | None':
+        """
+        Get the result of the OCR of an image, counting hits and misses.
+
+        Parameters
+        ----------
+        img_gray : ndarray
+            Grayscale image
+        namespace : str
+            OCR language, mode and size of the image
+
+        Returns
+        -------
+        list or None
+            Texts with bounding boxes, None if not found
+        """
+        img_hash, thumbnail = self.get_hash(img_gray), self.get_thumbnail(img_gray)
+        with self._lock:
+            key = self._find(self._entries, namespace, img_hash, thumbnail)
+            if key is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+            key = self._find(self._disk_entries, namespace, img_hash, thumbnail)
+            if key is not None:
+                entry = self._disk_entries[key]
+                self._add(key, entry)
+                self.disk_hits += 1
+                return entry[0]
+            self.misses += 1
+            return None
+
+    def _add(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        if len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
+
+    def put(self, img_gray, namespace:str, result:list):
+        """
+        Save the result of the OCR of an image, also on disk if the cache has a folder.
+
+        Parameters
+        ----------
+        img_gray : ndarray
+            Grayscale image
+        namespace : str
+            OCR language, mode and size of the image
+        result : list
+            Texts with bounding boxes
+        """
+        key = (namespace, self.get_hash(img_gray))
+        thumbnail = self.get_thumbnail(img_gray)
+        with self._lock:
+            self._add(key, (result, thumbnail))
+            # a different image with the same hash replaces the saved one, the last line of the file wins when loading
+            if self._path is not None and (key not in self._disk_entries or not self._is_same_thumbnail(thumbnail, self._disk_entries[key][1])):
+                self._disk_entries[key] = (result, thumbnail)
+                line = json.dumps({"version": OCR_CACHE_VERSION, "namespace": namespace, "hash": key[1].hex(),
+                                   "thumbnail": base64.b64encode(thumbnail.tobytes()).decode(), "thumbnail_shape": thumbnail.shape,
+                                   "result": [(text, [float(value) for value in bb]) for text, bb in result]})
+                # a single write of the whole line, workers of the same video append to the same file
+                fd = os.open(self._path, os.O_WRONLY | os.O_APPEND | os.O_CREAT)
+                try:
+                    os.write(fd, (line+'\n').encode())
+                finally:
+                    os.close(fd)
+
+    def get_folder(self) -> 'Path | None':
+        return self._path.parent if self._path is not None else None
+
+    def get_stats(self) -> dict:
+        """
+        Get the counters of the cache.
+
+        Returns
+        -------
+        dict
+            hits, disk_hits, misses and hit_rate (fraction of the lookups found)
+        """
+        lookups = self.hits + self.disk_hits + self.misses
+        return {"hits": self.hits, "disk_hits": self.disk_hits, "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.}
+
+    def clear(self):
+        """
+        Remove the in-memory results and reset the counters, the file is kept.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.disk_hits = self.misses = 0
+
+
 class ImageClassifier:
     """
     Image analysis and classification wrapper.
@@ -87,6 +429,12 @@ class ImageClassifier:
     ----------
     _face_detector : FaceDetectorSingleton
         Face detector instance
+    _ocr_cache : OCRCache or None
+        Results of the OCR shared by all the instances, disabled if None
+    _text_likelihood_threshold : float
+        Text likelihood under which OCR is skipped, shared by all the instances
+    _layout : SlideLayout or None
+        Slide area of the frames of the video, text and changes are searched only there if set
     _texts_with_contour : list
         Detected text regions with bounding boxes
     _image : ndarray
@@ -100,14 +448,27 @@ class ImageClassifier:
         Create a copy of the classifier
     detect_faces()
         Detect faces in the image
-    extract_text(return_text=False, with_contours=False)
+    extract_text(return_text=False, with_contours=False, ocr_mode=OCR_MODE_MOSAIC, use_prefilter=False)
         Extract text from image
+    get_text_likelihood()
+        Estimate without OCR how likely the image contains text
     is_same_image(other, threshold=3)
         Compare with another image
     has_changed_slide(other)
         Check if slide has changed
+    set_layout(layout)
+        Set the slide area of the image
+    get_ocr_cache()
+        Get the OCR cache of all the instances
+    set_ocr_cache(ocr_cache)
+        Set the OCR cache of all the instances
+    set_text_likelihood_threshold(threshold)
+        Set the text likelihood under which OCR is skipped for all the instances
     """
     _face_detector = FaceDetectorSingleton()
+    _ocr_cache:'OCRCache | None' = OCRCache()
+    _text_likelihood_threshold:float = TEXT_LIKELIHOOD_THRESHOLD
+    _layout:'SlideLayout | None' = None
     _texts_with_contour:'list[tuple[str,tuple[int,int,int,int]]] | None' = None
     _image = None
     _image_grayscaled = None
@@ -136,8 +497,55 @@ class ImageClassifier:
         new_img:ImageClassifier = ImageClassifier(self._image)
         new_img._image_grayscaled = self._image_grayscaled
         new_img._texts_with_contour = self._texts_with_contour
+        new_img._layout = self._layout
         return new_img
 
+    @classmethod
+    def get_ocr_cache(cls) -> 'OCRCache | None':
+        return cls._ocr_cache
+
+    @classmethod
+    def set_ocr_cache(cls, ocr_cache:'OCRCache | None'):
+        """
+        Set the OCR cache of all the instances.
+
+        Parameters
+        ----------
+        ocr_cache : OCRCache or None
+            Cache of the results, None to always read the text
+        """
+        cls._ocr_cache = ocr_cache
+
+    @classmethod
+    def set_text_likelihood_threshold(cls, threshold:float):
+        """
+        Set the text likelihood under which `extract_text(use_prefilter=True)` doesn't run OCR, for all the instances.
+
+        Parameters
+        ----------
+        threshold : float
+            Threshold in [0,1], 0 always runs OCR
+        """
+        cls._text_likelihood_threshold = threshold
+
+    def set_layout(self, layout:'SlideLayout | None'):
+        """
+        Set the slide area of the image: text is read, and changes are searched, only in the slide rectangle
+        of the layout with its overlays masked. Boxes of the text are fractions of the whole image anyway.
+
+        Parameters
+        ----------
+        layout : SlideLayout or None
+            Layout of the frames of the video, None for the whole image
+
+        Returns
+        -------
+        ImageClassifier
+            Self for method chaining
+        """
+        self._layout = layout if layout is not None and not layout.is_full_frame() else None
+        return self
+
     def detect_faces(self):
         """
         Detect faces in the image.
@@ -176,6 +584,18 @@ class ImageClassifier:
             self._image_grayscaled = self._image_grayscaled[:,:,None]
         return self._image_grayscaled
 
+    def _get_slide_grayscaled(self):
+        """
+        Grayscale image of the slide area of the layout, with the overlays filled with the mean gray of the slide.
+
+        Returns
+        -------
+        ndarray
+            Grayscale slide area, the whole grayscale image without layout
+        """
+        img_bw = self._convert_grayscale()
+        return img_bw if self._layout is None else self._layout.apply(img_bw)
+
     def _preprocess_image(self,img_bw):
         """
         Preprocess image for text detection.
@@ -195,11 +615,110 @@ class ImageClassifier:
         cv2.threshold(img_bw, 0, 255, cv2.THRESH_OTSU | cv2.THRESH_BINARY_INV,img_bw)
         cv2.dilate(img_bw, cv2.getStructuringElement(cv2.MORPH_RECT, (6, 6)), img_bw,iterations = 3)
         return cv2.findContours(img_bw, cv2.RETR_EXTERNAL,cv2.CHAIN_APPROX_NONE)[0]
-    
+
+    def get_text_likelihood(self, min_edges_per_column:float=3., full_text_area:float=0.01, min_contrast:float=6) -> float:
+        """
+        Estimate without OCR how likely the image contains readable text.
+
+        Edges are joined horizontally in blobs, which are kept if they are shaped as lines of text
+        (wider than tall, between 1% and 25% of the image height) and crossed by many edges in every column
+        as glyphs are, whatever the polarity and the size of the text. Edge thresholds follow the contrast
+        of the image, so that the text of fades is found too. The likelihood is the fraction of the image
+        they cover over `full_text_area`, clipped to 1.
+        Flat and blurred images (black transitions, blank screens) have likelihood 0.
+
+        Parameters
+        ----------
+        min_edges_per_column : float, optional
+            Min mean number of edge pixels in a column of a line of text
+        full_text_area : float, optional
+            Fraction of the image covered by text with likelihood 1, about a line of a slide
+        min_contrast : float, optional
+            Min difference of the darkest and the brightest gray levels of an image with text
+
+        Returns
+        -------
+        float
+            Likelihood in [0,1]
+        """
+        img_bw = self._get_slide_grayscaled()
+        img_height, img_width = img_bw.shape
+        dark, bright = cv2.minMaxLoc(img_bw)[:2]
+        if bright - dark < min_contrast:
+            return 0.
+        contrast = min((bright - dark) / 200, 1.)
+        edges = cv2.Canny(img_bw, 100*contrast, 200*contrast)
+        # letters of a line are joined, lines are kept apart
+        kernel_width = max(3, int(img_height*0.015)) | 1
+        blobs = cv2.dilate(edges, cv2.getStructuringElement(cv2.MORPH_RECT, (kernel_width, 3)))
+        text_area = 0
+        for contour in cv2.findContours(blobs, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)[0]:
+            x, y, w, h = cv2.boundingRect(contour)
+            if w > h and img_height*0.01 <= h <= img_height*0.25 and \
+               np.count_nonzero(edges[y:y+h,x:x+w]) >= min_edges_per_column*w:
+                text_area += w*h
+        return min(text_area / (img_width*img_height) / full_text_area, 1.)
+
     def _read_text_with_bbs(self, img, xywh_orig, conf=0) -> List[Tuple[str,Tuple[int,int,int,int]]]:
+        '''
+        Scans with the OCR engine of the thread every word of the image (which is passed as cropped) and groups them in sentences, see _parse_text_data()
+        '''
+        return self._parse_text_data(get_ocr_engine().image_to_data(img), xywh_orig, conf)
+
+    def _read_mosaic_text_with_bbs(self, img_bw, rects:'list[tuple[int,int,int,int]]', conf=0, padding:int=16) -> List[List[Tuple[str,Tuple[int,int,int,int]]]]:
+        '''
+        Reads the text of all the crops of the image with a single OCR call\n
+        Crops are stacked in a mosaic, one under the other separated by `padding` white rows, every word read
+        is mapped back to the crop that contains its vertical center and its line is renumbered inside the crop,
+        then the words of every crop are grouped in sentences as _read_text_with_bbs() does\n
+        Crops with dark background are inverted so that all the mosaic has dark text on light background
+
+        Returns
+        -------
+        list
+            Sentences with bounding boxes of every crop, in the order of `rects`
+        '''
+        if not len(rects):
+            return []
+        img_height,img_width = img_bw.shape
+        mosaic = np.full((sum(h for _,_,_,h in rects) + padding*(len(rects)+1), max(w for _,_,w,_ in rects) + 2*padding), 255, dtype=uint8)
+        tops = []
+        top = padding
+        for x, y, w, h in rects:
+            crop = img_bw[y:y+h,x:x+w]
+            border = np.concatenate((crop[0], crop[-1], crop[:,0], crop[:,-1]))
+            mosaic[top:top+h,padding:padding+w] = crop if np.median(border) >= 128 else 255 - crop
+            tops.append(top)
+            top += h + padding
+        data = get_ocr_engine().image_to_data(mosaic)
+
+        keys = ('text','left','top','width','height','conf','line_num')
+        crops_data = [{key:[] for key in keys} for _ in rects]
+        crops_last_line = [None]*len(rects)
+        crops_num_line = [0]*len(rects)
+        for i, word in enumerate(data['text']):
+            # only words, the entries of pages, blocks, paragraphs and lines have no text
+            if data['level'][i] != 5:
+                continue
+            num_crop = max(int(np.searchsorted(tops, data['top'][i] + data['height'][i]/2, side='right')) - 1, 0)
+            crop_data = crops_data[num_crop]
+            line = (data['block_num'][i], data['par_num'][i], data['line_num'][i])
+            if line != crops_last_line[num_crop]:
+                crops_last_line[num_crop] = line
+                crops_num_line[num_crop] += 1
+            crop_data['line_num'].append(crops_num_line[num_crop])
+            crop_data['text'].append(word)
+            crop_data['left'].append(data['left'][i] - padding)
+            crop_data['top'].append(data['top'][i] - tops[num_crop])
+            crop_data['width'].append(data['width'][i])
+            crop_data['height'].append(data['height'][i])
+            crop_data['conf'].append(data['conf'][i])
+        return [self._parse_text_data(crop_data, (x,y,img_width,img_height), conf) for crop_data, (x,y,_,_) in zip(crops_data, rects)]
+
+    def _parse_text_data(self, data:dict, xywh_orig, conf=0) -> List[Tuple[str,Tuple[int,int,int,int]]]:
         '''
         Read of text is made in this way:
-            - scan with pytesseract every word of the image (which is passed as cropped) and return as dict of words and other infos
+            - data is the dict of words and other infos returned by the OCR engine (as pytesseract.image_to_data()) for the cropped image
             - for every word in the structure i: check if is regognized with a confidence above conf, then save the delta line with respect to the previous
             
             - if there's a delta line equal to zero i check if the previous line is ended ( -> there's a new sentence)
@@ -210,7 +729,6 @@ class ImageClassifier:
             - New line is appended and bounding boxes are normalized with respect to the original size of the full image
             - lastly if there's still some text in the structure but the iterator has ended, save it
         '''
-        data = pytesseract.image_to_data(img, output_type=pytesseract.Output.DICT)
         texts = data['text']
         xs = data['left']
         ys = data['top']
@@ -273,42 +791,59 @@ class ImageClassifier:
 
         return texts_with_bb
 
-    def _scan_image_for_text_and_bounding_boxes(self):
+    def _scan_image_for_text_and_bounding_boxes(self, ocr_mode:int=OCR_MODE_MOSAIC):
         '''
-        Image is preprocessed and cropped in multiple rectangles of texts, then these are singularly analyzed\n
+        Image is preprocessed and cropped in multiple rectangles of texts, then these are analyzed\n
         Firstly turns into black and white\,
         _preprocess_image() finds the contours of text\n
-        for each contour a tuple of (text, bounding_boxes(x,y,w,h)) is read and insorted based on it's min Y value of the contours 
+        for each contour a tuple of (text, bounding_boxes(x,y,w,h)) is read and insorted based on it's min Y value of the contours\n
+        With OCR_MODE_MOSAIC all the crops are read with a single tesseract call (see _read_mosaic_text_with_bbs()),
+        with OCR_MODE_PER_CONTOUR every crop is read with its own call
         
+        With a layout only the slide area is read, boxes are mapped back to the whole image
+
         Prerequisite
         ------------
         RGB, BGR but with len(image_shape) == 3 always\n
         '''
-        img_bw = self._convert_grayscale()
+        img_bw = self._get_slide_grayscaled()
         img_height,img_width = img_bw.shape
         contours = self._preprocess_image(img_bw)
+        rects = [cv2.boundingRect(cnt) for cnt in contours]
+        if ocr_mode == OCR_MODE_MOSAIC:
+            texts_read = self._read_mosaic_text_with_bbs(img_bw, rects)
+        else:
+            texts_read = [self._read_text_with_bbs(img_bw[y:y+h,x:x+w],(x,y,img_width,img_height)) for x, y, w, h in rects]
         y_and_texts_with_bb = []
-        for cnt in contours:
-            x, y, w, h = cv2.boundingRect(cnt)
-            img_cropped = img_bw[y:y+h,x:x+w]
-            text_read = self._read_text_with_bbs(img_cropped,(x,y,img_width,img_height))
+        for (_, y, _, _), text_read in zip(rects, texts_read):
             if text_read:
                 insort_left(y_and_texts_with_bb,(y,text_read))
         self._texts_with_contour = [text_with_bb 
                                     for (_,texts_with_bb) in y_and_texts_with_bb
                                     for text_with_bb in texts_with_bb]
+        if self._layout is not None:
+            self._texts_with_contour = self._layout.map_texts_to_frame(self._texts_with_contour)
         
 
-    def extract_text(self,return_text=False,with_contours=False):
+    def extract_text(self,return_text=False,with_contours=False,ocr_mode:int=OCR_MODE_MOSAIC,use_prefilter:bool=False):
         """
         Extract text from image.
 
+        The result is taken from the OCR cache if an image with the same perceptual hash has already been read,
+        with `use_prefilter` OCR is skipped if the text likelihood of the image is under the threshold (see `get_text_likelihood()`).
+
         Parameters
         ----------
         return_text : bool, optional
             Return extracted text if True
         with_contours : bool, optional
             Include bounding box coordinates if True
+        ocr_mode : int, optional
+            OCR_MODE_MOSAIC to read all the text regions with one tesseract call,
+            OCR_MODE_PER_CONTOUR to read every region with its own call
+        use_prefilter : bool, optional
+            Skip OCR on images without anything shaped as text, meant for the frames of the slide analysis
+            (the filter misses heavily blurred text)
 
         Returns
         -------
@@ -320,7 +855,24 @@ class ImageClassifier:
         """
         if self._image is None:
             self._texts_with_contour = [[]]
-        self._scan_image_for_text_and_bounding_boxes()
+        ocr_cache = ImageClassifier._ocr_cache
+        texts_with_contour = None
+        if ocr_cache is not None:
+            img_bw = self._get_slide_grayscaled()
+            namespace = f"{get_ocr_engine().lang}|{ocr_mode}|{img_bw.shape[1]}x{img_bw.shape[0]}"
+            if self._layout is not None:
+                # the boxes of the results depend on the layout
+                namespace += f"|{self._layout.get_key()}"
+            texts_with_contour = ocr_cache.get(img_bw, namespace)
+        if texts_with_contour is not None:
+            self._texts_with_contour = texts_with_contour
+        elif use_prefilter and self.get_text_likelihood() < ImageClassifier._text_likelihood_threshold:
+            # nothing shaped as text to read
+            self._texts_with_contour = []
+        else:
+            self._scan_image_for_text_and_bounding_boxes(ocr_mode)
+            if ocr_cache is not None:
+                ocr_cache.put(img_bw, namespace, self._texts_with_contour)
         if return_text and with_contours:
             return self._texts_with_contour
         elif return_text and not with_contours:
@@ -351,21 +903,26 @@ class ImageClassifier:
 
     def is_same_image(self,other:'ImageClassifier', threshold=3) -> bool:
         """
-        Compare two images using MSE.
+        Compare two images using MSE, only on the slide area if the image has a layout.
 
         Parameters
         ----------
         other : ImageClassifier
             Image to compare against
         threshold : int, optional
-            MSE threshold for similarity
+            MSE threshold for similarity (previews use `segmentation.PREVIEW_SAME_IMAGE_THRESHOLD`)
 
         Returns
         -------
         bool
             True if images are similar
         """
-        return np.mean((self._image - other._image)**2) < threshold
+        # uint8 differences would wrap around
+        if self._layout is not None:
+            image, other_image = self._layout.apply(self._image, fill=0), self._layout.apply(other._image, fill=0)
+        else:
+            image, other_image = self._image, other._image
+        return np.mean((image.astype(np.float32) - other_image.astype(np.float32))**2) < threshold
 
         comp_method = self._comp_method
         if comp_method == DIST_MEAS_METHOD_COSINE_SIM:
@@ -377,7 +934,7 @@ class ImageClassifier:
         
     def has_changed_slide(self, other:"ImageClassifier") -> bool:
         """
-        Detect significant changes between images.
+        Detect significant changes between images, only on the slide area if the image has a layout.
 
         Parameters
         ----------
@@ -389,13 +946,13 @@ class ImageClassifier:
         bool
             True if significant changes detected
         """
-        if self._image_grayscaled is None:
-            self._convert_grayscale()
-        if other._image_grayscaled is None:
-            other._convert_grayscale()
+        img1_g, img2_g = self._convert_grayscale(), other._convert_grayscale()
+        if self._layout is not None:
+            # overlays are filled with the same value in both images, they never change
+            img1_g, img2_g = self._layout.apply(img1_g, fill=0), self._layout.apply(img2_g, fill=0)
 
         # Compute the absolute difference between the current frame and the previous frame
-        frame_diff = cv2.absdiff(self._image_grayscaled, other._image_grayscaled)
+        frame_diff = cv2.absdiff(img1_g, img2_g)
 
         # Threshold the difference to get the regions with significant changes
         _, thresh = cv2.threshold(frame_diff, 20, 255, cv2.THRESH_BINARY)
@@ -568,6 +1125,107 @@ class ImageClassifier:
                 plt.imshow(image)
 
 
+class OCRWorkerPool:
+    """
+    Threads that extract the text of frames in background.
+
+    Every worker thread uses its own OCR engine (see `media.ocr.get_ocr_engine()`), created once
+    and reused for all the frames it reads. The in-process tesseract releases the GIL while reading,
+    so workers run in parallel; with the pytesseract fallback they wait their own subprocesses.
+
+    Attributes
+    ----------
+    _executor : ThreadPoolExecutor
+        Worker threads
+    _layout : SlideLayout or None
+        Slide area of the frames read, see `ImageClassifier.set_layout()`
+
+    Methods
+    -------
+    submit(image, return_text, with_contours, use_prefilter)
+        Extract the text of a frame in background
+    map(images, return_text, with_contours, use_prefilter)
+        Extract the text of a batch of frames, results in order
+    close()
+        Wait the pending frames and stop the workers
+    """
+
+    def __init__(self, num_workers:'int | None'=None, layout:'SlideLayout | None'=None):
+        """
+        Parameters
+        ----------
+        num_workers : int or None, optional
+            Number of worker threads, all the cores if None
+        layout : SlideLayout or None, optional
+            Slide area of the frames read, None for the whole frames
+        """
+        self._executor = ThreadPoolExecutor(max_workers=num_workers or os.cpu_count(), thread_name_prefix="ocr")
+        self._layout = layout
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @staticmethod
+    def _extract_text(image, layout:'SlideLayout | None', return_text:bool, with_contours:bool, use_prefilter:bool):
+        return ImageClassifier(image).set_layout(layout).extract_text(return_text=return_text, with_contours=with_contours,
+                                                                      use_prefilter=use_prefilter)
+
+    def submit(self, image, return_text:bool=True, with_contours:bool=False, use_prefilter:bool=False) -> Future:
+        """
+        Extract the text of a frame in background, see `ImageClassifier.extract_text()`.
+
+        The frame must not be modified until the result is ready, copy reused buffers before submitting.
+
+        Parameters
+        ----------
+        image : ndarray
+            Frame to read
+        return_text : bool, optional
+            Return extracted text if True
+        with_contours : bool, optional
+            Include bounding box coordinates if True
+        use_prefilter : bool, optional
+            Skip OCR if the frame has nothing shaped as text
+
+        Returns
+        -------
+        Future
+            Future of the result of `extract_text()`
+        """
+        return self._executor.submit(self._extract_text, image, self._layout, return_text, with_contours, use_prefilter)
+
+    def map(self, images, return_text:bool=True, with_contours:bool=False, use_prefilter:bool=False) -> list:
+        """
+        Extract the text of a batch of frames in parallel.
+
+        Parameters
+        ----------
+        images : iterable of ndarray
+            Frames to read
+        return_text : bool, optional
+            Return extracted text if True
+        with_contours : bool, optional
+            Include bounding box coordinates if True
+        use_prefilter : bool, optional
+            Skip OCR on the frames with nothing shaped as text
+
+        Returns
+        -------
+        list
+            Results of `extract_text()` in the order of the frames
+        """
+        return [future.result() for future in [self.submit(image, return_text, with_contours, use_prefilter) for image in images]]
+
+    def close(self):
+        """
+        Wait the pending frames and stop the workers.
+        """
+        self._executor.shutdown(wait=True)
+
+
 def draw_bounding_boxes_on_image(img, bounding_boxes:'list[tuple[(int,int,int,int)]]'):
     """
     Draw bounding boxes on an image.
@@ -0,0 +1,389 @@
+"""
+Slide layout module.
+
+Finds where the slide is in the frames of a lecture from a small sample of frames: many recordings are
+picture-in-picture (a presenter camera next to or over a slide panel) or have static logos and banners
+over the slide. The layout is the rectangle of the slide, which frames are cropped to, and the boxes
+of the overlays inside it (presenter camera, logos, banners), which are masked.\n
+Every sample is a pair of frames about a second apart:
+- the presenter camera changes between the frames of most pairs
+- the slide is still between the frames of a pair and changes across the video
+- overlays never change and have edges
+
+Classes
+-------
+SlideLayout
+    Slide rectangle and masked overlays of the frames of a video
+"""
+
+import cv2
+import numpy as np
+from pathlib import Path
+
+from media.video import VIDEOS_PATH, FrameSampler
+
+
+class SlideLayout:
+    """
+    Slide rectangle and masked overlays of the frames of a video.
+
+    Boxes are (x0, y0, x1, y1) fractions of the width and the height of the frame, so that the layout
+    applies to frames of any resolution of the video (full frames, previews, thumbnails).
+
+    Attributes
+    ----------
+    slide_box : tuple
+        Rectangle of the slide, the whole frame if no slide area is found
+    masked_boxes : list
+        Boxes of the overlays inside the slide rectangle
+    _masks : dict
+        Masks of the overlays by frame size
+
+    Methods
+    -------
+    detect(frames, next_frames, ...)
+        Find the layout from pairs of grayscale frames
+    detect_from_store(store, num_samples)
+        Find the layout from the thumbnails of a `FrameFeatureStore`
+    detect_from_video(video_id, num_samples, pair_seconds, frame_size, _testing_path)
+        Find the layout decoding a sample of frames of a video
+    is_full_frame()
+        Whether the layout neither crops nor masks
+    get_slide_rect(width, height)
+        Rectangle of the slide in pixels
+    get_mask(width, height, cropped)
+        Pixels of the overlays
+    apply(img, fill, stacked)
+        Crop an image to the slide and fill its overlays
+    map_texts_to_frame(texts_with_bb)
+        Map the boxes of the texts read in the slide to the frame
+    get_key()
+        Short string that identifies the layout
+    to_dict()
+        Layout as a dict, as stored in the video data
+    from_dict(data)
+        Layout from a dict
+    """
+
+    def __init__(self, slide_box:'tuple[float,float,float,float]'=(0.,0.,1.,1.),
+                 masked_boxes:'list[tuple[float,float,float,float]] | None'=None):
+        """
+        Parameters
+        ----------
+        slide_box : tuple, optional
+            Rectangle (x0, y0, x1, y1) of the slide as fractions of the frame, the whole frame by default
+        masked_boxes : list or None, optional
+            Boxes (x0, y0, x1, y1) of the overlays as fractions of the frame
+        """
+        self.slide_box = tuple(float(coord) for coord in slide_box)
+        self.masked_boxes = [tuple(float(coord) for coord in box) for box in (masked_boxes or [])]
+        self._masks = {}
+
+    @staticmethod
+    def _find_border(edges, moving, start:int, stop:int, step:int, lines:slice, min_edge_fraction:float, default:int) -> int:
+        """
+        First line from `start` towards `stop` crossed by edges or moving content in `min_edge_fraction` of `lines`,
+        `default` if there is none. `edges` and `moving` have the lines on the first axis.
+        """
+        for line in range(start, stop, step):
+            if np.count_nonzero(edges[line, lines] | moving[line, lines]) >= min_edge_fraction*(lines.stop - lines.start):
+                return line
+        return default
+
+    @classmethod
+    def detect(cls, frames, next_frames, motion_threshold:int=16, min_motion_rate:float=0.25,
+               change_threshold:int=24, edge_threshold:int=24, min_edge_fraction:float=0.5,
+               min_slide_area:float=0.15, min_overlay_area:float=0.005, max_overlay_area:float=0.15,
+               border:float=0.2) -> 'SlideLayout':
+        """
+        Find the layout from pairs of grayscale frames.
+
+        Pixels that change between the frames of at least `min_motion_rate` of the pairs are moving content
+        (the presenter camera), pixels that change across the pairs and not within them are the slide.
+        Their bounding rectangle is extended on every side up to the border of the slide panel, the first line
+        crossed by edges of the mean frame or by moving content in `min_edge_fraction` of its length, or the frame border.
+        Moving areas inside the rectangle are masked and so are, near its border, the still areas with edges
+        that have no changing pixels around (logos, banners, not the fixed words of the titles).\n
+        If the rectangle covers less than `min_slide_area` of the frame the layout is the whole frame.
+
+        Parameters
+        ----------
+        frames : ndarray
+            Grayscale frames sampled over the video, shape (num_samples, height, width)
+        next_frames : ndarray
+            Frames about a second after `frames`, same shape
+        motion_threshold : int, optional
+            Min gray level difference of a pixel that changes between the frames of a pair
+        min_motion_rate : float, optional
+            Min fraction of the pairs where a moving pixel changes
+        change_threshold : int, optional
+            Min range of gray levels over the samples of a pixel that changes across the video
+        edge_threshold : int, optional
+            Min difference of gray levels of adjacent pixels of the mean frame on an edge
+        min_edge_fraction : float, optional
+            Min fraction of a line crossed by edges on the border of the slide panel
+        min_slide_area : float, optional
+            Min fraction of the frame covered by the slide rectangle
+        min_overlay_area : float, optional
+            Min fraction of the frame of an overlay
+        max_overlay_area : float, optional
+            Max fraction of the slide rectangle of a still overlay
+        border : float, optional
+            Fraction of the slide rectangle near its border where still overlays are searched
+
+        Returns
+        -------
+        SlideLayout
+            Layout of the frames
+        """
+        frames = np.asarray(frames, dtype=np.int16)
+        next_frames = np.asarray(next_frames, dtype=np.int16)
+        if len(frames) < 4:
+            return cls()
+        height, width = frames.shape[1:]
+        kernel_size = max(3, int(width*0.02)) | 1
+        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (kernel_size, kernel_size))
+        small_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3))
+
+        moving = ((np.abs(next_frames - frames) > motion_threshold).mean(axis=0) >= min_motion_rate).astype(np.uint8)
+        moving = cv2.dilate(cv2.morphologyEx(moving, cv2.MORPH_OPEN, small_kernel), kernel) > 0
+        changing = (frames.max(axis=0) - frames.min(axis=0)) > change_threshold
+        slide = cv2.morphologyEx((changing & ~moving).astype(np.uint8), cv2.MORPH_OPEN, small_kernel)
+        if np.count_nonzero(slide) == 0:
+            return cls()
+        x, y, w, h = cv2.boundingRect(slide)
+
+        mean_frame = frames.mean(axis=0)
+        # edges between a pixel and the previous one, on columns and on rows
+        vertical_edges = np.zeros((width, height), dtype=bool)
+        vertical_edges[1:] = (np.abs(np.diff(mean_frame, axis=1)) > edge_threshold).T
+        horizontal_edges = np.zeros((height, width), dtype=bool)
+        horizontal_edges[1:] = np.abs(np.diff(mean_frame, axis=0)) > edge_threshold
+        rows, columns = slice(y, y+h), slice(x, x+w)
+        no_motion = np.zeros_like(moving)
+        x0 = cls._find_border(vertical_edges, moving.T, x, 0, -1, rows, min_edge_fraction, 0)
+        x1 = cls._find_border(vertical_edges, moving.T, x+w, width, 1, rows, min_edge_fraction, width)
+        y0 = cls._find_border(horizontal_edges, moving, y, 0, -1, columns, min_edge_fraction, 0)
+        y1 = cls._find_border(horizontal_edges, moving, y+h, height, 1, columns, min_edge_fraction, height)
+        if (x1-x0)*(y1-y0) < min_slide_area*width*height:
+            return cls()
+        # a slide that almost fills the frame is not cropped
+        if x1-x0 >= 0.95*width and y1-y0 >= 0.95*height:
+            x0, y0, x1, y1 = 0, 0, width, height
+
+        # the parts of the presenter that move are joined and their box is extended to the border of the camera panel if there is one
+        masked_boxes = []
+        camera = cv2.morphologyEx(moving[y0:y1, x0:x1].astype(np.uint8), cv2.MORPH_CLOSE,
+                                  cv2.getStructuringElement(cv2.MORPH_RECT, (3*kernel_size, 3*kernel_size)))
+        num_components, _, stats, _ = cv2.connectedComponentsWithStats(camera)
+        for num_component in range(1, num_components):
+            mx, my, mw, mh, area = stats[num_component]
+            if area < min_overlay_area*width*height:
+                continue
+            mx0, my0, mx1, my1 = x0+mx, y0+my, x0+mx+mw, y0+my+mh
+            camera_rows, camera_columns = slice(my0, my1), slice(mx0, mx1)
+            mx0 = cls._find_border(vertical_edges, no_motion.T, mx0, x0, -1, camera_rows, min_edge_fraction, mx0)
+            mx1 = cls._find_border(vertical_edges, no_motion.T, mx1, x1, 1, camera_rows, min_edge_fraction, mx1)
+            my0 = cls._find_border(horizontal_edges, no_motion, my0, y0, -1, camera_columns, min_edge_fraction, my0)
+            my1 = cls._find_border(horizontal_edges, no_motion, my1, y1, 1, camera_columns, min_edge_fraction, my1)
+            masked_boxes.append((mx0, my0, mx1, my1))
+
+        gradient = horizontal_edges | vertical_edges.T
+        still = (gradient & ~changing & ~moving)[y0:y1, x0:x1].astype(np.uint8)
+        # the first row and column are the edges of the border of the panel
+        still[0], still[:,0] = 0, 0
+        still = cv2.dilate(still, kernel)
+        around_changing = cv2.dilate(changing[y0:y1, x0:x1].astype(np.uint8), kernel) > 0
+        num_components, labels, stats, _ = cv2.connectedComponentsWithStats(still)
+        slide_w, slide_h = x1-x0, y1-y0
+        for num_component in range(1, num_components):
+            sx, sy, sw, sh, area = stats[num_component]
+            near_border = sx+sw <= border*slide_w or sx >= (1-border)*slide_w or \
+                          sy+sh <= border*slide_h or sy >= (1-border)*slide_h
+            if near_border and min_overlay_area*width*height <= sw*sh <= max_overlay_area*slide_w*slide_h and \
+               not np.any(around_changing[labels == num_component]):
+                masked_boxes.append((x0+sx, y0+sy, x0+sx+sw, y0+sy+sh))
+
+        return cls((x0/width, y0/height, x1/width, y1/height),
+                   [(bx0/width, by0/height, bx1/width, by1/height) for bx0, by0, bx1, by1 in masked_boxes])
+
+    @classmethod
+    def detect_from_store(cls, store, num_samples:int=32) -> 'SlideLayout':
+        """
+        Find the layout from the thumbnails of a `FrameFeatureStore`, every sample is a thumbnail and the following one.
+
+        Parameters
+        ----------
+        store : FrameFeatureStore
+            Features of the video
+        num_samples : int, optional
+            Number of pairs of thumbnails spread over the video
+
+        Returns
+        -------
+        SlideLayout
+            Layout of the frames
+        """
+        thumbnails = store.thumbnails
+        if len(thumbnails) < 2:
+            return cls()
+        rows = np.unique(np.linspace(0, len(thumbnails)-2, num_samples).astype(int))
+        return cls.detect(thumbnails[rows], thumbnails[rows+1])
+
+    @classmethod
+    def detect_from_video(cls, video_id:str, num_samples:int=32, pair_seconds:float=1,
+                          frame_size:'tuple[int,int]'=(160,90), _testing_path=None) -> 'SlideLayout':
+        """
+        Find the layout decoding pairs of frames `pair_seconds` apart spread over a video.
+
+        Parameters
+        ----------
+        video_id : str
+            Id of the video
+        num_samples : int, optional
+            Number of pairs of frames
+        pair_seconds : float, optional
+            Seconds between the frames of a pair
+        frame_size : tuple, optional
+            Size (width, height) the frames are scaled to
+        _testing_path : str, optional
+            Override path of the video folder for testing
+
+        Returns
+        -------
+        SlideLayout
+            Layout of the frames
+        """
+        video_folder = VIDEOS_PATH.joinpath(video_id) if _testing_path is None else Path(_testing_path)
+        vidcap = cv2.VideoCapture(video_folder.joinpath(video_id+".mp4").__str__())
+        if not vidcap.isOpened():
+            raise Exception(f"Can't find video: {video_id}")
+        num_frames = int(vidcap.get(cv2.CAP_PROP_FRAME_COUNT))
+        pair_frames = max(int(vidcap.get(cv2.CAP_PROP_FPS)*pair_seconds), 1)
+        sampler = FrameSampler(vidcap)
+        frames, next_frames = [], []
+        for num_frame in np.unique(np.linspace(0, max(num_frames-pair_frames-1, 0), num_samples).astype(int)):
+            pair = [sampler.read(int(num_frame)), sampler.read(int(num_frame)+pair_frames)]
+            if pair[0] is None or pair[1] is None:
+                continue
+            frame, next_frame = (cv2.cvtColor(cv2.resize(image, frame_size, interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+                                 for image in pair)
+            frames.append(frame)
+            next_frames.append(next_frame)
+        vidcap.release()
+        if len(frames) == 0:
+            return cls()
+        return cls.detect(np.stack(frames), np.stack(next_frames))
+
+    def is_full_frame(self) -> bool:
+        return self.slide_box == (0.,0.,1.,1.) and not self.masked_boxes
+
+    def get_slide_rect(self, width:int, height:int) -> 'tuple[int,int,int,int]':
+        """
+        Rectangle of the slide in pixels of a frame.
+
+        Parameters
+        ----------
+        width : int
+            Width of the frame
+        height : int
+            Height of the frame
+
+        Returns
+        -------
+        tuple
+            x0, y0, x1, y1 of the rectangle
+        """
+        x0, y0, x1, y1 = self.slide_box
+        return int(x0*width + 0.5), int(y0*height + 0.5), max(int(x1*width + 0.5), 1), max(int(y1*height + 0.5), 1)
+
+    def get_mask(self, width:int, height:int, cropped:bool=True):
+        """
+        Pixels of the overlays of a frame, computed once per frame size.
+
+        Parameters
+        ----------
+        width : int
+            Width of the frame
+        height : int
+            Height of the frame
+        cropped : bool, optional
+            Mask of the slide rectangle if True, of the whole frame otherwise
+
+        Returns
+        -------
+        ndarray or None
+            Boolean mask, True on the overlays, None if there are no overlays
+        """
+        if not self.masked_boxes:
+            return None
+        if (width, height) not in self._masks:
+            mask = np.zeros((height, width), dtype=bool)
+            for bx0, by0, bx1, by1 in self.masked_boxes:
+                mask[int(by0*height):int(np.ceil(by1*height)), int(bx0*width):int(np.ceil(bx1*width))] = True
+            self._masks[(width, height)] = mask
+        mask = self._masks[(width, height)]
+        if not cropped:
+            return mask
+        x0, y0, x1, y1 = self.get_slide_rect(width, height)
+        return mask[y0:y1, x0:x1]
+
+    def apply(self, img, fill:'int | None'=None, stacked:bool=False):
+        """
+        Crop an image to the slide rectangle and fill its overlays.
+
+        Parameters
+        ----------
+        img : ndarray
+            Image of shape (height, width) or (height, width, channels)
+        fill : int or None, optional
+            Value of the overlays, None for the mean color of the rest of the slide (no edges are added to the text)
+        stacked : bool, optional
+            Whether `img` is a stack of frames, shape (num_frames, height, width)
+
+        Returns
+        -------
+        ndarray
+            The crop, a view of the image if there are no overlays
+        """
+        height, width = img.shape[int(stacked):int(stacked)+2]
+        x0, y0, x1, y1 = self.get_slide_rect(width, height)
+        index = (slice(None),)*int(stacked) + (slice(y0,y1), slice(x0,x1))
+        crop = img[index]
+        mask = self.get_mask(width, height)
+        if mask is None:
+            return crop
+        crop = crop.copy()
+        if fill is None:
+            fill = cv2.mean(crop, mask=(~mask).astype(np.uint8))[:1 if crop.ndim == 2 else crop.shape[2]]
+        crop[(slice(None),)*int(stacked) + (mask,)] = fill
+        return crop
+
+    def map_texts_to_frame(self, texts_with_bb:'list[tuple[str,tuple[float,float,float,float]]]') -> 'list[tuple[str,tuple[float,float,float,float]]]':
+        """
+        Map the boxes of the texts read in the slide rectangle to the frame.
+
+        Parameters
+        ----------
+        texts_with_bb : list
+            Texts with (x, y, w, h) boxes as fractions of the slide rectangle
+
+        Returns
+        -------
+        list
+            Texts with (x, y, w, h) boxes as fractions of the frame
+        """
+        x0, y0, x1, y1 = self.slide_box
+        return [(text, (x0 + x*(x1-x0), y0 + y*(y1-y0), w*(x1-x0), h*(y1-y0))) for text, (x, y, w, h) in texts_with_bb]
+
+    def get_key(self) -> str:
+        return "-".join(f"{coord:.3f}" for box in [self.slide_box] + self.masked_boxes for coord in box)
+
+    def to_dict(self) -> dict:
+        return {"slide_box": list(self.slide_box), "masked_boxes": [list(box) for box in self.masked_boxes]}
+
+    @classmethod
+    def from_dict(cls, data:'dict | None') -> 'SlideLayout':
+        if data is None:
+            return cls()
+        return cls(data["slide_box"], data["masked_boxes"])
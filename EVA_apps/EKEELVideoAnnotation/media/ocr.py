@@ -0,0 +1,226 @@
+"""
+OCR backends module.
+
+Engines that read the words of an image and return them in the format of `pytesseract.image_to_data`
+(dict of lists: level, block_num, par_num, line_num, left, top, width, height, conf, text, ...),
+so that `ImageClassifier` can group them in sentences independently from the backend.
+
+Classes
+-------
+PytesseractEngine
+    Runs the tesseract executable for every image
+TesserocrEngine
+    Keeps a tesseract instance in the process, language data is loaded once
+
+Functions
+---------
+get_ocr_engine
+    Get the engine of the current thread
+set_ocr_backend
+    Set the backend of the engines
+"""
+
+import os
+from threading import local
+
+import numpy as np
+import pytesseract
+pytesseract.pytesseract.tesseract_cmd = "/usr/bin/tesseract"
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
+
+OCR_BACKEND_PYTESSERACT = "pytesseract"
+OCR_BACKEND_TESSEROCR = "tesserocr"
+
+_ocr_backend = OCR_BACKEND_TESSEROCR if tesserocr is not None else OCR_BACKEND_PYTESSERACT
+_thread_engines = local()
+_is_fallback_logged = False
+
+
+def _log_fallback(reason:str):
+    """
+    Print, once per process, that the OCR runs a tesseract subprocess per image instead of the in-process engine.
+    """
+    global _is_fallback_logged
+    if not _is_fallback_logged:
+        print(f"Warning: {reason}, falling back to pytesseract (a tesseract process for every image)")
+        _is_fallback_logged = True
+
+
+class PytesseractEngine:
+    """
+    OCR engine that runs the tesseract executable for every image.
+
+    Every call starts a process that loads the language data again.
+
+    Attributes
+    ----------
+    lang : str
+        Tesseract language code
+
+    Methods
+    -------
+    image_to_data(img)
+        Read the words of an image
+    close()
+        Release the engine
+    """
+
+    def __init__(self, lang:str='eng'):
+        self.lang = lang
+
+    def image_to_data(self, img) -> dict:
+        """
+        Read the words of an image.
+
+        Parameters
+        ----------
+        img : ndarray
+            Grayscale or color image
+
+        Returns
+        -------
+        dict
+            Words and boxes, see `pytesseract.image_to_data`
+        """
+        return pytesseract.image_to_data(img, lang=self.lang, output_type=pytesseract.Output.DICT)
+
+    def close(self):
+        pass
+
+
+class TesserocrEngine:
+    """
+    OCR engine that keeps a tesseract instance (TessBaseAPI) in the process.
+
+    The language data is loaded once when the engine is created, images are passed in memory.
+    An instance must be used by one thread at a time, see `get_ocr_engine()`.
+
+    Attributes
+    ----------
+    lang : str
+        Tesseract language code
+    _api : tesserocr.PyTessBaseAPI
+        Tesseract instance
+
+    Methods
+    -------
+    image_to_data(img)
+        Read the words of an image
+    close()
+        Release the tesseract instance
+    """
+    _TSV_COLUMNS = ('level','page_num','block_num','par_num','line_num','word_num','left','top','width','height','conf','text')
+
+    def __init__(self, lang:str='eng'):
+        """
+        Load tesseract with the language data from `TESSDATA_PREFIX` if set, otherwise from the default folder of tesserocr.
+
+        Parameters
+        ----------
+        lang : str, optional
+            Tesseract language code
+
+        Raises
+        ------
+        Exception
+            If tesserocr is not installed or the language data is not found
+        """
+        if tesserocr is None:
+            raise Exception("tesserocr is not installed")
+        self.lang = lang
+        tessdata_path = os.environ.get("TESSDATA_PREFIX")
+        try:
+            if tessdata_path is not None:
+                self._api = tesserocr.PyTessBaseAPI(path=tessdata_path, lang=lang)
+            else:
+                self._api = tesserocr.PyTessBaseAPI(lang=lang)
+        except RuntimeError as e:
+            raise Exception(f"Can't load tesseract language {lang}: {e}")
+
+    def image_to_data(self, img) -> dict:
+        """
+        Read the words of an image.
+
+        Parameters
+        ----------
+        img : ndarray
+            Grayscale or color image, channels are passed in their order as `pytesseract` does
+
+        Returns
+        -------
+        dict
+            Words and boxes in the format of `pytesseract.image_to_data`
+        """
+        img = np.ascontiguousarray(img[:,:,0] if img.ndim == 3 and img.shape[2] == 1 else img)
+        height, width = img.shape[:2]
+        bytes_per_pixel = 1 if img.ndim == 2 else img.shape[2]
+        self._api.SetImageBytes(img.tobytes(), width, height, bytes_per_pixel, bytes_per_pixel*width)
+        self._api.Recognize()
+        data = {column: [] for column in self._TSV_COLUMNS}
+        for row in self._api.GetTSVText(0).splitlines():
+            # the text cell is missing when the text is empty
+            values = row.split('\t')
+            for column, value in zip(self._TSV_COLUMNS[:-1], values):
+                data[column].append(int(float(value)))
+            data['text'].append(values[-1] if len(values) == len(self._TSV_COLUMNS) else '')
+        return data
+
+    def close(self):
+        """
+        Release the tesseract instance.
+        """
+        self._api.End()
+
+
+def set_ocr_backend(backend:str):
+    """
+    Set the backend of the engines created from now on.
+
+    Parameters
+    ----------
+    backend : str
+        OCR_BACKEND_TESSEROCR or OCR_BACKEND_PYTESSERACT
+    """
+    global _ocr_backend
+    assert backend in (OCR_BACKEND_TESSEROCR, OCR_BACKEND_PYTESSERACT)
+    if backend == OCR_BACKEND_TESSEROCR and tesserocr is None:
+        _log_fallback("tesserocr is not installed")
+        backend = OCR_BACKEND_PYTESSERACT
+    _ocr_backend = backend
+
+
+def get_ocr_engine(lang:str='eng'):
+    """
+    Get the engine of the current thread for a language, created at the first call.
+
+    Every thread has its own engines because a tesseract instance can't be shared between threads.
+    If the tesserocr engine can't be loaded the pytesseract one is used.
+
+    Parameters
+    ----------
+    lang : str, optional
+        Tesseract language code
+
+    Returns
+    -------
+    TesserocrEngine or PytesseractEngine
+        Engine of the current thread
+    """
+    engines = getattr(_thread_engines, "engines", None)
+    if engines is None:
+        engines = _thread_engines.engines = {}
+    key = (_ocr_backend, lang)
+    if key not in engines:
+        engine = None
+        if _ocr_backend == OCR_BACKEND_TESSEROCR:
+            try:
+                engine = TesserocrEngine(lang)
+            except Exception as e:
+                _log_fallback(str(e))
+        elif tesserocr is None:
+            _log_fallback("tesserocr is not installed")
+        engines[key] = engine or PytesseractEngine(lang)
+    return engines[key]
@@ -0,0 +1,349 @@
+"""
+Scene change detection module.
+
+Computes a dense change signal over a whole video from small grayscale frames sampled at fixed rate,
+with numpy operations on chunks of frames instead of per-frame Python loops, and finds the scene
+boundaries as the peaks of the signal.\n
+The signal of a frame combines three distances from the previous sampled frame:
+- histogram distance: half L1 distance of the normalized gray histograms, robust to small motion
+- absdiff energy: mean absolute pixel difference, sensitive to any content change
+- edge difference: fraction of the edge pixels that appear or disappear, sensitive to changes of text and layout
+  and not to global brightness changes
+
+Classes
+-------
+SceneChangeDetector
+    Dense change signal and scene boundaries of a video
+"""
+
+import cv2
+import numpy as np
+from pathlib import Path
+from shutil import which
+
+from media.video import VIDEOS_PATH, FFmpegFrameStream, FrameSampler, COLOR_GRAY
+
+
+class SceneChangeDetector:
+    """
+    Dense change signal and scene boundaries of a video.
+
+    Frames are decoded once, scaled and converted to gray by ffmpeg when installed (otherwise by OpenCV),
+    or read from the thumbnails of a `FrameFeatureStore` without decoding the video.\n
+    A boundary is a sample whose signal is above an adaptive threshold (median of the signal plus
+    `sensitivity` times its robust standard deviation, never lower than `min_change`) and is the max
+    of the signal in a window of `min_scene_seconds` around it.
+
+    Attributes
+    ----------
+    frame_size : tuple
+        Size (width, height) of the analyzed frames
+    sample_fps : float
+        Analyzed frames per second of video
+    hist_bins : int
+        Number of bins of the gray histograms, a power of 2
+    edge_threshold : int
+        Min gradient magnitude of an edge pixel
+    weights : tuple
+        Weights of histogram distance, absdiff energy and edge difference in the signal
+    sensitivity : float
+        Number of robust standard deviations above the median of a boundary
+    min_change : float
+        Min signal of a boundary
+    min_scene_seconds : float
+        Min distance between two boundaries
+    chunk_size : int
+        Number of frames processed together
+
+    Methods
+    -------
+    compute_signal(video_id, store, _testing_path, layout)
+        Compute the change signal of every sampled frame of a video
+    find_boundaries(timestamps, signal, threshold_scale)
+        Find the scene boundaries from a change signal
+    find_shots(timestamps, signal, threshold_scale)
+        Split the samples in shots at the scene boundaries
+    detect(video_id, store, threshold_scale, _testing_path, layout)
+        Compute the change signal of a video and find its scene boundaries
+    """
+
+    def __init__(self, frame_size:'tuple[int,int]'=(160,90), sample_fps:float=2, hist_bins:int=32,
+                 edge_threshold:int=24, weights:'tuple[float,float,float]'=(1.,1.,1.), sensitivity:float=4.,
+                 min_change:float=0.03, min_scene_seconds:float=1., chunk_size:int=256):
+        """
+        Initialize the detector.
+
+        Parameters
+        ----------
+        frame_size : tuple, optional
+            Size (width, height) of the analyzed frames, ignored when reading from a store
+        sample_fps : float, optional
+            Analyzed frames per second of video, ignored when reading from a store
+        hist_bins : int, optional
+            Number of bins of the gray histograms, a power of 2 up to 256
+        edge_threshold : int, optional
+            Min gradient magnitude of an edge pixel
+        weights : tuple, optional
+            Weights of histogram distance, absdiff energy and edge difference in the signal
+        sensitivity : float, optional
+            Number of robust standard deviations above the median of a boundary
+        min_change : float, optional
+            Min signal of a boundary, avoids boundaries on noise in videos with few changes
+        min_scene_seconds : float, optional
+            Min distance between two boundaries
+        chunk_size : int, optional
+            Number of frames processed together, bounds the memory used
+        """
+        assert hist_bins in (2**exp for exp in range(9))
+        self.frame_size = tuple(int(dim) for dim in frame_size)
+        self.sample_fps = sample_fps
+        self.hist_bins = hist_bins
+        self.edge_threshold = edge_threshold
+        self.weights = np.array(weights, dtype=np.float32) / sum(weights)
+        self.sensitivity = sensitivity
+        self.min_change = min_change
+        self.min_scene_seconds = min_scene_seconds
+        self.chunk_size = chunk_size
+
+    def _iter_frames(self, video_id:str, _testing_path=None):
+        """
+        Yields the number and the gray frame (at `frame_size`) of every sampled frame of the video.
+        """
+        video_folder = VIDEOS_PATH.joinpath(video_id) if _testing_path is None else Path(_testing_path)
+        video_path = video_folder.joinpath(video_id+".mp4")
+        vidcap = cv2.VideoCapture(video_path.__str__())
+        if not vidcap.isOpened():
+            raise Exception(f"Can't find video: {video_id}")
+        src_fps = vidcap.get(cv2.CAP_PROP_FPS)
+        num_frames = int(vidcap.get(cv2.CAP_PROP_FRAME_COUNT))
+        self._src_fps = src_fps
+        if which("ffmpeg") is not None:
+            vidcap.release()
+            stream = FFmpegFrameStream(video_path.__str__(), self.frame_size, src_fps, COLOR_GRAY, sample_fps=self.sample_fps)
+            for num_frame, frame in stream.iter_frames():
+                yield num_frame, frame[:,:,0]
+            stream.close()
+            return
+        sampler = FrameSampler(vidcap, default_max_grab_gap=int(src_fps/self.sample_fps)+1)
+        num_sample = 0
+        while True:
+            num_frame = int(num_sample / self.sample_fps * src_fps + 0.5)
+            frame = sampler.read(num_frame) if num_frame < num_frames else None
+            if frame is None:
+                break
+            yield num_frame, cv2.cvtColor(cv2.resize(frame, self.frame_size, interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+            num_sample += 1
+        vidcap.release()
+
+    def _get_hists(self, frames):
+        """
+        Normalized gray histograms of a stack of frames, shape (num_frames, hist_bins).
+        """
+        num_frames = len(frames)
+        bins = (frames.reshape(num_frames, -1) >> (8 - int(np.log2(self.hist_bins)))).astype(np.int64)
+        bins += np.arange(num_frames)[:,None] * self.hist_bins
+        counts = np.bincount(bins.ravel(), minlength=num_frames*self.hist_bins)
+        return counts.reshape(num_frames, self.hist_bins) / bins.shape[1]
+
+    def _get_edges(self, frames):
+        """
+        Edge maps of a stack of frames from the gradient magnitude, shape (num_frames, height-1, width-1).
+        """
+        frames = frames.astype(np.int16)
+        grad_x = np.abs(frames[:,:-1,1:] - frames[:,:-1,:-1])
+        grad_y = np.abs(frames[:,1:,:-1] - frames[:,:-1,:-1])
+        return grad_x + grad_y > self.edge_threshold
+
+    def _get_sharpness(self, frames):
+        """
+        Variance of the Laplacian of every frame of a stack, shape (num_frames,).
+        """
+        frames = frames.astype(np.int32)
+        laplacian = frames[:,:-2,1:-1] + frames[:,2:,1:-1] + frames[:,1:-1,:-2] + frames[:,1:-1,2:] - 4*frames[:,1:-1,1:-1]
+        return laplacian.reshape(len(frames), -1).var(axis=1)
+
+    def _get_changes(self, frames):
+        """
+        Histogram distance, absdiff energy and edge difference of every frame from the previous one,
+        shape (num_frames-1, 3).
+        """
+        changes = np.empty((len(frames)-1, 3), dtype=np.float32)
+        hists = self._get_hists(frames)
+        changes[:,0] = np.abs(hists[1:] - hists[:-1]).sum(axis=1) / 2
+        changes[:,1] = np.abs(frames[1:].astype(np.int16) - frames[:-1]).mean(axis=(1,2)) / 255
+        edges = self._get_edges(frames)
+        changed_edges = (edges[1:] ^ edges[:-1]).sum(axis=(1,2))
+        all_edges = (edges[1:] | edges[:-1]).sum(axis=(1,2))
+        changes[:,2] = changed_edges / np.maximum(all_edges, 1)
+        return changes
+
+    def compute_signal(self, video_id:str, store=None, _testing_path=None, layout=None):
+        """
+        Compute the change signal of every sampled frame of a video.
+
+        Parameters
+        ----------
+        video_id : str
+            Identifier of the video
+        store : FrameFeatureStore, optional
+            Features of the video, its thumbnails are used instead of decoding the video
+        _testing_path : str, optional
+            Override path of the video folder for testing
+        layout : SlideLayout, optional
+            Slide area of the frames, the signal is computed only there (overlays don't change it)
+
+        Returns
+        -------
+        tuple
+            Frame numbers (num_samples,), timestamps in seconds (num_samples,),
+            signal (num_samples,) and its components (num_samples, 3), all in [0,1],
+            sharpness of every sample (num_samples,) as variance of the Laplacian.
+            The change of a sample is from the previous one, zero for the first sample
+        """
+        if store is not None:
+            frame_nums = np.asarray(store.frame_nums)
+            timestamps = np.asarray(store.timestamps)
+            frames = store.thumbnails
+            chunks = (frames[max(start-1,0):start+self.chunk_size] for start in range(0, len(frames), self.chunk_size))
+        else:
+            frame_nums = []
+            chunks = self._iter_chunks(video_id, frame_nums, _testing_path)
+
+        components = [np.zeros((1,3), dtype=np.float32)]
+        sharpness = []
+        for num_chunk, chunk in enumerate(chunks):
+            chunk = np.asarray(chunk)
+            if layout is not None:
+                chunk = layout.apply(chunk, fill=0, stacked=True)
+            # from the second chunk the first frame is the last of the previous one
+            sharpness.append(self._get_sharpness(chunk if num_chunk == 0 else chunk[1:]))
+            if len(chunk) > 1:
+                components.append(self._get_changes(chunk))
+        components = np.concatenate(components)
+        sharpness = np.concatenate(sharpness) if len(sharpness) else np.empty(0)
+
+        if store is None:
+            frame_nums = np.array(frame_nums, dtype=np.int64)
+            timestamps = frame_nums / self._src_fps
+        components = components[:len(frame_nums)]
+        return frame_nums, timestamps, components @ self.weights, components, sharpness
+
+    def _iter_chunks(self, video_id:str, frame_nums:'list[int]', _testing_path=None):
+        """
+        Yields stacks of `chunk_size` new frames preceded by the last frame of the previous stack,
+        appending the numbers of the new frames to `frame_nums`.
+        """
+        width, height = self.frame_size
+        chunk = np.empty((self.chunk_size+1, height, width), dtype=np.uint8)
+        num_in_chunk = 0
+        for num_frame, frame in self._iter_frames(video_id, _testing_path):
+            if num_in_chunk == len(chunk):
+                yield chunk
+                chunk[0] = chunk[-1]
+                num_in_chunk = 1
+            chunk[num_in_chunk] = frame
+            num_in_chunk += 1
+            frame_nums.append(num_frame)
+        if num_in_chunk > 0:
+            yield chunk[:num_in_chunk]
+
+    def _find_boundary_indices(self, timestamps, signal, threshold_scale:float=1):
+        """
+        Indices of the samples that start a new scene and the threshold used.
+        """
+        if len(signal) < 2:
+            return np.empty(0, dtype=np.int64), self.min_change * threshold_scale
+        timestamps = np.asarray(timestamps)
+        changes = signal[1:]
+        median = np.median(changes)
+        robust_std = 1.4826 * np.median(np.abs(changes - median))
+        threshold = max(median + self.sensitivity*robust_std, self.min_change) * threshold_scale
+
+        sample_seconds = (timestamps[-1] - timestamps[0]) / (len(timestamps) - 1) if timestamps[-1] > timestamps[0] else 1
+        half_window = max(int(self.min_scene_seconds / sample_seconds / 2), 0)
+        padded = np.pad(signal, half_window, constant_values=-1)
+        local_max = np.lib.stride_tricks.sliding_window_view(padded, 2*half_window+1).max(axis=1)
+        is_boundary = (signal >= threshold) & (signal == local_max)
+        is_boundary[0] = False
+
+        indices = []
+        last_time = None
+        for index in np.flatnonzero(is_boundary):
+            # plateaus give more than one max, the first is kept
+            if last_time is not None and timestamps[index] - last_time < self.min_scene_seconds:
+                continue
+            last_time = timestamps[index]
+            indices.append(index)
+        return np.array(indices, dtype=np.int64), threshold
+
+    def find_boundaries(self, timestamps, signal, threshold_scale:float=1) -> 'list[tuple[float,float]]':
+        """
+        Find the scene boundaries from a change signal.
+
+        Parameters
+        ----------
+        timestamps : ndarray
+            Time in seconds of every sample
+        signal : ndarray
+            Change signal of every sample from the previous one
+        threshold_scale : float, optional
+            Scale of the adaptive threshold, higher values give fewer boundaries
+
+        Returns
+        -------
+        list of tuple
+            Time in seconds of the first sample of every new scene and the confidence of the boundary in (0.5,1],
+            0.5 for a change at the threshold
+        """
+        indices, threshold = self._find_boundary_indices(timestamps, signal, threshold_scale)
+        return [(float(timestamps[index]), float(signal[index] / (signal[index] + threshold))) for index in indices]
+
+    def find_shots(self, timestamps, signal, threshold_scale:float=1) -> 'list[tuple[int,int]]':
+        """
+        Split the samples in shots at the scene boundaries.
+
+        Parameters
+        ----------
+        timestamps : ndarray
+            Time in seconds of every sample
+        signal : ndarray
+            Change signal of every sample from the previous one
+        threshold_scale : float, optional
+            Scale of the adaptive threshold, higher values give fewer shots
+
+        Returns
+        -------
+        list of tuple
+            Indices of the first and the last sample of every shot
+        """
+        if not len(signal):
+            return []
+        indices, _ = self._find_boundary_indices(timestamps, signal, threshold_scale)
+        starts = [0] + indices.tolist()
+        ends = (indices - 1).tolist() + [len(signal) - 1]
+        return list(zip(starts, ends))
+
+    def detect(self, video_id:str, store=None, threshold_scale:float=1, _testing_path=None, layout=None) -> 'list[tuple[float,float]]':
+        """
+        Compute the change signal of a video and find its scene boundaries.
+
+        Parameters
+        ----------
+        video_id : str
+            Identifier of the video
+        store : FrameFeatureStore, optional
+            Features of the video, its thumbnails are used instead of decoding the video
+        threshold_scale : float, optional
+            Scale of the adaptive threshold, higher values give fewer boundaries
+        _testing_path : str, optional
+            Override path of the video folder for testing
+        layout : SlideLayout, optional
+            Slide area of the frames, see `compute_signal()`
+
+        Returns
+        -------
+        list of tuple
+            Time in seconds and confidence of every boundary, see `find_boundaries()`
+        """
+        _, timestamps, signal, _, _ = self.compute_signal(video_id, store, _testing_path, layout)
+        return self.find_boundaries(timestamps, signal, threshold_scale)
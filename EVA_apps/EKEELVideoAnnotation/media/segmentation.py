@@ -9,6 +9,7 @@ from youtube_transcript_api import YouTubeTranscriptApi as YTTranscriptApi
 from youtube_transcript_api import Transcript
 from math import floor, ceil
 from collections import deque
+from copy import deepcopy
 from matplotlib import pyplot as plt
 import time
 from operator import itemgetter
@@ -18,15 +19,19 @@ from re import match, search
 import yt_dlp
 import requests
 from enum import Enum, auto
-from multiprocessing import Process
+from multiprocessing import Process, get_context
 from bisect import insort_left
+from statistics import NormalDist
 from multiprocessing.managers import ListProxy
 
 from media.audio import *
 from media.image import *
 from media.video import VideoSpeedManager, LocalVideo, SimpleVideo, VIDEOS_PATH
+from media.features import FrameFeatureStore
+from media.scene import SceneChangeDetector
+from media.layout import SlideLayout
+from media.checkpoint import StageCheckpoint
 from models.xgboost_adapter import XGBoostModelAdapter
-from utils.itertools import double_iterator, pairwise
 from utils.structures import LiFoStack
 from text_processor.conll import get_text
 from embedding.cluster import create_cluster_list, aggregate_short_clusters
@@ -37,6 +42,10 @@ from services.NLP_API import *
 os.environ['LIBGL_ALWAYS_SOFTWARE'] = '1'
 
 MAX_VIDEO_SECONDS = 18000
+# MSE under which two grayscale previews (320x180 or the 160x90 thumbnails of the feature store) show the same slide.
+# Measured on synthetic 1280x720 slides: noise and JPEG artifacts of the same slide stay under 1.1, a new word of small
+# text gives 3-6, a new line of text 200-300 (a moving pointer gives 2-3 and may count as a change)
+PREVIEW_SAME_IMAGE_THRESHOLD = 2
 
 '''
 variables to consider:
@@ -51,6 +60,1046 @@ variables to consider:
 
 
 
+def _get_video_folder(video_id:str, _testing_path=None) -> Path:
+    return VIDEOS_PATH.joinpath(video_id) if _testing_path is None else Path(_testing_path)
+
+
+def _use_video_ocr_cache(video_id:str, _testing_path=None):
+    """
+    Keeps the OCR results in the folder of the video (see `OCRCache`), so that the next analyses of the video reuse them.\n
+    Does nothing if the OCR cache is disabled or it's already the one of the video.
+    """
+    folder = _get_video_folder(video_id, _testing_path)
+    ocr_cache = ImageClassifier.get_ocr_cache()
+    if ocr_cache is not None and ocr_cache.get_folder() != folder and folder.exists():
+        ImageClassifier.set_ocr_cache(OCRCache(folder=folder))
+
+
+def _slide_to_dict(slide:VideoSlide) -> dict:
+    """
+    Attributes of the slide with its frame ranges as python numbers (frame numbers and boxes can be numpy scalars),
+    see `VideoSlide.from_dict()`.
+    """
+    slide_dict = dict(slide)
+    slide_dict["sent_indxs_and_bb"] = [[[int(index) for index in indxs], [float(coord) for coord in bb]]
+                                       for indxs, bb in slide_dict["sent_indxs_and_bb"]]
+    slide_dict["start_end_frames"] = [[None if frame is None else int(frame) for frame in frames] for frames in slide.start_end_frames]
+    return slide_dict
+
+
+def _get_text_region(frame, layout:SlideLayout):
+    """
+    Copy of the region of a frame where the text of a slide is checked: the slide area of the layout,
+    or without one the center of the frame, leaving out the logos (that are usually in corners).
+    """
+    if layout.is_full_frame():
+        frame_h, frame_w = frame.shape[:2]
+        return frame[int(frame_h/11):int(frame_h*8/9), int(frame_w/8):int(frame_w*7/8)].copy()
+    return layout.apply(frame).copy()
+
+
+def _analyze_video_range(video_id:str, start_frame:int=0, end_frame:'int | None'=None, look_for_opening:bool=True,
+                         layout:'SlideLayout | None'=None, budget:'AnalysisBudget | None'=None, checkpoint:'StageCheckpoint | None'=None,
+                         _testing_path=None, _show_info:bool=False) -> 'tuple[list[VideoSlide], int, int, tuple[int,int,bool] | None]':
+    """
+    Runs the slide segmentation state machine (WAITING_OPENING, OPENING, CONTENT, ENDED) on a range of frames.
+
+    If `look_for_opening` the EduOpen opening is searched from `start_frame`, and the range is extended
+    until the content is reached, otherwise the range is analyzed directly as content.\n
+    When the range ends before the video the slide on screen is closed at the last analyzed frame,
+    so that it can be joined with the first slide of the following range (see `_merge_sharded_slides()`).\n
+    With a budget the steps get wider while the analysis is behind its schedule (see `AnalysisBudget.get_step_scale()`)
+    and when the budget is over the range is stopped as if it ended there: the part left is returned to be analyzed later.\n
+    With a checkpoint the state of the loop (state, frame, step, slides) is saved periodically and at the end,
+    a range restarted with the checkpoint of a run that died continues from the last state saved.
+
+    Parameters
+    ----------
+    video_id : str
+        Id of the video
+    start_frame : int, optional
+        First frame of the range
+    end_frame : int or None, optional
+        Frame where the range ends, None for the end of the video
+    look_for_opening : bool, optional
+        Whether to wait the EduOpen opening before reading slides
+    layout : SlideLayout or None, optional
+        Slide area of the frames, frames are compared and read only there
+    budget : AnalysisBudget or None, optional
+        Budget of the range, None for no limit
+    checkpoint : StageCheckpoint or None, optional
+        Checkpoint of the range, None not to save the progress
+    _testing_path : str, optional
+        Override path of the video folder for testing
+    _show_info : bool, optional
+        Print the progress
+
+    Returns
+    -------
+    tuple
+        Slides found (with frame numbers), the last analyzed frame, the number of OCR calls and
+        the part of the range left by a stop of the budget (start frame, end frame, whether to look for the opening) or None
+    """
+    class State(Enum):
+        WAITING_OPENING = auto()
+        OPENING = auto()
+        CONTENT = auto()
+        ENDED = auto()
+
+    _use_video_ocr_cache(video_id, _testing_path)
+    # Frames are compared on small grayscale previews (the thumbnails of the feature store if it exists),
+    # full resolution frames are decoded only for OCR
+    video = SimpleVideo(video_id, preview_size=(320,180), preview_fps=5,
+                        preview_store=FrameFeatureStore.open(video_id, _testing_path), _testing_path=_testing_path)
+    video.set_step(video.get_fps())
+    if start_frame > 0:
+        video.roll(start_frame - video.get_fps())
+    if end_frame is None:
+        end_frame = video.get_count_frames()
+    # While OCR runs on the current frame, the next candidate frames are decoded in background
+    video.enable_prefetch(capacity=4)
+
+    slides:list[VideoSlide] = []
+
+    # We start looking for EduOpen
+    # Then transit to content
+    # Ending is optional (sometimes videos are cut)
+    state_machine = {"state": list(State)[0] if look_for_opening else State.CONTENT}
+    next_state = { from_state:to_state for from_state, to_state in list(zip(list(State), list(State)[1:] + [None])) }
+    prev_preview = ImageClassifier(video.get_frame(full_resolution=False)).set_layout(layout)
+    curr_preview = prev_preview.copy()
+    curr_frame = ImageClassifier(None).set_layout(layout)
+    speed_up_coef = 0.35
+    fps = video.get_fps()
+    max_speed = fps * 10
+    curr_slide = None
+    num_ocr_calls = 0
+    range_left = None
+    prev_frame_idx = video.get_frame_index()
+
+    saved_state = checkpoint.load() if checkpoint is not None else None
+    if saved_state is not None and saved_state["done"]:
+        video.close()
+        return ([VideoSlide.from_dict(slide) for slide in saved_state["slides"]], saved_state["last_analyzed_frame"],
+                saved_state["num_ocr_calls"], None if saved_state["range_left"] is None else tuple(saved_state["range_left"]))
+    if saved_state is not None:
+        # back to the start of the iteration saved, with the same previews
+        state_machine["state"] = State[saved_state["state"]]
+        video.roll(saved_state["prev_frame"] - video.get_frame_index())
+        prev_preview.set_img(video.get_current_frame(full_resolution=False))
+        video.roll(saved_state["frame"] - saved_state["prev_frame"])
+        video.set_step(saved_state["step"])
+        curr_preview.set_img(video.get_current_frame(full_resolution=False))
+        prev_frame_idx = saved_state["prev_frame"]
+        slides = [VideoSlide.from_dict(slide) for slide in saved_state["slides"]]
+        curr_slide = VideoSlide.from_dict(saved_state["curr_slide"]) if saved_state["curr_slide"] is not None else None
+        num_ocr_calls = saved_state["num_ocr_calls"]
+        if _show_info: print(f"Resuming the range {start_frame}-{end_frame} from frame {saved_state['frame']}")
+    # the budget is of this run
+    num_resumed_ocr_calls = num_ocr_calls
+    if budget is not None:
+        budget.start()
+
+    while True:
+
+        if checkpoint is not None and checkpoint.is_due():
+            checkpoint.save({"done": False, "state": state_machine["state"].name, "frame": int(video.get_frame_index()),
+                             "step": int(video._curr_step), "prev_frame": int(prev_frame_idx),
+                             "slides": [_slide_to_dict(slide) for slide in slides],
+                             "curr_slide": _slide_to_dict(curr_slide) if curr_slide is not None else None, "num_ocr_calls": num_ocr_calls})
+
+        # We have finished
+        if not curr_preview.has_image():
+            state_machine["state"] = State.ENDED
+
+        curr_state = state_machine['state']
+
+        # End of the range: the slide on screen is closed here and joined later with the next range
+        if curr_state == State.CONTENT and video.get_frame_index() >= end_frame:
+            if curr_slide is not None:
+                curr_slide.start_end_frames[-1] = (curr_slide.start_end_frames[-1][0], video.get_frame_index(True))
+                slides.append(curr_slide)
+            break
+
+        # Out of budget: the range ends here as well, the rest of it is left for a later analysis
+        if budget is not None and curr_state != State.ENDED and budget.is_exhausted(num_ocr_calls - num_resumed_ocr_calls):
+            if curr_slide is not None:
+                curr_slide.start_end_frames[-1] = (curr_slide.start_end_frames[-1][0], video.get_frame_index(True))
+                slides.append(curr_slide)
+            range_left = (int(video.get_frame_index()), end_frame, curr_state != State.CONTENT)
+            if _show_info: print(f"\nBudget over at frame {video.get_frame_index()}, {end_frame - video.get_frame_index()} frames left")
+            break
+
+        # We are looking for the edu (o) pen word (the o is not recognized)
+        if curr_state == State.WAITING_OPENING:
+            if not curr_preview.is_same_image(prev_preview, PREVIEW_SAME_IMAGE_THRESHOLD):
+                text = curr_frame.set_img(video.get_current_frame()).extract_text(return_text=True, use_prefilter=True)
+                num_ocr_calls += 1
+                if "edu" in text and "pen" in text:
+                    state_machine["state"] = next_state[curr_state]
+                    video.set_step(video.get_fps())
+            else:
+                video.set_step(np.clip(int(video._curr_step+2), 1, video.get_fps()*2, dtype=int))
+
+        # We are looking in a change in the text that won't have edu and open in the text
+        elif curr_state == State.OPENING:
+            text = curr_frame.set_img(video.get_current_frame()).extract_text(return_text=True, use_prefilter=True)
+            num_ocr_calls += 1
+            if not "edu" in text or not "pen" in text or len(text) > 8 :
+                state_machine['state'] = next_state[curr_state]
+
+        # We start processing slides reading the text at increasing video speed (capped at max speed) 
+        # as we find same text in the image
+        elif curr_state == State.CONTENT:
+            curr_frame.set_img(video.get_current_frame())
+            frame_idx = video.get_frame_index()
+            # Behind the schedule of the budget the steps get wider, so less frames of every slide are read
+            step_scale = 1. if budget is None else budget.get_step_scale((frame_idx - start_frame) / max(end_frame - start_frame, 1),
+                                                                         num_ocr_calls - num_resumed_ocr_calls)
+            curr_max_speed, change_step = int(max_speed * step_scale), max(int(fps//2 * step_scale), 1)
+            video.prefetch([frame_idx + int(np.clip(video._curr_step + speed_up_coef * curr_max_speed, 0, curr_max_speed)),
+                            frame_idx + change_step,
+                            frame_idx + video._curr_step])
+            texts_with_bb = curr_frame.extract_text(return_text=True, with_contours=True, use_prefilter=True)
+            num_ocr_calls += 1
+
+            # Found text
+            if any(texts_with_bb):
+
+                # Create new slide
+                if curr_slide is None:
+                    curr_slide = VideoSlide(texts_with_bb, (video.get_frame_index(), None))
+
+                # Check if it's the same slide as the one cached
+                else:
+                    new_slide = VideoSlide(texts_with_bb, (video.get_frame_index(),None))
+
+                    # If different append the previous slide setting it's end and reset the playback speed
+                    if new_slide != curr_slide:
+                        curr_slide.start_end_frames[-1] = (curr_slide.start_end_frames[-1][0], video.get_frame_index(True))
+                        slides.append(curr_slide)
+                        curr_slide = new_slide
+                        video.set_step(change_step)
+
+                    # If same slide increase playback speed
+                    else:
+                        video.set_step(int(np.clip(video._curr_step + speed_up_coef * curr_max_speed, 0, curr_max_speed)))
+
+            # Not found text
+            else:
+
+                # If there is a slide save it, set it's end and reset playback speed
+                if curr_slide is not None:
+                    curr_slide.start_end_frames[-1] = (curr_slide.start_end_frames[-1][0], video.get_frame_index(True))
+                    slides.append(curr_slide)
+                    curr_slide = None
+                    video.set_step(change_step)
+
+        # If the last slide has not an end_frame because the video ended before, we assign last frame
+        elif curr_state == State.ENDED:
+            if curr_slide is not None and len(slides) and curr_slide != slides[-1]:
+                curr_slide.start_end_frames[-1] = (curr_slide.start_end_frames[-1][0], video.get_frame_index(True))
+                slides.append(curr_slide)
+            break   
+
+        prev_preview.set_img(curr_preview.get_img())
+        prev_frame_idx = video.get_frame_index()
+        curr_preview.set_img(video.get_frame(full_resolution=False))
+
+        if _show_info: print(f"Doing {np.round((video._curr_frame_idx-video._curr_step)/video.get_count_frames()*100, 2)}%  curr step {video._curr_step} num slides {len(slides)}    ",end="\r")
+
+    last_analyzed_frame = video.get_frame_index(True)
+    video.close()
+    if checkpoint is not None:
+        checkpoint.save({"done": True, "slides": [_slide_to_dict(slide) for slide in slides], "last_analyzed_frame": int(last_analyzed_frame),
+                         "num_ocr_calls": num_ocr_calls, "range_left": range_left})
+    return slides, last_analyzed_frame, num_ocr_calls, range_left
+
+
+def _merge_sharded_slides(sharded_results:'list[tuple[list[VideoSlide], int, int]]') -> 'list[VideoSlide]':
+    """
+    Joins the slides found on consecutive ranges of the video.
+
+    Slides of a range that start before the last analyzed frame of the previous range are dropped
+    (the previous range was extended while waiting the opening).\n
+    The edge slides of two consecutive ranges are the same slide cut by the boundary if they are equal
+    or one is partially in the other, in that case they are joined in a single slide.
+
+    Parameters
+    ----------
+    sharded_results : list of tuple
+        Results of `_analyze_video_range()` in order of range
+
+    Returns
+    -------
+    list of VideoSlide
+        Slides of the whole video
+    """
+    txt_classif = TextSimilarityClassifier(comp_methods={ComparisonMethods.FUZZY_PARTIAL_RATIO, ComparisonMethods.CHARS_COMMON_DISTRIB})
+    slides:list[VideoSlide] = []
+    prev_last_frame = -1
+    for shard_slides, last_analyzed_frame, *_ in sharded_results:
+        shard_slides = [slide for slide in shard_slides if slide.start_end_frames[0][0] > prev_last_frame]
+        if len(slides) and len(shard_slides):
+            edge_slide, next_slide = slides[-1], shard_slides[0]
+            if edge_slide == next_slide or txt_classif.is_partially_in(edge_slide, next_slide) \
+                                        or txt_classif.is_partially_in(next_slide, edge_slide):
+                # keep the slide with more text and extend its appearance across the boundary
+                if len(next_slide.get_full_text()) > len(edge_slide.get_full_text()):
+                    next_slide.start_end_frames[0] = (edge_slide.start_end_frames[-1][0], next_slide.start_end_frames[0][1])
+                    next_slide.start_end_frames[:0] = edge_slide.start_end_frames[:-1]
+                    slides[-1] = next_slide
+                else:
+                    edge_slide.start_end_frames[-1] = (edge_slide.start_end_frames[-1][0], next_slide.start_end_frames[0][1])
+                    edge_slide.start_end_frames.extend(next_slide.start_end_frames[1:])
+                shard_slides = shard_slides[1:]
+        slides.extend(shard_slides)
+        prev_last_frame = max(prev_last_frame, last_analyzed_frame)
+    return slides
+
+
+class AnalysisBudget:
+    """
+    Max wall-clock time and max OCR calls of the slide analysis of a video.
+
+    The analysis compares the part of the budget used with the part of the video analyzed: behind schedule
+    the steps between the frames read get wider (see `get_step_scale()`), so that less frames of every slide are read,
+    and when the budget is over it stops, keeping the slides found so far and the frames left (see `SlideAnalysisCheckpoint`).
+    The boundaries of the slides are refined only if part of the budget is left (see `can_refine()`).\n
+    The time is measured from the first `start()` with the system clock, so that it's shared with the worker processes.
+
+    Attributes
+    ----------
+    max_seconds : float or None
+        Max wall-clock seconds, None for no limit
+    max_ocr_calls : int or None
+        Max OCR calls, None for no limit
+    max_step_scale : float
+        Max factor the steps are widened by
+    min_refine_fraction : float
+        Part of the budget that must be left to refine the boundaries of the slides
+    num_ocr_calls : int
+        OCR calls already used
+    _start_time : float or None
+        Time of the start of the analysis
+
+    Methods
+    -------
+    start()
+        Start measuring the time, if not already started
+    use_ocr_calls(num_calls)
+        Count OCR calls as used
+    split(num_parts)
+        Budgets of the ranges analyzed in parallel
+    get_used_fraction(num_ocr_calls)
+        Part of the budget used
+    is_exhausted(num_ocr_calls)
+        Whether the budget is over
+    get_step_scale(progress, num_ocr_calls)
+        Factor of the steps for the pace of the analysis
+    can_refine(num_ocr_calls)
+        Whether enough budget is left to refine the slides
+    """
+
+    def __init__(self, max_seconds:'float | None'=None, max_ocr_calls:'int | None'=None, max_step_scale:float=4., min_refine_fraction:float=0.2):
+        """
+        Parameters
+        ----------
+        max_seconds : float or None, optional
+            Max wall-clock seconds of the analysis, None for no limit
+        max_ocr_calls : int or None, optional
+            Max OCR calls of the analysis, None for no limit
+        max_step_scale : float, optional
+            Max factor the steps are widened by when the analysis is behind schedule
+        min_refine_fraction : float, optional
+            Part of the budget that must be left to refine the boundaries of the slides
+        """
+        if (max_seconds is not None and max_seconds <= 0) or (max_ocr_calls is not None and max_ocr_calls <= 0):
+            raise Exception("The limits of the budget must be positive")
+        self.max_seconds = max_seconds
+        self.max_ocr_calls = max_ocr_calls
+        self.max_step_scale = max_step_scale
+        self.min_refine_fraction = min_refine_fraction
+        self.num_ocr_calls = 0
+        self._start_time = None
+
+    def start(self) -> 'AnalysisBudget':
+        """
+        Start measuring the time, if not already started.
+
+        Returns
+        -------
+        AnalysisBudget
+            This budget
+        """
+        if self._start_time is None:
+            self._start_time = time.time()
+        return self
+
+    def use_ocr_calls(self, num_calls:int):
+        """
+        Count OCR calls as used.
+
+        Parameters
+        ----------
+        num_calls : int
+            Number of calls
+        """
+        self.num_ocr_calls += num_calls
+
+    def split(self, num_parts:int) -> 'list[AnalysisBudget]':
+        """
+        Budgets of ranges analyzed in parallel: they share the time and split the OCR calls left.
+
+        Parameters
+        ----------
+        num_parts : int
+            Number of ranges
+
+        Returns
+        -------
+        list of AnalysisBudget
+            Budget of every range
+        """
+        self.start()
+        max_ocr_calls = None if self.max_ocr_calls is None else max(ceil((self.max_ocr_calls - self.num_ocr_calls) / num_parts), 1)
+        parts = [AnalysisBudget(self.max_seconds, max_ocr_calls, self.max_step_scale, self.min_refine_fraction) for _ in range(num_parts)]
+        for part in parts:
+            part._start_time = self._start_time
+        return parts
+
+    def get_used_fraction(self, num_ocr_calls:int=0) -> float:
+        """
+        Part of the budget used, the largest of the parts of time and OCR calls.
+
+        Parameters
+        ----------
+        num_ocr_calls : int, optional
+            OCR calls used besides the ones already counted
+
+        Returns
+        -------
+        float
+            0 at the start, 1 or more when the budget is over
+        """
+        used_fraction = 0.
+        if self.max_seconds is not None and self._start_time is not None:
+            used_fraction = (time.time() - self._start_time) / self.max_seconds
+        if self.max_ocr_calls is not None:
+            used_fraction = max(used_fraction, (self.num_ocr_calls + num_ocr_calls) / self.max_ocr_calls)
+        return used_fraction
+
+    def is_exhausted(self, num_ocr_calls:int=0) -> bool:
+        """
+        Whether the budget is over.
+
+        Parameters
+        ----------
+        num_ocr_calls : int, optional
+            OCR calls used besides the ones already counted
+
+        Returns
+        -------
+        bool
+            True if the time or the OCR calls are over
+        """
+        return self.get_used_fraction(num_ocr_calls) >= 1
+
+    def get_step_scale(self, progress:float, num_ocr_calls:int=0) -> float:
+        """
+        Factor of the steps of the analysis: the ratio between the part of the budget used and the part of the work done,
+        between 1 (on schedule) and `max_step_scale`.
+
+        Parameters
+        ----------
+        progress : float
+            Part of the frames analyzed (0-1)
+        num_ocr_calls : int, optional
+            OCR calls used besides the ones already counted
+
+        Returns
+        -------
+        float
+            Factor of the steps
+        """
+        # at the start the pace isn't known yet
+        if progress < 0.02:
+            return 1.
+        return float(np.clip(self.get_used_fraction(num_ocr_calls) / progress, 1., self.max_step_scale))
+
+    def can_refine(self, num_ocr_calls:int=0) -> bool:
+        """
+        Whether enough budget is left to refine the boundaries of the slides.
+
+        Parameters
+        ----------
+        num_ocr_calls : int, optional
+            OCR calls used besides the ones already counted
+
+        Returns
+        -------
+        bool
+            True if at least `min_refine_fraction` of the budget is left
+        """
+        return self.get_used_fraction(num_ocr_calls) <= 1 - self.min_refine_fraction
+
+
+class SlideAnalysisCheckpoint:
+    """
+    Progress of the slide analysis of a video, to resume it after a stop of its budget.
+
+    The video is split in ranges of frames in order, every range is either analyzed, with the result of
+    `_analyze_video_range()` (or `_analyze_video_shots()`), or left. The part left by a range stopped before its end becomes a new range,
+    right after it, that starts from the first frame not analyzed. The slides of the ranges analyzed are joined
+    with `_merge_sharded_slides()`, as for the ranges analyzed in parallel.\n
+    It's saved with the video data (see `to_dict()`) while the analysis is partial.
+
+    Attributes
+    ----------
+    _ranges : list of dict
+        start_frame, end_frame, look_for_opening and result (None if left) of every range, in order
+
+    Methods
+    -------
+    add_range(start_frame, end_frame, look_for_opening)
+        Add a range to analyze after the others
+    has_ranges()
+        Whether the video has been split in ranges
+    get_ranges_left()
+        Ranges not analyzed yet
+    set_result(range_left, result)
+        Keep the result of a range
+    is_complete()
+        Whether all the ranges are analyzed
+    get_slides()
+        Slides of the ranges analyzed
+    to_dict()
+        Convert to a dict that can be stored in the video data
+    from_dict(data)
+        Load from the dict of `to_dict()`
+    """
+
+    def __init__(self):
+        self._ranges:list[dict] = []
+
+    def add_range(self, start_frame:int, end_frame:int, look_for_opening:bool):
+        """
+        Add a range to analyze after the others.
+
+        Parameters
+        ----------
+        start_frame : int
+            First frame of the range
+        end_frame : int
+            Frame where the range ends
+        look_for_opening : bool
+            Whether to wait the EduOpen opening before reading slides
+        """
+        self._ranges.append({"start_frame": start_frame, "end_frame": end_frame, "look_for_opening": look_for_opening, "result": None})
+
+    def has_ranges(self) -> bool:
+        return len(self._ranges) > 0
+
+    def get_ranges_left(self) -> 'list[dict]':
+        """
+        Ranges not analyzed yet, in order.
+
+        Returns
+        -------
+        list of dict
+            Ranges with start_frame, end_frame and look_for_opening
+        """
+        return [frames_range for frames_range in self._ranges if frames_range["result"] is None]
+
+    def set_result(self, range_left:dict, result:'tuple[list[VideoSlide], int, int, tuple[int,int,bool] | None]'):
+        """
+        Keep the result of a range, the part it left (if any) is added after it.
+
+        Parameters
+        ----------
+        range_left : dict
+            Range of `get_ranges_left()`
+        result : tuple
+            Result of `_analyze_video_range()` on the range
+        """
+        slides, last_analyzed_frame, num_ocr_calls, next_range = result
+        range_left["result"] = (slides, last_analyzed_frame, num_ocr_calls)
+        if next_range is not None:
+            start_frame, end_frame, look_for_opening = next_range
+            range_left["end_frame"] = start_frame
+            self._ranges.insert(self._ranges.index(range_left) + 1, {"start_frame": start_frame, "end_frame": end_frame,
+                                                                     "look_for_opening": look_for_opening, "result": None})
+
+    def is_complete(self) -> bool:
+        return not len(self.get_ranges_left())
+
+    def get_slides(self) -> 'list[VideoSlide]':
+        """
+        Slides of the ranges analyzed, joined across the ranges.
+
+        Returns
+        -------
+        list of VideoSlide
+            Copies of the slides with start and end frame numbers, not deduplicated
+        """
+        # joining changes the slides at the edges of the ranges, the ones kept must stay as analyzed
+        return _merge_sharded_slides(deepcopy([frames_range["result"] for frames_range in self._ranges if frames_range["result"] is not None]))
+
+    def to_dict(self) -> dict:
+        ranges = []
+        for frames_range in self._ranges:
+            result = frames_range["result"]
+            if result is not None:
+                slides, last_analyzed_frame, num_ocr_calls = result
+                result = {"slides": [_slide_to_dict(slide) for slide in slides],
+                          "last_analyzed_frame": int(last_analyzed_frame), "num_ocr_calls": int(num_ocr_calls)}
+            ranges.append(frames_range | {"start_frame": int(frames_range["start_frame"]), "end_frame": int(frames_range["end_frame"]), "result": result})
+        return {"ranges": ranges}
+
+    @classmethod
+    def from_dict(cls, data:'dict | None') -> 'SlideAnalysisCheckpoint':
+        checkpoint = cls()
+        if data is None:
+            return checkpoint
+        for frames_range in data["ranges"]:
+            result = frames_range["result"]
+            if result is not None:
+                result = ([VideoSlide.from_dict(slide) for slide in result["slides"]], result["last_analyzed_frame"], result["num_ocr_calls"])
+            checkpoint._ranges.append(frames_range | {"result": result})
+        return checkpoint
+
+
+def _analyze_video_shots(video_id:str, start_frame:int=0, end_frame:'int | None'=None, look_for_opening:bool=True, min_shot_seconds:float=1.,
+                         num_workers:'int | None'=None, layout:'SlideLayout | None'=None, budget:'AnalysisBudget | None'=None,
+                         _testing_path=None, _show_info:bool=False) -> 'tuple[list[VideoSlide], int, int, tuple[int,int,bool] | None]':
+    """
+    Segments the slides of a range of a video reading the text once for every visually stable shot.
+
+    First the video is split in shots by a `SceneChangeDetector` pass on small frames (the thumbnails
+    of the feature store if it exists), then OCR runs on the full resolution frame of the sharpest
+    sample of every shot and the shot's first and last sample are the frame range of its slide.
+    Frames are read by a pool of OCR workers while the next ones are decoded, results are used in order.\n
+    The EduOpen opening and the slides follow the rules of the state machine of `_analyze_video_range()`:
+    shots are skipped until the opening is read and while the text is the opening one,
+    consecutive shots with the same slide are joined and shots without text end the slide on screen.
+    Only the shots that start in the range are read.\n
+    With a budget no frame is sent to OCR once it's over: the shots read so far give the slides,
+    the shots left are returned as the part of the range left, as `_analyze_video_range()` does.
+
+    Parameters
+    ----------
+    video_id : str
+        Id of the video
+    start_frame : int, optional
+        First frame of the range
+    end_frame : int or None, optional
+        Frame where the range ends, None for the end of the video
+    look_for_opening : bool, optional
+        Whether to wait the EduOpen opening before reading slides
+    min_shot_seconds : float, optional
+        Min length of a shot
+    num_workers : int or None, optional
+        Number of OCR worker threads, all the cores if None
+    layout : SlideLayout or None, optional
+        Slide area of the frames, shots are found and text is read only there
+    budget : AnalysisBudget or None, optional
+        Budget of the range, None for no limit
+    _testing_path : str, optional
+        Override path of the video folder for testing
+    _show_info : bool, optional
+        Print the progress
+
+    Returns
+    -------
+    tuple
+        Slides found (with frame numbers), the last analyzed frame, the number of OCR calls and
+        the part of the range left by a stop of the budget (start frame, end frame, whether to look for the opening) or None
+    """
+    if budget is not None:
+        budget.start()
+    detector = SceneChangeDetector(min_scene_seconds=min_shot_seconds)
+    frame_nums, timestamps, signal, _, sharpness = detector.compute_signal(video_id, FrameFeatureStore.open(video_id, _testing_path), _testing_path, layout)
+
+    _use_video_ocr_cache(video_id, _testing_path)
+    video = SimpleVideo(video_id, _testing_path=_testing_path)
+    if end_frame is None:
+        end_frame = video.get_count_frames()
+    shots = [(first, last) for first, last in detector.find_shots(timestamps, signal) if start_frame <= frame_nums[first] < end_frame]
+    # the first sample of a shot can be in the middle of the transition
+    representatives = [int(frame_nums[first + 1 + np.argmax(sharpness[first+1:last+1])]) if last > first else int(frame_nums[first])
+                       for first, last in shots]
+    ocr_pool = OCRWorkerPool(num_workers, layout)
+    # frames submitted ahead of the one in use, bounds the frames in memory
+    max_pending = 2*(num_workers or os.cpu_count())
+    pending = deque()
+    num_submitted = num_ocr_submitted = 0
+    waiting_opening, in_opening = look_for_opening, False
+    slides:list[VideoSlide] = []
+    curr_slide = None
+    num_ocr_calls = 0
+    last_analyzed_frame = start_frame - 1
+    range_left = None
+    for num_shot, (first, last) in enumerate(shots):
+        while num_submitted < len(shots) and num_submitted < num_shot + max_pending:
+            # Out of budget: the frames already sent are used, the shots left are for a later analysis
+            if budget is not None and budget.is_exhausted(num_ocr_submitted):
+                break
+            video.rewind()
+            video.roll(representatives[num_submitted])
+            frame = video.get_current_frame()
+            pending.append(ocr_pool.submit(frame, return_text=True, with_contours=True, use_prefilter=True) if frame is not None else None)
+            num_submitted += 1
+            num_ocr_submitted += frame is not None
+        if not pending:
+            range_left = (int(frame_nums[first]), end_frame, waiting_opening or in_opening)
+            break
+        text_future = pending.popleft()
+        texts_with_bb = text_future.result() if text_future is not None else []
+        num_ocr_calls += text_future is not None
+        text = ''.join([elem[0] for elem in texts_with_bb])
+        start_end_frames = (int(frame_nums[first]), int(frame_nums[last]))
+        last_analyzed_frame = start_end_frames[1]
+        if _show_info: print(f"Doing {np.round(num_shot/len(shots)*100, 2)}%  num slides {len(slides)}    ",end="\r")
+
+        # We are looking for the edu (o) pen word (the o is not recognized)
+        if waiting_opening:
+            if "edu" in text and "pen" in text:
+                waiting_opening, in_opening = False, True
+            continue
+
+        if in_opening:
+            if "edu" in text and "pen" in text and len(text) <= 8:
+                continue
+            in_opening = False
+
+        # Not found text: the slide on screen ends
+        if not any(texts_with_bb):
+            if curr_slide is not None:
+                slides.append(curr_slide)
+                curr_slide = None
+            continue
+
+        new_slide = VideoSlide(texts_with_bb, start_end_frames)
+        if curr_slide is not None and new_slide == curr_slide:
+            curr_slide.start_end_frames[-1] = (curr_slide.start_end_frames[-1][0], start_end_frames[1])
+        else:
+            if curr_slide is not None:
+                slides.append(curr_slide)
+            curr_slide = new_slide
+    if curr_slide is not None:
+        slides.append(curr_slide)
+    ocr_pool.close()
+    video.close()
+    return slides, last_analyzed_frame, num_ocr_calls, range_left
+
+
+class SlideBoundaryRefiner:
+    """
+    Moves the start and end frames of the slides to the first and last frame they appear.
+
+    Every boundary is searched between the last frame known to show the slide and the first frame known
+    to show something else: the search moves away from the slide with doubling steps until a frame without it
+    is found (or the neighbouring slide is reached), then bisects the gap, so a boundary costs O(log gap) probes.\n
+    A probe compares the region of the slide's text with the same region of a frame known to show the slide
+    (fraction of the pixels of small grayscale crops that differ more than `pixel_threshold`): up to `same_threshold`
+    the probe shows the slide, from `different_threshold` it doesn't, in between its text is read with OCR
+    and the probe shows the slide if it reads as the same slide (see `VideoSlide.__eq__`).
+
+    Attributes
+    ----------
+    _video : SimpleVideo
+        Video of the slides
+    _pixel_threshold : int
+        Min absolute difference of a changed pixel
+    _same_threshold : float
+        Max fraction of changed pixels of a probe that shows the slide
+    _different_threshold : float
+        Min fraction of changed pixels of a probe that doesn't show the slide
+    _region_width : int
+        Width the crops are scaled to before comparing
+    _layout : SlideLayout or None
+        Slide area of the frames, overlays are masked in the crops
+    num_probes : int
+        Number of frames compared
+    num_ocr_calls : int
+        Number of probes decided with OCR
+
+    Methods
+    -------
+    refine(slides, budget)
+        Move the frame ranges of the slides to their first and last frames
+    get_fps()
+        Get frames per second of the video
+    get_stats()
+        Get the number of probes and OCR calls
+    close()
+        Release the video
+    """
+
+    def __init__(self, video_id:str, pixel_threshold:int=32, same_threshold:float=0.005, different_threshold:float=0.03,
+                 region_width:int=320, layout:'SlideLayout | None'=None, _testing_path=None):
+        """
+        Parameters
+        ----------
+        video_id : str
+            Id of the video
+        pixel_threshold : int, optional
+            Min absolute difference (0-255) of a changed pixel
+        same_threshold : float, optional
+            Max fraction of changed pixels of a probe that shows the slide
+        different_threshold : float, optional
+            Min fraction of changed pixels of a probe that doesn't show the slide
+        region_width : int, optional
+            Width the crops are scaled to before comparing
+        layout : SlideLayout or None, optional
+            Slide area of the frames, overlays are masked in the crops and text is read only in the slide
+        _testing_path : str, optional
+            Override path of the video folder for testing
+        """
+        self._video = SimpleVideo(video_id, _testing_path=_testing_path)
+        self._pixel_threshold = pixel_threshold
+        self._same_threshold = same_threshold
+        self._different_threshold = different_threshold
+        self._region_width = region_width
+        self._layout = layout if layout is not None and not layout.is_full_frame() else None
+        self.num_probes = 0
+        self.num_ocr_calls = 0
+
+    def get_fps(self) -> int:
+        """
+        Get frames per second of the video.
+
+        Returns
+        -------
+        int
+            Frames per second
+        """
+        return self._video.get_fps()
+
+    def get_stats(self) -> dict:
+        """
+        Get the number of probes and of the probes decided with OCR.
+
+        Returns
+        -------
+        dict
+            num_probes and num_ocr_calls
+        """
+        return {"num_probes": self.num_probes, "num_ocr_calls": self.num_ocr_calls}
+
+    def close(self):
+        """
+        Release the video.
+        """
+        self._video.close()
+
+    def _read(self, num_frame:int):
+        video = self._video
+        video.rewind()
+        video.roll(num_frame)
+        return video.get_current_frame()
+
+    @staticmethod
+    def _get_text_box(slide:VideoSlide, margin:float=0.02) -> 'tuple[float,float,float,float]':
+        """
+        Normalized (x0, y0, x1, y1) box around the text of the slide, the whole frame if it has no text boxes.
+        """
+        boxes = [bb for _, bb in slide.get_framed_sentences()]
+        if not len(boxes):
+            return 0., 0., 1., 1.
+        boxes = array(boxes, dtype=float)
+        return (max(boxes[:,0].min() - margin, 0.), max(boxes[:,1].min() - margin, 0.),
+                min((boxes[:,0] + boxes[:,2]).max() + margin, 1.), min((boxes[:,1] + boxes[:,3]).max() + margin, 1.))
+
+    def _get_region(self, frame, box:'tuple[float,float,float,float]'):
+        height, width = frame.shape[:2]
+        x0, y0, x1, y1 = int(box[0]*width), int(box[1]*height), max(int(box[2]*width), int(box[0]*width)+1), max(int(box[3]*height), int(box[1]*height)+1)
+        region = cv2.cvtColor(frame[y0:y1, x0:x1], cv2.COLOR_BGR2GRAY)
+        mask = self._layout.get_mask(width, height, cropped=False) if self._layout is not None else None
+        if mask is not None:
+            region[mask[y0:y1, x0:x1]] = 0
+        scale = min(self._region_width / region.shape[1], 1)
+        region = cv2.resize(region, (max(int(region.shape[1]*scale),1), max(int(region.shape[0]*scale),1)), interpolation=cv2.INTER_AREA)
+        return region.astype(np.int16)
+
+    def _shows_slide(self, slide:VideoSlide, num_frame:int, box:'tuple[float,float,float,float]', reference) -> bool:
+        """
+        Whether the frame shows the slide, reading its text only if the image comparison is ambiguous.
+        """
+        frame = self._read(num_frame)
+        if frame is None:
+            return False
+        self.num_probes += 1
+        changed = (np.abs(self._get_region(frame, box) - reference) > self._pixel_threshold).mean()
+        if changed <= self._same_threshold:
+            return True
+        if changed >= self._different_threshold:
+            return False
+        self.num_ocr_calls += 1
+        texts_with_bb = ImageClassifier(frame).set_layout(self._layout).extract_text(return_text=True, with_contours=True, use_prefilter=True)
+        return any(texts_with_bb) and VideoSlide(texts_with_bb, (num_frame, num_frame)) == slide
+
+    def _find_edge(self, slide:VideoSlide, known_frame:int, limit_frame:int, direction:int, box, reference) -> int:
+        """
+        Last frame showing the slide going from `known_frame` (that shows it) towards `limit_frame` (included) in `direction`.
+        """
+        step = max(self.get_fps()//5, 1)
+        inside = known_frame
+        # doubling steps until a frame without the slide, the limit can be shown by the slide
+        while True:
+            if (limit_frame - inside) * direction <= 0:
+                return inside
+            outside = inside + direction*step
+            if (limit_frame - outside) * direction < 0:
+                outside = limit_frame
+            if not self._shows_slide(slide, outside, box, reference):
+                break
+            inside = outside
+            step *= 2
+        # the slide changes between inside and outside
+        while abs(outside - inside) > 1:
+            middle = (inside + outside) // 2
+            if self._shows_slide(slide, middle, box, reference):
+                inside = middle
+            else:
+                outside = middle
+        return inside
+
+    def refine(self, slides:'list[VideoSlide]', budget:'AnalysisBudget | None'=None):
+        """
+        Move the frame ranges of the slides to the first and last frame they appear, in place.
+
+        The search of a range never crosses the ranges before and after it (of any slide).
+        When the budget is over the ranges left keep the frames they have.
+
+        Parameters
+        ----------
+        slides : list of VideoSlide
+            Slides with frame numbers
+        budget : AnalysisBudget or None, optional
+            Budget of the analysis, the OCR calls of the refiner are counted besides the ones already used
+        """
+        ranges = sorted(((start_frame, end_frame, slide, i) for slide in slides
+                                                            for i, (start_frame, end_frame) in enumerate(slide.start_end_frames)),
+                        key=itemgetter(0,1))
+        prev_end_frame = -1
+        last_frame = self._video.get_count_frames() - 1
+        for num_range, (start_frame, end_frame, slide, i) in enumerate(ranges):
+            if budget is not None and budget.is_exhausted(self.num_ocr_calls):
+                break
+            next_start_frame = ranges[num_range+1][0] if num_range+1 < len(ranges) else last_frame+1
+            box = self._get_text_box(slide)
+            frame = self._read(start_frame)
+            if frame is not None and prev_end_frame < start_frame:
+                start_frame = self._find_edge(slide, start_frame, prev_end_frame+1, -1, box, self._get_region(frame, box))
+            frame = self._read(end_frame)
+            if frame is not None and end_frame < next_start_frame:
+                end_frame = self._find_edge(slide, end_frame, next_start_frame-1, 1, box, self._get_region(frame, box))
+            slide.start_end_frames[i] = (start_frame, end_frame)
+            prev_end_frame = max(prev_end_frame, end_frame)
+
+
+def analyze_slides(video_id:str, num_workers:int=1, min_shard_seconds:float=120, mode:Literal['states','shots']='states',
+                   layout:'SlideLayout | None'=None, budget:'AnalysisBudget | None'=None, checkpoint:'SlideAnalysisCheckpoint | None'=None,
+                   checkpoint_seconds:'float | None'=None, _testing_path=None, _show_info:bool=False) -> 'tuple[list[VideoSlide], int]':
+    """
+    Segments the slides of a video, splitting it into time ranges analyzed in parallel.
+
+    With mode 'states' every range runs its own state machine in a worker process (see `_analyze_video_range()`),
+    only the first one waits for the EduOpen opening. The results are joined with `_merge_sharded_slides()`.\n
+    With a budget the ranges stop when it's over, the slides returned are the ones found so far and the parts of the ranges left
+    are kept in the checkpoint: called again with it, only those are analyzed and the slides returned are the ones of the whole video.\n
+    With `checkpoint_seconds` every range saves its progress in the folder of the video (see `StageCheckpoint`),
+    so that if the process dies the same call continues every range from its last state saved, the files are removed
+    by `VideoAnalyzer.analyze_video()` with `StageCheckpoint.clear()` once the slides are saved.\n
+    With mode 'shots' the video is split in stable shots and the text is read once per shot (see `_analyze_video_shots()`),
+    in the current process by `num_workers` OCR threads, as a single range: a budget stops it the same way.
+
+    Parameters
+    ----------
+    video_id : str
+        Id of the video
+    num_workers : int, optional
+        Number of processes, 1 analyzes the video in the current process (OCR threads with mode 'shots')
+    min_shard_seconds : float, optional
+        Min length of a range, shorter videos use less workers
+    mode : str, optional
+        'states' to follow the video with the state machine, 'shots' to read one frame per stable shot
+    layout : SlideLayout or None, optional
+        Slide area of the frames (see `SlideLayout`), None for the whole frames
+    budget : AnalysisBudget or None, optional
+        Time and OCR calls budget of the analysis, None for no limit
+    checkpoint : SlideAnalysisCheckpoint or None, optional
+        Progress of the analysis, updated in place: an empty one is split in ranges, otherwise its ranges left are analyzed
+    checkpoint_seconds : float or None, optional
+        Seconds between the saves of the progress of the ranges (mode 'states'), None not to save it
+    _testing_path : str, optional
+        Override path of the video folder for testing
+    _show_info : bool, optional
+        Print the progress (only in the current process)
+
+    Returns
+    -------
+    tuple
+        Slides with start and end frame numbers, not deduplicated, and the number of OCR calls of this call
+    """
+    if checkpoint is None:
+        checkpoint = SlideAnalysisCheckpoint()
+    if mode == 'shots':
+        if not checkpoint.has_ranges():
+            video = SimpleVideo(video_id, _testing_path=_testing_path)
+            checkpoint.add_range(0, video.get_count_frames(), True)
+            video.close()
+        num_ocr_calls = 0
+        for frames_range in checkpoint.get_ranges_left():
+            result = _analyze_video_shots(video_id, frames_range["start_frame"], frames_range["end_frame"], frames_range["look_for_opening"],
+                                          num_workers=num_workers, layout=layout, budget=budget, _testing_path=_testing_path, _show_info=_show_info)
+            checkpoint.set_result(frames_range, result)
+            num_ocr_calls += result[2]
+            if budget is not None:
+                budget.use_ocr_calls(result[2])
+        return checkpoint.get_slides(), num_ocr_calls
+    if not checkpoint.has_ranges():
+        video = SimpleVideo(video_id, _testing_path=_testing_path)
+        num_frames, fps = video.get_count_frames(), video.get_fps()
+        video.close()
+        num_shards = int(clip(num_frames // int(min_shard_seconds*fps), 1, max(num_workers, 1)))
+        bounds = [num_frames*i//num_shards for i in range(num_shards+1)]
+        for i, (start, end) in enumerate(zip(bounds, bounds[1:])):
+            checkpoint.add_range(start, end, i == 0)
+    ranges_left = checkpoint.get_ranges_left()
+    if checkpoint_seconds is not None:
+        folder = _get_video_folder(video_id, _testing_path)
+        layout_key = layout.get_key() if layout is not None else None
+        ranges_checkpoints = [StageCheckpoint(folder, f"slides_range_{frames_range['start_frame']}_{frames_range['end_frame']}",
+                                              {key: frames_range[key] for key in ("start_frame", "end_frame", "look_for_opening")} | {"layout": layout_key},
+                                              interval_seconds=checkpoint_seconds)
+                              for frames_range in ranges_left]
+    else:
+        ranges_checkpoints = [None]*len(ranges_left)
+    num_processes = min(len(ranges_left), max(num_workers, 1))
+    if num_processes <= 1:
+        # one range after the other, each one with the budget left by the previous ones
+        results = []
+        for frames_range, range_checkpoint in zip(ranges_left, ranges_checkpoints):
+            results.append(_analyze_video_range(video_id, frames_range["start_frame"], frames_range["end_frame"], frames_range["look_for_opening"],
+                                                layout, budget, range_checkpoint, _testing_path=_testing_path, _show_info=_show_info))
+            if budget is not None:
+                budget.use_ocr_calls(results[-1][2])
+    else:
+        budgets = budget.split(len(ranges_left)) if budget is not None else [None]*len(ranges_left)
+        # spawned workers, forking after the decoders have started threads can deadlock them
+        with get_context("spawn").Pool(num_processes) as pool:
+            results = pool.starmap(_analyze_video_range, [(video_id, frames_range["start_frame"], frames_range["end_frame"],
+                                                           frames_range["look_for_opening"], layout, range_budget, range_checkpoint, _testing_path)
+                                                          for frames_range, range_budget, range_checkpoint in zip(ranges_left, budgets, ranges_checkpoints)])
+        if budget is not None:
+            budget.use_ocr_calls(sum([num_ocr_calls for _, _, num_ocr_calls, _ in results]))
+    for frames_range, result in zip(ranges_left, results):
+        checkpoint.set_result(frames_range, result)
+    return checkpoint.get_slides(), sum([num_ocr_calls for _, _, num_ocr_calls, _ in results])
+
+
 class VideoAnalyzer:
     '''
     This class analyzes videos from their ids in the path "__class__"-path/static/videos \n
@@ -76,6 +1125,7 @@ class VideoAnalyzer:
     _frames_to_analyze = None
     _slide_startends = None
     _slide_titles = None
+    _feature_store: FrameFeatureStore | None = None
 
 
     def __init__(self, url:str,request_fields_from_db:list | None=None, _testing_path=None) -> None:
@@ -184,79 +1234,75 @@ class VideoAnalyzer:
                 break
         if not os.path.isfile(folder_path.joinpath(video_id+".mp4")):
             raise Exception("Video has not been correctly downloaded")
+
+    def get_feature_store(self, build:bool=False) -> 'FrameFeatureStore | None':
+        '''
+        Returns the store of the frame features of the video (thumbnails, histograms, faces) shared by the analysis stages\n
+        If `build` the store is computed when missing or when the video file has changed, otherwise None is returned in that case\n
+        It's built by the first analysis stage reading the frames (one decode pass of the video), not when the video is downloaded
+        '''
+        if self._feature_store is None:
+            if build:
+                self._feature_store = FrameFeatureStore.open_or_build(self.video_id, _testing_path=self.folder_path)
+            else:
+                self._feature_store = FrameFeatureStore.open(self.video_id, _testing_path=self.folder_path)
+        return self._feature_store
+
+    def get_layout(self) -> SlideLayout:
+        '''
+        Returns the layout of the frames (slide rectangle and overlays, see `SlideLayout`) used by all the frame analyses\n
+        It's found at the first call from a sample of frames (the thumbnails of the feature store if it exists)
+        and kept in the video data, so that it's saved with the video
+        '''
+        if "layout" not in self.data["video_data"].keys():
+            store = self.get_feature_store()
+            if store is not None:
+                layout = SlideLayout.detect_from_store(store)
+            else:
+                layout = SlideLayout.detect_from_video(self.video_id, _testing_path=self.folder_path)
+            self.data["video_data"]["layout"] = layout.to_dict()
+        return SlideLayout.from_dict(self.data["video_data"]["layout"])
   
 
-    def _create_keyframes(self,start_times,end_times,S,seconds_range, image_scale:float=1,create_thumbnails=True):
+    def _create_keyframes(self,start_times,end_times,threshold_scale,seconds_range, image_scale:float=1,create_thumbnails=True):
         """
-        Take a list of clusters and compute the color histogram on end and start of the cluster
+        Take a list of clusters and move their start and end times to the closest following scene change
         
         Parameters
         ----------
         cluster_list :
-        S : scala per color histogram
-        seconds_range : Adjust the start and end of segments based on the difference in color histograms.
+        threshold_scale : scale of the adaptive threshold of the scene changes, higher values give fewer changes
+            (see `SceneChangeDetector.find_boundaries()`, it's not a multiple of the mean histogram difference anymore)
+        seconds_range : Adjust the start and end of segments to the first scene change within this number of seconds.
         """
         assert len(start_times) == len(end_times)
-        vsm = VideoSpeedManager(self.video_id,output_colors=COLOR_RGB)
-        vid_ref = vsm.vid_ref
-        vidcap = vid_ref._vidcap
-        start_end_frames = [(vid_ref.get_num_frame_from_time(s_time),vid_ref.get_num_frame_from_time(e_time)) 
+        store = self.get_feature_store(build=True)
+        video_info = store if store is not None else LocalVideo(self.video_id, _testing_path=self.folder_path)
+        start_end_frames = [(video_info.get_num_frame_from_time(s_time),video_info.get_num_frame_from_time(e_time)) 
                                 for s_time,e_time in zip(start_times,end_times)]
+        fps = video_info.get_fps()
 
-        curr_num_frame = 0
-        vidcap.set(cv2.CAP_PROP_POS_FRAMES, curr_num_frame)
-        has_frame,curr_frame = vidcap.read()
-        next_frame_offset = 10*vid_ref.get_fps()
-        summation = 0
-        prev_hist = []
-        all_diffs = []
-        while has_frame:
-            curr_frame = cv2.resize(curr_frame,(240,180))
-            image = cv2.cvtColor(curr_frame, cv2.COLOR_RGB2GRAY)
-            hist = cv2.calcHist([image], [0], None, [32], [0, 128])
-            hist = cv2.normalize(hist, hist)
-            
-            if curr_num_frame > 0 :
-                diff = 0
-                for i, bin in enumerate(hist):
-                    diff += abs(bin[0] - prev_hist[i][0])
-                all_diffs.append(diff)
-                summation += diff
-            
-            curr_num_frame += next_frame_offset
-            vidcap.set(cv2.CAP_PROP_POS_FRAMES, curr_num_frame)
-            has_frame,curr_frame = vidcap.read()
-            prev_hist = hist
-
-            #if cv2.waitKey(1) & 0xFF == ord('q'):
-            #    break
-        threshold = S * (summation / curr_num_frame)
+        boundaries = SceneChangeDetector().detect(self.video_id, store=store, threshold_scale=threshold_scale, _testing_path=self.folder_path)
+        boundaries_times = array([b_time for b_time,_ in boundaries])
 
         '''
-        checking if there is a scene change within a timeframe of "seconds_range" frames from the beginning and end of each cluster.
+        checking if there is a scene change within a timeframe of "seconds_range" seconds from the beginning and end of each cluster.
         '''
-        fps = vid_ref.get_fps()
-
         for j,(start_f,end_f) in enumerate(start_end_frames):
-            changes_found = [False,False]
-            for i in range(seconds_range):
-                diffs = [int(start_f / next_frame_offset),int(end_f / next_frame_offset)]
-                if not changes_found[0] and diffs[0] + i < len(all_diffs) and all_diffs[diffs[0] + i] > threshold:
-                    sec = (start_f + i) / fps
-                    start_times[j] = round(sec,2)
-                    changes_found[0] = True
-                
-                if not changes_found[1] and diffs[1] + i < len(all_diffs) and all_diffs[diffs[1] + i] > threshold:
-                    sec = (end_f + i) / fps
-                    end_times[j] = round(sec,2)
-                    changes_found[1] = True
-
-                if all(changes_found): break
+            for times,num_frame in ((start_times,start_f),(end_times,end_f)):
+                sec = num_frame / fps
+                i = boundaries_times.searchsorted(sec)
+                if i < len(boundaries_times) and boundaries_times[i] - sec <= seconds_range:
+                    times[j] = float(round(boundaries_times[i],2))
     
         if not create_thumbnails:
+            if store is None:
+                video_info.close()
             return list(zip(start_times, end_times))
         
         # saving images to show into the timeline
+        vid_ref = video_info if store is None else LocalVideo(self.video_id, _testing_path=self.folder_path)
+        vidcap = vid_ref._vidcap
         images_path = []
         folder_path = VIDEOS_PATH.joinpath(self.video_id)
         for i, start_end in enumerate(start_end_frames):
@@ -268,7 +1314,7 @@ class VideoAnalyzer:
             #saving_position = "videos\\" + video_id + "\\" + str(start) + ".jpg"
             cv2.imwrite(name_file.__str__(), image)
             images_path.append("videos/" + self.video_id + "/" + str(i) + ".jpg")
-        vsm.close()
+        vid_ref.close()
         #print(images_path)
         self.images_path = images_path
         return list(zip(start_times, end_times))
@@ -333,14 +1379,16 @@ class VideoAnalyzer:
         self.data["transcript_data"]["text"] = timed_subtitles 
         
         mongo.insert_video_data(self.data)
+        # the youtube transcript is temporary, until the transcription worker replaces it
+        mongo.enqueue_transcription_job(self.video_id, language)
 
 
-    def transcript_segmentation(self, c_threshold=0.22, sec_min=35, S=1, frame_range=15, create_thumbnails=True):
+    def transcript_segmentation(self, c_threshold=0.22, sec_min=35, threshold_scale=1, frame_range=15, create_thumbnails=True):
         """
         :param c_threshold: threshold per la similarità tra frasi
         :param sec_min: se un segmento è minore di sec_min verrà unito con il successivo
-        :param S: scala per color histogram
-        :param frame_range: aggiustare inizio e fine dei segmenti in base a differenza nel color histogram nel frame_range
+        :param threshold_scale: scala della soglia adattiva dei cambi di scena, vedi `_create_keyframes()`
+        :param frame_range: aggiustare inizio e fine dei segmenti al primo cambio di scena entro frame_range secondi
         :return: segments
         """
         if "video_data" in self.data.keys() and "segments" in self.data["video_data"].keys():
@@ -361,7 +1409,8 @@ class VideoAnalyzer:
         #                                         .replace("Dr.","Dr").replace("dr.","dr") \
         #                                         .replace("Mr.","Mr").replace("mr.","mr")
         #print("Checking punctuation...")
-        semantic_transcript = SemanticText(" ".join(timed_sentence["text"] for timed_sentence in self.data["transcript_data"]["text"] if not "[" in timed_sentence['text']),language)
+        transcript = get_current_transcript(self.data["transcript_data"])
+        semantic_transcript = SemanticText(" ".join(timed_sentence["text"] for timed_sentence in transcript if not "[" in timed_sentence['text']),language)
 
         #video = mongo.get_video(video_id)
         
@@ -370,7 +1419,7 @@ class VideoAnalyzer:
         sentences = [sent.replace(" ,",",").replace(" .",".") for sent in semantic_transcript.tokenize()]
 
         '''For each sentence, add its start and end time obtained from the subtitles'''
-        timed_sentences = get_timed_sentences(self.data["transcript_data"]["text"], sentences)
+        timed_sentences = get_timed_sentences(transcript, sentences)
         
         '''Define the BERT model for similarity'''
         print("Creating embeddings..")
@@ -412,11 +1461,11 @@ class VideoAnalyzer:
         '''Adjust end and start time of each cluster based on detected scene changes'''
         #path = Path(__file__).parent.joinpath("static", "videos", video_id)
         #if not create_thumbnails:
-        #    self.data["video_data"]['segments'] = self._create_keyframes(start_times, end_times, S, frame_range, create_thumbnails=False)
+        #    self.data["video_data"]['segments'] = self._create_keyframes(start_times, end_times, threshold_scale, frame_range, create_thumbnails=False)
         #    return
 #
         #if not any(File.endswith(".jpg") for File in os.listdir(path)):
-        #    self.data["video_data"]['segments'] = self._create_keyframes(start_times, end_times, S, frame_range)
+        #    self.data["video_data"]['segments'] = self._create_keyframes(start_times, end_times, threshold_scale, frame_range)
         #else:
         #    print("keyframes already present")
         #    images = []
@@ -439,11 +1488,15 @@ class VideoAnalyzer:
 
 
 #######################
-    def _preprocess_video(self, vsm:VideoSpeedManager,num_segments:int=150,estimate_threshold=False,_show_info=False):
+    def _preprocess_video(self, vsm:VideoSpeedManager,num_segments:int=150,estimate_threshold=False,num_ocr_workers:'int | None'=None,
+                          checkpoint_seconds:'float | None'=60,_show_info=False):
         '''
         Split the video into `num_segments` windows frames, for every segment it's taken the frame that's far enough to guarantee a minimum sensibility\n
-        The current frame is analyzed by XGBoost model to recognize the scene\n
+        The frames of all the segments are analyzed by XGBoost model with one call to recognize the scenes\n
+        The text of the frames classified as slides is read in background by `num_ocr_workers` threads\n
         If there are two non-slide frames consecutively the resulting frame window is cut\n
+        Without the feature store the frames are decoded and the progress is saved every `checkpoint_seconds` (see `StageCheckpoint`):
+        if the process dies the next call continues the decoding from there (the text of the frames is in the OCR cache)\n
         Bounds are both upper and lower inclusive to avoid a miss as much as possible\n
         Then both are compared in terms of cosine distance of their histograms (it's faster than flattening and computing on pure pixels)\n\n
         Lastly the distance between wach frame is selected as either the average of values, either with fixed value.\n
@@ -473,8 +1526,8 @@ class VideoAnalyzer:
 
         # Optimization is performed by doing a first coarse-grained analysis with the XGBoost model predictor
         # then set those windows inside the VideoSpeedManager
-        model = XGBoostModelAdapter(Path(__file__).parent.parent.joinpath("models","xgboost500.sav").__str__())
-        #XGBoostModelAdapter(os.path.dirname(os.path.realpath(__file__))+"/xgboost/model/xgboost500.sav")
+        # the model is loaded once per process and all the segments are classified with one call
+        model = XGBoostModelAdapter.get_cached()
 
         start_frame_num = None
         frames_to_analyze:List[Tuple[int,int]] = []
@@ -482,40 +1535,88 @@ class VideoAnalyzer:
         curr_frame = ImageClassifier(None)
         prev_frame = curr_frame.copy()
         frame_w,frame_h,num_colors = vsm.get_video().get_dim_frame()
-        
-        # Loops through num segments and for every segment checks if is a slide
-        # When at least one 
-        # Iterates over num segments
-        while iterations_counter < num_segments:
-            
-            # Stores two frames
-            prev_frame.set_img(vsm.get_frame())
-            curr_frame.set_img(vsm.get_following_frame())
-            if model.is_enough_slidish_like(prev_frame):
+        # validate slide in frame in the slide area of the layout or in a region that removes logos (that are usually in corners)
+        layout = self.get_layout()
+        # with precomputed features only the frames classified as slides are decoded (for the text check)
+        store = self.get_feature_store(build=True) if not estimate_threshold else None
+        _use_video_ocr_cache(self.video_id, self.folder_path)
+        ocr_pool = OCRWorkerPool(num_ocr_workers)
+        texts_futures = []
+
+        if store is not None:
+            segments_features = [store.get_model_features(num_segment*step) for num_segment in range(num_segments)]
+            in_video = array([features is not None for features in segments_features])
+            features = np.vstack([features if features is not None else np.zeros((1,19)) for features in segments_features])
+            regions = None
+        else:
+            # Iterates over num segments, frames are decoded once: features are extracted by chunks
+            # and only the regions for the text check are kept until the segments are classified
+            features = empty((num_segments,19))
+            in_video = ones(num_segments, dtype=bool)
+            regions = []
+            chunk = []
+            # the decoding pass is saved after every chunk, a restarted pass continues from the last one saved
+            # and the regions of the segments done before are decoded again if needed
+            checkpoint = StageCheckpoint(self.folder_path, "preprocess",
+                                         {"num_frames": num_frames, "num_segments": num_segments, "estimate_threshold": estimate_threshold},
+                                         interval_seconds=checkpoint_seconds) if checkpoint_seconds is not None else None
+            saved_state = checkpoint.load() if checkpoint is not None else None
+            if saved_state is not None:
+                iterations_counter = saved_state["num_done"]
+                features[:iterations_counter] = saved_state["features"]
+                if estimate_threshold:
+                    cos_sim_values[:iterations_counter] = saved_state["cos_sim_values"]
+                segments_frames = saved_state["segments_frames"]
+                regions = [None]*iterations_counter
+                vsm.set_state(saved_state["vsm"])
+                if _show_info: print(f" Resuming coarse-grained analysis from segment {iterations_counter}")
+            else:
+                segments_frames = []
+            while iterations_counter < num_segments:
+                # Stores two frames, the frame can be a buffer reused by the decoder
+                prev_frame.set_img(vsm.get_frame())
+                segments_frames.append(int(min(vsm.get_curr_num_frame(), num_frames-1)))
+                curr_frame.set_img(vsm.get_following_frame())
                 frame = prev_frame.get_img()
-
-                # validate slide in frame by slicing the image in a region that removes logos (that are usually in corners)
-                region = (slice(int(frame_h/11),int(frame_h*8/9)),slice(int(frame_w/8),int(frame_w*7/8)))
-                prev_frame.set_img(frame[region])
-
-                # double checks the text  
-                is_slide = bool(txt_cleaner.clean_text(prev_frame.extract_text(return_text=True)).strip())
-                #from matplotlib import pyplot as plt; plt.figure("Figure 1"); plt.imshow(frame); plt.figure("Figure 2"); plt.imshow(prev_frame.get_img())
+                chunk.append(frame.copy())
+                regions.append(_get_text_region(frame, layout))
+                if estimate_threshold:
+                    cos_sim_values[iterations_counter,:] = prev_frame.get_cosine_similarity(curr_frame)
+                iterations_counter+=1
+                if len(chunk) == 16 or iterations_counter == num_segments:
+                    features[iterations_counter-len(chunk):iterations_counter] = model.extract_decisive_features_batch(chunk)
+                    chunk = []
+                    if checkpoint is not None and checkpoint.is_due():
+                        checkpoint.save({"num_done": iterations_counter, "features": features[:iterations_counter].tolist(),
+                                         "cos_sim_values": cos_sim_values[:iterations_counter].tolist() if estimate_threshold else None,
+                                         "segments_frames": segments_frames, "vsm": vsm.get_state()})
+                if _show_info: print(f" Coarse-grained analysis: {ceil((iterations_counter)/num_segments * 100)}%",end='\r')
+            if checkpoint is not None:
+                checkpoint.remove()
+
+        # double checks the text of the segments classified as slides in background
+        for num_segment, is_slidish in enumerate(model.are_enough_slidish_like(features) & in_video):
+            if not is_slidish:
+                texts_futures.append(None)
+            elif regions is not None and regions[num_segment] is not None:
+                texts_futures.append(ocr_pool.submit(regions[num_segment]))
+            elif regions is not None:
+                texts_futures.append(ocr_pool.submit(_get_text_region(vsm.get_frame_from_num(segments_frames[num_segment]), layout)))
             else:
-                is_slide = False
+                texts_futures.append(ocr_pool.submit(_get_text_region(vsm.get_frame_from_num(num_segment*step), layout)))
+
+        # results are collected in order of segment
+        for num_segment, text_future in enumerate(texts_futures):
+            is_slide = text_future is not None and bool(txt_cleaner.clean_text(text_future.result()).strip())
             answ_queue.appendleft(is_slide); answ_queue.pop()
 
             # if there's more than 1 True discontinuity -> cut the video
             if any(answ_queue) and start_frame_num is None:
-                start_frame_num = int(clip(iterations_counter-1,0,num_segments))*step
+                start_frame_num = int(clip(num_segment-1,0,num_segments))*step
             elif not any(answ_queue) and start_frame_num is not None:
-                frames_to_analyze.append((start_frame_num,(iterations_counter-1)*step))
+                frames_to_analyze.append((start_frame_num,(num_segment-1)*step))
                 start_frame_num = None
-
-            if estimate_threshold:
-                cos_sim_values[iterations_counter,:] = prev_frame.get_cosine_similarity(curr_frame)
-            iterations_counter+=1
-            if _show_info: print(f" Coarse-grained analysis: {ceil((iterations_counter)/num_segments * 100)}%",end='\r')
+        ocr_pool.close()
         if start_frame_num is not None:
             frames_to_analyze.append((start_frame_num,num_frames-1))
 
@@ -534,195 +1635,135 @@ class VideoAnalyzer:
         self._cos_sim_img_threshold = cos_sim_img_threshold 
         self._frames_to_analyze = frames_to_analyze    
 
+    def _estimate_slides_percentage(self, vsm:VideoSpeedManager, decision_threshold:float=0.5, max_frames:int=150,
+                                    error_tolerance:float=0.05, frames_per_round:int=4, num_ocr_workers:'int | None'=None,
+                                    _show_info=False) -> 'tuple[float,int]':
+        '''
+        Sequential version of _preprocess_video() for the slides percentage only: frames are sampled in a low-discrepancy order
+        (golden ratio sequence, every prefix is spread evenly over the video) and classified as _preprocess_video() does
+        (XGBoost model then text check), `frames_per_round` at a time\n
+        After every round the Wilson interval of the fraction of slide frames is computed, sampling stops as soon as it lies
+        all above or all below `decision_threshold`. The confidence of the interval is split among all the possible rounds,
+        so that the decision is wrong with probability `error_tolerance` at most\n
+        Clearly slide and clearly non slide lectures stop after a few rounds, the others after `max_frames` frames.
+
+        Returns
+        ----------
+        The estimated fraction of slide frames and the number of frames sampled
+        '''
+        num_frames = vsm.get_video().get_count_frames()
+        layout = self.get_layout()
+        model = XGBoostModelAdapter.get_cached()
+        txt_cleaner = TextCleaner()
+        store = self.get_feature_store(build=True)
+        _use_video_ocr_cache(self.video_id, self.folder_path)
+        z = NormalDist().inv_cdf(1 - error_tolerance / (2*ceil(max_frames/frames_per_round)))
+        golden_ratio = (5**0.5 - 1) / 2
+        num_slides = num_sampled = 0
+        ocr_pool = OCRWorkerPool(num_ocr_workers)
+        while num_sampled < max_frames:
+            frames_nums = [int(((0.5 + num_sample*golden_ratio) % 1) * num_frames)
+                           for num_sample in range(num_sampled, min(num_sampled+frames_per_round, max_frames))]
+            if store is not None:
+                frames = None
+                segments_features = [store.get_model_features(num_frame) for num_frame in frames_nums]
+                features = np.vstack([features if features is not None else np.zeros((1,19)) for features in segments_features])
+            else:
+                # the frame can be a buffer reused by the decoder
+                frames = [vsm.get_frame_from_num(num_frame).copy() for num_frame in frames_nums]
+                features = model.extract_decisive_features_batch(frames)
+            texts_futures = [ocr_pool.submit(_get_text_region(frames[num_sample] if frames is not None else vsm.get_frame_from_num(frames_nums[num_sample]), layout))
+                             for num_sample, is_slidish in enumerate(model.are_enough_slidish_like(features)) if is_slidish]
+            num_slides += len([text_future for text_future in texts_futures if txt_cleaner.clean_text(text_future.result()).strip()])
+            num_sampled += len(frames_nums)
+
+            # Wilson score interval of the fraction of slide frames
+            fraction = num_slides / num_sampled
+            center = (fraction + z**2/(2*num_sampled)) / (1 + z**2/num_sampled)
+            half_width = z*(fraction*(1-fraction)/num_sampled + z**2/(4*num_sampled**2))**0.5 / (1 + z**2/num_sampled)
+            if _show_info: print(f" Sequential analysis: {num_sampled} frames, slides fraction in [{center-half_width:.2f}, {center+half_width:.2f}]",end='\r')
+            if center - half_width > decision_threshold or center + half_width < decision_threshold:
+                break
+        ocr_pool.close()
+        if _show_info: print(f"\nSlides fraction {fraction:.2f} estimated on {num_sampled} frames")
+        return fraction, num_sampled
+
 
-    def analyze_video(self,_show_info:bool=True):
+    def analyze_video(self,num_workers:int=1,mode:Literal['states','shots']='states',budget:'AnalysisBudget | None'=None,
+                      checkpoint_seconds:'float | None'=60,_show_info:bool=True):
         """
         Analyzes a video to identify and extract slides, transitioning between different states 
         (WAITING_OPENING, OPENING, CONTENT, ENDED) based on the content of the video frames.
-        It's based on the EduOpen format, so it will look for the logo and start looking for the text using a state machine based algorithm
+        It's based on the EduOpen format, so it will look for the logo and start looking for the text using a state machine based algorithm\n
+        With a budget the analysis stops when it's over: the slides found so far are saved with "slides_partial" set
+        and with the checkpoint of the analysis, that the next call resumes from the first frame not analyzed.\n
+        While running, the progress is saved every `checkpoint_seconds` in the folder of the video: if the process dies,
+        the next call continues from there.
 
         Parameters:
+        num_workers (int): Number of processes analyzing separate time ranges of the video, see `analyze_slides()`. Defaults to 1.
+        mode (str): 'states' to follow the video with the state machine, 'shots' to read the text once per stable shot, see `analyze_slides()`. Defaults to 'states'.
+        budget (AnalysisBudget): Max time and OCR calls of the analysis, see `AnalysisBudget`. Defaults to None (no limit).
+        checkpoint_seconds (float): Seconds between the saves of the progress, see `analyze_slides()`. None not to save it. Defaults to 60.
         _show_info (bool): Flag to control the display of processing information. Defaults to True.
 
         Returns:
         None
         """
-        if not self.is_slide_video() or "slides" in self.data["video_data"].keys():
+        if budget is not None:
+            budget.start()
+        video_data = self.data["video_data"]
+        if not self.is_slide_video() or ("slides" in video_data.keys() and not video_data.get("slides_partial", False)):
             return
 
-        class State(Enum):
-            WAITING_OPENING = auto()
-            OPENING = auto()
-            CONTENT = auto()
-            ENDED = auto()
-            
-            
-        video = SimpleVideo(self.video_id)
-        video.set_step(video.get_fps())
-
-        slides:list[VideoSlide] = []
-        
-        # We start looking for EduOpen
-        # Then transit to content
-        # Ending is optional (sometimes videos are cut)
-        state_machine = {"state": list(State)[0]}
-        next_state = { from_state:to_state for from_state, to_state in list(zip(list(State), list(State)[1:] + [None])) }
-        prev_frame = ImageClassifier(video.get_frame())
-        curr_frame = prev_frame.copy()
-        speed_up_coef = 0.35
-        fps = video.get_fps()
-        max_speed = fps * 10
-        curr_slide = None
-        
-        while True:
-            
-            # We have finished
-            if not curr_frame.has_image():
-                state_machine["state"] = State.ENDED
-                
-            curr_state = state_machine['state']
-            
-            # We are looking for the edu (o) pen word (the o is not recognized)
-            if curr_state == State.WAITING_OPENING:
-                if not curr_frame.is_same_image(prev_frame):
-                    text = curr_frame.extract_text(return_text=True)
-                    if "edu" in text and "pen" in text:
-                        state_machine["state"] = next_state[curr_state]
-                        video.set_step(video.get_fps())
-                else:
-                    video.set_step(np.clip(int(video._curr_step+2), 1, video.get_fps()*2, dtype=int))
+        # the slide analysis compares the thumbnails of the store
+        self.get_feature_store(build=True)
+        layout = self.get_layout()
+        checkpoint = SlideAnalysisCheckpoint.from_dict(video_data.get("slides_checkpoint"))
+        if _show_info and checkpoint.has_ranges():
+            print(f"Resuming the analysis of {len(checkpoint.get_ranges_left())} ranges of frames")
+        slides, num_ocr_calls = analyze_slides(self.video_id, num_workers=num_workers, mode=mode, layout=layout, budget=budget,
+                                               checkpoint=checkpoint, checkpoint_seconds=checkpoint_seconds, _show_info=_show_info)
+        if _show_info: print(f"\nFound {len(slides)} slides with {num_ocr_calls} OCR calls")
+        ocr_cache = ImageClassifier.get_ocr_cache()
+        if _show_info and ocr_cache is not None:
+            # only the calls of this process, the workers of mode 'states' have their own counters
+            print(f"OCR cache: {ocr_cache.hits} hits, {ocr_cache.disk_hits} from disk, {ocr_cache.misses} misses")
 
-            # We are looking in a change in the text that won't have edu and open in the text
-            elif curr_state == State.OPENING:
-                text = curr_frame.extract_text(return_text=True)
-                if not "edu" in text or not "pen" in text or len(text) > 8 :
-                    state_machine['state'] = next_state[curr_state]
-            
-            # We start processing slides reading the text at increasing video speed (capped at max speed) 
-            # as we find same text in the image
-            elif curr_state == State.CONTENT:
-                texts_with_bb = curr_frame.extract_text(return_text=True, with_contours=True)
-                
-                # Found text
-                if any(texts_with_bb):
-                    
-                    # Create new slide
-                    if curr_slide is None:
-                        curr_slide = VideoSlide(texts_with_bb, (video.get_frame_index(), None))
-                    
-                    # Check if it's the same slide as the one cached
-                    else:
-                        new_slide = VideoSlide(texts_with_bb, (video.get_frame_index(),None))
-                        
-                        # If different append the previous slide setting it's end and reset the playback speed
-                        if new_slide != curr_slide:
-                            curr_slide.start_end_frames[-1] = (curr_slide.start_end_frames[-1][0], video.get_frame_index(True))
-                            slides.append(curr_slide)
-                            curr_slide = new_slide
-                            video.set_step(video.get_fps()//2)
-                        
-                        # If same slide increase playback speed
-                        else:
-                            video.set_step(int(np.clip(video._curr_step + speed_up_coef * max_speed, 0, max_speed)))
-                
-                # Not found text
-                else:
-                    
-                    # If there is a slide save it, set it's end and reset playback speed
-                    if curr_slide is not None:
-                        curr_slide.start_end_frames[-1] = (curr_slide.start_end_frames[-1][0], video.get_frame_index(True))
-                        slides.append(curr_slide)
-                        curr_slide = None
-                        video.set_step(video.get_fps()//2)
-            
-            # If the last slide has not an end_frame because the video ended before, we assign last frame
-            elif curr_state == State.ENDED:
-                if curr_slide is not None and len(slides) and curr_slide != slides[-1]:
-                    curr_slide.start_end_frames[-1] = (curr_slide.start_end_frames[-1][0], video.get_frame_index(True))
-                    slides.append(curr_slide)
-                break   
-                
-            prev_frame.set_img(curr_frame.get_img())
-            curr_frame.set_img(video.get_frame())
-            
-            if _show_info: print(f"Doing {np.round((video._curr_frame_idx-video._curr_step)/video.get_count_frames()*100, 2)}%  curr step {video._curr_step} num slides {len(slides)}    ",end="\r")
-        
         # Cleaning doubles
         # TODO need to implement method to remove gibberish
         txt_classif = TextSimilarityClassifier(comp_methods={ComparisonMethods.FUZZY_PARTIAL_RATIO, ComparisonMethods.CHARS_COMMON_DISTRIB})
-        changed = True
-        n_iter = 0
-        while changed:
-            changed = False
-            for to_reverse in [False, True]:
-                for slide1,slide2 in pairwise(slides, None_tail=False, reversed=to_reverse):
-                    if txt_classif.is_partially_in(slide1,slide2):
-                        slide2:VideoSlide
-                        slide2.merge_frames(slide1)
-                        slides.remove(slide1)
-                        changed = True
-                    n_iter += 1
-                    
-            for slide1, slide2 in double_iterator(slides):
-                if txt_classif.is_partially_in(slide2,slide1):
-                    slide1:VideoSlide
-                    slide1.merge_frames(slide2)
-                    slides.remove(slide2)
-                    changed = True
-                n_iter += 1
-        
-        # Now correct slides offsets to the first and last frame they appear
-        # TODO need to implement binary search because it's too slow
-        if False:
-            step = fps//5
-            total = sum([len(slide.start_end_frames) for slide in slides])
-            iter_ = 0
-            print()
-            for slide in slides:
-                this_slide_text = slide._full_text
-                for i, (start_frame, end_frame) in enumerate(slide.start_end_frames):
-
-                    # Shifting start frame backward
-                    video.rewind()
-                    video.roll(start_frame)
-                    video.set_step(-step)
-                    while True:
-                        other_frame_text = curr_frame.set_img(video.get_frame()).extract_text(return_text=True)
-
-                        if (i > 0 and slide.start_end_frames[i-1][1] >= start_frame-1) or \
-                           (this_slide_text != other_frame_text and not slide.txt_sim_class.are_cosine_similar(this_slide_text, other_frame_text,confidence=0.4)):
-                            start_frame += step
-                            break
-                        
-                        start_frame -= step
-
-                    # Shifting end frame forward
-                    video.rewind()
-                    video.roll(end_frame)
-                    video.set_step(step)
-                    while True:
-                        other_frame_text = curr_frame.set_img(video.get_frame()).extract_text(return_text=True)
-
-                        if (i+1 < len(slide.start_end_frames) and slide.start_end_frames[i+1][0] <= end_frame+1) or \
-                           (this_slide_text != other_frame_text and not slide.txt_sim_class.are_cosine_similar(this_slide_text, other_frame_text,confidence=0.4)):
-                            end_frame -= step
-                            break
-                        
-                        end_frame += step
-
-                    iter_ += 1
-                    print(f"At {iter_/total*100}%")
-                    # We reassign the frames
-                    slide.start_end_frames[i] = (start_frame, end_frame)
+        duplicates_index = SlideDuplicatesIndex(txt_classif)
+        num_found = len(slides)
+        slides = duplicates_index.merge_duplicates(slides)
+        if _show_info: print(f"Merged {num_found} slides into {len(slides)} with {duplicates_index.num_comparisons} comparisons")
+
+        # Now correct slides offsets to the first and last frame they appear (if the budget allows it)
+        refiner = SlideBoundaryRefiner(self.video_id, layout=layout)
+        fps = refiner.get_fps()
+        if budget is None or budget.can_refine():
+            refiner.refine(slides, budget)
+            if _show_info: print(f"Refined slides boundaries with {refiner.num_probes} probes and {refiner.num_ocr_calls} OCR calls")
+        elif _show_info:
+            print("Slides boundaries not refined, not enough budget left")
+        refiner.close()
 
         # Convert into seconds
         for slide in slides:
             for i, (start_frame, end_frame) in enumerate(slide.start_end_frames):
                 slide.start_end_frames[i] = (start_frame/fps, end_frame/fps)
         
-        self.data["video_data"]["slides"] = [dict(tft) for tft in slides]
+        video_data["slides"] = [dict(tft) for tft in slides]
+        video_data["slides_partial"] = not checkpoint.is_complete()
+        if video_data["slides_partial"]:
+            video_data["slides_checkpoint"] = checkpoint.to_dict()
+            if _show_info: print(f"Budget over, {len(checkpoint.get_ranges_left())} ranges of frames left to analyze")
+        else:
+            video_data.pop("slides_checkpoint", None)
         
         mongo.insert_video_data(self.data)
+        # the results of the ranges are in the video data now
+        StageCheckpoint.clear(self.folder_path, "slides_range_")
 
 
 #######################
@@ -898,13 +1939,14 @@ class VideoAnalyzer:
         """
         if self._text_in_video is None:
             return None
+        # conversions from frames to times use the feature store when available to avoid opening the video
         if format=='list':
             return self._text_in_video
         elif format=='str':
             return ' '.join([tft.get_full_text() for tft in self._text_in_video])
         elif format=='set[times]':
             out = []
-            video = LocalVideo(self.video_id)
+            video = self.get_feature_store() or LocalVideo(self.video_id)
             for tft in self._text_in_video:
                 out.extend([(video.get_time_from_num_frame(st_en_frames[0]),video.get_time_from_num_frame(st_en_frames[1])) for st_en_frames in tft.start_end_frames])
             return out
@@ -923,14 +1965,14 @@ class VideoAnalyzer:
             return timed_text_with_bb
         elif format=='list[text,time,box]':
             timed_text_with_bb = []
-            video = LocalVideo(self.video_id)
+            video = self.get_feature_store() or LocalVideo(self.video_id)
             for tft in self._text_in_video:
                 st_en_frames = tft.start_end_frames[0]
                 for sentence,bb in tft.get_framed_sentences():
                     timed_text_with_bb.append((sentence.strip('\n'),(video.get_time_from_num_frame(st_en_frames[0]),video.get_time_from_num_frame(st_en_frames[1])),bb))
             return timed_text_with_bb
         elif format=='list[time,list[text,box]]':
-            video = LocalVideo(self.video_id)
+            video = self.get_feature_store() or LocalVideo(self.video_id)
             timed_text = []
             texts = self._text_in_video
             for tft in texts:
@@ -938,15 +1980,18 @@ class VideoAnalyzer:
                     insort_left(timed_text,((video.get_time_from_num_frame(startend[0]),video.get_time_from_num_frame(startend[1])), tft.get_full_text()))
             return timed_text
         elif format=='list[tuple(id,timed-text)]':
-            video = LocalVideo(self.video_id)
+            video = self.get_feature_store() or LocalVideo(self.video_id)
             return [(id,(video.get_time_from_num_frame(startend[0]),video.get_time_from_num_frame(startend[1])), tft.get_full_text()) 
                             for id, tft in enumerate(self._text_in_video) 
                             for startend in tft.start_end_frames]
             
 
-    def is_slide_video(self,slide_frames_percent_threshold:float=0.5,_show_info=True):
+    def is_slide_video(self,slide_frames_percent_threshold:float=0.5,sequential:bool=False,max_frames:int=150,error_tolerance:float=0.05,_show_info=True):
         '''
-        Computes a threshold against a value that can be calculated or passed as precomputed_value
+        Computes a threshold against a value that can be calculated or passed as precomputed_value\n
+        If `sequential` the percentage is estimated sampling frames until the decision is certain
+        up to `error_tolerance` (at most `max_frames`, see _estimate_slides_percentage()),
+        otherwise (the default) `max_frames` evenly spaced segments are classified (see _preprocess_video())
         
         Returns
         -------
@@ -956,7 +2001,15 @@ class VideoAnalyzer:
         '''
         if not "slides_percentage" in self.data["video_data"].keys():
             print(self.data["video_data"])
-            self._preprocess_video(vsm=VideoSpeedManager(self.video_id,COLOR_RGB),_show_info=_show_info)
+            if sequential:
+                vsm = VideoSpeedManager(self.video_id,COLOR_RGB)
+                self.data["video_data"]["slides_percentage"], _ = self._estimate_slides_percentage(vsm,slide_frames_percent_threshold,max_frames,
+                                                                                                   error_tolerance,_show_info=_show_info)
+            else:
+                # frames are decoded in background while the classifier and OCR run on the previous ones
+                vsm = VideoSpeedManager(self.video_id,COLOR_RGB,prefetch_capacity=4)
+                self._preprocess_video(vsm=vsm,num_segments=max_frames,_show_info=_show_info)
+            vsm.close()
             mongo.insert_video_data(self.data)
         return self.data["video_data"]['slides_percentage'] > slide_frames_percent_threshold
 
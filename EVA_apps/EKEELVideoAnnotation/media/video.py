@@ -6,12 +6,23 @@ and extracting frames for analysis.
 
 Classes
 -------
+FrameSampler
+    Frame access layer that chooses between sequential grabbing and seeking
+FFmpegFrameStream
+    Decode backend that streams downscaled frames from an ffmpeg subprocess
+FramePrefetcher
+    Background thread that decodes the frames likely to be requested next
 LocalVideo
     Basic video file handler with frame extraction capabilities
 SimpleVideo
     Basic video player with simple frame controls
 VideoSpeedManager
     Advanced video processor with adaptive frame skipping
+
+Functions
+---------
+get_analysis_frame_size
+    Size of the frames analyzed by `VideoSpeedManager`
 """
 
 #import ffmpeg
@@ -19,17 +30,557 @@ VideoSpeedManager
 #from moviepy.editor import VideoFileClip
 import os
 import cv2
-from numpy import clip,reshape,divmod,array,round
+import subprocess
+from shutil import which
+from numpy import clip,reshape,divmod,array,round,empty,uint8
 
 from math import floor, ceil, log2
 from inspect import getfile
-from typing import Tuple
+from typing import Tuple, Callable
+from time import perf_counter
+from threading import Thread, Condition
+from collections import OrderedDict, deque
+from weakref import WeakSet
+from atexit import register as register_at_exit
 
 from media.image import ImageClassifier,COLOR_BGR,COLOR_RGB,COLOR_GRAY
 from pathlib import Path
 
 VIDEOS_PATH = Path(__file__).parent.parent / "static" / "videos"
 
+DECODE_BACKEND_OPENCV = "opencv"
+DECODE_BACKEND_FFMPEG = "ffmpeg"
+
+def get_analysis_frame_size(frame_size:'tuple[int,int]', max_dim_frame:'tuple[int,int]'=(640,360)) -> 'tuple[int,int]':
+    """
+    Size of the frames analyzed by `VideoSpeedManager`: the frame is scaled down by the integer factor
+    that makes it fit `max_dim_frame`.
+
+    Parameters
+    ----------
+    frame_size : tuple
+        Size (width, height) of the video
+    max_dim_frame : tuple, optional
+        Max size (width, height) of the analyzed frames
+
+    Returns
+    -------
+    tuple
+        Size (width, height) of the analyzed frames
+    """
+    max_scale_factor = max(divmod(frame_size,max_dim_frame)[0])
+    if max_scale_factor > 1:
+        return tuple(int(dim) for dim in (array(frame_size)/max_scale_factor).astype(int))
+    return tuple(int(dim) for dim in frame_size)
+
+class FrameSampler:
+    """
+    Frame access layer over a `cv2.VideoCapture` for mostly forward access patterns.
+
+    Setting `CAP_PROP_POS_FRAMES` makes the decoder restart from the previous keyframe
+    and decode up to the requested frame, which for long GOP videos (H.264 lectures) costs
+    much more than decoding the few frames in between.\n
+    This class keeps track of the decoder position and, for every request, chooses between:\n
+    - `grab()` the frames in between when the request is a short forward jump\n
+    - seek when the request is backward or the forward gap is too long\n
+    The choice is driven by a cost model where the average seconds spent by a `grab()` and by a seek
+    are measured on the video itself and updated with an exponential moving average.
+    Until the grab cost has been measured gaps up to `default_max_grab_gap` frames are grabbed,
+    then the next long enough gap is used to measure the seek cost.
+    Every `explore_every` decisions the strategy that is losing is taken once,
+    so that its cost follows the position of the keyframes in the video.
+
+    Attributes
+    ----------
+    _vidcap : cv2.VideoCapture
+        OpenCV video capture object
+    _next_num_frame : int
+        Number of the frame that the next `read()` of the decoder returns
+    _grab_cost : float or None
+        Measured seconds needed to grab a single frame
+    _seek_cost : float or None
+        Measured seconds needed to seek to a frame
+    _default_max_grab_gap : int
+        Max forward gap grabbed while the costs are not measured yet
+    _ema_factor : float
+        Weight of the newest measure in the moving average of the costs
+    _explore_every : int
+        Number of decisions after which the losing strategy is measured again
+    _num_decisions : int
+        Number of forward decisions taken
+    _num_grabs : int
+        Number of frames skipped with `grab()`
+    _num_seeks : int
+        Number of seeks performed
+
+    Methods
+    -------
+    read(num_frame)
+        Decode the frame with the given number
+    get_stats()
+        Get counters and measured costs of the sampler
+    """
+    def __init__(self, vidcap:cv2.VideoCapture, default_max_grab_gap:int=30, ema_factor:float=0.2, explore_every:int=64):
+        """
+        Initialize the frame sampler.
+
+        Parameters
+        ----------
+        vidcap : cv2.VideoCapture
+            Opened capture object, positioned at its first frame
+        default_max_grab_gap : int, optional
+            Max forward gap grabbed while the costs are still not measured
+        ema_factor : float, optional
+            Weight of the newest measure in the moving average of the costs
+        explore_every : int, optional
+            Number of decisions after which the losing strategy is measured again
+        """
+        self._vidcap = vidcap
+        self._next_num_frame = int(vidcap.get(cv2.CAP_PROP_POS_FRAMES))
+        self._grab_cost = None
+        self._seek_cost = None
+        self._default_max_grab_gap = default_max_grab_gap
+        self._ema_factor = ema_factor
+        self._explore_every = explore_every
+        self._num_decisions = 0
+        self._num_grabs = 0
+        self._num_seeks = 0
+
+    def _update_cost(self, prev_cost:'float | None', measure:float) -> float:
+        if prev_cost is None:
+            return measure
+        return (1-self._ema_factor)*prev_cost + self._ema_factor*measure
+
+    def _should_grab(self, gap:int) -> bool:
+        """
+        Decide whether grabbing `gap` frames is cheaper than seeking.
+        """
+        if gap <= 0:
+            return gap == 0
+        self._num_decisions += 1
+        if self._grab_cost is None:
+            return gap <= self._default_max_grab_gap
+        if self._seek_cost is None:
+            # measure the seek on the first gap that is not trivial
+            return gap <= 1
+        is_grab_cheaper = gap*self._grab_cost <= self._seek_cost
+        if self._num_decisions % self._explore_every == 0:
+            return not is_grab_cheaper
+        return is_grab_cheaper
+
+    def _grab(self, gap:int) -> bool:
+        vidcap = self._vidcap
+        start = perf_counter()
+        for num_grabbed in range(gap):
+            if not vidcap.grab():
+                self._next_num_frame += num_grabbed
+                return False
+        if gap > 0:
+            self._grab_cost = self._update_cost(self._grab_cost, (perf_counter()-start)/gap)
+            self._num_grabs += gap
+        self._next_num_frame += gap
+        return True
+
+    def _seek(self, num_frame:int):
+        start = perf_counter()
+        self._vidcap.set(cv2.CAP_PROP_POS_FRAMES, num_frame)
+        self._seek_cost = self._update_cost(self._seek_cost, perf_counter()-start)
+        self._num_seeks += 1
+        self._next_num_frame = num_frame
+
+    def read(self, num_frame:int):
+        """
+        Decode the frame with the given number.
+
+        Parameters
+        ----------
+        num_frame : int
+            Number of the frame to decode
+
+        Returns
+        -------
+        ndarray or None
+            Decoded BGR frame, None if the frame is out of the video
+        """
+        if num_frame < 0:
+            return None
+        gap = num_frame - self._next_num_frame
+        if self._should_grab(gap):
+            if not self._grab(gap):
+                return None
+        else:
+            self._seek(num_frame)
+        has_frame, image = self._vidcap.read()
+        if not has_frame:
+            # position of the decoder after a failed read is unreliable
+            self._next_num_frame = int(self._vidcap.get(cv2.CAP_PROP_POS_FRAMES))
+            return None
+        self._next_num_frame = num_frame + 1
+        return image
+
+    def get_stats(self) -> dict:
+        """
+        Get counters and measured costs of the sampler.
+
+        Returns
+        -------
+        dict
+            Number of grabbed frames and seeks, average grab and seek costs in seconds
+        """
+        return {"num_grabs": self._num_grabs,
+                "num_seeks": self._num_seeks,
+                "grab_cost": self._grab_cost,
+                "seek_cost": self._seek_cost}
+
+class FFmpegFrameStream:
+    """
+    Decode backend that streams raw frames from an ffmpeg subprocess.
+
+    Scaling, pixel format conversion and frame rate decimation are applied inside ffmpeg
+    (`-vf fps=...,scale=...`, `-pix_fmt gray`), so Python receives only small frames in the
+    requested color scheme and reads them directly into preallocated numpy buffers.\n
+    Returned frames are views on a ring of `num_buffers` buffers: a frame stays valid
+    for the following `num_buffers-1` reads, copy it to keep it longer.\n
+    The stream only moves forward: a request before the last returned frame or further than
+    `max_forward_seconds` restarts the subprocess from the requested time.
+
+    Attributes
+    ----------
+    _video_path : str
+        Path of the video file
+    _frame_size : tuple
+        Size (width, height) of the output frames
+    _src_fps : float
+        Frames per second of the video file
+    _sample_fps : float or None
+        Frames per second of the stream, None to keep all the frames
+    _output_colors : int
+        Color scheme for output frames
+    _buffers : ndarray
+        Ring of preallocated output frames
+    _scratch : ndarray
+        Buffer for the frames that are skipped
+    _process : subprocess.Popen or None
+        Running ffmpeg subprocess
+    _out_index : int
+        Index of the next frame of the stream since its start
+    _last_frame : tuple or None
+        Number and buffer of the last returned frame
+
+    Methods
+    -------
+    read(num_frame)
+        Get the frame with the given number or the closest sampled one before it
+    iter_frames()
+        Iterate over all the frames of the stream from the start of the video
+    close()
+        Terminate the ffmpeg subprocess
+    """
+    _PIX_FMTS = {COLOR_GRAY: 'gray', COLOR_BGR: 'bgr24', COLOR_RGB: 'rgb24'}
+
+    def __init__(self, video_path:str, frame_size:'tuple[int,int]', src_fps:float, output_colors:int=COLOR_GRAY,
+                 sample_fps:'float | None'=None, num_buffers:int=4, max_forward_seconds:float=30):
+        """
+        Initialize the stream, the subprocess is started at the first read.
+
+        Parameters
+        ----------
+        video_path : str
+            Path of the video file
+        frame_size : tuple
+            Size (width, height) of the output frames
+        src_fps : float
+            Frames per second of the video file
+        output_colors : int, optional
+            One of COLOR_GRAY, COLOR_BGR, COLOR_RGB
+        sample_fps : float or None, optional
+            Frames per second kept by ffmpeg, None to keep all the frames
+        num_buffers : int, optional
+            Number of preallocated output frames
+        max_forward_seconds : float, optional
+            Forward jumps longer than this restart the subprocess instead of decoding through
+        """
+        if which("ffmpeg") is None:
+            raise Exception("ffmpeg executable not found")
+        assert output_colors in self._PIX_FMTS
+        self._video_path = str(video_path)
+        self._frame_size = tuple(int(dim) for dim in frame_size)
+        self._src_fps = src_fps
+        self._sample_fps = sample_fps
+        self._output_colors = output_colors
+        self._max_forward_frames = int(max_forward_seconds*src_fps)
+        num_colors = 1 if output_colors == COLOR_GRAY else 3
+        width, height = self._frame_size
+        self._buffers = empty((num_buffers, height, width, num_colors), dtype=uint8)
+        self._scratch = empty((height, width, num_colors), dtype=uint8)
+        self._next_buffer = 0
+        self._process = None
+        self._start_seconds = 0.
+        self._out_index = 0
+        self._last_frame = None
+
+    def _start(self, num_frame:int):
+        self.close()
+        self._start_seconds = num_frame / self._src_fps
+        width, height = self._frame_size
+        filters = [f"scale={width}:{height}:flags=area"]
+        if self._sample_fps is not None:
+            filters.insert(0, f"fps={self._sample_fps}")
+        self._process = subprocess.Popen(['ffmpeg', '-loglevel', 'error', '-nostdin',
+                                          '-ss', f"{self._start_seconds:.3f}", '-i', self._video_path,
+                                          '-an', '-sn', '-vf', ",".join(filters),
+                                          '-pix_fmt', self._PIX_FMTS[self._output_colors], '-f', 'rawvideo', 'pipe:1'],
+                                         stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                         bufsize=self._scratch.nbytes)
+        self._out_index = 0
+        self._last_frame = None
+
+    def _num_frame_of(self, out_index:int) -> int:
+        """
+        Number of the video frame that corresponds to the given index of the stream.
+        """
+        if self._sample_fps is None:
+            return int(self._start_seconds*self._src_fps + 0.5) + out_index
+        return int((self._start_seconds + out_index/self._sample_fps)*self._src_fps + 0.5)
+
+    def _read_into(self, buffer) -> bool:
+        view = memoryview(buffer).cast('B')
+        stdout = self._process.stdout
+        filled = 0
+        while filled < len(view):
+            num_read = stdout.readinto(view[filled:])
+            if not num_read:
+                return False
+            filled += num_read
+        self._out_index += 1
+        return True
+
+    def read(self, num_frame:int):
+        """
+        Get the frame with the given number or, when the stream is decimated,
+        the closest sampled frame before it.
+
+        Parameters
+        ----------
+        num_frame : int
+            Number of the frame in the video file
+
+        Returns
+        -------
+        ndarray or None
+            Frame of shape (height, width, num_colors), None if out of the video
+        """
+        if num_frame < 0:
+            return None
+        last_frame = self._last_frame
+        if self._process is None or \
+           (last_frame is not None and num_frame < last_frame[0]) or \
+           num_frame - self._num_frame_of(self._out_index) > self._max_forward_frames:
+            self._start(num_frame)
+            last_frame = None
+        # the next frame of the stream is still in the future: the last one is the closest
+        if last_frame is not None and self._num_frame_of(self._out_index) > num_frame:
+            return last_frame[1]
+        while self._num_frame_of(self._out_index+1) <= num_frame:
+            if not self._read_into(self._scratch):
+                return None
+        buffer = self._buffers[self._next_buffer]
+        self._next_buffer = (self._next_buffer + 1) % len(self._buffers)
+        if not self._read_into(buffer):
+            return None
+        self._last_frame = (self._num_frame_of(self._out_index-1), buffer)
+        return buffer
+
+    def iter_frames(self):
+        """
+        Iterate over all the frames of the stream from the start of the video, in a single decode pass.
+
+        Yields
+        ------
+        tuple
+            Number of the frame in the video file and the frame (a reusable buffer, see the class notes)
+        """
+        self._start(0)
+        while True:
+            buffer = self._buffers[self._next_buffer]
+            self._next_buffer = (self._next_buffer + 1) % len(self._buffers)
+            if not self._read_into(buffer):
+                return
+            self._last_frame = (self._num_frame_of(self._out_index-1), buffer)
+            yield self._last_frame
+
+    def close(self):
+        """
+        Terminate the ffmpeg subprocess.
+        """
+        if self._process is not None:
+            self._process.stdout.close()
+            self._process.kill()
+            self._process.wait()
+            self._process = None
+
+class FramePrefetcher:
+    """
+    Bounded producer/consumer prefetcher of video frames.
+
+    A background thread decodes the frames that the consumer hints as likely to be requested next
+    (e.g. the next exponential and linear candidates of the speed manager) and keeps them in a bounded
+    buffer, so decoding runs while the consumer is busy with OCR.\n
+    The thread must own its decoder: `read_frame` has to be bound to a video handler that is not used elsewhere.\n
+    Every decoded frame that is evicted or discarded without being requested counts as a wasted speculative decode.
+
+    Attributes
+    ----------
+    _read_frame : Callable
+        Function that decodes a frame from its number, returns None if out of the video
+    _capacity : int
+        Max number of decoded frames kept
+    _frames : OrderedDict
+        Decoded frames by frame number, oldest first
+    _pending : deque
+        Frame numbers waiting to be decoded
+    _in_progress : int or None
+        Frame number being decoded
+    _num_prefetched : int
+        Number of speculative decodes
+    _num_hits : int
+        Number of requests served by the prefetcher
+    _num_wasted : int
+        Number of speculative decodes never requested
+
+    Methods
+    -------
+    hint(num_frames)
+        Replace the frames to decode in background
+    get(num_frame)
+        Get a prefetched frame
+    get_stats()
+        Get the counters of the prefetcher
+    close()
+        Stop the background thread
+    """
+    def __init__(self, read_frame:Callable, capacity:int=6):
+        """
+        Initialize the prefetcher and start its background thread.
+
+        Parameters
+        ----------
+        read_frame : Callable
+            Function that decodes a frame from its number, used only by the background thread
+        capacity : int, optional
+            Max number of decoded frames kept
+        """
+        self._read_frame = read_frame
+        self._capacity = capacity
+        self._frames = OrderedDict()
+        self._pending = deque()
+        self._in_progress = None
+        self._cond = Condition()
+        self._closed = False
+        self._num_prefetched = 0
+        self._num_hits = 0
+        self._num_wasted = 0
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+        _live_prefetchers.add(self)
+
+    def _run(self):
+        cond = self._cond
+        while True:
+            with cond:
+                while not self._pending and not self._closed:
+                    cond.wait()
+                if self._closed:
+                    return
+                num_frame = self._pending.popleft()
+                self._in_progress = num_frame
+            frame = self._read_frame(num_frame)
+            with cond:
+                self._in_progress = None
+                if frame is not None:
+                    self._num_prefetched += 1
+                    self._frames[num_frame] = frame.copy()
+                    while len(self._frames) > self._capacity:
+                        self._frames.popitem(last=False)
+                        self._num_wasted += 1
+                cond.notify_all()
+
+    def hint(self, num_frames:'list[int]'):
+        """
+        Replace the frames to decode in background, in order of likelihood.
+
+        Decoded frames that are not hinted anymore are discarded.
+
+        Parameters
+        ----------
+        num_frames : list of int
+            Frame numbers likely to be requested next
+        """
+        with self._cond:
+            self._pending.clear()
+            for num_frame in [num_frame for num_frame in self._frames if num_frame not in num_frames]:
+                del self._frames[num_frame]
+                self._num_wasted += 1
+            for num_frame in num_frames:
+                if num_frame >= 0 and num_frame not in self._frames and num_frame != self._in_progress \
+                   and num_frame not in self._pending:
+                    self._pending.append(num_frame)
+            self._cond.notify_all()
+
+    def get(self, num_frame:int):
+        """
+        Get a prefetched frame, waiting for it if it's being decoded.
+
+        Parameters
+        ----------
+        num_frame : int
+            Number of the requested frame
+
+        Returns
+        -------
+        ndarray or None
+            The frame, None if it has not been prefetched (the caller must decode it)
+        """
+        with self._cond:
+            while self._in_progress == num_frame:
+                self._cond.wait()
+            frame = self._frames.pop(num_frame, None)
+            if frame is not None:
+                self._num_hits += 1
+            return frame
+
+    def get_stats(self) -> dict:
+        """
+        Get the counters of the prefetcher.
+
+        Returns
+        -------
+        dict
+            Number of speculative decodes, of requests served and of wasted decodes
+            (evicted, plus the ones still buffered and never requested)
+        """
+        with self._cond:
+            return {"num_prefetched": self._num_prefetched,
+                    "num_hits": self._num_hits,
+                    "num_wasted": self._num_wasted + len(self._frames)}
+
+    def close(self):
+        """
+        Stop the background thread, buffered frames are counted as wasted.
+        """
+        with self._cond:
+            self._closed = True
+            self._pending.clear()
+            self._cond.notify_all()
+        self._thread.join()
+        self._num_wasted += len(self._frames)
+        self._frames.clear()
+        _live_prefetchers.discard(self)
+
+# the decoders must be stopped before the interpreter exits, even if the videos are not closed
+_live_prefetchers = WeakSet()
+register_at_exit(lambda: [prefetcher.close() for prefetcher in list(_live_prefetchers)])
+
 class LocalVideo:
     """
     Local video file handler with frame extraction capabilities.
@@ -46,6 +597,14 @@ class LocalVideo:
         Forced frame size (width, height)
     _vid_id : str
         Video identifier
+    _sampler : FrameSampler
+        Frame access layer that avoids seeking on short forward jumps
+    _num_frame : int
+        Number of the frame returned by the next extraction
+    _decode_backend : str
+        DECODE_BACKEND_OPENCV or DECODE_BACKEND_FFMPEG
+    _stream : FFmpegFrameStream or None
+        Stream of downscaled frames when the ffmpeg backend is used
 
     Methods
     -------
@@ -65,12 +624,14 @@ class LocalVideo:
         Convert time to frame number
     set_num_frame(num_frame)
         Set current frame number
+    get_sampler_stats()
+        Get counters and measured costs of the frame access layer
     set_frame_size(value)
         Set frame dimensions
     close()
         Release video capture resources
     """
-    def __init__(self,video_id:str,output_colors:int=COLOR_BGR,forced_frame_size:'tuple[int,int] | None'= None,_testing_path=None):
+    def __init__(self,video_id:str,output_colors:int=COLOR_BGR,forced_frame_size:'tuple[int,int] | None'= None,decode_backend:str=DECODE_BACKEND_OPENCV,_testing_path=None):
         """
         Initialize video file handler.
 
@@ -82,6 +643,9 @@ class LocalVideo:
             Color scheme for output frames
         forced_frame_size : tuple or None, optional
             Force specific frame dimensions (width, height)
+        decode_backend : str, optional
+            DECODE_BACKEND_FFMPEG lets ffmpeg scale and convert the frames while decoding,
+            falls back to DECODE_BACKEND_OPENCV if ffmpeg is not installed
         _testing_path : str, optional
             Override path for testing
         """
@@ -99,10 +663,17 @@ class LocalVideo:
             video_file_folder = VIDEOS_PATH.joinpath(video_id)
         else:
             video_file_folder = _testing_path
-        self._vidcap = cv2.VideoCapture(os.path.join(video_file_folder,video_id+'.mp4'))
+        self._video_path = os.path.join(video_file_folder,video_id+'.mp4')
+        self._vidcap = cv2.VideoCapture(self._video_path)
         #self._vidcap = cv2.VideoCapture(os.path.join(class_path, "static", "videos", video_id,f"{video_id}.mkv"))
         if not self._vidcap.isOpened():
             raise Exception(f"Can't find video: {video_id}")
+        self._sampler = FrameSampler(self._vidcap)
+        self._num_frame = 0
+        if decode_backend == DECODE_BACKEND_FFMPEG and which("ffmpeg") is None:
+            decode_backend = DECODE_BACKEND_OPENCV
+        self._decode_backend = decode_backend
+        self._stream = None
     
     def __exit__(self, exc_type, exc_value, traceback):
         self._vidcap.relase()
@@ -112,19 +683,33 @@ class LocalVideo:
         Release video capture resources.
         """
         self._vidcap.release()
+        if self._stream is not None:
+            self._stream.close()
 
     def extract_next_frame(self):
         """
         Extract next frame from video.
 
+        With the ffmpeg backend the returned frame is a view on a reusable buffer,
+        see `FFmpegFrameStream`.
+
         Returns
         -------
         ndarray or None
             Image array if frame exists, None otherwise
         """
-        has_frame, image = self._vidcap.read()
-        if not has_frame:
+        if self._decode_backend == DECODE_BACKEND_FFMPEG:
+            if self._stream is None:
+                self._stream = FFmpegFrameStream(self._video_path, self.get_dim_frame()[:2],
+                                                 self._vidcap.get(cv2.CAP_PROP_FPS), self._output_colors)
+            image = self._stream.read(self._num_frame)
+            if image is not None:
+                self._num_frame += 1
+            return image
+        image = self._sampler.read(self._num_frame)
+        if image is None:
             return None
+        self._num_frame += 1
         if self._frame_size is not None:
             image = cv2.resize(image,self._frame_size,interpolation=cv2.INTER_AREA)
         if self._output_colors != COLOR_BGR:
@@ -218,12 +803,26 @@ class LocalVideo:
         """
         Set current frame number.
 
+        The decoder is not moved here, the `FrameSampler` decides how to reach
+        the frame at the next extraction.
+
         Parameters
         ----------
         num_frame : int
             Frame number to set
         """
-        self._vidcap.set(cv2.CAP_PROP_POS_FRAMES,num_frame)
+        self._num_frame = int(num_frame)
+
+    def get_sampler_stats(self) -> dict:
+        """
+        Get counters and measured costs of the frame access layer.
+
+        Returns
+        -------
+        dict
+            See `FrameSampler.get_stats()`
+        """
+        return self._sampler.get_stats()
     
     def set_frame_size(self,value:'tuple[int,int]'):
         """
@@ -235,6 +834,9 @@ class LocalVideo:
             New frame dimensions (width, height)
         """
         self._frame_size = value
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
 
 class VideoSpeedManager:
     """
@@ -259,6 +861,8 @@ class VideoSpeedManager:
         Flag indicating video end
     _is_forced_speed : bool
         Flag for forced speed mode
+    _prefetcher : FramePrefetcher or None
+        Background decoder of the next candidate frames, on a dedicated `LocalVideo`
 
     Methods
     -------
@@ -268,6 +872,12 @@ class VideoSpeedManager:
         Handle text detection collision
     lock_speed(num_frames_skipped)
         Lock frame skip rate
+    get_prefetch_stats()
+        Get the counters of the background prefetcher
+    get_state()
+        Get the position and the speed state, to resume from a checkpoint
+    set_state(state)
+        Restore the position and the speed state
     """
     def __init__(self,
                  video_id:str, 
@@ -278,12 +888,14 @@ class VideoSpeedManager:
                  lin_factor:float=2,
                  max_seconds_exp_window:float=5,
                  ratio_lin_exp_window_size:float=1.5,
+                 decode_backend:str=DECODE_BACKEND_OPENCV,
+                 prefetch_capacity:int=0,
                  _testing_path:str=None):
-        self._init_params = (video_id,output_colors,max_dim_frame,time_decimals_accuracy,exp_base,lin_factor,max_seconds_exp_window,ratio_lin_exp_window_size)
-        vid_ref = LocalVideo(video_id=video_id,output_colors=output_colors,_testing_path=_testing_path)
+        self._init_params = (video_id,output_colors,max_dim_frame,time_decimals_accuracy,exp_base,lin_factor,max_seconds_exp_window,ratio_lin_exp_window_size,decode_backend,prefetch_capacity,_testing_path)
+        vid_ref = LocalVideo(video_id=video_id,output_colors=output_colors,decode_backend=decode_backend,_testing_path=_testing_path)
         frame_dim = vid_ref.get_dim_frame()[:2]
-        max_scale_factor = max(divmod(frame_dim,max_dim_frame)[0])
-        if max_scale_factor > 1: vid_ref.set_frame_size(tuple((array(frame_dim)/max_scale_factor).astype(int)))
+        analysis_frame_size = get_analysis_frame_size(frame_dim,max_dim_frame)
+        if analysis_frame_size != tuple(frame_dim): vid_ref.set_frame_size(analysis_frame_size)
         
         max_size_exp_window_frames = int(vid_ref.get_fps()*max_seconds_exp_window)
         max_size_lin_window_frames = int(max_size_exp_window_frames*ratio_lin_exp_window_size)
@@ -306,6 +918,16 @@ class VideoSpeedManager:
         self._is_collided = False
         self._is_video_ended = False
         self._is_forced_speed = False
+        self._prefetcher = None
+        if prefetch_capacity > 0:
+            # the background thread needs its own decoder
+            prefetch_vid = LocalVideo(video_id=video_id,output_colors=output_colors,forced_frame_size=vid_ref._frame_size,
+                                      decode_backend=decode_backend,_testing_path=_testing_path)
+            def read_frame(num_frame:int):
+                prefetch_vid.set_num_frame(num_frame)
+                return prefetch_vid.extract_next_frame()
+            self._prefetcher = FramePrefetcher(read_frame, prefetch_capacity)
+            self._prefetch_vid = prefetch_vid
     
     def _exp_step(self,value:int): # (base^x - 1) + y0
         """
@@ -344,6 +966,59 @@ class VideoSpeedManager:
 
     def close(self):
         self.vid_ref.close()
+        if self._prefetcher is not None:
+            self._prefetcher.close()
+            self._prefetch_vid.close()
+            self._prefetcher = None
+
+    def get_prefetch_stats(self) -> dict:
+        """
+        Get the counters of the background prefetcher.
+
+        Returns
+        -------
+        dict
+            See `FramePrefetcher.get_stats()`, empty if prefetching is disabled
+        """
+        if self._prefetcher is None:
+            return {}
+        return self._prefetcher.get_stats()
+
+    def _read_frame(self,num_frame:int):
+        """
+        Read a frame, from the prefetched ones if available.
+        """
+        if self._prefetcher is not None:
+            frame = self._prefetcher.get(num_frame)
+            if frame is not None:
+                return frame
+        vid_ref = self.vid_ref
+        vid_ref.set_num_frame(num_frame)
+        return vid_ref.extract_next_frame()
+
+    def _peek_next_window_size(self) -> int:
+        """
+        Size of the window that the next `get_frame()` will use if nothing changes.
+        """
+        if self._is_forced_speed:
+            return self._curr_window_frame_size
+        if self._is_collided:
+            return self._min_window_frame_size
+        if self._is_cong_avoid:
+            return int(clip(self._lin_step(self._curr_x), self._min_window_frame_size, self._max_size_lin_window_frames))
+        return int(clip(self._exp_step(self._curr_x), self._min_window_frame_size, self._max_size_exp_window_frames))
+
+    def _hint_next_frames(self,following_first:bool=True):
+        """
+        Let the prefetcher decode the following frame (used on collisions and by `get_following_frame()`)
+        and the next step candidate, in order of likelihood.
+        """
+        if self._prefetcher is None or self._is_video_ended:
+            return
+        curr_num_frame = self._curr_num_frame
+        candidates = [  curr_num_frame + self._min_window_frame_size,
+                        curr_num_frame + self._peek_next_window_size() ]
+        self._prefetcher.hint(candidates if following_first else candidates[::-1])
 
     def get_video(self):
         """
@@ -443,6 +1118,11 @@ class VideoSpeedManager:
         ndarray
             Next video frame
         """
+        frame = self._next_frame()
+        self._hint_next_frames()
+        return frame
+
+    def _next_frame(self):
         if self._is_forced_speed:
             next_size_window_frame = self._curr_window_frame_size 
         else:
@@ -470,8 +1150,7 @@ class VideoSpeedManager:
         
         vid_ref = self.vid_ref
         self._curr_num_frame += self._curr_window_frame_size 
-        vid_ref.set_num_frame(self._curr_num_frame)
-        frame = vid_ref.extract_next_frame()
+        frame = self._read_frame(self._curr_num_frame)
         if frame is None:
             self._is_video_ended = True
             num_last_frame = self._get_num_last_frame(vid_ref)
@@ -555,6 +1234,7 @@ class VideoSpeedManager:
         self._curr_num_frame = num_frame - int(prev_size_window_frame)
 
     def reset(self):
+        self.close()
         self.__init__(*self._init_params)
 
     def lock_speed(self,num_frames_skipped:'int | None'= None):
@@ -582,9 +1262,10 @@ class VideoSpeedManager:
         was_forced = self._is_forced_speed
         self._is_forced_speed = True
         self._curr_window_frame_size = offset
-        frame = self.get_frame()
+        frame = self._next_frame()
         self._curr_window_frame_size = prev_speed
         self._is_forced_speed = was_forced
+        self._hint_next_frames(following_first=False)
         return frame
 
     def get_following_frame(self):
@@ -600,6 +1281,46 @@ class VideoSpeedManager:
             self._curr_num_frame -= (self._min_window_frame_size+1)
         return self._get_frame_offset(self._min_window_frame_size)
 
+    def get_state(self) -> dict:
+        """
+        Get the position and the speed state (current frame, window size, growth phase, frame ranges left),
+        so that the analysis can be resumed from it with `set_state()`.
+
+        Returns
+        -------
+        dict
+            State with python numbers, JSON serializable
+        """
+        to_ranges = lambda frames: None if frames is None else [[int(start), int(end)] for start, end in frames]
+        window_frame_size = getattr(self, "_curr_window_frame_size", None)
+        return {"curr_num_frame": int(self._curr_num_frame), "curr_x": int(self._curr_x),
+                "curr_window_frame_size": None if window_frame_size is None else int(window_frame_size),
+                "y0_lin": float(self._y0_lin), "is_cong_avoid": self._is_cong_avoid, "is_collided": self._is_collided,
+                "is_video_ended": self._is_video_ended, "is_forced_speed": self._is_forced_speed,
+                "frames": to_ranges(self._frames),
+                "curr_start_end_frames": None if self._curr_start_end_frames is None else [int(frame) for frame in self._curr_start_end_frames]}
+
+    def set_state(self, state:dict):
+        """
+        Restore the position and the speed state of `get_state()`.
+
+        Parameters
+        ----------
+        state : dict
+            State of a video speed manager of the same video
+        """
+        self._curr_num_frame = state["curr_num_frame"]
+        self._curr_x = state["curr_x"]
+        if state["curr_window_frame_size"] is not None:
+            self._curr_window_frame_size = state["curr_window_frame_size"]
+        self._y0_lin = state["y0_lin"]
+        self._is_cong_avoid = state["is_cong_avoid"]
+        self._is_collided = state["is_collided"]
+        self._is_video_ended = state["is_video_ended"]
+        self._is_forced_speed = state["is_forced_speed"]
+        self._frames = None if state["frames"] is None else [tuple(frames) for frames in state["frames"]]
+        self._curr_start_end_frames = None if state["curr_start_end_frames"] is None else tuple(state["curr_start_end_frames"])
+
     def set_analysis_frames(self,frames:'list[tuple[int,int]]'):
         """
         Set specific frame ranges for analysis.
@@ -619,6 +1340,16 @@ class SimpleVideo:
     ----------
     video : cv2.VideoCapture
         OpenCV video capture object
+    _sampler : FrameSampler
+        Frame access layer that avoids seeking on short forward jumps
+    _preview_size : tuple or None
+        Size (width, height) of the grayscale preview frames
+    _preview_stream : FFmpegFrameStream or None
+        Stream of preview frames decoded and downscaled by ffmpeg
+    _preview_store : FrameFeatureStore or None
+        Precomputed thumbnails used as previews instead of decoding
+    _prefetcher : FramePrefetcher or None
+        Background decoder of full resolution frames, see `enable_prefetch()`
     _curr_step : int
         Current frame step size
     _curr_frame_idx : int
@@ -632,8 +1363,16 @@ class SimpleVideo:
         Get total number of frames
     get_fps()
         Get frames per second
-    get_frame()
+    get_frame(full_resolution)
         Get next frame based on step size
+    get_current_frame(full_resolution)
+        Get the frame at the current index
+    enable_prefetch(capacity)
+        Decode full resolution frames in background
+    prefetch(frame_indices)
+        Hint the frames likely to be requested next
+    get_prefetch_stats()
+        Get the counters of the background prefetcher
     roll(offset)
         Move frame position by offset
     rewind()
@@ -643,7 +1382,7 @@ class SimpleVideo:
     get_frame_index(one_step_back)
         Get current frame index
     """
-    def __init__(self, video_id: str):
+    def __init__(self, video_id: str, preview_size:'tuple[int,int] | None'=None, preview_fps:'float | None'=None, preview_store=None, _testing_path=None):
         """
         Initialize simple video player.
 
@@ -651,10 +1390,33 @@ class SimpleVideo:
         ----------
         video_id : str
             Identifier for the video file
+        preview_size : tuple or None, optional
+            Size (width, height) of the grayscale preview frames returned with `full_resolution=False`,
+            they are produced by ffmpeg while decoding when it is installed
+        preview_fps : float or None, optional
+            Frames per second decoded for the previews, a preview is the closest sampled frame
+            before the current index. None to sample all the frames
+        preview_store : FrameFeatureStore or None, optional
+            Store of the video, its thumbnails are used as previews (size and rate of the store)
+        _testing_path : str, optional
+            Override path for testing
         """
-        self.video = cv2.VideoCapture(Path(__file__).parent.joinpath("static","videos",video_id,video_id+".mp4").__str__())
+        video_file_folder = VIDEOS_PATH.joinpath(video_id) if _testing_path is None else Path(_testing_path)
+        video_path = video_file_folder.joinpath(video_id+".mp4").__str__()
+        self.video = cv2.VideoCapture(video_path)
         if not self.video.isOpened():
             raise Exception("Error loading video in SimpleVideo")
+        self._sampler = FrameSampler(self.video)
+        self._preview_size = preview_size
+        self._preview_store = preview_store
+        self._preview_stream = None
+        if preview_store is not None:
+            self._preview_size = tuple(preview_store.thumbnails.shape[2:0:-1])
+        elif preview_size is not None and which("ffmpeg") is not None:
+            self._preview_stream = FFmpegFrameStream(video_path, preview_size, self.video.get(cv2.CAP_PROP_FPS),
+                                                     COLOR_GRAY, sample_fps=preview_fps)
+        self._video_path = video_path
+        self._prefetcher = None
         self._curr_step = 1
         self._curr_frame_idx = 0
         
@@ -663,6 +1425,54 @@ class SimpleVideo:
         Release video capture resources.
         """
         self.video.release()
+        if self._preview_stream is not None:
+            self._preview_stream.close()
+        if self._prefetcher is not None:
+            self._prefetcher.close()
+            self._prefetch_video.release()
+            self._prefetcher = None
+
+    def enable_prefetch(self, capacity: int = 4):
+        """
+        Decode full resolution frames in a background thread with a dedicated capture,
+        so that decoding overlaps with the analysis of the current frame.
+
+        Parameters
+        ----------
+        capacity : int, optional
+            Max number of prefetched frames kept in memory
+        """
+        if self._prefetcher is not None:
+            return
+        self._prefetch_video = cv2.VideoCapture(self._video_path)
+        self._prefetcher = FramePrefetcher(FrameSampler(self._prefetch_video).read, capacity)
+
+    def prefetch(self, frame_indices: 'list[int]'):
+        """
+        Hint the frames likely to be requested next at full resolution, most likely first.
+
+        Does nothing if prefetching is not enabled.
+
+        Parameters
+        ----------
+        frame_indices : list of int
+            Indices of the frames
+        """
+        if self._prefetcher is not None:
+            self._prefetcher.hint(frame_indices)
+
+    def get_prefetch_stats(self) -> dict:
+        """
+        Get the counters of the background prefetcher.
+
+        Returns
+        -------
+        dict
+            See `FramePrefetcher.get_stats()`, empty if prefetching is disabled
+        """
+        if self._prefetcher is None:
+            return {}
+        return self._prefetcher.get_stats()
 
     def get_count_frames(self) -> int:
         """
@@ -686,18 +1496,53 @@ class SimpleVideo:
         """
         return int(self.video.get(cv2.CAP_PROP_FPS))
 
-    def get_frame(self):
+    def get_frame(self, full_resolution: bool = True):
         """
         Get next frame based on current step size.
 
+        Parameters
+        ----------
+        full_resolution : bool, optional
+            If False returns the grayscale preview of the frame (requires `preview_size`)
+
         Returns
         -------
         ndarray
             Next video frame
         """
         self._curr_frame_idx += self._curr_step
-        self.video.set(cv2.CAP_PROP_POS_FRAMES,self._curr_frame_idx)
-        return self.video.read()[1]
+        return self.get_current_frame(full_resolution)
+
+    def get_current_frame(self, full_resolution: bool = True):
+        """
+        Get the frame at the current index without moving.
+
+        Used to decode at full resolution only the frames whose preview needs further analysis (e.g. OCR).
+
+        Parameters
+        ----------
+        full_resolution : bool, optional
+            If False returns the grayscale preview of the frame (requires `preview_size`)
+
+        Returns
+        -------
+        ndarray or None
+            Current video frame, None if out of the video
+        """
+        if self._preview_store is not None and not full_resolution:
+            return self._preview_store.get_thumbnail(self._curr_frame_idx)
+        if full_resolution or self._preview_size is None:
+            if self._prefetcher is not None:
+                frame = self._prefetcher.get(self._curr_frame_idx)
+                if frame is not None:
+                    return frame
+            return self._sampler.read(self._curr_frame_idx)
+        if self._preview_stream is not None:
+            return self._preview_stream.read(self._curr_frame_idx)
+        frame = self._sampler.read(self._curr_frame_idx)
+        if frame is None:
+            return None
+        return cv2.cvtColor(cv2.resize(frame, self._preview_size, interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)[:,:,None]
     
     def roll(self, offset: int):
         """
@@ -709,7 +1554,6 @@ class SimpleVideo:
             Number of frames to move (positive or negative)
         """
         self._curr_frame_idx += offset
-        self.video.set(cv2.CAP_PROP_POS_FRAMES,self._curr_frame_idx)
     
     def rewind(self):
         """
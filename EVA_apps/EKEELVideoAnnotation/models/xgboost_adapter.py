@@ -8,11 +8,24 @@ XGBoostModelAdapter
 
 """
 from pickle import load as load_model
-from media.image import ImageClassifier
-from numpy import prod, empty, argmax, ndarray, zeros
+from pathlib import Path
+from threading import Lock
+import cv2
+from media.image import ImageClassifier, FaceDetectorSingleton
+from numpy import prod, empty, argmax, ndarray, zeros, ascontiguousarray, array, repeat, flatnonzero
 from mediapipe.framework.formats.detection_pb2 import Detection
 from xgboost import XGBClassifier
 
+XGBOOST_MODEL_PATH = Path(__file__).parent.joinpath("xgboost500.sav")
+
+# Face features [x_center, face_size, n_faces] tried to find out if the faces can change the classification of a frame:
+# no faces, or one or two faces on the left, center and right, small, medium and large (fractions of width and area of the frame)
+FACE_PROBES = array([[0., 0., 0.]] + [[x_center, face_size, n_faces] for n_faces in (1, 2)
+                                                                  for x_center in (0.25, 0.5, 0.75)
+                                                                  for face_size in (0.005, 0.02, 0.1)])
+# Min distance from the decision boundary of `are_enough_slidish_like()` of all the probes to skip face detection
+FACE_SKIP_MARGIN: float = 0.1
+
 class XGBoostModelAdapter:
     '''
     Model adapter for the XGBoost pretrained model from the
@@ -22,15 +35,23 @@ class XGBoostModelAdapter:
     ----------
     _labels : dict
         A dictionary mapping label indices to their corresponding names.
+    _cached_adapters : dict
+        Adapters loaded by `get_cached()`, by model path.
 
     Methods
     -------
     __init__(model_path: str) -> None
         Initializes the model adapter with the given model path.
+    get_cached(model_path: str) -> XGBoostModelAdapter
+        Gets the adapter of the model loaded once per process.
     _extract_faces_info(detections: 'list[Detection] | None')
         Extracts face information from the current image.
     _extract_features_from_image(image: ImageClassifier, norm_minmax: bool = False)
         Extracts features from the given image.
+    extract_features_batch(frames: ndarray, detect_faces: bool = True)
+        Extracts the features of a batch of frames.
+    extract_decisive_features_batch(frames: ndarray, margin: float = FACE_SKIP_MARGIN)
+        Extracts the features of a batch of frames, detecting faces only where they can change the classification.
     predict_probability(image: ImageClassifier)
         Predicts the probability distribution over classes for the given image.
     predict_max_confidence(image: ImageClassifier)
@@ -39,9 +60,15 @@ class XGBoostModelAdapter:
         Gets the label corresponding to the given prediction.
     is_enough_slidish_like(image: ImageClassifier)
         Predicts if the image is likely to be a slide with a small margin of confidence.
+    are_enough_slidish_like(images: ndarray)
+        Predicts for a batch of frames if they are likely to be slides, with one model call.
+    _slidish_margins(features: ndarray)
+        Distances of the frames from the decision boundary of `are_enough_slidish_like()`.
     '''
 
     _labels = {0: "Blackboard", 1: "Slide", 2: "Slide-and-Talk", 3: "Talk"}
+    _cached_adapters: 'dict[str, XGBoostModelAdapter]' = {}
+    _cache_lock = Lock()
 
     def __init__(self, model_path: str) -> None:
         '''
@@ -57,7 +84,29 @@ class XGBoostModelAdapter:
         except:
             raise FileExistsError("cannot find XGBoost model")
 
-    def _extract_faces_info(self, detections: 'list[Detection] | None'):
+    @classmethod
+    def get_cached(cls, model_path: 'str | Path' = XGBOOST_MODEL_PATH) -> 'XGBoostModelAdapter':
+        '''
+        Gets the adapter of a model, which is unpickled only at the first call of the process.
+
+        Parameters
+        ----------
+        model_path : str or Path, optional
+            The path to the pretrained XGBoost model (default is `xgboost500.sav`).
+
+        Returns
+        -------
+        adapter : XGBoostModelAdapter
+            The adapter shared by all the callers of the process.
+        '''
+        model_path = str(model_path)
+        with cls._cache_lock:
+            if model_path not in cls._cached_adapters:
+                cls._cached_adapters[model_path] = cls(model_path)
+            return cls._cached_adapters[model_path]
+
+    @staticmethod
+    def _extract_faces_info(detections: 'list[Detection] | None'):
         '''
         Extracts face information from the current image.
 
@@ -109,20 +158,88 @@ class XGBoostModelAdapter:
         out_arr[0, 16:] = self._extract_faces_info(image.detect_faces())
         return out_arr
 
-    def predict_probability(self, image: ImageClassifier):
+    @staticmethod
+    def extract_features_batch(frames: 'ndarray | list[ndarray]', detect_faces: bool = True):
+        '''
+        Extracts the features of a batch of frames, the same as `_extract_features_from_image()` for every frame,
+        in a single array ready for one model call.
+
+        Parameters
+        ----------
+        frames : ndarray or list[ndarray]
+            Frames of shape (height, width, 3), stacked or in a list.
+        detect_faces : bool, optional
+            Whether to compute the face features, zeros otherwise (default is True).
+
+        Returns
+        -------
+        out_arr : ndarray
+            An array with the features of every frame, shape (num_frames, 19).
+        '''
+        out_arr = zeros((len(frames), 19), dtype=float)
+        face_detector = FaceDetectorSingleton() if detect_faces else None
+        for num_frame, frame in enumerate(frames):
+            assert frame.ndim == 3 and frame.shape[2] == 3
+            # calcHist on every frame is faster than numpy histograms on the whole stack
+            frame_gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            out_arr[num_frame, :16] = cv2.calcHist([frame_gray], [0], None, [16], [0, 256]).ravel()
+            out_arr[num_frame, :16] /= frame_gray.size
+            if face_detector is not None:
+                out_arr[num_frame, 16:] = XGBoostModelAdapter._extract_faces_info(face_detector.detect(ascontiguousarray(frame)).detections)
+        return out_arr
+
+    def extract_decisive_features_batch(self, frames: 'ndarray | list[ndarray]', margin: float = FACE_SKIP_MARGIN):
+        '''
+        Extracts the features of a batch of frames like `extract_features_batch()`, but runs face detection only on the frames
+        whose classification can depend on the faces.
+
+        The histograms are scored with every face features in `FACE_PROBES` with one model call: if the frame is classified
+        the same way with all of them, at least `margin` away from the decision boundary, its face features are left to zero.
+
+        Parameters
+        ----------
+        frames : ndarray or list[ndarray]
+            Frames of shape (height, width, 3), stacked or in a list.
+        margin : float, optional
+            Min distance from the decision boundary of all the probes to skip face detection (default is FACE_SKIP_MARGIN).
+
+        Returns
+        -------
+        out_arr : ndarray
+            An array with the features of every frame, shape (num_frames, 19), faces are zeros where they are not detected.
+        '''
+        out_arr = self.extract_features_batch(frames, detect_faces=False)
+        if len(out_arr) == 0:
+            return out_arr
+        num_probes = len(FACE_PROBES)
+        probes = repeat(out_arr, num_probes, axis=0)
+        for num_frame, frame in enumerate(frames):
+            height, width = frame.shape[:2]
+            # face features are in pixels of the frame
+            probes[num_frame*num_probes:(num_frame+1)*num_probes, 16:] = FACE_PROBES * (width, width * height, 1)
+        margins = self._slidish_margins(probes).reshape(len(out_arr), num_probes)
+        decided = (margins.min(axis=1) >= margin) | (margins.max(axis=1) <= -margin)
+        face_detector = FaceDetectorSingleton()
+        for num_frame in flatnonzero(~decided):
+            out_arr[num_frame, 16:] = self._extract_faces_info(face_detector.detect(ascontiguousarray(frames[num_frame])).detections)
+        return out_arr
+
+    def predict_probability(self, image: 'ImageClassifier | ndarray'):
         '''
         Predicts the probability distribution over classes for the given image.
 
         Parameters
         ----------
-        image : ImageClassifier
-            The image classifier object.
+        image : ImageClassifier or ndarray
+            The image classifier object, or its features already extracted (e.g. from `FrameFeatureStore`).
 
         Returns
         -------
         probs : ndarray
             The probability distribution over classes.
         '''
+        if isinstance(image, ndarray):
+            return self._model.predict_proba(image)
         return self._model.predict_proba(self._extract_features_from_image(image))
 
     def predict_max_confidence(self, image: ImageClassifier):
@@ -164,21 +281,55 @@ class XGBoostModelAdapter:
         else:
             return None
 
-    def is_enough_slidish_like(self, image: ImageClassifier):
+    def is_enough_slidish_like(self, image: 'ImageClassifier | ndarray'):
         '''
         Predicts if the image is likely to be a slide with a small margin of confidence.
 
         Parameters
         ----------
-        image : ImageClassifier
-            The image classifier object.
+        image : ImageClassifier or ndarray
+            The image classifier object, or its features already extracted.
 
         Returns
         -------
         is_slidish : bool
             True if the image is likely to be a slide, False otherwise.
         '''
-        probs = self.predict_probability(image)
-        best_slidish_prob = max(probs[0, (1, 2)])
-        best_not_slidish_prob = max(probs[0, (0, 3)])
-        return 1.15 * best_slidish_prob >= best_not_slidish_prob
+        return bool(self.are_enough_slidish_like(image if isinstance(image, ndarray) else [image.get_img()])[0])
+
+    def are_enough_slidish_like(self, images: 'ndarray | list[ndarray]'):
+        '''
+        Predicts for a batch of frames if they are likely to be slides with a small margin of confidence,
+        scoring all of them with one model call.
+
+        Parameters
+        ----------
+        images : ndarray or list[ndarray]
+            The features of the frames, shape (num_frames, 19), or the frames themselves (see `extract_decisive_features_batch()`).
+
+        Returns
+        -------
+        are_slidish : ndarray
+            Boolean array, True for the frames likely to be slides.
+        '''
+        if not isinstance(images, ndarray) or images.ndim != 2:
+            images = self.extract_decisive_features_batch(images)
+        return self._slidish_margins(images) >= 0
+
+    def _slidish_margins(self, features: ndarray):
+        '''
+        Distances of the frames from the decision boundary of `are_enough_slidish_like()`,
+        positive for the frames likely to be slides.
+
+        Parameters
+        ----------
+        features : ndarray
+            The features of the frames, shape (num_frames, 19).
+
+        Returns
+        -------
+        margins : ndarray
+            1.15 times the best probability of the slide classes minus the best probability of the other classes.
+        '''
+        probs = self.predict_probability(features)
+        return 1.15 * probs[:, (1, 2)].max(axis=1) - probs[:, (0, 3)].max(axis=1)
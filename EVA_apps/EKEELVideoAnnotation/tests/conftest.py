@@ -0,0 +1,39 @@
+"""
+Fixtures of the tests, run them from the EKEELVideoAnnotation folder with `python -m pytest tests`.
+
+The tests of the database functions need a MongoDB server (4.2 or later, a standalone one is enough):
+set MONGO_TEST_URI (e.g. mongodb://localhost:27017) to run them, otherwise they are skipped.
+Every test uses its own database, dropped at the end.
+"""
+
+import os
+import sys
+import uuid
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+
+@pytest.fixture
+def mongo(monkeypatch):
+    """
+    Module `database.mongo` working on an empty test database.
+    """
+    uri = os.environ.get("MONGO_TEST_URI")
+    if not uri:
+        pytest.skip("MONGO_TEST_URI not set")
+    pymongo = pytest.importorskip("pymongo")
+    try:
+        import database.mongo as mongo
+    except pymongo.errors.ConfigurationError as e:
+        # the client of the cluster is created when the module is imported, it's never used by the tests
+        pytest.skip(f"database.mongo can't be imported: {e}")
+    client = pymongo.MongoClient(uri, serverSelectionTimeoutMS=5000)
+    db = client[f"ekeel_test_{uuid.uuid4().hex[:12]}"]
+    monkeypatch.setattr(mongo, "db", db)
+    monkeypatch.setattr(mongo, "_are_transcription_jobs_indexed", False)
+    yield mongo
+    client.drop_database(db.name)
+    client.close()
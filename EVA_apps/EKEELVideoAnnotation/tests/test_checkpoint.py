@@ -0,0 +1,44 @@
+"""
+Tests of the checkpoints of the analysis stages.
+"""
+
+from media.checkpoint import StageCheckpoint, CHECKPOINTS_FOLDER
+
+
+def test_state_round_trip(tmp_path):
+    key = {"start_frame": 0, "end_frame": 1500, "frame_size": (640, 360)}
+    state = {"num_done": 12, "slides": [{"text": "title", "frames": [[0, 250]]}]}
+    checkpoint = StageCheckpoint(tmp_path, "slides_0", key)
+
+    assert checkpoint.load() is None
+    checkpoint.save(state)
+
+    # a tuple of the key is a list after the round trip, the key still matches
+    assert StageCheckpoint(tmp_path, "slides_0", key).load() == state
+    assert checkpoint.num_saves == 1
+    assert list(tmp_path.joinpath(CHECKPOINTS_FOLDER).iterdir()) == [checkpoint.get_path()]
+
+
+def test_state_of_another_key_is_ignored(tmp_path):
+    StageCheckpoint(tmp_path, "transcription", {"model": "small"}).save({"num_segments": 3})
+
+    assert StageCheckpoint(tmp_path, "transcription", {"model": "large-v3"}).load() is None
+
+
+def test_unreadable_state_is_ignored(tmp_path):
+    checkpoint = StageCheckpoint(tmp_path, "transcription")
+    checkpoint.save({"num_segments": 3})
+    checkpoint.get_path().write_text('{"key": null, "state": {"num_seg')
+
+    assert checkpoint.load() is None
+
+
+def test_remove_and_clear(tmp_path):
+    for name in ("slides_0", "slides_1500", "transcription"):
+        StageCheckpoint(tmp_path, name).save({})
+    StageCheckpoint(tmp_path, "transcription").remove()
+    StageCheckpoint(tmp_path, "transcription").remove()
+
+    StageCheckpoint.clear(tmp_path, "slides_")
+
+    assert list(tmp_path.joinpath(CHECKPOINTS_FOLDER).iterdir()) == []
@@ -0,0 +1,65 @@
+"""
+Tests of the cache of the OCR results.
+"""
+
+import cv2
+import numpy as np
+import pytest
+
+image = pytest.importorskip("media.image")
+
+RESULT = [("Some slide text", (60., 70., 400., 40.))]
+
+
+def _render_slide(extra_word:bool=False, noise:float=0, seed:int=0):
+    slide = np.full((720, 1280), 235, dtype=np.uint8)
+    for num_line in range(6):
+        cv2.putText(slide, f"Some slide text line {num_line}", (60, 100 + 80*num_line), cv2.FONT_HERSHEY_SIMPLEX, 1.4, 20, 3)
+    if extra_word:
+        cv2.putText(slide, "ok", (900, 500), cv2.FONT_HERSHEY_SIMPLEX, 1.2, 20, 2)
+    if noise:
+        noisy = slide + np.random.default_rng(seed).normal(0, noise, slide.shape)
+        slide = np.clip(noisy, 0, 255).astype(np.uint8)
+    return slide
+
+
+def test_hit_on_the_same_slide():
+    cache = image.OCRCache()
+    cache.put(_render_slide(), "eng", RESULT)
+
+    assert cache.get(_render_slide(), "eng") == RESULT
+    assert cache.get_stats()["hits"] == 1
+
+
+def test_miss_on_another_namespace():
+    cache = image.OCRCache()
+    cache.put(_render_slide(), "eng", RESULT)
+
+    assert cache.get(_render_slide(), "ita") is None
+    assert cache.get_stats()["misses"] == 1
+
+
+def test_miss_on_a_slide_with_one_more_word():
+    cache = image.OCRCache()
+    cache.put(_render_slide(), "eng", RESULT)
+
+    # the hashes are close, the thumbnails are not
+    assert cache.get(_render_slide(extra_word=True), "eng") is None
+
+
+def test_near_hit_is_confirmed_by_the_thumbnails():
+    cache = image.OCRCache(max_distance=64)
+    cache.put(_render_slide(), "eng", RESULT)
+
+    assert cache.get(_render_slide(noise=2, seed=1), "eng") == RESULT
+    assert cache.get(_render_slide(extra_word=True, noise=2, seed=2), "eng") is None
+
+
+def test_results_are_loaded_from_the_folder(tmp_path):
+    image.OCRCache(folder=tmp_path).put(_render_slide(), "eng", RESULT)
+
+    cache = image.OCRCache(folder=tmp_path)
+
+    assert cache.get(_render_slide(), "eng") == RESULT
+    assert cache.get(_render_slide(extra_word=True), "eng") is None
+    assert cache.get_stats()["disk_hits"] == 1
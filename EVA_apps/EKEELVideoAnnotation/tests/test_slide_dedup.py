@@ -0,0 +1,68 @@
+"""
+Tests of the merge of the duplicated slides.
+"""
+
+from bisect import insort_left
+
+import pytest
+
+words = pytest.importorskip("text_processor.words")
+
+
+class FakeSlide:
+    """
+    Slide with the methods used by `SlideDuplicatesIndex`, its text is already clean.
+    """
+
+    def __init__(self, text:str, start_frame:int):
+        self.text = text
+        self.start_end_frames = [(start_frame, start_frame + 100)]
+
+    def get_clean_text(self) -> str:
+        return self.text
+
+    def merge_frames(self, other_slide:'FakeSlide'):
+        for start_end in other_slide.start_end_frames:
+            if start_end not in self.start_end_frames:
+                insort_left(self.start_end_frames, start_end)
+
+
+class ContainmentClassifier:
+    """
+    A slide is in another one if its text is a substring of the other text.
+    """
+
+    def is_partially_in(self, slide:FakeSlide, other_slide:FakeSlide) -> bool:
+        return slide.text in other_slide.text
+
+
+def test_find_root_compresses_the_path():
+    parents = [1, 2, 3, 3]
+
+    assert words.SlideDuplicatesIndex._find_root(parents, 0) == 3
+    assert parents == [3, 3, 3, 3]
+
+
+def test_chain_of_contained_slides_is_merged_into_the_longest():
+    title = FakeSlide("introduction to graphs", 0)
+    first_bullet = FakeSlide("introduction to graphs vertices and edges", 200)
+    both_bullets = FakeSlide("introduction to graphs vertices and edges paths and cycles", 400)
+    other = FakeSlide("sorting algorithms quicksort", 600)
+
+    slides = words.SlideDuplicatesIndex(ContainmentClassifier()).merge_duplicates([title, first_bullet, both_bullets, other])
+
+    assert slides == [both_bullets, other]
+    assert both_bullets.start_end_frames == [(0, 100), (200, 300), (400, 500)]
+    assert other.start_end_frames == [(600, 700)]
+
+
+def test_contained_slide_is_merged_into_the_closest_in_time():
+    bullet = FakeSlide("the master theorem", 1000)
+    before = FakeSlide("recurrences and the master theorem", 0)
+    after = FakeSlide("examples of the master theorem", 1200)
+
+    slides = words.SlideDuplicatesIndex(ContainmentClassifier()).merge_duplicates([before, bullet, after])
+
+    assert slides == [before, after]
+    assert after.start_end_frames == [(1000, 1100), (1200, 1300)]
+    assert before.start_end_frames == [(0, 100)]
@@ -0,0 +1,67 @@
+"""
+Tests of the transcript published while the transcription runs and of its finalization in MongoDB.
+"""
+
+OPTIONS = {"backend": "faster-whisper", "model_size": "large-v3", "compute_type": "int8"}
+
+
+def _segment(index:int) -> dict:
+    return {"start": float(index), "end": index + 1., "text": f"segment {index}"}
+
+
+def _insert_analyzed_video(mongo):
+    mongo.db.videos.insert_one({"video_id": "v", "language": "en",
+                                "transcript_data": {"is_whisper_transcribed": False, "text": "old transcript",
+                                                    "terms": ["old term"], "ItaliaNLP_doc_id": 7, "tagged_text": []},
+                                "video_data": {"duration": 60, "segments": [[0, 30], [30, 60]]}})
+    mongo.db.conlls.insert_one({"video_id": "v", "conll": "1\told\n"})
+
+
+def test_segments_are_appended_after_the_published_ones(mongo):
+    _insert_analyzed_video(mongo)
+
+    assert mongo.append_transcript_segments("v", [_segment(0), _segment(1)], 0, 2.)
+    # a gap is refused
+    assert not mongo.append_transcript_segments("v", [_segment(3)], 3, 4.)
+    assert mongo.append_transcript_segments("v", [_segment(2)], 2, 3.)
+
+    partial = mongo.db.videos.find_one({"video_id": "v"})["transcript_data"]["whisper_partial"]
+    assert partial["segments"] == [_segment(0), _segment(1), _segment(2)]
+    assert partial["num_segments"] == 3
+    assert partial["watermark_seconds"] == 3.
+
+
+def test_segments_from_the_start_replace_the_published_ones(mongo):
+    _insert_analyzed_video(mongo)
+    mongo.append_transcript_segments("v", [_segment(0), _segment(1)], 0, 2.)
+
+    assert mongo.append_transcript_segments("v", [_segment(0)], 0, 1.)
+
+    partial = mongo.db.videos.find_one({"video_id": "v"})["transcript_data"]["whisper_partial"]
+    assert partial["segments"] == [_segment(0)]
+    assert partial["num_segments"] == 1
+
+
+def test_finalize_requires_all_the_segments(mongo):
+    _insert_analyzed_video(mongo)
+    mongo.append_transcript_segments("v", [_segment(0), _segment(1)], 0, 2.)
+
+    assert not mongo.finalize_transcript("v", 3, OPTIONS)
+
+    video = mongo.db.videos.find_one({"video_id": "v"})
+    assert "whisper_partial" in video["transcript_data"]
+    assert mongo.db.conlls.count_documents({"video_id": "v"}) == 1
+
+
+def test_finalize_rebuilds_the_transcript_and_removes_derived_data(mongo):
+    _insert_analyzed_video(mongo)
+    mongo.append_transcript_segments("v", [_segment(0), _segment(1)], 0, 2.)
+
+    assert mongo.finalize_transcript("v", 2, OPTIONS)
+
+    video = mongo.db.videos.find_one({"video_id": "v"})
+    assert video["transcript_data"] == {"is_whisper_transcribed": True, "is_autogenerated": True,
+                                        "transcription_options": OPTIONS, "text": [_segment(0), _segment(1)]}
+    assert video["video_data"] == {"duration": 60}
+    assert "_whisper_segments" not in video
+    assert mongo.db.conlls.count_documents({"video_id": "v"}) == 0
@@ -0,0 +1,123 @@
+"""
+Tests of the queue of the transcription jobs in MongoDB (leases, renewals, expiry, retries).
+"""
+
+import time
+from datetime import datetime, timezone
+
+
+def _expire_leases():
+    # leases of 0 seconds expire as soon as the clock of the database moves
+    time.sleep(0.05)
+
+
+def _now():
+    # pymongo returns naive UTC datetimes
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def test_jobs_are_claimed_by_priority_then_age(mongo):
+    mongo.enqueue_transcription_job("old", "en")
+    time.sleep(0.01)
+    mongo.enqueue_transcription_job("new", "en")
+    mongo.enqueue_transcription_job("urgent", "en", priority=5)
+
+    claimed = [mongo.claim_transcription_job("worker", 60)["video_id"] for _ in range(3)]
+
+    assert claimed == ["urgent", "old", "new"]
+    assert mongo.claim_transcription_job("worker", 60) is None
+
+
+def test_claim_leases_the_job_to_the_worker(mongo):
+    options = {"backend": "faster-whisper", "model_size": "small", "compute_type": "int8"}
+    mongo.enqueue_transcription_job("v", "it", options=options)
+
+    job = mongo.claim_transcription_job("w1", 60)
+
+    assert job["status"] == mongo.TRANSCRIPTION_JOB_RUNNING
+    assert job["worker_id"] == "w1"
+    assert job["attempts"] == 1
+    assert job["language"] == "it"
+    assert job["options"] == options
+    assert job["lease_expires_at"] > _now()
+    assert mongo.claim_transcription_job("w2", 60) is None
+
+
+def test_lease_is_renewed_only_by_its_worker(mongo):
+    mongo.enqueue_transcription_job("v", "en")
+    job = mongo.claim_transcription_job("w1", 1)
+
+    assert mongo.renew_transcription_job_lease("v", "w1", 120)
+    assert not mongo.renew_transcription_job_lease("v", "w2", 120)
+    renewed = mongo.db.transcription_jobs.find_one({"video_id": "v"})
+    assert renewed["lease_expires_at"] > job["lease_expires_at"]
+
+
+def test_expired_lease_is_claimed_by_another_worker(mongo):
+    mongo.enqueue_transcription_job("v", "en")
+    mongo.claim_transcription_job("w1", 0)
+    _expire_leases()
+
+    job = mongo.claim_transcription_job("w2", 60)
+
+    assert job["video_id"] == "v"
+    assert job["worker_id"] == "w2"
+    assert job["attempts"] == 2
+    assert not mongo.renew_transcription_job_lease("v", "w1", 60)
+    assert not mongo.complete_transcription_job("v", "w1")
+    assert mongo.complete_transcription_job("v", "w2")
+    assert mongo.db.transcription_jobs.find_one({"video_id": "v"})["status"] == mongo.TRANSCRIPTION_JOB_DONE
+
+
+def test_expired_lease_after_max_attempts_fails_the_job(mongo):
+    mongo.enqueue_transcription_job("v", "en")
+    for _ in range(2):
+        assert mongo.claim_transcription_job("worker", 0, max_attempts=2) is not None
+        _expire_leases()
+
+    assert mongo.claim_transcription_job("worker", 60, max_attempts=2) is None
+    job = mongo.db.transcription_jobs.find_one({"video_id": "v"})
+    assert job["status"] == mongo.TRANSCRIPTION_JOB_FAILED
+    assert job["lease_expires_at"] is None
+    assert "2 attempts" in job["error"]
+
+
+def test_released_job_is_retried_later_then_fails(mongo):
+    mongo.enqueue_transcription_job("v", "en")
+    mongo.claim_transcription_job("worker", 60)
+
+    mongo.release_transcription_job("v", "worker", "out of memory", retry_seconds=60, max_attempts=2)
+    job = mongo.db.transcription_jobs.find_one({"video_id": "v"})
+    assert job["status"] == mongo.TRANSCRIPTION_JOB_QUEUED
+    assert job["error"] == "out of memory"
+    assert mongo.claim_transcription_job("worker", 60) is None
+
+    mongo.db.transcription_jobs.update_one({"video_id": "v"}, {"$set": {"available_at": datetime(2000, 1, 1)}})
+    assert mongo.claim_transcription_job("worker", 60)["attempts"] == 2
+    mongo.release_transcription_job("v", "worker", "out of memory", retry_seconds=60, max_attempts=2)
+    assert mongo.db.transcription_jobs.find_one({"video_id": "v"})["status"] == mongo.TRANSCRIPTION_JOB_FAILED
+
+
+def test_enqueue_indexes_the_queue_and_keeps_one_job_per_video(mongo):
+    mongo.enqueue_transcription_job("v", "en")
+    mongo.enqueue_transcription_job("v", "en", priority=3)
+    mongo.enqueue_transcription_job("v", "en", priority=1)
+
+    assert mongo.db.transcription_jobs.count_documents({}) == 1
+    assert mongo.db.transcription_jobs.find_one({"video_id": "v"})["priority"] == 3
+    indexes = mongo.db.transcription_jobs.index_information().values()
+    assert any(index.get("unique") and index["key"] == [("video_id", 1)] for index in indexes)
+
+
+def test_finished_jobs_are_queued_again_only_if_requested(mongo):
+    mongo.enqueue_transcription_job("v", "en")
+    mongo.claim_transcription_job("worker", 60)
+    mongo.complete_transcription_job("v", "worker")
+
+    mongo.enqueue_transcription_job("v", "en", requeue_finished=False)
+    assert mongo.db.transcription_jobs.find_one({"video_id": "v"})["status"] == mongo.TRANSCRIPTION_JOB_DONE
+
+    mongo.enqueue_transcription_job("v", "en")
+    job = mongo.db.transcription_jobs.find_one({"video_id": "v"})
+    assert job["status"] == mongo.TRANSCRIPTION_JOB_QUEUED
+    assert job["attempts"] == 0
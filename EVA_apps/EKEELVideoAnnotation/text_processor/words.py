@@ -26,6 +26,7 @@ from nltk.corpus import words
 from nltk import WordNetLemmatizer
 from typing import List,Tuple
 from bisect import insort_left
+from math import ceil, sqrt
 from sklearn.feature_extraction.text import CountVectorizer
 from sentence_transformers import SentenceTransformer
 from difflib import ndiff
@@ -927,6 +928,10 @@ class TextSimilarityClassifier:
         """
         Check if text1 is partially in text2.
 
+        The checks of the comparison methods run from the cheapest, on the cleaned text and the counts of the characters
+        cached by the slides: the characters in common bound the characters matched by the fuzzy ratio and by the diff,
+        so most pairs are rejected before computing them.
+
         Parameters
         ----------
         TFT1 : VideoSlide
@@ -939,99 +944,116 @@ class TextSimilarityClassifier:
         bool
             True if text1 is part of text2, False otherwise.
         """
-        #comp_methods = self._comp_methods
-        checks:list[bool] = [bool(TFT1) and bool(TFT2)]
-        text1 = TFT1.get_full_text()
-        text2 = TFT2.get_full_text()
-        checks.append(bool(text1) and bool(text2))
-        
-        comp_methods = self._comp_methods
-        removed_chars_count = None
-        cleaner = self._txt_cleaner
-        text1_cleaned = cleaner.clean_text(text1)
-        text2_cleaned = cleaner.clean_text(text2)
-        checks.append(len(text1_cleaned) < len(text2_cleaned))
-        
-        if not all(checks):
+        if not (bool(TFT1) and bool(TFT2) and TFT1.get_full_text() and TFT2.get_full_text()):
+            return False
+        text1_cleaned, text2_cleaned = TFT1.get_clean_text(), TFT2.get_clean_text()
+        text1_len, text2_len = len(text1_cleaned), len(text2_cleaned)
+        if text1_len >= text2_len:
             return False
-        
-        if ComparisonMethods.FUZZY_PARTIAL_RATIO in comp_methods:
-            fuzz_ratio = partial_ratio(text1_cleaned, text2_cleaned)/100
-            checks.append(fuzz_ratio > self.fuzz_ratio_thresh)
 
-        if not all(checks):
+        comp_methods = self._comp_methods
+        # no alignment of the texts matches more characters than the ones they have in common
+        max_common_chars = (TFT1.get_chars_count() & TFT2.get_chars_count()).total()
+        max_fuzz_ratio = int(round(100 * (2.0 * max_common_chars / (text1_len + max_common_chars)))) / 100 if text1_len > 0 else 0
+        if ComparisonMethods.FUZZY_PARTIAL_RATIO in comp_methods and max_fuzz_ratio <= self.fuzz_ratio_thresh:
             return False
-    
         if ComparisonMethods.TXT_SIM_RATIO in comp_methods:
+            max_diffs_len = text1_len + text2_len - max_common_chars
+            if not (text1_len > 0 and
+                    (text1_len - max_common_chars)/max_diffs_len < self.removed_chars_diff_ratio_thresh and
+                    max_common_chars/text1_len > self.common_chars_txt_ratio_thresh and
+                    (text2_len - max_common_chars)/max_diffs_len < self.added_chars_diff_ratio_thresh):
+                return False
+        if ComparisonMethods.TXT_MISS_RATIO in comp_methods and \
+            not (text1_len > 0 and (text1_len - max_common_chars)/text1_len < self.removed_chars_txt_ratio_thresh):
+            return False
+
+        fuzz_ratio = None
+        if ComparisonMethods.CHARS_COMMON_DISTRIB in comp_methods and \
+            not self._are_chars_distrib_similar(TFT1.get_chars_count(), TFT2.get_chars_count()):
+            # the distribution check passes anyway with an almost exact fuzzy match
+            if ComparisonMethods.FUZZY_PARTIAL_RATIO not in comp_methods or max_fuzz_ratio <= 0.95:
+                return False
+            fuzz_ratio = partial_ratio(text1_cleaned, text2_cleaned)/100
+            if not fuzz_ratio > 0.95:
+                return False
+
+        if ComparisonMethods.FUZZY_PARTIAL_RATIO in comp_methods:
+            if fuzz_ratio is None:
+                fuzz_ratio = partial_ratio(text1_cleaned, text2_cleaned)/100
+            if not fuzz_ratio > self.fuzz_ratio_thresh:
+                return False
+
+        if ComparisonMethods.TXT_SIM_RATIO in comp_methods or ComparisonMethods.TXT_MISS_RATIO in comp_methods:
             counter = Counter([change[0] for change in ndiff(text1_cleaned,text2_cleaned)])
-            removed_chars_count = 0 if not '-' in counter.keys() else counter['-']
-            common_chars_count = 0 if not ' ' in counter.keys() else counter[' ']
-            added_chars_count = 0 if not '+' in counter.keys() else counter['+']
+            removed_chars_count, common_chars_count, added_chars_count = counter['-'], counter[' '], counter['+']
+
+        if ComparisonMethods.TXT_SIM_RATIO in comp_methods:
             diffs_len = removed_chars_count+common_chars_count+added_chars_count
-            text1_len = len(text1_cleaned)
-            checks.append(  diffs_len > 0 and 
-                            text1_len > 0 and 
-                            removed_chars_count/diffs_len < self.removed_chars_diff_ratio_thresh and 
-                            common_chars_count/text1_len > self.common_chars_txt_ratio_thresh  and
-                            added_chars_count/diffs_len < self.added_chars_diff_ratio_thresh)
-        
-        if not all(checks):
-            return False
-                
+            if not (diffs_len > 0 and
+                    removed_chars_count/diffs_len < self.removed_chars_diff_ratio_thresh and
+                    common_chars_count/text1_len > self.common_chars_txt_ratio_thresh and
+                    added_chars_count/diffs_len < self.added_chars_diff_ratio_thresh):
+                return False
+
         if ComparisonMethods.MEANINGFUL_WORDS_COUNT in comp_methods:
             all_words = self._words
             txt1_split = text1_cleaned.split(); txt2_split = text2_cleaned.split()
-            len_txt1_split = len(txt1_split); len_txt2_split = len(txt2_split) 
-            checks.append(( 0 < len_txt1_split <= len_txt2_split 
-                                and ( len([word for word in txt1_split if word in all_words]) / len_txt1_split 
-                                        <= 
-                                      len([word for word in txt2_split if word in all_words]) / len_txt2_split) ) 
-                            or len_txt1_split <= len_txt2_split )
-        
-        if not all(checks):
-            return False
-        
-        if ComparisonMethods.TXT_MISS_RATIO in comp_methods:
-            if removed_chars_count is None:
-                text1_cleaned = cleaner.clean_text(text1); text2_cleaned = cleaner.clean_text(text2)
-                counter = Counter([change[0] for change in ndiff(text1_cleaned,text2_cleaned)])
-                removed_chars_count = 0 if not '-' in counter.keys() else counter['-']
-                added_chars_count = 0 if not '+' in counter.keys() else counter['+']
-                text1_len = len(text1_cleaned)
-            checks.append(  text1_len > 0 and 
-                            removed_chars_count/len(text1_cleaned) < self.removed_chars_txt_ratio_thresh)
-        
-        if not all(checks):
+            len_txt1_split = len(txt1_split); len_txt2_split = len(txt2_split)
+            if not (( 0 < len_txt1_split <= len_txt2_split
+                      and ( len([word for word in txt1_split if word in all_words]) / len_txt1_split
+                            <=
+                            len([word for word in txt2_split if word in all_words]) / len_txt2_split) )
+                    or len_txt1_split <= len_txt2_split ):
+                return False
+
+        if ComparisonMethods.TXT_MISS_RATIO in comp_methods and not removed_chars_count/text1_len < self.removed_chars_txt_ratio_thresh:
             return False
-        
-        if ComparisonMethods.CHARS_COMMON_DISTRIB in comp_methods:
-            counts1 = Counter(text1_cleaned); counts2 = Counter(text2_cleaned)
-            counts1.pop(" ",0); counts2.pop(" ",0)
-            for key in set(counts1.keys()).union(set(counts2.keys())):
-                if key not in counts1:
-                    counts1[key] = 0
-                if key not in counts2:
-                    counts2[key] = 0
-
-            cosine_sim = cosine_similarity([np.array(list(counts1[key] for key in sorted(counts1)))], 
-                                           [np.array(list(counts2[key] for key in sorted(counts2)))])[0][0]
-            
-            checks.append(cosine_sim > self.cosine_sim_thresh or (ComparisonMethods.FUZZY_PARTIAL_RATIO in comp_methods and fuzz_ratio > 0.95))
-        
-        if not all(checks):
-            return False
-        
+
         if ComparisonMethods.LEMMAS_CONTAINED_RATIO in comp_methods:
-            lang = self.language
-            lemmas1:list = NLPSingleton().lemmatize(text1_cleaned,lang)
-            lemmas2:list = NLPSingleton().lemmatize(text2_cleaned,lang)
-            lemmas_diff = [lemma for lemma in lemmas2 if not lemma in lemmas1 or lemmas1.remove(lemma)]
-            checks.append(len(lemmas_diff)/len(lemmas1) <= self.extra_lemmas_ratio_thresh)
-        
-        return all(checks)
+            lemmas1 = TFT1.get_lemmas(self.language)
+            lemmas_diff = Counter(TFT2.get_lemmas(self.language)) - Counter(lemmas1)
+            if not lemmas_diff.total()/len(lemmas1) <= self.extra_lemmas_ratio_thresh:
+                return False
+
+        return True
+
+    def _are_chars_distrib_similar(self, counts1: Counter, counts2: Counter) -> bool:
+        """
+        Check if the cosine similarity of the counts of the characters (but spaces) of two texts is above `cosine_sim_thresh`.
+
+        Parameters
+        ----------
+        counts1 : Counter
+            Counts of the characters of the first text.
+        counts2 : Counter
+            Counts of the characters of the second text.
+
+        Returns
+        -------
+        bool
+            True if the distributions of the characters are similar, False otherwise.
+        """
+        dot = sum_squares1 = sum_squares2 = 0
+        for char, count in counts1.items():
+            if char != " ":
+                dot += count * counts2[char]
+                sum_squares1 += count * count
+        for char, count in counts2.items():
+            if char != " ":
+                sum_squares2 += count * count
+        if sum_squares1 == 0 or sum_squares2 == 0:
+            return False
+        cosine_sim = dot / (sqrt(sum_squares1) * sqrt(sum_squares2))
+        if abs(cosine_sim - self.cosine_sim_thresh) > 1e-9:
+            return cosine_sim > self.cosine_sim_thresh
 
+        # at the threshold the rounding of the computation decides, the same as sklearn
+        keys = sorted((set(counts1.keys()) | set(counts2.keys())) - {" "})
+        return cosine_similarity([np.array([counts1[key] for key in keys])],
+                                 [np.array([counts2[key] for key in keys])])[0][0] > self.cosine_sim_thresh
 
-    def are_cosine_similar(self,text1:str,text2:str,confidence:float=0.9) -> bool:
+    def are_cosine_similar(self,text1:'str | VideoSlide',text2:'str | VideoSlide',confidence:float=0.9) -> bool:
         '''
         Determine if two texts are cosine similar.
 
@@ -1044,8 +1066,8 @@ class TextSimilarityClassifier:
 
         Parameters
         -----------
-            text1 (str) : The first text to compare.\n
-            text2 (str) : The second text to compare.\n
+            text1 (str or VideoSlide) : The first text to compare, the words of a slide are cleaned once.\n
+            text2 (str or VideoSlide) : The second text to compare.\n
             confidence (float, optional) : The minimum confidence level required to consider
                 the texts similar. Defaults to 0.9\n
 
@@ -1056,20 +1078,25 @@ class TextSimilarityClassifier:
 
         '''
         cleaner = self._txt_cleaner
-        text1_clean_split, text2_clean_split = cleaner.clean_text(text1).split(), cleaner.clean_text(text2).split()
+        text1_clean_split = text1.get_clean_words() if isinstance(text1, VideoSlide) else cleaner.clean_text(text1).split()
+        text2_clean_split = text2.get_clean_words() if isinstance(text2, VideoSlide) else cleaner.clean_text(text2).split()
         len_split1, len_split2 = len(text1_clean_split), len(text2_clean_split)
-        max_len = max(len_split1,len_split2)
-        if max_len > 0 and min(len_split1, len_split2) == 0:
+        if min(len_split1, len_split2) == 0:
             return False
-        words_set = set(text1_clean_split+text2_clean_split)
-        values = list(range(1,len(words_set)+1))
-        words_dict = dict(zip(words_set,values))
-        text1_vectorized = list(map(lambda key: words_dict[key], text1_clean_split))
-        text2_vectorized = list(map(lambda key: words_dict[key], text2_clean_split))
-        texts_vectorized = empty((2,max_len),dtype=int)
-        texts_vectorized[0,:len_split1] = text1_vectorized; texts_vectorized[0,len_split1:] = 0
-        texts_vectorized[1,:len_split2] = text2_vectorized; texts_vectorized[1,len_split2:] = 0
-        return sum(prod(texts_vectorized,axis=0))/prod(norm(texts_vectorized,axis=1)) > confidence
+        # sorted to map words to the same numbers in every process (set order depends on the hash seed)
+        words_dict = {word: value for value, word in enumerate(sorted(set(text1_clean_split).union(text2_clean_split)), start=1)}
+        text1_vectorized = [words_dict[word] for word in text1_clean_split]
+        text2_vectorized = [words_dict[word] for word in text2_clean_split]
+        # integer sums are exact, the float operations are the ones of the norms of numpy
+        dot = 0
+        for value1, value2 in zip(text1_vectorized, text2_vectorized):
+            dot += value1 * value2
+        sum_squares1 = sum_squares2 = 0
+        for value in text1_vectorized:
+            sum_squares1 += value * value
+        for value in text2_vectorized:
+            sum_squares2 += value * value
+        return dot / (sqrt(float(sum_squares1)) * sqrt(float(sum_squares2))) > confidence
 
 
     def is_exactly_in_txt_version(self,text1:str,text2:str,chars_tol_percentage:float=0.9):
@@ -1113,6 +1140,8 @@ class VideoSlide:
         Overall bounding box coordinates.
     start_end_frames : List[Tuple[int, int]]
         List of frame number ranges where slide appears.
+    _cache : dict
+        Representations of the text used by the comparisons, computed once.
     txt_sim_class : TextSimilarityClassifier
         Text similarity analyzer instance.
 
@@ -1130,10 +1159,20 @@ class VideoSlide:
         Returns text split by newlines.
     get_framed_sentences()
         Returns text segments with screen locations.
+    get_clean_text()
+        Returns the cleaned text.
+    get_clean_words()
+        Returns the words of the cleaned text.
+    get_chars_count()
+        Returns the counts of the characters of the cleaned text.
+    get_lemmas(language)
+        Returns the lemmas of the cleaned text.
     merge_adjacent_startend_frames(max_dist)
         Merges nearby frame ranges.
     __iter__()
         Iterates over the slide attributes.
+    from_dict(data)
+        Creates a slide from its attributes and frame ranges.
     __eq__(other)
         Checks if two slides are equal based on text similarity and bounding boxes.
     __lt__(other)
@@ -1166,6 +1205,7 @@ class VideoSlide:
         self._bounding_box = np.array(min_bb)
         self._framed_sentences = converted_framed_sentence
         self._full_text = full_text
+        self._cache = {}
  
     def copy(self):
         """
@@ -1229,6 +1269,63 @@ class VideoSlide:
         full_text = self._full_text
         return [((full_text[start_char_pos:end_char_pos]), bb) for (start_char_pos, end_char_pos), bb in self._framed_sentences]
 
+    def get_clean_text(self) -> str:
+        """
+        Returns the cleaned text (see `TextCleaner`), computed once.
+
+        Returns
+        -------
+        str
+            Cleaned text of the slide.
+        """
+        if "clean_text" not in self._cache:
+            self._cache["clean_text"] = TextCleaner().clean_text(self._full_text)
+        return self._cache["clean_text"]
+
+    def get_clean_words(self) -> List[str]:
+        """
+        Returns the words of the cleaned text, computed once.
+
+        Returns
+        -------
+        List[str]
+            Words of the cleaned text.
+        """
+        if "clean_words" not in self._cache:
+            self._cache["clean_words"] = self.get_clean_text().split()
+        return self._cache["clean_words"]
+
+    def get_chars_count(self) -> Counter:
+        """
+        Returns the counts of the characters of the cleaned text, computed once.
+
+        Returns
+        -------
+        Counter
+            Occurrences of every character, spaces included.
+        """
+        if "chars_count" not in self._cache:
+            self._cache["chars_count"] = Counter(self.get_clean_text())
+        return self._cache["chars_count"]
+
+    def get_lemmas(self, language: str) -> List[str]:
+        """
+        Returns the lemmas of the cleaned text, computed once per language.
+
+        Parameters
+        ----------
+        language : str
+            Language code ('en' or 'it').
+
+        Returns
+        -------
+        List[str]
+            Lemma of every token.
+        """
+        if "lemmas_" + language not in self._cache:
+            self._cache["lemmas_" + language] = [token.lemma_ for token in NLPSingleton().lemmatize(self.get_clean_text(), language)]
+        return self._cache["lemmas_" + language]
+
     def merge_adjacent_startend_frames(self, max_dist: int = 15) -> 'VideoSlide':
         """
         Merges nearby frame ranges.
@@ -1269,7 +1366,28 @@ class VideoSlide:
         yield "text", self._full_text
         yield "full_bounding_box", self._bounding_box.tolist()
         yield "sent_indxs_and_bb", self._framed_sentences
-    
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "VideoSlide":
+        """
+        Creates a slide from its attributes (see `__iter__()`) with its frame ranges.
+
+        Parameters
+        ----------
+        data : dict
+            Attributes of the slide, with the frame ranges in "start_end_frames".
+
+        Returns
+        -------
+        VideoSlide
+            The slide.
+        """
+        text = data["text"]
+        start_end_frames = [tuple(frames) for frames in data["start_end_frames"]]
+        slide = cls([(text[start:end], tuple(bb)) for (start, end), bb in data["sent_indxs_and_bb"]], start_end_frames[0])
+        slide.start_end_frames = start_end_frames
+        return slide
+
     def __eq__(self, other: "VideoSlide") -> bool:
         """
         Checks if two slides are equal based on text similarity and bounding boxes.
@@ -1284,12 +1402,10 @@ class VideoSlide:
         bool
             True if slides are equal, False otherwise.
         """
-        if not self.txt_sim_class.are_cosine_similar(self._full_text, other._full_text, confidence=0.8):
-            return False
-
         this_bbs = self._bounding_box
         other_bbs = other._bounding_box
-        return (this_bbs - 10 <= other_bbs).all() and (other_bbs <= this_bbs + 10).all()
+        return (this_bbs - 10 <= other_bbs).all() and (other_bbs <= this_bbs + 10).all() and \
+               self.txt_sim_class.are_cosine_similar(self, other, confidence=0.8)
 
     def __lt__(self, other: 'VideoSlide'):
         """
@@ -1319,6 +1435,148 @@ class VideoSlide:
         return 'TFT(txt={0}, window_time={1}, bbs={2})'.format(
             repr(self._full_text), repr(self.start_end_frames), repr(self._bounding_box))
 
+
+class SlideDuplicatesIndex:
+    """
+    Index of the text of the slides that merges the slides partially contained in other slides
+    without comparing all the pairs.
+
+    The cleaned text of every slide is split in character shingles, indexed by shingle.
+    A slide is compared with `TextSimilarityClassifier.is_partially_in()` only with the longer slides
+    sharing at least `min_containment` of its shingles, found from its rarest shingles (prefix filtering:
+    a slide sharing that fraction of n shingles shares at least one of the n - ceil(min_containment*n) + 1 rarest).
+    With 4 characters shingles a text with a tenth of the characters read wrong, the limit of the fuzzy ratio,
+    still shares more than half of them.\n
+    Slides are visited from the shortest text and each one is merged into the closest in time of the slides
+    containing it, the merges make a union-find forest whose roots keep the frames of their whole tree.
+
+    Attributes
+    ----------
+    _txt_classif : TextSimilarityClassifier
+        Classifier verifying the candidate pairs
+    shingle_size : int
+        Characters of a shingle
+    min_containment : float
+        Min fraction of the shingles of a slide shared with a longer slide to compare them
+    num_comparisons : int
+        Calls to `is_partially_in()` of the last `merge_duplicates()`
+
+    Methods
+    -------
+    __init__(txt_classif, shingle_size, min_containment)
+        Initializes the index with the classifier verifying the candidates.
+    _get_shingles(text)
+        Returns the set of shingles of a cleaned text.
+    _find_root(parents, index)
+        Returns the slide a slide is merged into.
+    merge_duplicates(slides)
+        Merges the slides partially contained in other slides.
+    """
+
+    def __init__(self, txt_classif: TextSimilarityClassifier, shingle_size: int = 4, min_containment: float = 0.5) -> None:
+        self._txt_classif = txt_classif
+        self.shingle_size = shingle_size
+        self.min_containment = min_containment
+        self.num_comparisons = 0
+
+    def _get_shingles(self, text: str) -> set:
+        """
+        Returns the set of shingles of a cleaned text.
+
+        Parameters
+        ----------
+        text : str
+            Cleaned text.
+
+        Returns
+        -------
+        set
+            Substrings of `shingle_size` characters, empty for texts shorter than that.
+        """
+        size = self.shingle_size
+        return {text[start:start+size] for start in range(len(text) - size + 1)}
+
+    @staticmethod
+    def _find_root(parents: List[int], index: int) -> int:
+        """
+        Returns the slide a slide is merged into, compressing the path to it.
+
+        Parameters
+        ----------
+        parents : List[int]
+            Index of the slide every slide is merged into, itself for the roots.
+        index : int
+            Index of the slide.
+
+        Returns
+        -------
+        int
+            Index of the root of the slide.
+        """
+        root = index
+        while parents[root] != root:
+            root = parents[root]
+        while parents[index] != root:
+            parents[index], index = root, parents[index]
+        return root
+
+    def merge_duplicates(self, slides: List[VideoSlide]) -> List[VideoSlide]:
+        """
+        Merges the slides partially contained in other slides, like `is_partially_in()` repeated on all the pairs until nothing changes.
+
+        Parameters
+        ----------
+        slides : List[VideoSlide]
+            Slides to deduplicate, merged in place.
+
+        Returns
+        -------
+        List[VideoSlide]
+            Slides not contained in other slides, in the input order, with the frames of the slides merged into them.
+        """
+        texts = [slide.get_clean_text() for slide in slides]
+        shingles = [self._get_shingles(text) for text in texts]
+        postings: dict = {}
+        for index, slide_shingles in enumerate(shingles):
+            for shingle in slide_shingles:
+                postings.setdefault(shingle, set()).add(index)
+        # shingles as bits of an int, shared shingles are counted with one AND
+        shingles_ids = {shingle: num_shingle for num_shingle, shingle in enumerate(postings)}
+        masks = [0] * len(slides)
+        for index, slide_shingles in enumerate(shingles):
+            for shingle in slide_shingles:
+                masks[index] |= 1 << shingles_ids[shingle]
+
+        self.num_comparisons = 0
+        parents = list(range(len(slides)))
+        # longer slides are still roots when a slide is merged into them
+        for index in sorted(range(len(slides)), key=lambda index: len(texts[index])):
+            if not texts[index]:
+                continue
+            slide_shingles = shingles[index]
+            if slide_shingles:
+                rarest = sorted(slide_shingles, key=lambda shingle: len(postings[shingle]))
+                prefix = rarest[:len(rarest) - ceil(self.min_containment*len(rarest)) + 1]
+                min_shared = self.min_containment*len(slide_shingles)
+                candidates = [other for other in set().union(*[postings[shingle] for shingle in prefix])
+                              if len(texts[other]) > len(texts[index]) and (masks[index] & masks[other]).bit_count() >= min_shared]
+            else:
+                # too short to be indexed
+                candidates = [other for other in range(len(slides)) if len(texts[other]) > len(texts[index])]
+            start_frame = slides[index].start_end_frames[0][0]
+            for other in sorted(candidates, key=lambda other: abs(slides[other].start_end_frames[0][0] - start_frame)):
+                self.num_comparisons += 1
+                if self._txt_classif.is_partially_in(slides[index], slides[other]):
+                    parents[index] = other
+                    break
+
+        for index, slide in enumerate(slides):
+            root = self._find_root(parents, index)
+            if root != index:
+                slides[root].merge_frames(slide)
+        return [slide for index, slide in enumerate(slides) if parents[index] == index]
+
+
 def lemmatize(lemmas):
     """
     Lemmatizes a list of concepts.
@@ -1451,6 +1709,32 @@ def get_timed_sentences(subtitles, sentences: List[str]):
     return timed_sentences
 
 
+def get_current_transcript(transcript_data: dict) -> list:
+    """
+    Get the most accurate transcript available for a video.
+
+    While the Whisper transcription is running, the segments it has published (see
+    `database.mongo.append_transcript_segments()`) replace the temporary transcript up to the watermark,
+    and the temporary transcript is kept after it, so that consumers (e.g. `get_timed_sentences()`)
+    can start on the completed prefix of a long lecture.
+
+    Parameters
+    ----------
+    transcript_data : dict
+        The "transcript_data" of the video, with 'text' and optionally 'whisper_partial'.
+
+    Returns
+    -------
+    List[Dict[str, Any]]
+        List of segments with 'text', 'start', 'end' and 'words' keys.
+    """
+    partial = transcript_data.get("whisper_partial")
+    if transcript_data.get("is_whisper_transcribed") or partial is None or not partial["segments"]:
+        return transcript_data.get("text", [])
+    watermark = max(partial["watermark_seconds"], partial["segments"][-1]["end"])
+    return partial["segments"] + [segment for segment in transcript_data.get("text", []) if segment["start"] >= watermark]
+
+
 def extract_keywords_LEGACY(text: str, maxWords=3, minFrequency=1):
     """
     Extracts keywords from text using the Rake algorithm.
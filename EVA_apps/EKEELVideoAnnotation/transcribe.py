@@ -11,44 +11,698 @@ More details about deployment can be found [here](../../platforms/annotator/tran
 
 Functions
 ---------
+get_transcription_options(job_options)
+    Get the backend, model size and compute type of a transcription job
+load_transcription_backend(options, num_threads)
+    Load the backend of the given options
+transcribe_in_windows(backend, audio_path, checkpoint, window_seconds, overlap_seconds, on_progress)
+    Transcribe the audio of a file streamed in time windows cut at the pauses, resuming from a checkpoint
 main()
     Main worker process for continuous video transcription
+
+Classes
+-------
+StableWhisperBackend
+    Whisper model of `stable-whisper` (PyTorch), in full or half precision
+FasterWhisperBackend
+    Whisper model of `faster-whisper` (CTranslate2) regrouped by `stable-whisper`, also quantized to int8 on CPU
+ParallelTranscriber
+    Transcribes chunks of the audio cut at the pauses of the speech in a pool of processes, for CPU-only deployments
+TranscriptPublisher
+    Publishes the segments of a running transcription in the transcript storage of the video
+JobLeaseHeartbeat
+    Renews the lease of a transcription job while the worker runs it
 """
 
+import os
+from collections import deque
+from threading import Event, Thread
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
 import stable_whisper
+try:
+    import faster_whisper
+except ImportError:
+    faster_whisper = None
+
+TRANSCRIPTION_BACKEND_STABLE_WHISPER = "stable-whisper"
+TRANSCRIPTION_BACKEND_FASTER_WHISPER = "faster-whisper"
+TRANSCRIPTION_MODEL = 'large-v3'
+TRANSCRIPTION_WINDOW_SECONDS = 600
+# audio shared by two windows of the GPU transcription cut without a pause of the speech
+TRANSCRIPTION_WINDOW_OVERLAP_SECONDS = 2.
+# worker processes of the transcription on machines without GPU, 1 to transcribe in the main process
+TRANSCRIPTION_CPU_PROCESSES = 4
+# jobs of dead workers are claimed again after their lease expires, a heartbeat renews it every third of it
+TRANSCRIPTION_LEASE_SECONDS = 300
+TRANSCRIPTION_IDLE_WAIT_SECONDS = 60
+TRANSCRIPTION_SWEEP_SECONDS = 600
+
+
+def _append_segments(segments:list, new_segments:list, start_seconds:float,
+                     keep_start_seconds:'float | None'=None, keep_end_seconds:'float | None'=None):
+    """
+    Append to the segments of a transcription the ones of a part of the audio starting at `start_seconds`,
+    moving their times and keeping only the words whose middle is in [`keep_start_seconds`, `keep_end_seconds`)
+    (segments that lose words are shortened to the words left).
+    """
+    def is_kept(start:float, end:float) -> bool:
+        middle = (start + end) / 2
+        return (keep_start_seconds is None or middle >= keep_start_seconds) and (keep_end_seconds is None or middle < keep_end_seconds)
+
+    for segment in new_segments:
+        segment["start"] += start_seconds
+        segment["end"] += start_seconds
+        words = segment.get("words") or []
+        for word in words:
+            word["start"] += start_seconds
+            word["end"] += start_seconds
+        if words:
+            kept_words = [word for word in words if is_kept(word["start"], word["end"])]
+            if not kept_words:
+                continue
+            if len(kept_words) < len(words):
+                segment["words"] = kept_words
+                segment["text"] = "".join([word["word"] for word in kept_words])
+                segment["start"], segment["end"] = kept_words[0]["start"], kept_words[-1]["end"]
+                if "tokens" in segment and all("tokens" in word for word in kept_words):
+                    segment["tokens"] = [token for word in kept_words for token in word["tokens"]]
+        elif not is_kept(segment["start"], segment["end"]):
+            continue
+        segment["id"] = len(segments)
+        segments.append(segment)
+
+
+class StableWhisperBackend:
+    """
+    Transcription backend with a Whisper model of `stable-whisper` (PyTorch).
+
+    Results are regrouped by `stable-whisper` in segments that end at the punctuation, with word timestamps.
+
+    Attributes
+    ----------
+    model_size : str
+        Name of the Whisper model
+    compute_type : str
+        'float16' (GPU only) or 'float32'
+    _model : whisper.Whisper
+        Model loaded in memory
+
+    Methods
+    -------
+    transcribe(audio, initial_prompt)
+        Transcribe audio samples
+    """
+
+    def __init__(self, model_size:str=TRANSCRIPTION_MODEL, compute_type:'str | None'=None, num_threads:'int | None'=None):
+        """
+        Parameters
+        ----------
+        model_size : str, optional
+            Name of the Whisper model
+        compute_type : str or None, optional
+            'float16' or 'float32', None for half precision on GPU and full precision on CPU
+        num_threads : int or None, optional
+            Threads of PyTorch on CPU, None for the default
+
+        Raises
+        ------
+        Exception
+            If the compute type is not supported
+        """
+        import torch
+        if compute_type is None:
+            compute_type = "float16" if torch.cuda.is_available() else "float32"
+        if compute_type not in ("float16", "float32"):
+            raise Exception(f"Compute type {compute_type} not supported by {TRANSCRIPTION_BACKEND_STABLE_WHISPER}")
+        if num_threads is not None:
+            torch.set_num_threads(num_threads)
+        self.model_size = model_size
+        self.compute_type = compute_type
+        self._model = stable_whisper.load_model(name=model_size, in_memory=True, cpu_preload=True)
+
+    def transcribe(self, audio, initial_prompt:'str | None'=None) -> list:
+        """
+        Transcribe audio samples.
+
+        Parameters
+        ----------
+        audio : np.ndarray
+            16 kHz mono float32 samples
+        initial_prompt : str or None, optional
+            Text before the audio
+
+        Returns
+        -------
+        list
+            Segments in the format of the "segments" of the stable-ts JSON result
+        """
+        return self._model.transcribe(audio, initial_prompt=initial_prompt, fp16=self.compute_type == "float16").to_dict()["segments"]
+
+
+class FasterWhisperBackend:
+    """
+    Transcription backend with a Whisper model of `faster-whisper` (CTranslate2), loaded through `stable-whisper`
+    so that results are regrouped and formatted as the ones of `StableWhisperBackend`.
+
+    With compute type 'int8' the weights are quantized, the practical choice on machines without GPU
+    (a fraction of the memory and time of the model in full precision).
+
+    Attributes
+    ----------
+    model_size : str
+        Name of the Whisper model
+    compute_type : str
+        Compute type of CTranslate2 ('int8', 'int8_float32', 'int8_float16', 'float16', 'float32'...)
+    _model : faster_whisper.WhisperModel
+        Model loaded in memory
+
+    Methods
+    -------
+    transcribe(audio, initial_prompt)
+        Transcribe audio samples
+    """
+
+    def __init__(self, model_size:str=TRANSCRIPTION_MODEL, compute_type:'str | None'=None, num_threads:'int | None'=None):
+        """
+        Parameters
+        ----------
+        model_size : str, optional
+            Name of the Whisper model
+        compute_type : str or None, optional
+            Compute type of CTranslate2, None for 'float16' on GPU and 'int8' on CPU
+        num_threads : int or None, optional
+            Threads of CTranslate2 on CPU, None for the default
+
+        Raises
+        ------
+        Exception
+            If faster-whisper is not installed
+        """
+        if faster_whisper is None:
+            raise Exception("faster-whisper is not installed")
+        import torch
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+        if compute_type is None:
+            compute_type = "float16" if device == "cuda" else "int8"
+        self.model_size = model_size
+        self.compute_type = compute_type
+        self._model = stable_whisper.load_faster_whisper(model_size, device=device, compute_type=compute_type, cpu_threads=num_threads or 0)
+
+    def transcribe(self, audio, initial_prompt:'str | None'=None) -> list:
+        """
+        Transcribe audio samples.
+
+        Parameters
+        ----------
+        audio : np.ndarray
+            16 kHz mono float32 samples
+        initial_prompt : str or None, optional
+            Text before the audio
+
+        Returns
+        -------
+        list
+            Segments in the format of the "segments" of the stable-ts JSON result
+        """
+        return self._model.transcribe_stable(audio, initial_prompt=initial_prompt).to_dict()["segments"]
+
+
+_TRANSCRIPTION_BACKENDS = {TRANSCRIPTION_BACKEND_STABLE_WHISPER: StableWhisperBackend,
+                           TRANSCRIPTION_BACKEND_FASTER_WHISPER: FasterWhisperBackend}
+
+
+def get_transcription_options(job_options:'dict | None'=None) -> dict:
+    """
+    Get the backend, model size and compute type of a transcription job.
+
+    Options missing from the job are the defaults: `stable-whisper` with large-v3 in half precision on GPU,
+    `faster-whisper` with large-v3 quantized to int8 on CPU (`stable-whisper` in full precision if not installed).
+
+    Parameters
+    ----------
+    job_options : dict or None, optional
+        Options of the job, with keys "backend", "model_size" and "compute_type" (None for the default of the backend)
+
+    Returns
+    -------
+    dict
+        Complete options
+
+    Raises
+    ------
+    Exception
+        If the backend is unknown
+    """
+    import torch
+    job_options = job_options or {}
+    if "backend" in job_options:
+        backend = job_options["backend"]
+    elif torch.cuda.is_available() or faster_whisper is None:
+        backend = TRANSCRIPTION_BACKEND_STABLE_WHISPER
+    else:
+        backend = TRANSCRIPTION_BACKEND_FASTER_WHISPER
+    if backend not in _TRANSCRIPTION_BACKENDS:
+        raise Exception(f"Unknown transcription backend {backend}")
+    return {"backend": backend,
+            "model_size": job_options.get("model_size", TRANSCRIPTION_MODEL),
+            "compute_type": job_options.get("compute_type")}
+
+
+def load_transcription_backend(options:dict, num_threads:'int | None'=None) -> 'StableWhisperBackend | FasterWhisperBackend':
+    """
+    Load the backend of the given options.
+
+    Parameters
+    ----------
+    options : dict
+        Options returned by `get_transcription_options()`
+    num_threads : int or None, optional
+        Threads of the backend on CPU, None for the default
+
+    Returns
+    -------
+    StableWhisperBackend or FasterWhisperBackend
+        Backend with the model loaded
+    """
+    return _TRANSCRIPTION_BACKENDS[options["backend"]](options["model_size"], options["compute_type"], num_threads)
+
+
+_worker_backend = None
+
+
+def _init_transcription_worker(options:dict, num_threads:int):
+    global _worker_backend
+    _worker_backend = load_transcription_backend(options, num_threads)
+
+
+def _transcribe_chunk(samples) -> list:
+    return _worker_backend.transcribe(samples)
+
+
+class ParallelTranscriber:
+    """
+    Transcription of the audio of a file split in chunks at the pauses of the speech, transcribed in parallel
+    by a pool of processes, each one with its own backend loaded once and reused for all the chunks and files.
+
+    Meant for machines without GPU, where a single `model.transcribe()` takes a multiple of the length of the audio:
+    the cores are shared between the workers. The audio is streamed (see `media.audio.iter_speech_chunks()`) and at
+    most `2*num_processes` chunks are pending, so memory doesn't grow with the length of the audio.\n
+    Chunks are transcribed independently (without the text before them as prompt); the words of chunks cut without
+    a silence are merged at the cut so that none is duplicated or lost. The result has the format of the
+    "segments" of the stable-ts JSON result, as `transcribe_in_windows()`.
+
+    Attributes
+    ----------
+    _executor : ProcessPoolExecutor
+        Worker processes
+    _options : dict
+        Transcription options of the workers, see `get_transcription_options()`
+    _num_processes : int
+        Number of worker processes
+    _max_chunk_seconds : float
+        Max length of the chunks
+    _overlap_seconds : float
+        Overlap of the chunks cut where there isn't a silence
+
+    Methods
+    -------
+    get_checkpoint_key()
+        Get the key of the checkpoints of the transcriptions
+    transcribe(audio_path, checkpoint, on_progress)
+        Transcribe the audio of a file
+    close()
+        Stop the workers
+    """
+
+    def __init__(self, options:'dict | None'=None, num_processes:int=TRANSCRIPTION_CPU_PROCESSES,
+                 max_chunk_seconds:float=120., overlap_seconds:float=2.):
+        """
+        Parameters
+        ----------
+        options : dict or None, optional
+            Transcription options (see `get_transcription_options()`) of the backend loaded by every worker, None for the defaults
+        num_processes : int, optional
+            Number of worker processes, the cores are split among them
+        max_chunk_seconds : float, optional
+            Max length of the chunks
+        overlap_seconds : float, optional
+            Overlap of the chunks cut where there isn't a silence
+        """
+        self._options = get_transcription_options(options)
+        self._num_processes = num_processes
+        self._max_chunk_seconds = max_chunk_seconds
+        self._overlap_seconds = overlap_seconds
+        # spawned workers, torch threads don't survive a fork
+        self._executor = ProcessPoolExecutor(max_workers=num_processes, mp_context=get_context("spawn"),
+                                             initializer=_init_transcription_worker,
+                                             initargs=(self._options, max(os.cpu_count() // num_processes, 1)))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def get_checkpoint_key(self) -> dict:
+        """
+        Key of the checkpoints of the transcriptions, see `media.checkpoint.StageCheckpoint`.
+
+        Returns
+        -------
+        dict
+            Transcription options and chunking parameters
+        """
+        return self._options | {"max_chunk_seconds": self._max_chunk_seconds, "overlap_seconds": self._overlap_seconds}
+
+    def transcribe(self, audio_path, checkpoint=None, on_progress=None) -> list:
+        """
+        Transcribe the audio of a file in chunks transcribed in parallel.
+
+        With a checkpoint (see `media.checkpoint.StageCheckpoint`) the segments of the chunks transcribed
+        are saved periodically and a restarted transcription continues from the first chunk not saved.
+
+        Parameters
+        ----------
+        audio_path : str or Path
+            Audio (or video) file
+        checkpoint : StageCheckpoint or None, optional
+            Checkpoint of the transcription, None not to save the progress
+        on_progress : callable or None, optional
+            Called after every chunk with the segments and the seconds of audio transcribed (e.g. `TranscriptPublisher.publish()`)
+
+        Returns
+        -------
+        list
+            Segments of the transcription, in the format of the "segments" of the stable-ts JSON result
+        """
+        from media.audio import PCMAudioStream, iter_speech_chunks
+
+        saved_state = checkpoint.load() if checkpoint is not None else None
+        if saved_state is None:
+            saved_state = {"num_chunks_done": 0, "next_start_seconds": 0., "keep_start_seconds": None, "is_ended": False, "segments": []}
+        elif saved_state["is_ended"]:
+            return saved_state["segments"]
+        elif saved_state["num_chunks_done"] > 0:
+            print(f"Resuming transcription from {saved_state['next_start_seconds']} seconds")
+        segments = saved_state["segments"]
+
+        def collect(pending_chunk:tuple):
+            future, start_seconds, keep_start_seconds, keep_end_seconds, next_start_seconds = pending_chunk
+            _append_segments(segments, future.result(), start_seconds, keep_start_seconds, keep_end_seconds)
+            saved_state.update(num_chunks_done=saved_state["num_chunks_done"]+1, next_start_seconds=next_start_seconds,
+                               keep_start_seconds=keep_end_seconds)
+            if checkpoint is not None and checkpoint.is_due():
+                checkpoint.save(saved_state)
+            if on_progress is not None:
+                # words before the cut of an overlapped chunk are final
+                on_progress(segments, keep_end_seconds if keep_end_seconds is not None else next_start_seconds)
+
+        pending = deque()
+        with PCMAudioStream(audio_path, start_seconds=saved_state["next_start_seconds"]) as audio_stream:
+            for start_seconds, samples, keep_start_seconds, keep_end_seconds, next_start_seconds in \
+                    iter_speech_chunks(audio_stream, self._max_chunk_seconds, overlap_seconds=self._overlap_seconds,
+                                       keep_start_seconds=saved_state["keep_start_seconds"]):
+                pending.append((self._executor.submit(_transcribe_chunk, samples),
+                                start_seconds, keep_start_seconds, keep_end_seconds, next_start_seconds))
+                if len(pending) >= 2*self._num_processes:
+                    collect(pending.popleft())
+            while pending:
+                collect(pending.popleft())
+        saved_state["is_ended"] = True
+        if checkpoint is not None:
+            checkpoint.save(saved_state)
+        return segments
+
+    def close(self):
+        """
+        Stop the workers, cancelling the chunks not started.
+        """
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+
+def transcribe_in_windows(backend, audio_path, checkpoint=None, window_seconds:float=TRANSCRIPTION_WINDOW_SECONDS,
+                          overlap_seconds:float=TRANSCRIPTION_WINDOW_OVERLAP_SECONDS, on_progress=None) -> list:
+    """
+    Transcribe the audio of a file one time window after the other, saving the segments after every window.
+
+    The audio is streamed from a single ffmpeg subprocess (see `media.audio.PCMAudioStream`) one window at a time,
+    so memory is bounded by the length of a window and nothing is written on disk but the checkpoint.\n
+    Windows are cut at the pauses of the speech as the chunks of `ParallelTranscriber` (see `media.audio.iter_speech_chunks()`),
+    a window without pauses overlaps the next one and only its words before the cut are kept, so no word is split between two windows.\n
+    Every window is transcribed with `backend.transcribe()`, the text of the last segments transcribed
+    is its initial prompt (as Whisper does between its 30 seconds windows), so the result doesn't depend on where a run
+    has been restarted. Times of segments and words are moved to the time of the window in the file.\n
+    With a checkpoint (see `media.checkpoint.StageCheckpoint`) a restarted transcription continues from the cut of the last window saved.
+
+    Parameters
+    ----------
+    backend : StableWhisperBackend or FasterWhisperBackend
+        Backend loaded with `load_transcription_backend()`
+    audio_path : str or Path
+        Audio (or video) file
+    checkpoint : StageCheckpoint or None, optional
+        Checkpoint of the transcription, None not to save the progress
+    window_seconds : float, optional
+        Maximum length of the windows
+    overlap_seconds : float, optional
+        Audio shared by two windows cut without a pause
+    on_progress : callable or None, optional
+        Called after every window with the segments and the seconds of audio transcribed (e.g. `TranscriptPublisher.publish()`)
+
+    Returns
+    -------
+    list
+        Segments of the transcription, in the format of the "segments" of the stable-ts JSON result
+    """
+    from media.audio import PCMAudioStream, iter_speech_chunks
+
+    saved_state = checkpoint.load() if checkpoint is not None else None
+    if saved_state is None:
+        saved_state = {"num_windows_done": 0, "next_start_seconds": 0., "keep_start_seconds": None, "is_ended": False, "segments": []}
+    elif saved_state["is_ended"]:
+        return saved_state["segments"]
+    elif saved_state["num_windows_done"] > 0:
+        print(f"Resuming transcription from {saved_state['next_start_seconds']} seconds")
+    segments = saved_state["segments"]
+    with PCMAudioStream(audio_path, start_seconds=saved_state["next_start_seconds"]) as audio_stream:
+        for start_seconds, audio, keep_start_seconds, keep_end_seconds, next_start_seconds in \
+                iter_speech_chunks(audio_stream, window_seconds, overlap_seconds=overlap_seconds,
+                                   keep_start_seconds=saved_state["keep_start_seconds"]):
+            prompt = "".join([segment["text"] for segment in segments[-3:]]).strip()
+            _append_segments(segments, backend.transcribe(audio, initial_prompt=prompt if prompt else None),
+                             start_seconds, keep_start_seconds, keep_end_seconds)
+            saved_state.update(num_windows_done=saved_state["num_windows_done"]+1, next_start_seconds=next_start_seconds,
+                               keep_start_seconds=keep_end_seconds)
+            if checkpoint is not None:
+                checkpoint.save(saved_state)
+            if on_progress is not None:
+                # words before the cut of an overlapped window are final
+                on_progress(segments, keep_end_seconds if keep_end_seconds is not None else next_start_seconds)
+    # the end of the stream can be found only after the last window
+    saved_state["is_ended"] = True
+    if checkpoint is not None:
+        checkpoint.save(saved_state)
+    return segments
+
+
+class TranscriptPublisher:
+    """
+    Publication of the segments of a running transcription in the transcript storage of the video,
+    so that the annotation can start on the completed prefix (see `text_processor.words.get_current_transcript()`).
+
+    Every publication appends only the segments not published yet, with the watermark of the audio transcribed;
+    the end of the transcription turns them into the transcript of the video without sending them again.
+    Errors are printed and don't stop the transcription: the next publication sends all the segments.
+
+    Attributes
+    ----------
+    video_id : str
+        ID of the video
+    num_published : int or None
+        Number of segments published, None before the first publication and after an error
+
+    Methods
+    -------
+    publish(segments, watermark_seconds)
+        Publish the segments transcribed
+    finalize(segments, transcription_options)
+        Publish the last segments and make them the transcript of the video
+    """
+
+    def __init__(self, video_id:str):
+        self.video_id = video_id
+        self.num_published = None
+
+    def publish(self, segments:list, watermark_seconds:float) -> bool:
+        """
+        Publish the segments transcribed, see `database.mongo.append_transcript_segments()`.
+
+        Parameters
+        ----------
+        segments : list
+            All the segments of the transcription so far
+        watermark_seconds : float
+            Seconds of audio transcribed
+
+        Returns
+        -------
+        bool
+            True if all the segments have been published
+        """
+        from database.mongo import append_transcript_segments
+        first_index = self.num_published or 0
+        try:
+            if append_transcript_segments(self.video_id, segments[first_index:], first_index, watermark_seconds):
+                self.num_published = len(segments)
+                return True
+            print(f"Warning: segments of {self.video_id} published by someone else, publishing them all again")
+        except Exception as e:
+            print(f"Warning: segments of {self.video_id} not published: {e}")
+        self.num_published = None
+        return False
+
+    def finalize(self, segments:list, transcription_options:dict) -> bool:
+        """
+        Publish the last segments and make them the transcript of the video, see `database.mongo.finalize_transcript()`.
+
+        Parameters
+        ----------
+        segments : list
+            All the segments of the transcription
+        transcription_options : dict
+            Options of the transcription, stored with the transcript
+
+        Returns
+        -------
+        bool
+            False if the transcript hasn't been written
+        """
+        from database.mongo import finalize_transcript
+        if self.num_published != len(segments) or not len(segments):
+            if not self.publish(segments, segments[-1]["end"] if len(segments) else 0.):
+                return False
+        try:
+            return finalize_transcript(self.video_id, len(segments), transcription_options)
+        except Exception as e:
+            print(f"Warning: transcript of {self.video_id} not finalized: {e}")
+            return False
+
+
+class JobLeaseHeartbeat:
+    """
+    Thread that renews the lease of a transcription job while the worker runs it,
+    see `database.mongo.renew_transcription_job_lease()`.
+
+    Attributes
+    ----------
+    video_id : str
+        ID of the video of the job
+    worker_id : str
+        ID of the worker of the job
+    lease_seconds : float
+        Seconds of the lease, renewed every third of it
+    is_lost : bool
+        Whether the lease has been lost (expired and the job claimed by another worker)
+    _stop_event : Event
+        Set to stop the thread
+    _thread : Thread
+        Heartbeat thread
+
+    Methods
+    -------
+    start()
+        Start renewing the lease
+    stop()
+        Stop renewing the lease
+    """
+
+    def __init__(self, video_id:str, worker_id:str, lease_seconds:float=TRANSCRIPTION_LEASE_SECONDS):
+        self.video_id = video_id
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds
+        self.is_lost = False
+        self._stop_event = Event()
+        self._thread = Thread(target=self._run, name="lease-heartbeat", daemon=True)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def _run(self):
+        from database.mongo import renew_transcription_job_lease
+        while not self._stop_event.wait(self.lease_seconds / 3):
+            try:
+                if not renew_transcription_job_lease(self.video_id, self.worker_id, self.lease_seconds):
+                    print(f"Warning: lease of job {self.video_id} lost")
+                    self.is_lost = True
+                    return
+            except Exception as e:
+                print(f"Warning: lease of job {self.video_id} not renewed: {e}")
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self._thread.join()
+
 
 def main():
     """
     Continuous video transcription worker process.
     
-    Runs an infinite loop to process untranscribed videos by:\n
-    1. Retrieving untranscribed videos from MongoDB\n
+    Runs an infinite loop to process the jobs of the transcription queue in MongoDB by:\n
+    1. Claiming the queued job with the highest priority, leased to the worker while a heartbeat renews the lease
+    (see `database.mongo.claim_transcription_job()`), or waiting for new jobs when there are none\n
     2. Downloading the video from YouTube\n
-    3. Converting to WAV\n
-    4. Transcribing with `stable-whisper` library and large-v3 model\n
-    5. Storing results\n
+    3. Transcribing with the backend, model size and compute type of the job (its options, see `get_transcription_options()`),
+    in windows saved in the folder of the video (see `transcribe_in_windows()`), or without GPU in chunks cut at the pauses
+    of the speech and transcribed by `TRANSCRIPTION_CPU_PROCESSES` processes (see `ParallelTranscriber`)\n
+    4. Publishing the segments in the transcript of the video while they are transcribed (see `TranscriptPublisher`),
+    then storing results and marking the job as done\n
+    Several workers can run at the same time, each job is run by one of them. A failed job is queued again after a delay,
+    the job of a worker that dies is claimed again when its lease expires and continues from the last window saved.
+    Videos marked as untranscribed without a job are queued periodically.
     """
     # TODO stable-ts version 2.17.3: passing the language is not working, will be inferenced at cost of small increase in time
     # self._model.transcribe(wav_path.__str__(), decode_options={"language":language}) \
     #             .save_as_json(json_path.__str__())
-    model = stable_whisper.load_model(name='large-v3', in_memory=True, cpu_preload=True)
-    print("Model loaded")
+    import torch
+    use_processes = TRANSCRIPTION_CPU_PROCESSES > 1 and not torch.cuda.is_available()
+    # models of the last options used, reloaded only when a job asks for other ones
+    loaded_options, backend, transcriber = None, None, None
     
     from pathlib import Path
     base_folder = Path(__file__).parent.joinpath("static").joinpath("videos")
     
-    from database.mongo import get_untranscribed_videos, insert_video_data, get_video_data, remove_annotations_data
+    from database.mongo import ensure_transcription_jobs_indexes, enqueue_untranscribed_videos, claim_transcription_job, \
+                               complete_transcription_job, release_transcription_job, wait_for_transcription_jobs, \
+                               insert_video_data, get_video_data, remove_annotations_data, remove_conll
     from time import sleep, time
-    from json import load
-    from media.audio import convert_mp4_to_wav
+    from json import dump
     from media.segmentation import VideoAnalyzer
+    from media.checkpoint import StageCheckpoint
+    import socket
     import os
     
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    last_sweep_time = 0.
     try:
         while True:
             try:
-                videos_metadata:list = get_untranscribed_videos()
-                print(f"Jobs: {videos_metadata}")
+                if time() - last_sweep_time > TRANSCRIPTION_SWEEP_SECONDS:
+                    ensure_transcription_jobs_indexes()
+                    enqueue_untranscribed_videos()
+                    last_sweep_time = time()
+                job = claim_transcription_job(worker_id, TRANSCRIPTION_LEASE_SECONDS)
+                if job is None:
+                    wait_for_transcription_jobs(TRANSCRIPTION_IDLE_WAIT_SECONDS)
+                    continue
             except Exception as e:
                 import sys
                 import os
@@ -76,40 +730,87 @@ def main():
 
                 db = client.ekeel
                 continue
-            for (video_id, language) in videos_metadata:
-                print(f"New job: {video_id}")
-                start_time = time()
-                video_folder_path = base_folder.joinpath(video_id)
-                try:
+            video_id = job["video_id"]
+            print(f"New job: {video_id} (attempt {job['attempts']})")
+            start_time = time()
+            video_folder_path = base_folder.joinpath(video_id)
+            try:
+                with JobLeaseHeartbeat(video_id, worker_id) as heartbeat:
                     VideoAnalyzer("https://www.youtube.com/watch?v="+video_id, request_fields_from_db=["video_id"]).download_video()
-                    convert_mp4_to_wav(video_folder_path, video_id)
-                except Exception as e:
-                    print(e)
-                    sleep(300)
-                    continue
 
-                wav_path = video_folder_path.joinpath(video_id+".wav")
-                json_path = video_folder_path.joinpath(video_id+".json")
-                
-                model.transcribe(wav_path.__str__()).save_as_json(json_path.__str__())
-                
-                with open(json_path) as f:
-                    transcribed_data = load(f)["segments"]
-                
-                os.remove(wav_path)
-                #os.remove(json_path)  # Don't remove json for debug purposes
-                
-                video_data = get_video_data(video_id)
-                video_data["transcript_data"] = {
-                                 "is_whisper_transcribed":True, 
-                                 "is_autogenerated":True, 
-                                 "text":transcribed_data
-                                }
-                    
-                insert_video_data(video_data,update=False)
-                remove_annotations_data(video_id)
-                print(f"Done job: {video_id} in {round(time()-start_time,1)} seconds")
-            sleep(60)
+                    video_path = video_folder_path.joinpath(video_id+".mp4")
+                    json_path = video_folder_path.joinpath(video_id+".json")
+
+                    options = get_transcription_options(job.get("options"))
+                    if options != loaded_options:
+                        if transcriber is not None:
+                            transcriber.close()
+                        backend, transcriber = None, None
+                        if use_processes:
+                            transcriber = ParallelTranscriber(options, TRANSCRIPTION_CPU_PROCESSES)
+                        else:
+                            backend = load_transcription_backend(options)
+                        loaded_options = options
+                        print(f"Model loaded: {options}")
+                    if transcriber is not None:
+                        checkpoint_key = transcriber.get_checkpoint_key()
+                    else:
+                        checkpoint_key = options | {"window_seconds": TRANSCRIPTION_WINDOW_SECONDS,
+                                                    "overlap_seconds": TRANSCRIPTION_WINDOW_OVERLAP_SECONDS}
+                    checkpoint = StageCheckpoint(video_folder_path, "transcription", checkpoint_key)
+                    publisher = TranscriptPublisher(video_id)
+
+                    def publish(segments:list, watermark_seconds:float):
+                        # a worker that lost the lease mustn't overwrite the segments of the new one
+                        if not heartbeat.is_lost:
+                            publisher.publish(segments, watermark_seconds)
+
+                    if transcriber is not None:
+                        try:
+                            transcribed_data = transcriber.transcribe(video_path, checkpoint, on_progress=publish)
+                        except Exception:
+                            # a dead worker (e.g. out of memory) breaks the pool for good, the next job builds a new one
+                            transcriber.close()
+                            transcriber = loaded_options = None
+                            raise
+                    else:
+                        transcribed_data = transcribe_in_windows(backend, video_path, checkpoint, on_progress=publish)
+
+                    with open(json_path, "w") as f:
+                        dump({"segments": transcribed_data}, f)
+
+                    #os.remove(json_path)  # Don't remove json for debug purposes
+
+                    if heartbeat.is_lost:
+                        # another worker has claimed the job, the checkpoint is left to it
+                        print(f"Lease of job {video_id} lost, result discarded")
+                        continue
+
+                    if not publisher.finalize(transcribed_data, options):
+                        video_data = get_video_data(video_id)
+                        video_data["transcript_data"] = {
+                                         "is_whisper_transcribed":True, 
+                                         "is_autogenerated":True, 
+                                         "transcription_options":options,
+                                         "text":transcribed_data
+                                        }
+                        # as finalize_transcript(), the data derived from the previous transcript is removed
+                        video_data.get("video_data", {}).pop("segments", None)
+
+                        insert_video_data(video_data,update=False)
+                        remove_conll(video_id)
+                    checkpoint.remove()
+                    remove_annotations_data(video_id)
+                    complete_transcription_job(video_id, worker_id)
+            except Exception as e:
+                print(f"Failed job: {video_id}: {e}")
+                try:
+                    release_transcription_job(video_id, worker_id, str(e))
+                except Exception as release_error:
+                    # the lease will expire
+                    print(f"Job {video_id} not released: {release_error}")
+                continue
+            print(f"Done job: {video_id} in {round(time()-start_time,1)} seconds")
     except Exception as e:
         import sys
         import os
@@ -126,6 +827,9 @@ def main():
                 lines = f.readlines()
                 error_line = lines[line_number - 1].strip()
             print(f"File: {filename}, Function: {frame.name}, Line: {line_number} | {error_line}")
+    finally:
+        if transcriber is not None:
+            transcriber.close()
     
 
 if __name__ == "__main__":